@@ -0,0 +1,118 @@
+"""Update cost of the EPN air-quality rollup over months of hourly history.
+
+``--sites`` stations each report every pollutant hourly for ``--days``.
+The history is folded in once, then ``--updates`` new hours arrive one at a
+time as Firehose objects, each mixed with ``--hotspots`` FIRMS records. For
+each new hour the benchmark times:
+
+* the fold on its own (reading extraction, ring-buffer scatter and the
+  touched averages);
+* the whole stage update, including the S3 GET and record filtering;
+* the publish of every site's series and the station snapshot.
+
+Run with ``python benchmarks/bench_air_quality.py [--sites N] [--days N]
+[--updates N] [--hotspots N]``.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from stubs import StubS3
+
+import numpy as np
+
+from common.record_codec import get_encoder
+from geojson_processor.air_quality import POLLUTANTS, UPDATE_SECONDS, AirQualityRollup, AirQualityStage
+from geojson_processor.incremental import S3StateStore
+
+START_HOUR = 490000
+
+
+def _records(sites, hour, hotspots):
+    stamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(hour * 3600))
+    for n in range(sites):
+        for pollutant in POLLUTANTS:
+            yield {
+                "source": "nsw_epn",
+                "id": f"site-{n}",
+                "latitude": -33.0 - n * 0.02,
+                "longitude": 151.0,
+                "timestamp": stamp,
+                "raw": {"Site_Id": f"site-{n}", "Parameter": {"ParameterCode": pollutant}, "Value": (n + hour) % 60},
+            }
+    for j in range(hotspots):
+        yield {"source": "nasa_firms", "id": str(j), "latitude": -35.0, "longitude": 149.0, "timestamp": stamp, "raw": {}}
+
+
+def _summary(values):
+    values = sorted(values)
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sites", type=int, default=100)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--updates", type=int, default=24)
+    parser.add_argument("--hotspots", type=int, default=5000)
+    args = parser.parse_args()
+
+    hours = args.days * 24
+    s3 = StubS3()
+    stage = AirQualityStage(s3, "raw", "out", "air_quality/", S3StateStore(s3, "out", "state.npz"))
+    rollup = stage.rollup = AirQualityRollup(capacity=hours)
+    rows = [rollup._row(f"site-{n}", pollutant) for n in range(args.sites) for pollutant in POLLUTANTS]
+    for n in range(args.sites):
+        rollup.site(f"site-{n}", latitude=-33.0 - n * 0.02, longitude=151.0)
+    rollup._grow()
+    started = time.perf_counter()
+    rollup.add_arrays(
+        np.repeat(np.asarray(rows), hours),
+        np.tile(np.arange(START_HOUR, START_HOUR + hours), len(rows)),
+        np.random.default_rng(0).random(len(rows) * hours, dtype=np.float32) * 60,
+    )
+    backfill = time.perf_counter() - started
+    stage.publish()
+
+    encode = get_encoder("jsonl")
+    folds, updates, publishes = [], [], []
+    for n in range(args.updates):
+        hour = START_HOUR + hours + n
+        body = b"".join(encode(rec) for rec in _records(args.sites, hour, args.hotspots))
+        s3.put_object(Bucket="raw", Key=f"epn/{hour}", Body=body)
+        listing = [obj for page in s3.get_paginator("list_objects_v2").paginate(Bucket="raw") for obj in page["Contents"]]
+        folded = UPDATE_SECONDS.sum()
+        started = time.perf_counter()
+        stats = stage.update(listing)
+        updates.append(time.perf_counter() - started)
+        folds.append(UPDATE_SECONDS.sum() - folded)
+        assert stats["readings"] == len(rows)
+        started = time.perf_counter()
+        stage.publish()
+        publishes.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    state = rollup.to_bytes()
+    checkpoint = time.perf_counter() - started
+    report = {
+        "sites": args.sites,
+        "series": len(rows),
+        "history_hours": hours,
+        "buffer_mib": round((rollup.values.nbytes + rollup.hours.nbytes) / 2**20, 1),
+        "backfill_s": round(backfill, 3),
+        "fold_one_hour": _summary(folds),
+        "stage_update": _summary(updates),
+        "publish": _summary(publishes),
+        "checkpoint": {"seconds": round(checkpoint, 3), "bytes": len(state)},
+        "series_bytes": len(s3.objects["out/air_quality/sites/site-0.json"]["Body"]),
+        "snapshot_bytes": len(s3.objects["out/air_quality/stations.geojson"]["Body"]),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Import-time / cold-start cost of every Lambda handler.
+
+Each handler is imported in a fresh interpreter under ``python -X importtime``
+(the module's cumulative import time) and timed wall-clock against a bare
+interpreter (the init phase a cold start pays). Runs are repeated and the
+median kept, with instrumentation off and with ``INSTRUMENTATION=true``.
+With ``--budget-ms`` the script exits non-zero when any handler's median
+import exceeds the budget with instrumentation off, which is how CI uses it.
+Run with ``python benchmarks/bench_cold_start.py [--repeat N] [--budget-ms MS] [--root PATH]``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (module, directory it is imported from, relative to the repo root)
+HANDLERS = {
+    "ingest": ("ingest_lambda.handlers", "src"),
+    "rule_eval": ("rule_eval", "lambda"),
+    "push_bridge": ("push_bridge", "lambda"),
+    "subscribe": ("api.subscribe", "src"),
+    "unsubscribe": ("api.unsubscribe", "src"),
+    "geojson_proxy": ("api.geojson_proxy", "src"),
+    "perimeter_query": ("api.perimeter_query", "src"),
+}
+
+
+def _env(root: str, directory: str, instrumented: bool) -> dict:
+    env = dict(os.environ, AWS_DEFAULT_REGION="ap-southeast-2", PYTHONDONTWRITEBYTECODE="1")
+    env["PYTHONPATH"] = os.pathsep.join([os.path.join(root, directory), os.path.join(root, "src")])
+    env["INSTRUMENTATION"] = "true" if instrumented else "false"
+    return env
+
+
+def import_time_ms(module: str, env: dict) -> float:
+    """Cumulative ``-X importtime`` microseconds of ``module``, in ms."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], env=env, capture_output=True, text=True, check=True
+    )
+    for line in reversed(out.stderr.splitlines()):
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000
+    raise RuntimeError(f"{module} missing from importtime output")
+
+
+def wall_ms(code: str, env: dict) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True)
+    return (time.perf_counter() - started) * 1000
+
+
+def measure(root: str, repeat: int) -> dict:
+    baseline = statistics.median(wall_ms("pass", _env(root, "src", False)) for _ in range(repeat))
+    report = {}
+    for name, (module, directory) in HANDLERS.items():
+        row = {}
+        for instrumented in (False, True):
+            env = _env(root, directory, instrumented)
+            suffix = "_instrumented" if instrumented else ""
+            row["import_ms" + suffix] = round(statistics.median(import_time_ms(module, env) for _ in range(repeat)), 1)
+            row["init_ms" + suffix] = round(
+                statistics.median(wall_ms(f"import {module}", env) for _ in range(repeat)) - baseline, 1
+            )
+        report[name] = row
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--root", default=os.path.dirname(HERE), help="repository checkout to measure")
+    args = parser.parse_args()
+    report = {"python": sys.version.split()[0], "repeat": args.repeat, "handlers": measure(args.root, args.repeat)}
+    if args.budget_ms is not None:
+        report["budget_ms"] = args.budget_ms
+        report["over_budget"] = sorted(
+            name for name, row in report["handlers"].items() if row["import_ms"] > args.budget_ms
+        )
+    print(json.dumps(report, indent=2))
+    if report.get("over_budget"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
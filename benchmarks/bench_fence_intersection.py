@@ -0,0 +1,84 @@
+"""Fence intersection flags: STRtree + prepared fences vs a per-fence check.
+
+Fences are point-and-radius circles and small polygons scattered over the
+synthetic fire area; the perimeter is the clustered union of the synthetic
+hotspots. The first engine run writes every fence that now intersects, the
+second finds nothing to change. The naive baseline tests a sample of
+fences one by one against the whole perimeter and is extrapolated.
+Run with ``python benchmarks/bench_fence_intersection.py [fences] [hotspots] [latency]``.
+"""
+import json
+import sys
+import time
+
+import numpy as np
+import shapely
+
+import stubs
+from bench_hotspot_clustering import synthetic_hotspots
+from geojson_processor.clustering import cluster_and_union
+from geojson_processor.fences import fence_geometries, update_fence_intersections
+
+TABLE = "geo_fences"
+
+
+def synthetic_fences(count: int, seed: int = 4):
+    """Raw ``geo_fences`` items: 70% point fences with a radius, 30% GeoJSON polygons."""
+    rng = np.random.default_rng(seed)
+    lon, lat = rng.uniform(140, 154, count), rng.uniform(-39, -27, count)
+    items = []
+    for i in range(count):
+        if i % 10 < 7:
+            params = {
+                "latitude": {"N": f"{lat[i]:.5f}"},
+                "longitude": {"N": f"{lon[i]:.5f}"},
+                "radius_m": {"N": str(int(rng.uniform(1000, 20000)))},
+            }
+        else:
+            size = rng.uniform(0.005, 0.05)
+            ring = [[lon[i], lat[i]], [lon[i] + size, lat[i]], [lon[i] + size, lat[i] + size], [lon[i], lat[i] + size]]
+            ring.append(ring[0])
+            coords = {"L": [{"L": [{"L": [{"N": f"{v:.5f}"} for v in point]} for point in ring]}]}
+            params = {"geometry": {"M": {"type": {"S": "Polygon"}, "coordinates": coords}}}
+        items.append(
+            {"user_id": {"S": f"user-{i // 3}"}, "fence_id": {"S": f"fence-{i}"}, "params": {"M": params}}
+        )
+    return items
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    hotspots = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.005
+
+    perimeter = cluster_and_union(list(synthetic_hotspots(hotspots)))
+    items = synthetic_fences(count)
+    client = stubs.StubDynamoDB(throttle_rate=0.05)
+    for item in items:
+        client.put_item(TableName=TABLE, Item=item)
+    client.requests.clear()
+    client.latency = latency
+
+    report = {"fences": count, "perimeter_parts": int(shapely.get_num_geometries(perimeter)), "latency_s": latency}
+    started = time.perf_counter()
+    report["first_run"] = update_fence_intersections(client, TABLE, perimeter, scan_segments=8, write_workers=16)
+    report["first_run"]["total_s"] = round(time.perf_counter() - started, 3)
+    started = time.perf_counter()
+    report["second_run"] = update_fence_intersections(client, TABLE, perimeter, scan_segments=8, write_workers=16)
+    report["second_run"]["total_s"] = round(time.perf_counter() - started, 3)
+    report["dynamodb_requests"] = dict(client.requests)
+
+    # Naive baseline: every fence against the whole perimeter, unprepared
+    sample = fence_geometries(items[:: max(1, count // 500)])
+    started = time.perf_counter()
+    expected = [perimeter.intersects(fence) for fence in sample]
+    naive = (time.perf_counter() - started) / len(sample) * count
+    stored = {row["fence_id"]["S"]: row.get("intersects", {}).get("BOOL", False) for row in client.tables[TABLE].values()}
+    agree = all(stored[item["fence_id"]["S"]] == hit for item, hit in zip(items[:: max(1, count // 500)], expected))
+    report["naive_estimated_s"] = round(naive, 1)
+    report["sample_agrees_with_naive"] = agree
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Fiona tempfile + upload_file vs the in-memory GeoJSON serializer.
+
+Perimeters come from clustering synthetic hotspots, as the processor does.
+Run with ``python benchmarks/bench_geojson_output.py [hotspots]``.
+"""
+import json
+import sys
+import tempfile
+import time
+
+import fiona
+from shapely.geometry import mapping
+
+import stubs
+from bench_hotspot_clustering import synthetic_hotspots
+from geojson_processor.clustering import cluster_and_union
+from geojson_processor.geojson_output import upload_geojson
+
+
+def fiona_upload(s3, geometry):
+    schema = {"geometry": geometry.geom_type, "properties": {}}
+    with tempfile.NamedTemporaryFile(suffix=".geojson") as tmp:
+        with fiona.open(tmp.name, "w", driver="GeoJSON", schema=schema) as dst:
+            dst.write({"geometry": mapping(geometry), "properties": {}})
+        s3.upload_file(tmp.name, "out", "fiona.geojson")
+    return {"bytes": len(s3.objects["out/fiona.geojson"]["Body"])}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    perimeters = cluster_and_union(list(synthetic_hotspots(count)))
+    s3 = stubs.StubS3()
+    report = {"hotspots": count, "polygons": len(perimeters.geoms)}
+    methods = [("fiona_tempfile", lambda: fiona_upload(s3, perimeters))]
+    for precision in (None, 6):
+        for encoding in ("identity", "gzip", "br"):
+            methods.append(
+                (
+                    f"direct_{'full' if precision is None else precision}_{encoding}",
+                    lambda p=precision, e=encoding: upload_geojson(s3, "out", "direct.geojson", perimeters, p, e),
+                )
+            )
+    for name, fn in methods:
+        started = time.perf_counter()
+        result = fn()
+        report[name] = {"seconds": round(time.perf_counter() - started, 3), "bytes": result["bytes"]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
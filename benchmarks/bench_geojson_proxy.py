@@ -0,0 +1,63 @@
+"""geojsonProxyFn latency and S3 traffic: uncached vs warm-container cache.
+
+S3 is a local stand-in with ``latency`` seconds per request; the object is
+a processor-sized perimeter FeatureCollection.
+Run with ``python benchmarks/bench_geojson_proxy.py [requests] [latency]``.
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+import stubs
+from bench_hotspot_clustering import synthetic_hotspots
+from geojson_processor.clustering import cluster_and_union
+from geojson_processor.geojson_output import feature_collection
+
+os.environ["GEOJSON_BUCKET"] = "out"
+os.environ["GEOJSON_KEY"] = "fire_perimeters.geojson"
+from api import geojson_proxy  # noqa: E402
+
+
+def run(requests: int, s3, event, cold: bool):
+    geojson_proxy.s3 = s3
+    geojson_proxy._cache.clear()
+    s3.requests.clear()
+    latencies, sizes = [], []
+    for _ in range(requests):
+        if cold:
+            geojson_proxy._cache.clear()
+        started = time.perf_counter()
+        response = geojson_proxy.geojsonProxyFn(event, None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(response["body"]))
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "response_bytes": sizes[-1],
+        "status": response["statusCode"],
+        "s3_requests": dict(s3.requests),
+    }
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    s3 = stubs.StubS3(latency=latency)
+    body = feature_collection(cluster_and_union(list(synthetic_hotspots(10_000))), precision=6)
+    s3.put_object(Bucket="out", Key="fire_perimeters.geojson", Body=body, ContentType="application/geo+json")
+    etag = s3.objects["out/fire_perimeters.geojson"]["ETag"]
+
+    report = {"requests": requests, "object_bytes": len(body), "s3_latency_s": latency}
+    report["uncached"] = run(requests, s3, {}, cold=True)
+    report["warm_identity"] = run(requests, s3, {}, cold=False)
+    report["warm_gzip"] = run(requests, s3, {"headers": {"Accept-Encoding": "gzip"}}, cold=False)
+    report["warm_br"] = run(requests, s3, {"headers": {"Accept-Encoding": "br"}}, cold=False)
+    report["not_modified"] = run(requests, s3, {"headers": {"If-None-Match": etag}}, cold=False)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
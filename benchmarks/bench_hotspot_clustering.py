@@ -0,0 +1,53 @@
+"""Perimeters from point hotspots: raw union vs buffer-then-union vs clustering.
+
+Run with ``python benchmarks/bench_hotspot_clustering.py [hotspots]``.
+"""
+import json
+import sys
+import time
+
+import numpy as np
+import shapely
+
+import stubs  # noqa: F401  (puts src/ on sys.path)
+from geojson_processor.clustering import DEFAULT_FOOTPRINT_M, M_PER_DEG_LAT, cluster_and_union
+
+
+def synthetic_hotspots(count: int, seed: int = 1):
+    """FIRMS-like hotspot points scattered around 60 fire fronts."""
+    rng = np.random.default_rng(seed)
+    centres = np.column_stack([rng.uniform(141, 153, 60), rng.uniform(-38, -28, 60)])
+    which = rng.integers(0, len(centres), count)
+    xy = centres[which] + rng.normal(0, 0.15, (count, 2))
+    return shapely.points(xy)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, round(time.perf_counter() - started, 2)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    points = synthetic_hotspots(count)
+    half_deg = DEFAULT_FOOTPRINT_M / 2 / M_PER_DEG_LAT
+
+    report = {"hotspots": count}
+    for name, fn in (
+        ("raw_point_union", lambda: shapely.union_all(points)),
+        ("buffer_then_union", lambda: shapely.union_all(shapely.buffer(points, half_deg, cap_style="square"))),
+        ("cluster_and_union", lambda: cluster_and_union(list(points))),
+    ):
+        result, seconds = timed(fn)
+        report[name] = {
+            "seconds": seconds,
+            "geom_type": result.geom_type,
+            "parts": len(shapely.get_parts(result)),
+            "area": round(result.area, 6),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
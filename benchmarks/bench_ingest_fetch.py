@@ -0,0 +1,49 @@
+"""Compare sequential and concurrent feed fetching against slow local feeds.
+
+Run with ``python benchmarks/bench_ingest_fetch.py``.
+"""
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from stubs import SlowJSONServer, StubFirehose, synthetic_firms
+
+from ingest_lambda import handlers
+
+ROUTES = {
+    "rfs": (0.8, {"features": [{"properties": {"id": "r1"}, "geometry": {"coordinates": [150.0, -33.0]}}]}),
+    "firms": (1.2, synthetic_firms(2000)),
+    "epn": (0.5, {"records": [{"Site": "Sydney", "Latitude": -33.86, "Longitude": 151.2}]}),
+    "hung": (30.0, {}),
+}
+
+
+def _run(server, mode, epn_route="epn"):
+    feeds = (
+        ("nsw_rfs", server.url("rfs"), handlers.normalize_nsw_rfs),
+        ("nasa_firms", server.url("firms"), handlers.normalize_nasa_firms),
+        ("nsw_epn", server.url(epn_route), handlers.normalize_nsw_epn),
+    )
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 60000)
+    with patch.object(handlers, "FEEDS", feeds), patch.object(handlers, "FETCH_MODE", mode), patch.object(
+        handlers, "FETCH_SOURCE_TIMEOUT", 3.0
+    ), patch.object(handlers, "firehose", StubFirehose()):
+        started = time.perf_counter()
+        result = handlers.handler({}, context)
+        return time.perf_counter() - started, result
+
+
+def main():
+    report = {}
+    with SlowJSONServer(ROUTES) as server:
+        for mode in ("sequential", "concurrent"):
+            elapsed, result = _run(server, mode)
+            report[mode] = {"seconds": round(elapsed, 3), **result}
+            elapsed, result = _run(server, mode, epn_route="hung")
+            report[f"{mode}_hung_source"] = {"seconds": round(elapsed, 3), **result}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
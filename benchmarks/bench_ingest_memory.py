@@ -0,0 +1,68 @@
+"""Peak Python heap of the ingest path for a synthetic 200k-feature FIRMS feed.
+
+Compares the original fully materialised path (``resp.json()`` plus list
+normalizers), the handler with whole-body parsing, and the handler with
+``STREAMING_INGEST`` enabled. Run with
+``python benchmarks/bench_ingest_memory.py [features]``.
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from stubs import SlowJSONServer, StubFirehose, synthetic_firms
+
+from ingest_lambda import handlers
+
+
+def _measure(fn):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 2), "peak_mib": round(peak / 2**20, 1), "records": result}
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    body = json.dumps(synthetic_firms(count)).encode("utf-8")
+    report = {"features": count, "body_mib": round(len(body) / 2**20, 1)}
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 300000)
+
+    with SlowJSONServer({"firms": (0.0, body)}) as server:
+        url = server.url("firms")
+        feeds = (("nasa_firms", url, handlers.iter_nasa_firms),)
+
+        def materialised():
+            data = handlers.fetch_json(url, timeout=60)
+            records = handlers.normalize_nasa_firms(data) + []
+            with patch.object(handlers, "firehose", StubFirehose()):
+                return handlers.send_to_firehose(records)
+
+        def run_handler(streaming):
+            def run():
+                with patch.object(handlers, "FEEDS", feeds), patch.object(
+                    handlers, "STREAMING_INGEST", streaming
+                ), patch.object(handlers, "INCREMENTAL_INGEST", False), patch.object(
+                    handlers, "feed_cache", handlers.FeedCache(handlers.InMemoryFeedStateStore())
+                ), patch.object(handlers, "FETCH_SOURCE_TIMEOUT", 60), patch.object(
+                    handlers, "firehose", StubFirehose()
+                ):
+                    return handlers.handler({}, context)["records"]
+
+            return run
+
+        report["materialised_lists"] = _measure(materialised)
+        report["handler_whole_body"] = _measure(run_handler(False))
+        report["handler_streaming"] = _measure(run_handler(True))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
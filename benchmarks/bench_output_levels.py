@@ -0,0 +1,36 @@
+"""Size and generation time of each output level: full, simplified bands and MVT zooms.
+
+Perimeters come from clustering synthetic hotspots, as the processor does.
+Run with ``python benchmarks/bench_output_levels.py [hotspots] [max_zoom]``.
+"""
+import json
+import sys
+import time
+
+from shapely.geometry import mapping
+
+import stubs
+from bench_hotspot_clustering import synthetic_hotspots
+from geojson_processor.clustering import cluster_and_union
+from geojson_processor.simplified import parse_zoom_bands, upload_simplified_outputs
+from geojson_processor.vector_tiles import upload_tile_pyramid
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    max_zoom = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    perimeters = cluster_and_union(list(synthetic_hotspots(count)))
+    s3 = stubs.StubS3()
+
+    started = time.perf_counter()
+    full = json.dumps({"type": "Feature", "geometry": mapping(perimeters), "properties": {}}).encode("utf-8")
+    levels = [{"level": "full", "bytes": len(full), "seconds": round(time.perf_counter() - started, 3)}]
+    levels += upload_simplified_outputs(
+        s3, "out", "fire_perimeters.geojson", perimeters, parse_zoom_bands("0-5,6-9,10-12")
+    )
+    levels += upload_tile_pyramid(s3, "out", "tiles/", perimeters, 0, max_zoom, workers=8)
+    print(json.dumps({"hotspots": count, "levels": levels}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
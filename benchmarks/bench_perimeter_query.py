@@ -0,0 +1,115 @@
+"""perimeterQueryFn viewport latency vs downloading the whole perimeter file.
+
+Synthetic hotspots are spread over 24 hourly slices from two sources and
+folded into a ``PerimeterState``; the processor's index build is timed,
+then viewport queries run against a warm container over a local S3
+stand-in with ``latency`` seconds per request.
+Run with ``python benchmarks/bench_perimeter_query.py [hotspots] [queries] [latency]``.
+"""
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+import stubs
+from bench_hotspot_clustering import synthetic_hotspots
+from geojson_processor.clustering import cluster_and_union
+from geojson_processor.geojson_output import feature_collection
+from geojson_processor.incremental import PerimeterState, update_perimeter
+from geojson_processor.spatial_index import annotate_parts, build_index
+
+os.environ["GEOJSON_BUCKET"] = "out"
+os.environ["GEOJSON_KEY"] = "fire_perimeters.geojson"
+os.environ["GEOJSON_INDEX_KEY"] = "fire_perimeters.index.ndjson"
+from api import geojson_proxy, perimeter_query  # noqa: E402
+
+NOW = 1_700_000_000
+
+
+def build_state(count: int):
+    points = synthetic_hotspots(count)
+    rng = np.random.default_rng(2)
+    hours = rng.integers(0, 24, count)
+    sources = np.where(rng.random(count) < 0.6, "VIIRS", "MODIS")
+    objects, loaded = [], {}
+    for hour in range(24):
+        key = f"raw/{hour:02d}"
+        objects.append({"Key": key, "ETag": key, "LastModified": NOW - (24 - hour) * 3600})
+        loaded[key] = {source: list(points[(hours == hour) & (sources == source)]) for source in ("VIIRS", "MODIS")}
+    state = PerimeterState(3600)
+    merged, _ = update_perimeter(
+        state, objects, lambda objs: [(o, loaded[o["Key"]]) for o in objs], now=NOW, union=cluster_and_union
+    )
+    return state, merged
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+
+    state, merged = build_state(count)
+    started = time.perf_counter()
+    parts, attributes, sources = annotate_parts(state, merged)
+    index = build_index(parts, attributes, sources, generated=NOW)
+    build_seconds = round(time.perf_counter() - started, 3)
+    full = feature_collection(merged)
+
+    s3 = stubs.StubS3(latency=latency)
+    s3.put_object(Bucket="out", Key="fire_perimeters.geojson", Body=full)
+    s3.put_object(Bucket="out", Key="fire_perimeters.index.ndjson", Body=index)
+    geojson_proxy.s3 = perimeter_query.s3 = s3
+
+    started = time.perf_counter()
+    perimeter_query.perimeterQueryFn({}, None)
+    cold_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    rng = np.random.default_rng(3)
+    viewports, sizes, matched = [], [], []
+    for _ in range(queries):
+        x, y = rng.uniform(141, 152), rng.uniform(-38, -29)
+        params = {"bbox": f"{x},{y},{x + 1},{y + 1}", "since": str(NOW - 12 * 3600)}
+        started = time.perf_counter()
+        response = perimeter_query.perimeterQueryFn({"queryStringParameters": params}, None)
+        viewports.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(response["body"]))
+        matched.append(json.loads(response["body"])["matched"])
+
+    whole = []
+    for _ in range(min(queries, 50)):
+        geojson_proxy._cache.clear()
+        started = time.perf_counter()
+        geojson_proxy.geojsonProxyFn({}, None)
+        whole.append((time.perf_counter() - started) * 1000)
+
+    report = {
+        "hotspots": count,
+        "features": len(parts),
+        "s3_latency_s": latency,
+        "index_build_s": build_seconds,
+        "index_bytes": len(index),
+        "full_geojson_bytes": len(full),
+        "cold_load_ms": cold_ms,
+        "viewport_query": {
+            **percentiles(viewports),
+            "mean_response_bytes": int(statistics.mean(sizes)),
+            "mean_matched": round(statistics.mean(matched), 1),
+        },
+        "full_download": {**percentiles(whole), "response_bytes": len(full)},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Fire-to-map latency of the resident perimeter service against the 5-minute batch task.
+
+A stubbed bucket is filled with ``--objects`` Firehose objects of
+``--hotspots`` points each and checkpointed. Then new objects land one at a
+time. For each one the benchmark records:
+
+* batch: a fresh interpreter importing ``geojson_processor.main``, plus one
+  incremental run (checkpoint load, full relist, fold, publish, save). An
+  object waits on average half the schedule period before that run starts.
+* resident: a started ``PerimeterEngine`` polling every ``--poll-seconds``.
+  It measures the time until ``/perimeters`` serves the object and until
+  the S3 output is rewritten.
+
+Run with ``python benchmarks/bench_perimeter_service.py [--objects N]
+[--hotspots N] [--updates N] [--poll-seconds S] [--latency-ms MS]``.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from stubs import ROOT, StubS3
+
+from common.record_codec import get_encoder
+from geojson_processor import main as processor
+from geojson_processor import service
+from geojson_processor.incremental import PerimeterState, S3StateStore, update_perimeter
+from geojson_processor.reader import iter_firehose_objects, iter_objects
+
+SCHEDULE_SECONDS = 300
+
+
+def _put(s3, n, hotspots):
+    encode = get_encoder("jsonl")
+    body = b"".join(
+        encode(
+            {
+                "source": "nasa_firms",
+                "id": f"{n}-{j}",
+                "latitude": -37.0 + (n % 40) * 0.2 + (j % 10) * 0.003,
+                "longitude": 142.0 + (n // 40) * 0.2 + (j // 10) * 0.003,
+                "timestamp": "t",
+                "raw": {},
+            }
+        )
+        for j in range(hotspots)
+    )
+    s3.put_object(Bucket="raw", Key=f"2026/10/18/01/obj-{n:06d}", Body=body)
+
+
+def import_seconds():
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, "src"))
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import geojson_processor.main"], env=env, check=True)
+    return time.perf_counter() - started
+
+
+def batch_run(s3):
+    """One scheduled run of ``main.main`` against the stub, minus the interpreter start."""
+    started = time.perf_counter()
+    store = S3StateStore(s3, "out", processor.STATE_KEY)
+    state = PerimeterState.from_bytes(store.load(), processor.SLICE_MINUTES * 60)
+
+    def load(objects):
+        return iter_firehose_objects(s3, "raw", "2026/", objects, processor.DOWNLOAD_WORKERS, 0, by_source=True)
+
+    union_geom, _ = update_perimeter(
+        state, iter_objects(s3, "raw", "2026/"), load, time.time(), 0, processor.perimeter_union
+    )
+    processor.publish_outputs(s3, "out", "fire_perimeters.geojson", state, union_geom)
+    store.save(state.to_bytes())
+    return time.perf_counter() - started
+
+
+def _wait(predicate, timeout=60.0):
+    started = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("service did not pick up the object")
+        time.sleep(0.005)
+    return time.perf_counter() - started
+
+
+def _summary(values):
+    values = sorted(values)
+    return {
+        "median_s": round(statistics.median(values), 3),
+        "p95_s": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        "max_s": round(values[-1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--objects", type=int, default=200)
+    parser.add_argument("--hotspots", type=int, default=100)
+    parser.add_argument("--updates", type=int, default=10)
+    parser.add_argument("--poll-seconds", type=float, default=1.0)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    processor.TILE_WORKERS = processor.PARSE_WORKERS = 0
+    service.MIN_PUBLISH_SECONDS = 0
+    s3 = StubS3()
+    for n in range(args.objects):
+        _put(s3, n, args.hotspots)
+    batch_run(s3)
+    s3.latency = args.latency_ms / 1000
+
+    imports = [import_seconds() for _ in range(3)]
+    batch = []
+    for n in range(args.objects, args.objects + 3):
+        _put(s3, n, args.hotspots)
+        batch.append(batch_run(s3))
+    cold = statistics.median(imports) + statistics.median(batch)
+
+    source = service.ListingSource(s3, "raw", "2026/")
+    source.interval = args.poll_seconds
+    engine = service.PerimeterEngine(
+        s3, source, "out", store=S3StateStore(s3, "out", processor.STATE_KEY), window_seconds=0
+    )
+    started = time.perf_counter()
+    engine.start()
+    _wait(lambda: engine.last_publish is not None)
+    startup = time.perf_counter() - started
+
+    served, published = [], []
+    for n in range(args.objects + 3, args.objects + 3 + args.updates):
+        features = engine.index
+        output = s3.objects["out/fire_perimeters.geojson"]["ETag"]
+        publishes = engine.last_publish
+        landed = time.perf_counter()
+        _put(s3, n, args.hotspots)
+        served.append(_wait(lambda: engine.index is not features))
+        _wait(lambda: engine.last_publish != publishes)
+        published.append(time.perf_counter() - landed)
+        assert s3.objects["out/fire_perimeters.geojson"]["ETag"] != output
+        # Let the next object land at a random point of the poll cycle
+        time.sleep(args.poll_seconds * ((n * 0.37) % 1))
+    engine.stop(timeout=10)
+
+    report = {
+        "objects": args.objects,
+        "hotspots_per_object": args.hotspots,
+        "s3_latency_ms": args.latency_ms,
+        "batch": {
+            "import_s": round(statistics.median(imports), 3),
+            "run_s": round(statistics.median(batch), 3),
+            "schedule_s": SCHEDULE_SECONDS,
+            # Average wait for the next cron tick plus a cold run
+            "fire_to_map_mean_s": round(SCHEDULE_SECONDS / 2 + cold, 1),
+        },
+        "resident": {
+            "poll_seconds": args.poll_seconds,
+            "startup_s": round(startup, 3),
+            "fire_to_api": _summary(served),
+            "fire_to_s3": _summary(published),
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
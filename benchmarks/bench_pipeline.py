@@ -0,0 +1,383 @@
+"""End-to-end load test of the whole alert path, fully offline.
+
+Each of ``--cycles`` cycles is one fire-season interval:
+
+1. **ingest**: ``handler`` fetches synthetic RFS incidents, ``--hotspots``
+   new FIRMS hotspots around fresh fire fronts and an hour of EPN readings
+   from local feed servers, and writes to a Firehose stand-in that delivers
+   buffered objects to S3.
+2. **processor**: ``geojson_processor.main`` folds the new objects into the
+   perimeter, publishes every output and flips the ``intersects`` flag of
+   the ``--fences`` fences it now covers.
+3. **rule_eval**: the fence table's stream records, ``--stream-batch`` per
+   invocation, become EventBridge alerts.
+4. **push_bridge**: the alerts arrive as SQS records, ``--queue-batch`` per
+   invocation, and are fanned out to ``--subscribers`` users' devices
+   through a local Expo server.
+
+S3, DynamoDB, EventBridge and Expo stand-ins add ``--latency-ms`` per
+request, the feeds ``--feed-latency-ms``. Per stage the report gives
+throughput, invocation latency percentiles and the peak RSS sampled while
+the stage ran. ``--baseline`` takes an earlier report and adds the ratios
+against it, so releases can be compared like for like. Process pools are
+off by default (``--workers``) so the RSS covers all the work.
+Run with ``python benchmarks/bench_pipeline.py [--hotspots N] [--fences N]
+[--subscribers N] [--cycles N] [--baseline report.json] > report.json``.
+"""
+import argparse
+import contextlib
+import importlib
+import json
+import math
+import os
+import resource
+import sys
+import threading
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from stubs import (
+    SlowJSONServer,
+    StubDynamoDB,
+    StubEventBridge,
+    StubExpoServer,
+    StubFirehoseDelivery,
+    StubS3,
+)
+
+import numpy as np
+
+from bench_fence_intersection import TABLE, synthetic_fences
+from common import metrics
+from geojson_processor import main as processor
+from geojson_processor.air_quality import POLLUTANTS
+from ingest_lambda import handlers
+from ingest_lambda.dedup import RecordDeduper
+
+rule_eval = importlib.import_module("lambda.rule_eval")
+push_bridge = importlib.import_module("lambda.push_bridge")
+
+RAW_BUCKET = "raw"
+OUTPUT_BUCKET = "out"
+REGIONS = 8
+STAGES = ("ingest", "processor", "rule_eval", "push_bridge")
+
+
+def _rss_bytes():
+    """Current resident set size, or the process high-water mark where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RSSSampler:
+    """Peak RSS while a block runs, sampled every ``interval`` seconds on a background thread."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes())
+
+    def __enter__(self):
+        self.peak = _rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss_bytes())
+
+
+class Stage:
+    """Invocation latencies, items handled and peak RSS of one pipeline stage across cycles."""
+
+    def __init__(self, unit):
+        self.unit = unit
+        self.latencies = []
+        self.items = 0
+        self.seconds = 0.0
+        self.peak_rss = 0
+
+    @contextlib.contextmanager
+    def measure(self):
+        with RSSSampler() as sampler:
+            yield self
+        self.peak_rss = max(self.peak_rss, sampler.peak)
+
+    def call(self, fn, *args):
+        started = time.perf_counter()
+        # Handlers log to stdout; keep it for the report
+        with contextlib.redirect_stdout(sys.stderr):
+            result = fn(*args)
+        elapsed = time.perf_counter() - started
+        self.latencies.append(elapsed)
+        self.seconds += elapsed
+        return result
+
+    def report(self):
+        latencies = sorted(self.latencies)
+        return {
+            "invocations": len(latencies),
+            self.unit: self.items,
+            "seconds": round(self.seconds, 3),
+            f"{self.unit}_per_s": round(self.items / self.seconds, 1) if self.seconds else None,
+            "latency_ms": {
+                name: round(_percentile(latencies, q) * 1000, 1) if latencies else None
+                for name, q in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+            },
+            "peak_rss_mib": round(self.peak_rss / 2**20, 1),
+        }
+
+
+def _percentile(values, q):
+    """Nearest-rank percentile of sorted ``values``."""
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+
+def rfs_feed(count):
+    features = []
+    for i in range(count):
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [141.0 + (i * 0.113) % 12.0, -38.0 + (i * 0.071) % 10.0]},
+            "properties": {"id": f"rfs-{i}", "title": f"Incident {i}", "updated": "2026-10-18T00:00:00Z"},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def firms_feed(count, cycle, seed):
+    """``count`` new hotspots scattered around fire fronts that start in ``cycle``."""
+    rng = np.random.default_rng((seed, cycle))
+    fronts = np.column_stack([rng.uniform(141, 153, 20), rng.uniform(-38, -28, 20)])
+    xy = fronts[rng.integers(0, len(fronts), count)] + rng.normal(0, 0.1, (count, 2))
+    stamp = time.gmtime()
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [round(lon, 5), round(lat, 5)]},
+            "properties": {
+                "fid": f"{cycle}-{i}",
+                "acq_date": time.strftime("%Y-%m-%d", stamp),
+                "acq_time": time.strftime("%H%M", stamp),
+                "brightness": 320.5,
+                "confidence": 80,
+            },
+        }
+        for i, (lon, lat) in enumerate(xy.tolist())
+    ]
+    return {"type": "FeatureCollection", "features": features}
+
+
+def epn_feed(sites, cycle):
+    """One hour of long-row readings, every pollutant at every site."""
+    records = []
+    for n in range(sites):
+        for pollutant in POLLUTANTS:
+            records.append({
+                "Site_Id": n,
+                "Site": f"site-{n}",
+                "Latitude": -33.0 - n * 0.02,
+                "Longitude": 151.0,
+                "Date": "2026-10-18",
+                "Hour": cycle % 24 + 1,
+                "Parameter": {"ParameterCode": pollutant},
+                "Value": (n + cycle) % 40,
+            })
+    return {"records": records}
+
+
+def seed_subscriptions(client, fence_items, subscribers, per_subscriber, devices, seed):
+    rng = np.random.default_rng(seed)
+    fence_ids = [item["fence_id"]["S"] for item in fence_items]
+    for i in range(subscribers):
+        for j in rng.choice(len(fence_ids), min(per_subscriber, len(fence_ids)), replace=False).tolist():
+            client.put_item(TableName="alerts", Item={"user_id": {"S": f"u{i}"}, "fence_id": {"S": fence_ids[j]}})
+        tokens = [f"ExponentPushToken[u{i}-{d}]" for d in range(devices)]
+        client.put_item(TableName="devices", Item={"user_id": {"S": f"u{i}"}, "device_tokens": {"SS": tokens}})
+
+
+def sqs_records(entries, start):
+    """EventBridge entries as delivered by an SQS target."""
+    return [
+        {
+            "messageId": f"m{start + n}",
+            "eventSource": "aws:sqs",
+            "body": json.dumps({"source": e["Source"], "detail-type": e["DetailType"], "detail": json.loads(e["Detail"])}),
+        }
+        for n, e in enumerate(entries)
+    ]
+
+
+def _ratio(new, old):
+    return round(new / old, 2) if new is not None and old else None
+
+
+def compare(report, baseline):
+    """Current over baseline for each stage's throughput, p99 latency and peak RSS."""
+    ratios = {}
+    for name, stage in report["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before:
+            continue
+        rate = next(key for key in stage if key.endswith("_per_s"))
+        ratios[name] = {
+            rate: _ratio(stage[rate], before.get(rate)),
+            "p99_ms": _ratio(stage["latency_ms"]["p99"], before["latency_ms"]["p99"]),
+            "peak_rss_mib": _ratio(stage["peak_rss_mib"], before["peak_rss_mib"]),
+        }
+    return ratios
+
+
+def run(args):
+    latency = args.latency_ms / 1000
+    feed_delay = args.feed_latency_ms / 1000
+    s3 = StubS3(latency=latency)
+    fences = StubDynamoDB(stream_tables=(TABLE,))
+    fence_items = synthetic_fences(args.fences, seed=args.seed)
+    for n, item in enumerate(fence_items):
+        item["region"] = {"S": f"region-{n % REGIONS}"}
+        fences.put_item(TableName=TABLE, Item=item)
+    fences.streams[TABLE].clear()
+    subscriptions = StubDynamoDB()
+    seed_subscriptions(subscriptions, fence_items, args.subscribers, args.fences_per_subscriber, args.devices, args.seed)
+    for client in (fences, subscriptions):
+        client.requests.clear()
+        client.latency = latency
+    eventbridge = StubEventBridge(latency=latency)
+    firehose = StubFirehoseDelivery(s3, RAW_BUCKET, buffer_bytes=args.buffer_mib * 2**20)
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 300000)
+
+    stages = {
+        "ingest": Stage("records"),
+        "processor": Stage("records"),
+        "rule_eval": Stage("stream_records"),
+        "push_bridge": Stage("messages"),
+    }
+    totals = {"firehose_objects": 0, "transitions": 0, "events": 0, "messages_delivered": 0}
+    fires = metrics.counter("fires_processed_total", "")
+    routes = {"rfs": (feed_delay, json.dumps(rfs_feed(args.incidents)).encode())}
+    env = {"FIREHOSE_BUCKET": RAW_BUCKET, "FIREHOSE_PREFIX": "", "OUTPUT_BUCKET": OUTPUT_BUCKET}
+
+    with SlowJSONServer(routes) as feeds, StubExpoServer(latency=latency) as expo, contextlib.ExitStack() as stack:
+        feed_list = (
+            ("nsw_rfs", feeds.url("rfs"), handlers.iter_nsw_rfs),
+            ("nasa_firms", feeds.url("firms"), handlers.iter_nasa_firms),
+            ("nsw_epn", feeds.url("epn"), handlers.iter_nsw_epn),
+        )
+        for target, name, value in (
+            (handlers, "FEEDS", feed_list),
+            (handlers, "firehose", firehose),
+            (handlers, "deduper", RecordDeduper()),
+            (processor, "make_s3_client", lambda workers=None: s3),
+            (processor, "make_dynamodb_client", lambda workers=None: fences),
+            (processor, "FENCES_TABLE", TABLE),
+            (processor, "PARSE_WORKERS", args.workers),
+            (processor, "TILE_WORKERS", args.workers),
+            (rule_eval, "eventbridge", eventbridge),
+            (push_bridge, "EXPO_URL", expo.url),
+            (push_bridge, "_client", None),
+            (push_bridge, "dynamodb", subscriptions),
+            (push_bridge, "SUBSCRIPTIONS_TABLE", "alerts"),
+            (push_bridge, "DEVICES_TABLE", "devices"),
+        ):
+            stack.enter_context(patch.object(target, name, value))
+        stack.enter_context(patch.dict(os.environ, env))
+        rule_eval._local_windows.clear()
+        push_bridge._device_cache.clear()
+
+        stream_seen = published_seen = 0
+        for cycle in range(args.cycles):
+            feeds.routes["firms"] = (feed_delay, json.dumps(firms_feed(args.hotspots, cycle, args.seed)).encode())
+            feeds.routes["epn"] = (feed_delay, json.dumps(epn_feed(args.sites, cycle)).encode())
+
+            with stages["ingest"].measure() as stage:
+                result = stage.call(handlers.handler, {}, context)
+                # The buffer interval elapses before the processor runs
+                totals["firehose_objects"] = firehose.flush()
+                stage.items += result["records"]
+
+            with stages["processor"].measure() as stage:
+                before = fires.value()
+                stage.call(processor.main)
+                stage.items += int(fires.value() - before)
+
+            records = fences.streams[TABLE][stream_seen:]
+            stream_seen += len(records)
+            with stages["rule_eval"].measure() as stage:
+                for start in range(0, len(records), args.stream_batch):
+                    result = stage.call(rule_eval.lambda_handler, {"Records": records[start : start + args.stream_batch]}, None)
+                    totals["transitions"] += result["transitions"]
+                stage.items += len(records)
+
+            entries = eventbridge.published[published_seen:]
+            messages = sqs_records(entries, published_seen)
+            published_seen += len(entries)
+            totals["events"] += len(entries)
+            with stages["push_bridge"].measure() as stage:
+                delivered = len(expo.delivered)
+                for start in range(0, len(messages), args.queue_batch):
+                    stage.call(push_bridge.lambda_handler, {"Records": messages[start : start + args.queue_batch]}, None)
+                stage.items += len(expo.delivered) - delivered
+                totals["messages_delivered"] += len(expo.delivered) - delivered
+                # Keep the stand-in's log from counting towards the next cycle's RSS
+                expo.delivered.clear()
+
+    totals["requests"] = {
+        "s3": dict(s3.requests),
+        "fences_dynamodb": dict(fences.requests),
+        "subscriptions_dynamodb": dict(subscriptions.requests),
+        "eventbridge": eventbridge.calls,
+        "expo": expo.requests,
+    }
+    return {name: stages[name].report() for name in STAGES}, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--hotspots", type=int, default=20000, help="new FIRMS hotspots per cycle")
+    parser.add_argument("--fences", type=int, default=20000)
+    parser.add_argument("--subscribers", type=int, default=5000)
+    parser.add_argument("--fences-per-subscriber", type=int, default=3)
+    parser.add_argument("--devices", type=int, default=1, help="device tokens per subscriber")
+    parser.add_argument("--incidents", type=int, default=200, help="RFS major incidents")
+    parser.add_argument("--sites", type=int, default=50, help="EPN stations")
+    parser.add_argument("--cycles", type=int, default=4)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="per request to S3, DynamoDB, EventBridge and Expo")
+    parser.add_argument("--feed-latency-ms", type=float, default=200.0)
+    parser.add_argument("--buffer-mib", type=float, default=5.0, help="Firehose buffer size")
+    parser.add_argument("--stream-batch", type=int, default=500, help="fence stream records per rule_eval invocation")
+    parser.add_argument("--queue-batch", type=int, default=100, help="SQS records per push_bridge invocation")
+    parser.add_argument("--workers", type=int, default=0, help="processor parse and tile pool sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    args = parser.parse_args()
+
+    config = {name: value for name, value in vars(args).items() if name != "baseline"}
+    started = time.perf_counter()
+    stages, totals = run(args)
+    report = {
+        "config": config,
+        "python": sys.version.split()[0],
+        "seconds": round(time.perf_counter() - started, 1),
+        "stages": stages,
+        "totals": totals,
+    }
+    if args.baseline:
+        with open(args.baseline) as fh:
+            report["versus_baseline"] = compare(report, json.load(fh))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""push_bridge delivery throughput: one request per message vs. batched keep-alive.
+
+An SQS batch of alert records, each carrying several device tokens, is
+delivered through a local Expo stand-in with ``latency`` seconds per
+request. The baseline posts every message on its own fresh connection,
+as push_bridge did before batching.
+Run with ``python benchmarks/bench_push_bridge.py [records] [tokens_per_record] [latency]``.
+"""
+import importlib
+import json
+import sys
+import time
+import urllib.request
+
+import stubs
+
+push_bridge = importlib.import_module("lambda.push_bridge")
+
+
+def batch(records: int, tokens: int):
+    return {
+        "Records": [
+            {
+                "messageId": f"m{i}",
+                "eventSource": "aws:sqs",
+                "body": json.dumps({"detail": {"fence_id": f"f{i}", "device_tokens": [f"t{i}-{j}" for j in range(tokens)]}}),
+            }
+            for i in range(records)
+        ]
+    }
+
+
+def one_per_request(event, url):
+    sent = 0
+    for record in event["Records"]:
+        detail = push_bridge._record_detail(record)
+        for device_token in push_bridge._device_tokens(detail):
+            req = urllib.request.Request(
+                url,
+                data=json.dumps(push_bridge._message(detail, device_token)).encode("utf-8"),
+                headers={"Content-Type": "application/json", "Connection": "close"},
+            )
+            with urllib.request.urlopen(req) as resp:
+                sent += resp.status == 200
+    return sent
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    tokens = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.005
+    event = batch(records, tokens)
+    report = {"records": records, "messages": records * tokens, "latency_s": latency, "runs": []}
+
+    with stubs.StubExpoServer(latency=latency) as server:
+        started = time.perf_counter()
+        sent = one_per_request(event, server.url)
+        elapsed = time.perf_counter() - started
+        report["runs"].append(
+            {
+                "mode": "one_per_request",
+                "seconds": round(elapsed, 3),
+                "messages_per_s": round(sent / elapsed),
+                "requests": server.requests,
+                "connections": server.connections,
+            }
+        )
+
+    for concurrency in (1, 4):
+        with stubs.StubExpoServer(latency=latency) as server:
+            push_bridge.EXPO_URL = server.url
+            push_bridge.PUSH_CONCURRENCY = concurrency
+            push_bridge._client = None
+            started = time.perf_counter()
+            result = push_bridge.lambda_handler(event, None)
+            elapsed = time.perf_counter() - started
+            report["runs"].append(
+                {
+                    "mode": f"batched_concurrency_{concurrency}",
+                    "seconds": round(elapsed, 3),
+                    "messages_per_s": round(result["sent"] / elapsed),
+                    "requests": server.requests,
+                    "connections": server.connections,
+                }
+            )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""push_bridge fan-out of one fence alert to every subscribed device.
+
+A fence with ``subscribers`` users (``devices`` tokens each) intersects.
+The baseline resolves the whole audience up front, one GetItem per user,
+and then sends; fan-out streams BatchGetItem chunks into the sender, cold
+and then with a warm device cache. DynamoDB and Expo stand-ins add
+``latency`` seconds per request.
+Run with ``python benchmarks/bench_push_fanout.py [subscribers] [devices] [latency]``.
+"""
+import importlib
+import json
+import sys
+import time
+import tracemalloc
+
+import stubs
+
+push_bridge = importlib.import_module("lambda.push_bridge")
+
+
+class Counter:
+    """Stands in for the Expo stand-in's delivered list so it does not count towards peak memory."""
+
+    def __init__(self):
+        self.count = 0
+
+    def append(self, message):
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+
+def seed(client, subscribers: int, devices: int):
+    for i in range(subscribers):
+        client.put_item(TableName="alerts", Item={"user_id": {"S": f"u{i}"}, "fence_id": {"S": "f1"}})
+        tokens = [f"ExponentPushToken[u{i}-{d}]" for d in range(devices)]
+        client.put_item(TableName="devices", Item={"user_id": {"S": f"u{i}"}, "device_tokens": {"SS": tokens}})
+
+
+def resolve_all_then_send(client, detail):
+    messages = []
+    for page in push_bridge._subscribers(detail["fence_id"]):
+        for user_id in page:
+            item = client.get_item(TableName="devices", Key={"user_id": {"S": user_id}}).get("Item", {})
+            for device_token in item.get("device_tokens", {}).get("SS", []):
+                messages.append(((0, device_token), push_bridge._message(detail, device_token)))
+    outcomes = push_bridge.send_messages(messages)
+    return {"sent": sum(outcome == "ok" for outcome in outcomes.values())}
+
+
+def measure(name, run, server, client):
+    requests_before = dict(client.requests)
+    delivered_before = len(server.delivered)
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = run()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    calls = {op: count - requests_before.get(op, 0) for op, count in client.requests.items()}
+    return {
+        "mode": name,
+        "seconds": round(elapsed, 3),
+        "deliveries_per_s": round(result["sent"] / elapsed),
+        "delivered": len(server.delivered) - delivered_before,
+        "peak_traced_mb": round(peak / 1e6, 1),
+        "dynamodb_calls": {op: count for op, count in calls.items() if count and op != "PutItem"},
+    }
+
+
+def main():
+    subscribers = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    devices = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    latency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.005
+    client = stubs.StubDynamoDB()
+    seed(client, subscribers, devices)
+    client.latency = latency
+    push_bridge.dynamodb = client
+    push_bridge.SUBSCRIPTIONS_TABLE = "alerts"
+    push_bridge.DEVICES_TABLE = "devices"
+    detail = {"fence_id": "f1", "region": "nsw"}
+    report = {"subscribers": subscribers, "devices_per_user": devices, "latency_s": latency, "runs": []}
+    with stubs.StubExpoServer(latency=latency) as server:
+        push_bridge.EXPO_URL = server.url
+        server.delivered = Counter()
+        report["runs"].append(measure("resolve_all_then_send", lambda: resolve_all_then_send(client, detail), server, client))
+        push_bridge._device_cache.clear()
+        report["runs"].append(measure("fanout_cold", lambda: push_bridge.lambda_handler({"detail": detail}, None), server, client))
+        report["runs"].append(measure("fanout_warm", lambda: push_bridge.lambda_handler({"detail": detail}, None), server, client))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
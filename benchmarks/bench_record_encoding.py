@@ -0,0 +1,39 @@
+"""Size and encode/decode throughput of the Firehose record encodings.
+
+Run with ``python benchmarks/bench_record_encoding.py [records]``.
+"""
+import gzip
+import json
+import sys
+import time
+
+from stubs import synthetic_firms
+
+from common.record_codec import decode_records, get_encoder
+from ingest_lambda.handlers import normalize_nasa_firms
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    records = normalize_nasa_firms(synthetic_firms(count))
+    report = {"records": count}
+    for encoding, include_raw in (("jsonl", True), ("jsonl", False), ("msgpack", True), ("msgpack", False)):
+        encode = get_encoder(encoding, include_raw=include_raw)
+        started = time.perf_counter()
+        body = b"".join(encode(rec) for rec in records)
+        encode_s = time.perf_counter() - started
+        started = time.perf_counter()
+        decoded = sum(1 for _ in decode_records(body))
+        decode_s = time.perf_counter() - started
+        assert decoded == count
+        report[f"{encoding}{'' if include_raw else '_no_raw'}"] = {
+            "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, 6)),
+            "encode_records_per_s": int(count / encode_s),
+            "decode_records_per_s": int(count / decode_s),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""rule_eval EventBridge publishing throughput by PutEvents concurrency.
+
+A stream batch of intersecting fences is published through a stand-in
+EventBridge client with ``latency`` seconds per call and ``failure_rate``
+throttled entries, which are retried.
+Run with ``python benchmarks/bench_rule_eval_publish.py [records] [latency] [failure_rate]``.
+"""
+import importlib
+import json
+import sys
+import time
+
+import stubs
+
+rule_eval = importlib.import_module("lambda.rule_eval")
+
+
+def stream(count: int):
+    return {
+        "Records": [
+            {
+                "eventName": "MODIFY",
+                "dynamodb": {
+                    "SequenceNumber": str(i),
+                    "NewImage": {"intersects": {"BOOL": True}, "region": {"S": "nsw"}, "fence_id": {"S": f"f{i}"}},
+                },
+            }
+            for i in range(count)
+        ]
+    }
+
+
+def main():
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    failure_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    event = stream(records)
+    report = {"records": records, "latency_s": latency, "failure_rate": failure_rate, "runs": []}
+    for concurrency in (1, 4, 8, 16):
+        rule_eval.PUBLISH_CONCURRENCY = concurrency
+        stub = stubs.StubEventBridge(latency=latency, failure_rate=failure_rate)
+        rule_eval.eventbridge = stub
+        started = time.perf_counter()
+        result = rule_eval.lambda_handler(event, None)
+        elapsed = time.perf_counter() - started
+        report["runs"].append(
+            {
+                "concurrency": concurrency,
+                "seconds": round(elapsed, 3),
+                "events_per_s": round(result["events_published"] / elapsed),
+                "put_events_calls": stub.calls,
+                "published": result["events_published"],
+                "batch_item_failures": len(result["batchItemFailures"]),
+            }
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
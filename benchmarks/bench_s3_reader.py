@@ -0,0 +1,66 @@
+"""Serial vs parallel reading of Firehose objects from a stubbed S3 bucket.
+
+The stub holds 10k objects and sleeps ``--latency`` per request to mimic
+S3 round trips. Run with
+``python benchmarks/bench_s3_reader.py [objects] [latency_seconds]``.
+"""
+import json
+import os
+import sys
+import time
+
+from stubs import StubS3
+
+from common.record_codec import get_encoder
+from geojson_processor import reader
+
+
+def _populate(s3, count, per_object=20):
+    encode = get_encoder("jsonl")
+    for i in range(count):
+        body = b"".join(
+            encode({"source": "nasa_firms", "id": f"{i}-{j}", "latitude": -35.0 + (i % 100) / 50, "longitude": 145.0 + j / 10, "timestamp": "t", "raw": {"frp": 1.0}})
+            for j in range(per_object)
+        )
+        s3.put_object(Bucket="raw", Key=f"2024/12/01/{i:06d}", Body=body)
+
+
+def _serial(s3):
+    # The original loop, but paginated so it sees every object
+    count = 0
+    for obj in reader.iter_objects(s3, "raw", "2024/"):
+        body = s3.get_object(Bucket="raw", Key=obj["Key"])["Body"].read()
+        count += len(reader.parse_object(body))
+    return count
+
+
+def _parallel(s3, download_workers, parse_workers):
+    return sum(
+        len(geoms)
+        for _, geoms in reader.iter_firehose_objects(
+            s3, "raw", "2024/", download_workers=download_workers, parse_workers=parse_workers
+        )
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.005
+    s3 = StubS3()
+    _populate(s3, count)
+    s3.latency = latency
+    report = {"objects": count, "latency_s": latency, "cpus": os.cpu_count()}
+    runs = {
+        "serial": lambda: _serial(s3),
+        "threads_16": lambda: _parallel(s3, 16, 0),
+        "threads_32_procs_auto": lambda: _parallel(s3, 32, max(1, (os.cpu_count() or 2) - 1)),
+    }
+    for name, fn in runs.items():
+        started = time.perf_counter()
+        geometries = fn()
+        report[name] = {"seconds": round(time.perf_counter() - started, 2), "geometries": geometries}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
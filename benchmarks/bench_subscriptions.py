@@ -0,0 +1,111 @@
+"""Load test for council onboarding and area lookups on the alerts table.
+
+``fences`` fences scattered around Sydney are subscribed one ``PutItem``
+per API call, then through one ``batchSubscribeFn`` request, against a
+local DynamoDB stand-in with ``latency`` seconds per request and
+``unprocessed_rate`` of batch writes handed back. Users watching one
+geohash cell are then found by scanning versus one cell-index query,
+and everything is removed with ``batchUnsubscribeFn``.
+Run with ``python benchmarks/bench_subscriptions.py [fences] [latency] [unprocessed_rate]``.
+"""
+import json
+import random
+import sys
+import time
+
+import stubs  # noqa: F401  (puts src/ on the path)
+
+from api import subscribe, unsubscribe
+
+
+def event(body, user="council-1"):
+    return {"requestContext": {"authorizer": {"claims": {"sub": user}}}, "body": json.dumps(body)}
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, round(time.perf_counter() - started, 3)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.002
+    unprocessed_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    rng = random.Random(0)
+    fences = [
+        {"fence_id": f"f{i}", "latitude": -33.87 + rng.uniform(-0.6, 0.6), "longitude": 151.21 + rng.uniform(-0.6, 0.6), "radius_m": 2000}
+        for i in range(count)
+    ]
+    client = stubs.StubDynamoDB(latency=latency, unprocessed_rate=unprocessed_rate)
+    subscribe.client = unsubscribe.client = client
+    subscribe.os.environ["ALERTS_TABLE"] = "alerts"
+    report = {"fences": count, "latency_s": latency, "unprocessed_rate": unprocessed_rate}
+
+    def one_call_each():
+        for fence in fences:
+            item = subscribe._item("council-0", json.loads(json.dumps(fence), parse_float=subscribe.Decimal))
+            client.put_item(TableName="alerts", Item=subscribe._serialize(item))
+
+    _, seconds = timed(one_call_each)
+    report["put_item_per_fence"] = {"seconds": seconds, "requests": client.requests.get("PutItem", 0)}
+
+    response, seconds = timed(lambda: subscribe.batchSubscribeFn(event({"fences": fences}), None))
+    report["batch_subscribe"] = {
+        "seconds": seconds,
+        "status": response["statusCode"],
+        "written": json.loads(response["body"])["written"],
+        "batch_write_calls": client.requests["BatchWriteItem"],
+        "batch_get_calls": client.requests["BatchGetItem"],
+    }
+
+    cell = subscribe.geohash(-33.87, 151.21)[: subscribe.CELL_PRECISION]
+
+    def scan_for_cell():
+        found, read, kwargs = 0, 0, {"TableName": "alerts"}
+        while True:
+            page = client.scan(**kwargs)
+            read += page["Count"]
+            found += sum(item.get("cell", {}).get("S") == cell for item in page["Items"])
+            if "LastEvaluatedKey" not in page:
+                return found, read
+            kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+    def query_cell():
+        found, kwargs = 0, {
+            "TableName": "alerts",
+            "IndexName": "cell-index",
+            "KeyConditionExpression": "cell = :cell",
+            "ExpressionAttributeValues": {":cell": {"S": cell}},
+        }
+        while True:
+            page = client.query(**kwargs)
+            found += page["Count"]
+            if "LastEvaluatedKey" not in page:
+                return found, found
+            kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+    scans = client.requests.get("Scan", 0)
+    (found, read), seconds = timed(scan_for_cell)
+    report["area_lookup_scan"] = {
+        "seconds": seconds, "matches": found, "items_read": read, "requests": client.requests["Scan"] - scans
+    }
+    (found, read), seconds = timed(query_cell)
+    report["area_lookup_query"] = {
+        "seconds": seconds, "matches": found, "items_read": read, "requests": client.requests["Query"]
+    }
+
+    writes = client.requests["BatchWriteItem"]
+    response, seconds = timed(
+        lambda: unsubscribe.batchUnsubscribeFn(event({"fence_ids": [f["fence_id"] for f in fences]}), None)
+    )
+    report["batch_unsubscribe"] = {
+        "seconds": seconds,
+        "deleted": json.loads(response["body"])["deleted"],
+        "batch_write_calls": client.requests["BatchWriteItem"] - writes,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Wall time and peak RSS of ``unary_union`` vs the tiled union.
+
+Each method runs in its own subprocess so ``ru_maxrss`` is per method.
+Run with ``python benchmarks/bench_tiled_union.py [hotspots] [workers]``.
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import shapely
+
+import stubs  # noqa: F401  (puts src/ on sys.path)
+from geojson_processor.tiling import tiled_union
+
+
+def synthetic_footprints(count: int, seed: int = 1):
+    """FIRMS-density hotspot footprints: ~1 km squares scattered around 60 fire fronts."""
+    rng = np.random.default_rng(seed)
+    centres = np.column_stack([rng.uniform(141, 153, 60), rng.uniform(-38, -28, 60)])
+    which = rng.integers(0, len(centres), count)
+    xy = centres[which] + rng.normal(0, 0.15, (count, 2))
+    half = 0.005
+    return shapely.box(xy[:, 0] - half, xy[:, 1] - half, xy[:, 0] + half, xy[:, 1] + half)
+
+
+def run(method: str, count: int, workers: int):
+    geoms = synthetic_footprints(count)
+    started = time.perf_counter()
+    if method == "unary_union":
+        result = shapely.union_all(geoms)
+    else:
+        result = tiled_union(list(geoms), 0.5, workers)
+    elapsed = time.perf_counter() - started
+    rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_kib = max(rss_kib, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return {
+        "seconds": round(elapsed, 2),
+        "peak_rss_mib": round(rss_kib / 1024, 1),
+        "area": round(result.area, 6),
+        "parts": len(shapely.get_parts(result)),
+    }
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))))
+        return
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else max(1, (os.cpu_count() or 2) - 1)
+    report = {"hotspots": count, "workers": workers, "cpus": os.cpu_count()}
+    for method, w in (("unary_union", 0), ("tiled_inline", 0), ("tiled_pool", workers)):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", method, str(count), str(w)],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        report[method] = json.loads(out.stdout)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
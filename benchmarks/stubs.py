@@ -0,0 +1,738 @@
+"""Local stand-ins for the upstream services used by the benchmarks."""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+for path in (ROOT, os.path.join(ROOT, "src")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+
+class SlowJSONServer:
+    """Serve fixed JSON documents on ``/<name>`` after a configurable delay.
+
+    ``routes`` maps a path name to ``(delay_seconds, payload)``; ``bytes``
+    payloads are sent as-is so large bodies need not be re-encoded per request.
+    """
+
+    def __init__(self, routes: Dict[str, Tuple[float, Any]]):
+        self.routes = routes
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                name = self.path.lstrip("/").split("?")[0]
+                if name not in server.routes:
+                    self.send_error(404)
+                    return
+                delay, payload = server.routes[name]
+                time.sleep(delay)
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    def url(self, name: str) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/{name}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class StubFirehose:
+    """Minimal Firehose client that accepts every record."""
+
+    def __init__(self):
+        self.calls = 0
+        self.records = 0
+        self.bytes = 0
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        self.calls += 1
+        self.records += len(Records)
+        self.bytes += sum(len(r["Data"]) for r in Records)
+        return {"FailedPutCount": 0, "RequestResponses": [{"RecordId": str(i)} for i in range(len(Records))]}
+
+
+class StubFirehoseDelivery(StubFirehose):
+    """Firehose client that delivers to an S3 stand-in the way a delivery stream does.
+
+    Record data is concatenated as-is into a buffer that is written as one
+    object under ``<prefix>YYYY/MM/DD/HH/`` once it reaches ``buffer_bytes``;
+    ``flush()`` stands in for the buffer interval elapsing.
+    """
+
+    def __init__(self, s3, bucket: str, prefix: str = "", buffer_bytes: int = 5 * 2**20):
+        super().__init__()
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+        self.buffer_bytes = buffer_bytes
+        self.objects = 0
+        self._stream = "bushfire_raw"
+        self._buffer: list = []
+        self._buffered = 0
+        self._lock = threading.Lock()
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        with self._lock:
+            response = super().put_record_batch(DeliveryStreamName, Records)
+            self._stream = DeliveryStreamName
+            self._buffer.extend(r["Data"] for r in Records)
+            self._buffered += sum(len(r["Data"]) for r in Records)
+            if self._buffered >= self.buffer_bytes:
+                self._deliver()
+        return response
+
+    def flush(self) -> int:
+        """Deliver whatever is buffered; returns the number of objects written so far."""
+        with self._lock:
+            if self._buffer:
+                self._deliver()
+            return self.objects
+
+    def _deliver(self) -> None:
+        now = time.gmtime()
+        self.objects += 1
+        key = (
+            f"{self.prefix}{time.strftime('%Y/%m/%d/%H', now)}/"
+            f"{self._stream}-1-{time.strftime('%Y-%m-%d-%H-%M-%S', now)}-{self.objects:08d}"
+        )
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=b"".join(self._buffer))
+        self._buffer, self._buffered = [], 0
+
+
+def synthetic_firms(count: int) -> Dict[str, Any]:
+    """FIRMS-shaped GeoJSON with ``count`` point hotspots over south-east Australia."""
+    features = []
+    for i in range(count):
+        lon = 141.0 + (i * 0.0137) % 12.0
+        lat = -38.0 + (i * 0.0071) % 9.0
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [round(lon, 5), round(lat, 5)]},
+                "properties": {
+                    "fid": str(i),
+                    "acq_date": "2024-12-01",
+                    "acq_time": f"{i % 24:02d}{i % 60:02d}",
+                    "brightness": 320.5,
+                    "confidence": 80,
+                },
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+class StubS3:
+    """Thread-safe in-memory S3 client covering the calls the pipeline makes.
+
+    ``latency`` seconds are slept per request to mimic network round trips.
+    Queues passed to ``notify`` receive S3 event notifications for every
+    object created or deleted, like a bucket notification to SQS.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        import hashlib
+
+        self._md5 = hashlib.md5
+        self.latency = latency
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.queues = []
+
+    def notify(self, queue: "StubSQS") -> None:
+        self.queues.append(queue)
+
+    def _event(self, name: str, bucket: str, key: str, obj: Dict[str, Any] = None) -> None:
+        from datetime import datetime, timezone
+        from urllib.parse import quote_plus
+
+        detail = {"key": quote_plus(key)}
+        if obj is not None:
+            detail.update({"eTag": obj["ETag"].strip('"'), "size": len(obj["Body"])})
+        record = {
+            "eventSource": "aws:s3",
+            "eventName": name,
+            "eventTime": datetime.fromtimestamp(obj["LastModified"] if obj else time.time(), timezone.utc).isoformat(),
+            "s3": {"bucket": {"name": bucket}, "object": detail},
+        }
+        for queue in self.queues:
+            queue.send_message(QueueUrl=queue.url, MessageBody=json.dumps({"Records": [record]}))
+
+    def _tick(self, op: str) -> None:
+        with self.lock:
+            self.requests[op] = self.requests.get(op, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _missing(self, op: str):
+        from botocore.exceptions import ClientError
+
+        return ClientError({"Error": {"Code": "NoSuchKey", "Message": "missing"}}, op)
+
+    def put_object(self, Bucket, Key, Body=b"", **kwargs):
+        self._tick("PutObject")
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        elif hasattr(Body, "read"):
+            Body = Body.read()
+        etag = f'"{self._md5(Body).hexdigest()}"'
+        obj = {"Body": bytes(Body), "ETag": etag, "LastModified": time.time(), "Metadata": kwargs}
+        with self.lock:
+            self.objects[f"{Bucket}/{Key}"] = obj
+        self._event("ObjectCreated:Put", Bucket, Key, obj)
+        return {"ETag": etag}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, **kwargs):
+        self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj.read(), **(ExtraArgs or {}))
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None, **kwargs):
+        with open(Filename, "rb") as fh:
+            self.upload_fileobj(fh, Bucket, Key, ExtraArgs)
+
+    def get_object(self, Bucket, Key, **kwargs):
+        import io
+
+        self._tick("GetObject")
+        with self.lock:
+            obj = self.objects.get(f"{Bucket}/{Key}")
+        if obj is None:
+            raise self._missing("GetObject")
+        if kwargs.get("IfMatch") not in (None, obj["ETag"]):
+            from botocore.exceptions import ClientError
+
+            raise ClientError({"Error": {"Code": "PreconditionFailed", "Message": "ETag changed"}}, "GetObject")
+        return {
+            "Body": io.BytesIO(obj["Body"]),
+            "ETag": obj["ETag"],
+            "ContentLength": len(obj["Body"]),
+            **obj["Metadata"],
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._tick("HeadObject")
+        with self.lock:
+            obj = self.objects.get(f"{Bucket}/{Key}")
+        if obj is None:
+            from botocore.exceptions import ClientError
+
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ETag": obj["ETag"], "ContentLength": len(obj["Body"]), **obj["Metadata"]}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._tick("DeleteObject")
+        with self.lock:
+            found = self.objects.pop(f"{Bucket}/{Key}", None)
+        if found is not None:
+            self._event("ObjectRemoved:Delete", Bucket, Key)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._tick("DeleteObjects")
+        with self.lock:
+            for item in Delete["Objects"]:
+                self.objects.pop(f"{Bucket}/{item['Key']}", None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000, StartAfter="", **kwargs):
+        self._tick("ListObjectsV2")
+        head = f"{Bucket}/{Prefix}"
+        after = f"{Bucket}/{StartAfter}"
+        with self.lock:
+            keys = sorted(k for k in self.objects if k.startswith(head) and (not StartAfter or k > after))
+            start = int(ContinuationToken or 0)
+            page = keys[start : start + MaxKeys]
+            contents = [
+                {
+                    "Key": k[len(Bucket) + 1 :],
+                    "ETag": self.objects[k]["ETag"],
+                    "Size": len(self.objects[k]["Body"]),
+                    "LastModified": self.objects[k]["LastModified"],
+                }
+                for k in page
+            ]
+        resp = {"Contents": contents, "KeyCount": len(contents), "IsTruncated": start + MaxKeys < len(keys)}
+        if resp["IsTruncated"]:
+            resp["NextContinuationToken"] = str(start + MaxKeys)
+        return resp
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        client = self
+
+        class _Paginator:
+            def paginate(self, **kwargs):
+                token = None
+                while True:
+                    resp = client.list_objects_v2(ContinuationToken=token, **kwargs)
+                    yield resp
+                    token = resp.get("NextContinuationToken")
+                    if not token:
+                        return
+
+        return _Paginator()
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn=3600):
+        return f"https://stub-s3.local/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class StubSQS:
+    """Thread-safe in-memory SQS queue with visibility timeouts.
+
+    Received messages stay invisible for ``visibility`` seconds and come back
+    unless deleted, so a consumer that crashes before deleting loses nothing.
+    """
+
+    def __init__(self, url: str = "https://sqs.local/queue", visibility: float = 30.0):
+        self.url = url
+        self.visibility = visibility
+        self.messages: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self._ids = 0
+
+    def _tick(self, op: str) -> None:
+        with self.lock:
+            self.requests[op] = self.requests.get(op, 0) + 1
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        self._tick("SendMessage")
+        with self.lock:
+            self._ids += 1
+            message_id = f"msg-{self._ids}"
+            self.messages[message_id] = {"Body": MessageBody, "visible_at": 0.0, "receives": 0}
+        return {"MessageId": message_id}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages=1, WaitTimeSeconds=0, VisibilityTimeout=None, **kwargs):
+        self._tick("ReceiveMessage")
+        deadline = time.monotonic() + WaitTimeSeconds
+        while True:
+            now = time.monotonic()
+            with self.lock:
+                ready = [mid for mid, m in self.messages.items() if m["visible_at"] <= now][:MaxNumberOfMessages]
+                out = []
+                for mid in ready:
+                    message = self.messages[mid]
+                    message["visible_at"] = now + (self.visibility if VisibilityTimeout is None else VisibilityTimeout)
+                    message["receives"] += 1
+                    out.append({"MessageId": mid, "ReceiptHandle": mid, "Body": message["Body"]})
+            if out or now >= deadline:
+                return {"Messages": out} if out else {}
+            time.sleep(min(0.01, max(0.0, deadline - now)))
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        self._tick("DeleteMessageBatch")
+        assert len(Entries) <= 10, "DeleteMessageBatch takes at most 10 entries"
+        with self.lock:
+            for entry in Entries:
+                self.messages.pop(entry["ReceiptHandle"], None)
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries], "Failed": []}
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.messages)
+
+
+class StubDynamoDB:
+    """Thread-safe in-memory low-level DynamoDB client for the calls the pipeline makes.
+
+    Items are kept in attribute-value form keyed by ``key_attributes``.
+    ``unprocessed_rate`` of each BatchWriteItem's requests (and
+    BatchGetItem's keys) are handed back as ``UnprocessedItems``
+    (``UnprocessedKeys``), and ``throttle_rate`` of UpdateItem calls fail
+    with ProvisionedThroughputExceededException, to exercise retries; ``latency`` seconds are slept
+    per request. Queries on a secondary index match ``IndexName``'s hash
+    attribute, named by the ``<attribute>-index`` convention. Writes to
+    ``stream_tables`` are appended to ``streams[table]`` as
+    ``NEW_AND_OLD_IMAGES`` stream records.
+    """
+
+    def __init__(self, key_attributes=("user_id", "fence_id"), latency: float = 0.0, unprocessed_rate: float = 0.0,
+                 stream_tables=(), throttle_rate: float = 0.0):
+        import random
+
+        self.key_attributes = tuple(key_attributes)
+        self.latency = latency
+        self.unprocessed_rate = unprocessed_rate
+        self.throttle_rate = throttle_rate
+        self.tables: Dict[str, Dict[Tuple, Dict[str, Any]]] = {}
+        self.streams: Dict[str, list] = {table: [] for table in stream_tables}
+        self._sequence = 0
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self._random = random.Random(0)
+        # Bumped on every write so cached scan segments are rebuilt
+        self._version = 0
+        self._segments: Dict[Tuple, Tuple[int, list]] = {}
+        self._indexes: Dict[Tuple, Tuple[int, Dict[str, list]]] = {}
+
+    def _tick(self, op: str) -> None:
+        with self.lock:
+            self.requests[op] = self.requests.get(op, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _key(self, item: Dict[str, Any]) -> Tuple:
+        return tuple(json.dumps(item[name], sort_keys=True) for name in self.key_attributes if name in item)
+
+    @staticmethod
+    def _condition_holds(item, expression, values) -> bool:
+        """Evaluate the simple condition forms the pipeline uses: ``OR``-joined
+        ``attribute_exists``/``attribute_not_exists`` and comparisons with placeholders."""
+        import operator
+        import re
+
+        ops = {"<=": operator.le, ">=": operator.ge, "<>": operator.ne, "=": operator.eq, "<": operator.lt, ">": operator.gt}
+
+        def scalar(value):
+            kind, inner = next(iter(value.items()))
+            return float(inner) if kind == "N" else inner
+
+        for clause in expression.split(" OR "):
+            clause = clause.strip()
+            match = re.fullmatch(r"attribute_(not_)?exists\((\w+)\)", clause)
+            if match:
+                if (match.group(2) in (item or {})) != bool(match.group(1)):
+                    return True
+                continue
+            name, op, placeholder = re.fullmatch(r"(\w+)\s*(<=|>=|<>|=|<|>)\s*(:\w+)", clause).groups()
+            if item and name in item and ops[op](scalar(item[name]), scalar(values[placeholder])):
+                return True
+        return False
+
+    def _write(self, table: str, key: Tuple, item) -> None:
+        """Store (or, for None, delete) ``item`` and record the change on the table's stream; call under the lock."""
+        rows = self.tables.setdefault(table, {})
+        old = rows.pop(key, None) if item is None else rows.get(key)
+        if item is not None:
+            rows[key] = item
+        self._version += 1
+        if table not in self.streams or (old is None and item is None):
+            return
+        self._sequence += 1
+        images = {"NewImage": item} if item is not None else {}
+        if old is not None:
+            images["OldImage"] = old
+        self.streams[table].append({
+            "eventName": "REMOVE" if item is None else "MODIFY" if old is not None else "INSERT",
+            "eventSource": "aws:dynamodb",
+            "dynamodb": {
+                "Keys": {name: (item or old)[name] for name in self.key_attributes if name in (item or old)},
+                "SequenceNumber": f"{self._sequence:021d}",
+                "StreamViewType": "NEW_AND_OLD_IMAGES",
+                **images,
+            },
+        })
+
+    def _check(self, op: str, table: str, key: Tuple, kwargs) -> None:
+        expression = kwargs.get("ConditionExpression")
+        if expression and not self._condition_holds(
+            self.tables.get(table, {}).get(key), expression, kwargs.get("ExpressionAttributeValues", {})
+        ):
+            from botocore.exceptions import ClientError
+
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "failed"}}, op)
+
+    def put_item(self, TableName, Item, **kwargs):
+        self._tick("PutItem")
+        with self.lock:
+            self._check("PutItem", TableName, self._key(Item), kwargs)
+            self._write(TableName, self._key(Item), Item)
+        return {}
+
+    def update_item(self, TableName, Key, UpdateExpression, ExpressionAttributeValues, **kwargs):
+        """``SET name = :value[, ...] [REMOVE name[, ...]]`` updates; a missing item is created unless the condition forbids it."""
+        import re
+
+        self._tick("UpdateItem")
+        if self.throttle_rate and self._random.random() < self.throttle_rate:
+            from botocore.exceptions import ClientError
+
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow down"}}, "UpdateItem")
+        assignments, removals = re.fullmatch(r"SET\s+(.+?)(?:\s+REMOVE\s+(.+))?", UpdateExpression.strip()).groups()
+        with self.lock:
+            key = self._key(Key)
+            self._check("UpdateItem", TableName, key, {**kwargs, "ExpressionAttributeValues": ExpressionAttributeValues})
+            # A new dict, so the stored (and streamed) old image is left as it was
+            item = dict(self.tables.get(TableName, {}).get(key) or Key)
+            for assignment in assignments.split(","):
+                name, placeholder = (part.strip() for part in assignment.split("="))
+                item[name] = ExpressionAttributeValues[placeholder]
+            for name in (removals or "").split(","):
+                item.pop(name.strip(), None)
+            self._write(TableName, key, item)
+        return {}
+
+    def get_item(self, TableName, Key, **kwargs):
+        self._tick("GetItem")
+        with self.lock:
+            item = self.tables.get(TableName, {}).get(self._key(Key))
+        return {"Item": item} if item is not None else {}
+
+    def delete_item(self, TableName, Key, **kwargs):
+        self._tick("DeleteItem")
+        with self.lock:
+            self._check("DeleteItem", TableName, self._key(Key), kwargs)
+            self._write(TableName, self._key(Key), None)
+        return {}
+
+    def _segment_keys(self, table: str, segment: int, total: int) -> list:
+        """Sorted keys of one scan segment, cached until the table next changes."""
+        import zlib
+
+        cached = self._segments.get((table, segment, total))
+        if cached is None or cached[0] != self._version:
+            keys = sorted(k for k in self.tables.get(table, {}) if zlib.crc32(repr(k).encode()) % total == segment)
+            cached = self._segments[(table, segment, total)] = (self._version, keys)
+        return cached[1]
+
+    def scan(self, TableName, Segment=0, TotalSegments=1, ExclusiveStartKey=None, Limit=1000, **kwargs):
+        import bisect
+
+        self._tick("Scan")
+        with self.lock:
+            keys = self._segment_keys(TableName, Segment, TotalSegments)
+            start = bisect.bisect_right(keys, self._key(ExclusiveStartKey)) if ExclusiveStartKey else 0
+            # Copies, as a real client deserializes fresh dicts; callers may update them in place
+            items = [dict(self.tables[TableName][k]) for k in keys[start : start + Limit]]
+        resp = {"Items": items, "Count": len(items)}
+        if start + Limit < len(keys):
+            resp["LastEvaluatedKey"] = {name: items[-1][name] for name in self.key_attributes}
+        return resp
+
+    def _index_keys(self, table: str, attribute: str, value) -> list:
+        """Sorted keys of the items whose ``attribute`` equals ``value``, cached until the table next changes."""
+        cached = self._indexes.get((table, attribute))
+        if cached is None or cached[0] != self._version:
+            groups: Dict[str, list] = {}
+            for key in sorted(self.tables.get(table, {})):
+                item = self.tables[table][key]
+                if attribute in item:
+                    groups.setdefault(json.dumps(item[attribute], sort_keys=True), []).append(key)
+            cached = self._indexes[(table, attribute)] = (self._version, groups)
+        return cached[1].get(json.dumps(value, sort_keys=True), [])
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeValues, IndexName=None,
+              ExclusiveStartKey=None, Limit=1000, ProjectionExpression=None, **kwargs):
+        import bisect
+
+        self._tick("Query")
+        attribute, placeholder = [part.strip() for part in KeyConditionExpression.split("=")]
+        if IndexName:
+            assert IndexName == f"{attribute}-index", f"unknown index {IndexName}"
+        with self.lock:
+            keys = self._index_keys(TableName, attribute, ExpressionAttributeValues[placeholder])
+            start = bisect.bisect_right(keys, self._key(ExclusiveStartKey)) if ExclusiveStartKey else 0
+            items = [self.tables[TableName][k] for k in keys[start : start + Limit]]
+        if ProjectionExpression:
+            names = [name.strip() for name in ProjectionExpression.split(",")]
+            items = [{name: item[name] for name in names if name in item} for item in items]
+        resp = {"Items": items, "Count": len(items)}
+        if start + Limit < len(keys):
+            last = self.tables[TableName][keys[start + Limit - 1]]
+            resp["LastEvaluatedKey"] = {name: last[name] for name in (*self.key_attributes, attribute) if name in last}
+        return resp
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self._tick("BatchGetItem")
+        assert sum(len(request["Keys"]) for request in RequestItems.values()) <= 100, "BatchGetItem accepts at most 100 keys"
+        responses: Dict[str, list] = {}
+        unprocessed: Dict[str, dict] = {}
+        for table, request in RequestItems.items():
+            for key in request["Keys"]:
+                if self.unprocessed_rate and self._random.random() < self.unprocessed_rate:
+                    unprocessed.setdefault(table, {**request, "Keys": []})["Keys"].append(key)
+                    continue
+                with self.lock:
+                    item = self.tables.get(table, {}).get(self._key(key))
+                if item is not None:
+                    responses.setdefault(table, []).append(item)
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self._tick("BatchWriteItem")
+        unprocessed: Dict[str, list] = {}
+        for table, requests in RequestItems.items():
+            assert len(requests) <= 25, "BatchWriteItem accepts at most 25 requests"
+            for request in requests:
+                if self.unprocessed_rate and self._random.random() < self.unprocessed_rate:
+                    unprocessed.setdefault(table, []).append(request)
+                    continue
+                with self.lock:
+                    if "PutRequest" in request:
+                        self._write(table, self._key(request["PutRequest"]["Item"]), request["PutRequest"]["Item"])
+                    else:
+                        self._write(table, self._key(request["DeleteRequest"]["Key"]), None)
+        return {"UnprocessedItems": unprocessed}
+
+
+class StubEventBridge:
+    """EventBridge client enforcing PutEvents limits, with injectable per-entry failures.
+
+    ``failure_rate`` of entries come back with a ThrottlingException error
+    code; entries for which ``reject(entry)`` is true always fail with
+    ``reject_code``. ``latency`` seconds are slept per call.
+    """
+
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, reject=None, reject_code="InternalFailure"):
+        import random
+
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.reject = reject
+        self.reject_code = reject_code
+        self.published: list = []
+        self.calls = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self.lock = threading.Lock()
+        self._random = random.Random(0)
+
+    def put_events(self, Entries, **kwargs):
+        assert 0 < len(Entries) <= 10, "PutEvents accepts 1-10 entries"
+        size = sum(len(e.get("Source", "")) + len(e.get("DetailType", "")) + len(e.get("Detail", "").encode()) for e in Entries)
+        assert size <= 256 * 1024, "PutEvents request exceeds 256 KB"
+        with self.lock:
+            self.calls += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        if self.latency:
+            time.sleep(self.latency)
+        results, failed = [], 0
+        with self.lock:
+            for entry in Entries:
+                if self.reject is not None and self.reject(entry):
+                    results.append({"ErrorCode": self.reject_code, "ErrorMessage": "rejected"})
+                elif self.failure_rate and self._random.random() < self.failure_rate:
+                    results.append({"ErrorCode": "ThrottlingException", "ErrorMessage": "slow down"})
+                else:
+                    self.published.append(entry)
+                    results.append({"EventId": str(len(self.published))})
+                    continue
+                failed += 1
+            self._in_flight -= 1
+        return {"FailedEntryCount": failed, "Entries": results}
+
+
+class StubExpoServer:
+    """Local stand-in for the Expo push API (``POST /--/api/v2/push/send``).
+
+    Answers each message with an ok ticket, a ``DeviceNotRegistered`` ticket
+    for tokens in ``invalid_tokens``, or a ``MessageRateExceeded`` ticket for
+    ``ticket_error_rate`` of messages. Every ``throttle_every``-th request
+    gets a 429. Connections are kept alive and counted.
+    """
+
+    PATH = "/--/api/v2/push/send"
+
+    def __init__(self, latency: float = 0.0, invalid_tokens=(), ticket_error_rate: float = 0.0, throttle_every: int = 0):
+        import random
+
+        self.latency = latency
+        self.invalid_tokens = set(invalid_tokens)
+        self.ticket_error_rate = ticket_error_rate
+        self.throttle_every = throttle_every
+        self.requests = 0
+        self.throttled = 0
+        self.connections = 0
+        self.delivered: list = []
+        self.authorization: list = []
+        self.lock = threading.Lock()
+        self._random = random.Random(0)
+        server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections += 1
+
+            def _reply(self, status, payload, headers=()):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                messages = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                single = isinstance(messages, dict)
+                if single:
+                    messages = [messages]
+                if server.latency:
+                    time.sleep(server.latency)
+                if self.path != server.PATH or len(messages) > 100:
+                    self._reply(400, {"errors": [{"code": "VALIDATION_ERROR"}]})
+                    return
+                with server.lock:
+                    server.requests += 1
+                    server.authorization.append(self.headers.get("Authorization"))
+                    throttle = server.throttle_every and server.requests % server.throttle_every == 0
+                    if throttle:
+                        server.throttled += 1
+                    tickets = []
+                    for message in messages:
+                        if throttle:
+                            break
+                        if message["to"] in server.invalid_tokens:
+                            tickets.append({"status": "error", "details": {"error": "DeviceNotRegistered"}})
+                        elif server.ticket_error_rate and server._random.random() < server.ticket_error_rate:
+                            tickets.append({"status": "error", "details": {"error": "MessageRateExceeded"}})
+                        else:
+                            server.delivered.append(message)
+                            tickets.append({"status": "ok", "id": str(len(server.delivered))})
+                if throttle:
+                    self._reply(429, {"errors": [{"code": "TOO_MANY_REQUESTS"}]}, [("Retry-After", "0")])
+                else:
+                    self._reply(200, {"data": tickets[0] if single else tickets})
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}{self.PATH}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
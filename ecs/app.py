@@ -1,22 +1,88 @@
-from flask import Flask
+import os
+
+from flask import Flask, Response, jsonify, request
 from opentelemetry import trace
 from opentelemetry.instrumentation.flask import FlaskInstrumentor
 
+from api.perimeter_query import parse_index, query
+from common import metrics
+from geojson_processor import service
+
 app = Flask(__name__)
 FlaskInstrumentor().instrument_app(app)
 tracer = trace.get_tracer(__name__)
 
+# The resident perimeter engine; set by start() (tests assign their own)
+engine = None
+# Parsed form of the engine's current index body, re-parsed when the body is swapped
+_parsed = {"body": None, "index": None}
+
+
+def start(new_engine=None):
+    """Build the engine from the environment (or use ``new_engine``) and start its loop."""
+    global engine
+    engine = (new_engine or service.build_engine()).start()
+    return engine
+
+
+def current_index():
+    body = engine.index if engine is not None else None
+    if body is None:
+        return None
+    if _parsed["body"] is not body:
+        _parsed["index"] = parse_index(body)
+        _parsed["body"] = body
+    return _parsed["index"]
+
 
 @app.route("/health")
 def health():
-    return {"status": "ok"}
+    if engine is None:
+        return {"status": "starting", "ok": False}, 503
+    report = engine.health()
+    return report, 200 if report["ok"] else 503
+
+
+@app.route("/perimeters")
+def perimeters():
+    with tracer.start_as_current_span("perimeters"):
+        index = current_index()
+        if index is None:
+            return jsonify({"error": "perimeter not loaded yet"}), 503
+        resp = query(index, request.args.to_dict())
+        return Response(resp["body"], status=resp["statusCode"], headers=resp.get("headers"))
+
+
+@app.route("/air-quality")
+def air_quality_stations():
+    """Station snapshot GeoJSON, as published to S3."""
+    stage = engine.air_quality if engine is not None else None
+    if stage is None:
+        return jsonify({"error": "air-quality rollup disabled"}), 404
+    return Response(stage.snapshot, mimetype="application/geo+json")
+
+
+@app.route("/air-quality/<site>")
+def air_quality_site(site):
+    stage = engine.air_quality if engine is not None else None
+    series = stage.series(site) if stage is not None else None
+    if series is None:
+        return jsonify({"error": f"unknown site {site}"}), 404
+    return jsonify(series)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Every pipeline counter and histogram recorded in this process, for Prometheus to scrape."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/")
 def index():
     with tracer.start_as_current_span("index"):
-        return {"message": "Hello from ECS with OTel"}
+        return {"message": "KoalaSafe perimeter service", "endpoints": ["/perimeters", "/air-quality", "/health", "/metrics"]}
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8080)
+    start()
+    app.run(host="0.0.0.0", port=int(os.environ.get("PORT", "8080")), threaded=True)
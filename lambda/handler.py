@@ -1,8 +1,9 @@
 from opentelemetry import trace
-from opentelemetry.instrumentation.aws_lambda import AwsLambdaInstrumentor
 
-# Instrument the Lambda handler
-AwsLambdaInstrumentor().instrument()
+from common import runtime
+
+# Instrument the Lambda handler when INSTRUMENTATION is enabled
+runtime.instrument()
 
 tracer = trace.get_tracer(__name__)
 
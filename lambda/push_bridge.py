@@ -1,13 +1,75 @@
+"""Deliver fire alerts to devices through the Expo push API.
+
+Alerts arrive as SQS (or SNS) batches, or straight from EventBridge. Every
+device token of a batch is packed into Expo requests of up to 100 messages,
+sent ``PUSH_CONCURRENCY`` at a time over keep-alive connections that survive
+warm invocations. Alerts that name only a fence are fanned out to its
+subscribers, resolved ``FANOUT_CHUNK`` at a time and streamed into the
+sender so memory stays bounded. Pushes that a failed attempt already settled
+are recorded in ``DELIVERIES_TABLE``, and the retry skips them.
+"""
+import http.client
 import json
+import logging
 import os
-import urllib.request
+import queue
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from itertools import islice
+from urllib.parse import urlsplit
+
+from common import batch_write, metrics, runtime
+
+runtime.instrument()
 
-import boto3
-from opentelemetry.instrumentation.aws_lambda import AwsLambdaInstrumentor
+logger = logging.getLogger(__name__)
 
-AwsLambdaInstrumentor().instrument()
+EXPO_URL = os.environ.get("EXPO_PUSH_URL", "https://exp.host/--/api/v2/push/send")
+# Expo accepts at most 100 messages per push request
+MAX_MESSAGES = 100
+# Push requests in flight at once, each on its own pooled keep-alive connection
+PUSH_CONCURRENCY = int(os.environ.get("PUSH_CONCURRENCY", "4"))
+PUSH_MAX_ATTEMPTS = int(os.environ.get("PUSH_MAX_ATTEMPTS", "5"))
+PUSH_TIMEOUT_SECONDS = float(os.environ.get("PUSH_TIMEOUT_SECONDS", "10"))
+# A token read from Secrets Manager is reused this long
+TOKEN_TTL_SECONDS = float(os.environ.get("TOKEN_TTL_SECONDS", "300"))
+BASE_DELAY = 0.1
+MAX_DELAY = 5.0
 
-EXPO_URL = "https://exp.host/--/api/v2/push/send"
+# Alerts table with a fence_id-keyed index; events without device tokens are
+# fanned out to every subscriber of their fence(s). Unset disables fan-out.
+SUBSCRIPTIONS_TABLE = os.environ.get("SUBSCRIPTIONS_TABLE")
+SUBSCRIPTIONS_INDEX = os.environ.get("SUBSCRIPTIONS_INDEX", "fence_id-index")
+# Table of device tokens (string set device_tokens) keyed by user_id
+DEVICES_TABLE = os.environ.get("DEVICES_TABLE")
+# Subscribers resolved per step before their messages are handed to the sender
+FANOUT_CHUNK = int(os.environ.get("FANOUT_CHUNK", "500"))
+# A user's device tokens stay cached in a warm container this long
+DEVICE_CACHE_TTL_SECONDS = float(os.environ.get("DEVICE_CACHE_TTL_SECONDS", "300"))
+DEVICE_CACHE_MAX_USERS = int(os.environ.get("DEVICE_CACHE_MAX_USERS", "100000"))
+# BatchGetItem accepts at most 100 keys
+MAX_GET_KEYS = 100
+# Ledger of pushes already settled for a record that is being re-driven, keyed
+# by (message_id, device_token), so its retry only resends what failed. Unset disables it.
+DELIVERIES_TABLE = os.environ.get("DELIVERIES_TABLE")
+# Ledger entries outlive every redelivery of a message (5 receives x 360 s visibility)
+DELIVERY_TTL_SECONDS = int(os.environ.get("DELIVERY_TTL_SECONDS", "86400"))
+
+# Ticket errors worth sending again; anything else (e.g. DeviceNotRegistered) is final
+_RETRYABLE_TICKET_ERRORS = {"MessageRateExceeded"}
+
+SEND_SECONDS = metrics.histogram("push_send_seconds", "Expo push request latency by HTTP status")
+MESSAGES = metrics.counter("push_messages_total", "Push messages by final outcome (ok, retry or the ticket error)")
+FANOUT_SUBSCRIBERS = metrics.counter("push_fanout_subscribers_total", "Fence subscribers resolved for fan-out")
+LEDGER_UNWRITTEN = metrics.counter(
+    "push_ledger_unwritten_total", "Settled pushes the delivery ledger could not record (a redrive resends them)"
+)
+UNROUTABLE = metrics.counter(
+    "push_unroutable_events_total", "Events with no device tokens dropped because SUBSCRIPTIONS_TABLE is unset"
+)
 
 
 def _get_token() -> str | None:
@@ -15,27 +77,533 @@ def _get_token() -> str | None:
     if token:
         return token
     secret_arn = os.environ.get("EXPO_TOKEN_SECRET_ARN")
-    if secret_arn:
-        sm = boto3.client("secretsmanager")
-        resp = sm.get_secret_value(SecretId=secret_arn)
-        return resp.get("SecretString")
-    return None
+    if not secret_arn:
+        return None
+    return runtime.secret(secret_arn, ttl=TOKEN_TTL_SECONDS)
 
 
-def lambda_handler(event, context):
-    detail = event.get('detail', {})
-    message = {
-        'to': detail.get('device_token'),
-        'title': 'Bushfire Alert',
-        'body': f"Fire intersected fence {detail.get('fence_id')}",
-        'data': detail,
+class ExpoClient:
+    """Keep-alive HTTP connections to the Expo push endpoint, reused across invocations."""
+
+    def __init__(self, url: str, timeout: float = 10.0):
+        parts = urlsplit(url)
+        self.url = url
+        self.https = parts.scheme == "https"
+        self.host = parts.netloc
+        self.path = parts.path or "/"
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        with self._lock:
+            self.connections_opened += 1
+        if self.https:
+            return http.client.HTTPSConnection(self.host, timeout=self.timeout)
+        return http.client.HTTPConnection(self.host, timeout=self.timeout)
+
+    def post(self, body: bytes, headers: dict):
+        """POST ``body`` and return ``(status, headers, payload)``, reconnecting once if the server closed the socket."""
+        try:
+            conn = self.idle.get_nowait()
+            reused = True
+        except queue.Empty:
+            conn, reused = self._connect(), False
+        try:
+            conn.request("POST", self.path, body=body, headers=headers)
+            resp = conn.getresponse()
+            payload = resp.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+            return self.post(body, headers)
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self.idle.put(conn)
+        return resp.status, resp.headers, payload
+
+
+_client = None
+
+
+def _expo() -> ExpoClient:
+    global _client
+    if _client is None or _client.url != EXPO_URL:
+        _client = ExpoClient(EXPO_URL, PUSH_TIMEOUT_SECONDS)
+    return _client
+
+
+# Only used to fan out alerts when SUBSCRIPTIONS_TABLE is set
+dynamodb = runtime.lazy_client("dynamodb")
+
+
+class DeviceCache:
+    """user_id -> device tokens for warm invocations, expiring after a TTL and evicting least recently used."""
+
+    def __init__(self, ttl: float, max_users: int):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.entries = OrderedDict()
+
+    def get(self, user_id, now):
+        entry = self.entries.get(user_id)
+        if entry is None or entry[1] <= now:
+            return None
+        self.entries.move_to_end(user_id)
+        return entry[0]
+
+    def put(self, user_id, tokens, now):
+        self.entries[user_id] = (tokens, now + self.ttl)
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_users:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+_device_cache = DeviceCache(DEVICE_CACHE_TTL_SECONDS, DEVICE_CACHE_MAX_USERS)
+
+
+def _subscribers(fence_id):
+    """Pages of user ids subscribed to ``fence_id``, read from the fence_id index."""
+    kwargs = {
+        "TableName": SUBSCRIPTIONS_TABLE,
+        "IndexName": SUBSCRIPTIONS_INDEX,
+        "KeyConditionExpression": "fence_id = :fence_id",
+        "ExpressionAttributeValues": {":fence_id": {"S": fence_id}},
+        "ProjectionExpression": "user_id",
     }
-    data = json.dumps(message).encode('utf-8')
-    headers = {'Content-Type': 'application/json'}
-    token = _get_token()
+    while True:
+        resp = dynamodb.query(**kwargs)
+        yield [item["user_id"]["S"] for item in resp.get("Items", [])]
+        if "LastEvaluatedKey" not in resp:
+            return
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def _read_devices(user_ids):
+    """Read device tokens with BatchGetItem, retrying unprocessed keys.
+
+    Returns ``(tokens_by_user, unresolved_user_ids)``; users without a
+    devices item map to an empty list.
+    """
+    found = {user_id: [] for user_id in user_ids}
+    pending = [{"user_id": {"S": user_id}} for user_id in user_ids]
+    for attempt in range(PUSH_MAX_ATTEMPTS):
+        if not pending:
+            break
+        if attempt:
+            time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt)))
+        retry = []
+        for start in range(0, len(pending), MAX_GET_KEYS):
+            resp = dynamodb.batch_get_item(
+                RequestItems={
+                    DEVICES_TABLE: {
+                        "Keys": pending[start:start + MAX_GET_KEYS],
+                        "ProjectionExpression": "user_id, device_tokens",
+                    }
+                }
+            )
+            for item in resp.get("Responses", {}).get(DEVICES_TABLE, []):
+                found[item["user_id"]["S"]] = sorted(item.get("device_tokens", {}).get("SS", []))
+            retry.extend(resp.get("UnprocessedKeys", {}).get(DEVICES_TABLE, {}).get("Keys", []))
+        pending = retry
+    unresolved = [key["user_id"]["S"] for key in pending]
+    for user_id in unresolved:
+        found.pop(user_id, None)
+    return found, unresolved
+
+
+def device_tokens(user_ids, now=None):
+    """Device tokens for ``user_ids``, served from the warm cache where possible."""
+    now = time.monotonic() if now is None else now
+    tokens, misses = {}, []
+    for user_id in user_ids:
+        cached = _device_cache.get(user_id, now)
+        if cached is None:
+            misses.append(user_id)
+        else:
+            tokens[user_id] = cached
+    unresolved = []
+    if misses:
+        found, unresolved = _read_devices(misses)
+        for user_id, user_tokens in found.items():
+            _device_cache.put(user_id, user_tokens, now)
+        tokens.update(found)
+    return tokens, unresolved
+
+
+def _resolve(fence_id, user_ids):
+    FANOUT_SUBSCRIBERS.inc(len(user_ids))
+    tokens, unresolved = device_tokens(user_ids)
+    for user_id in user_ids:
+        for device_token in tokens.get(user_id, ()):
+            yield fence_id, device_token
+    for _ in unresolved:
+        yield fence_id, None
+
+
+def fanout(detail):
+    """Yield ``(fence_id, device_token)`` for every subscriber of the event's fence(s).
+
+    Subscribers are resolved ``FANOUT_CHUNK`` at a time so deliveries start
+    before the whole audience is known and memory stays bounded. A user
+    subscribed to several fences of a digest is alerted once. ``None``
+    tokens stand for users whose devices could not be read.
+    """
+    fence_ids = detail.get("fence_ids") or [detail.get("fence_id")]
+    seen = set()
+    for fence_id in fence_ids:
+        if not fence_id:
+            continue
+        chunk = []
+        for page in _subscribers(fence_id):
+            for user_id in page:
+                if user_id not in seen:
+                    seen.add(user_id)
+                    chunk.append(user_id)
+            while len(chunk) >= FANOUT_CHUNK:
+                yield from _resolve(fence_id, chunk[:FANOUT_CHUNK])
+                chunk = chunk[FANOUT_CHUNK:]
+        if chunk:
+            yield from _resolve(fence_id, chunk)
+
+
+def _alert_text(detail):
+    """Notification text for a single-fence alert or a ``FenceIntersectionDigest``."""
+    if detail.get("fence_id") is not None:
+        return f"Fire intersected fence {detail['fence_id']}"
+    fence_ids = detail.get("fence_ids") or []
+    if len(fence_ids) == 1:
+        return f"Fire intersected fence {fence_ids[0]}"
+    count = detail.get("count") or len(fence_ids)
+    if count:
+        return f"Fire intersected {count} of your fences"
+    return "Fire intersected one of your fences"
+
+
+def _message(detail, device_token):
+    return {
+        "to": device_token,
+        "title": "Bushfire Alert",
+        "body": _alert_text(detail),
+        "data": detail,
+    }
+
+
+def _retry_after(headers, attempt):
+    value = headers.get("Retry-After") if headers is not None else None
+    try:
+        return min(MAX_DELAY, float(value))
+    except (TypeError, ValueError):
+        return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def send_chunk(chunk, token):
+    """Send up to 100 ``(key, message)`` pairs; return per-key outcomes.
+
+    Each outcome is ``"ok"``, ``"retry"`` (still failing after every attempt,
+    so the source record should be re-driven) or the final ticket error code.
+    429 and 5xx responses back off (honouring Retry-After) and resend the
+    whole chunk; rate-limited tickets are resent on their own.
+    """
+    headers = {"Content-Type": "application/json", "Accept": "application/json", "Accept-Encoding": "identity"}
     if token:
-        headers['Authorization'] = f'Bearer {token}'
-    request = urllib.request.Request(EXPO_URL, data=data, headers=headers)
-    with urllib.request.urlopen(request) as resp:
-        resp.read()
-    return {'status': 'sent'}
+        headers["Authorization"] = f"Bearer {token}"
+    outcomes, pending = {}, chunk
+    delay_headers = None
+    for attempt in range(PUSH_MAX_ATTEMPTS):
+        if attempt:
+            time.sleep(_retry_after(delay_headers, attempt))
+        body = json.dumps([message for _, message in pending]).encode("utf-8")
+        started = time.perf_counter()
+        try:
+            status, delay_headers, payload = _expo().post(body, headers)
+        except (OSError, http.client.HTTPException):
+            SEND_SECONDS.observe(time.perf_counter() - started, status="error")
+            delay_headers = None
+            continue
+        SEND_SECONDS.observe(time.perf_counter() - started, status=status)
+        if status == 429 or status >= 500:
+            continue
+        tickets = None
+        if status == 200:
+            try:
+                tickets = json.loads(payload or b"{}").get("data")
+            except (ValueError, AttributeError):
+                # A truncated or non-JSON body: nothing can be settled, so re-drive the chunk
+                for key, _ in pending:
+                    outcomes[key] = "retry"
+                return outcomes
+        if not isinstance(tickets, list) or len(tickets) != len(pending):
+            # A request-level error: nothing in this chunk was accepted
+            for key, _ in pending:
+                outcomes[key] = "retry" if status in (408, 429) else f"http_{status}"
+            return outcomes
+        retry = []
+        for item, ticket in zip(pending, tickets):
+            if ticket.get("status") == "ok":
+                outcomes[item[0]] = "ok"
+                continue
+            error = (ticket.get("details") or {}).get("error") or "error"
+            if error in _RETRYABLE_TICKET_ERRORS:
+                retry.append(item)
+            else:
+                outcomes[item[0]] = error
+        if not retry:
+            return outcomes
+        pending, delay_headers = retry, None
+    for key, _ in pending:
+        outcomes[key] = "retry"
+    return outcomes
+
+
+def send_stream(messages, token=None):
+    """Send an iterable of ``(key, message)`` pairs in chunks of 100, yielding each chunk's outcomes.
+
+    Messages are drawn from ``messages`` only as sender slots free up, so a
+    lazily produced fan-out is never held in memory all at once.
+    """
+    source = iter(messages)
+    chunks = iter(lambda: list(islice(source, MAX_MESSAGES)), [])
+    if PUSH_CONCURRENCY <= 1:
+        for chunk in chunks:
+            yield _counted(send_chunk(chunk, token))
+        return
+    with ThreadPoolExecutor(max_workers=PUSH_CONCURRENCY) as pool:
+        in_flight = set()
+        for chunk in chunks:
+            in_flight.add(pool.submit(send_chunk, chunk, token))
+            if len(in_flight) >= 2 * PUSH_CONCURRENCY:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield _counted(future.result())
+        for future in in_flight:
+            yield _counted(future.result())
+
+
+def _counted(outcomes):
+    for outcome, count in Counter(outcomes.values()).items():
+        MESSAGES.inc(count, outcome=outcome)
+    return outcomes
+
+
+def send_messages(messages, token=None):
+    """Send ``(key, message)`` pairs in chunks of 100, several chunks at a time."""
+    outcomes = {}
+    for result in send_stream(messages, token):
+        outcomes.update(result)
+    return outcomes
+
+
+def _record_detail(record):
+    """The EventBridge detail carried by an SQS or SNS record (SNS-to-SQS envelopes included)."""
+    if "Sns" in record:
+        body = record["Sns"]["Message"]
+    else:
+        body = record.get("body", "{}")
+    payload = json.loads(body)
+    if "Message" in payload and payload.get("Type") == "Notification":
+        payload = json.loads(payload["Message"])
+    return payload.get("detail", payload)
+
+
+def _device_tokens(detail):
+    tokens = detail.get("device_tokens") or []
+    if detail.get("device_token"):
+        tokens = [detail["device_token"], *tokens]
+    return tokens
+
+
+def _messages(details, failed, skip):
+    """``((index, device_token), message)`` for every delivery the details call for.
+
+    Details without device tokens are fanned out to their fence's
+    subscribers, or dropped as unroutable when fan-out is disabled; indexes
+    whose subscribers could not all be resolved are added to ``failed``. Tokens in ``skip[index]`` were settled by an
+    earlier attempt and are left out.
+    """
+    for index, detail in details:
+        tokens = _device_tokens(detail)
+        done = skip.get(index, ())
+        if not tokens and not SUBSCRIPTIONS_TABLE:
+            _unroutable(detail)
+            continue
+        if tokens:
+            for device_token in tokens:
+                if device_token in done:
+                    MESSAGES.inc(outcome="already_settled")
+                    continue
+                yield (index, device_token), _message(detail, device_token)
+            continue
+        for fence_id, device_token in fanout(detail):
+            if device_token is None:
+                failed.add(index)
+                continue
+            if device_token in done:
+                MESSAGES.inc(outcome="already_settled")
+                continue
+            alert = {"fence_id": fence_id, "region": detail.get("region")}
+            yield (index, device_token), _message(alert, device_token)
+
+
+def deliver(details, skip=None, settled=None):
+    """Deliver ``(index, detail)`` pairs; return stats and the indexes to retry.
+
+    ``skip`` maps indexes to device tokens not to send again. When given,
+    ``settled`` collects the tokens of each index that need no resend (sent,
+    or failed for good).
+    """
+    failed = set()
+    stats = {"sent": 0, "failed": 0, "invalid_tokens": []}
+    token = _get_token()
+    for outcomes in send_stream(_messages(details, failed, skip or {}), token):
+        for (index, device_token), outcome in outcomes.items():
+            if outcome != "retry" and settled is not None:
+                settled.setdefault(index, set()).add(device_token)
+            if outcome == "ok":
+                stats["sent"] += 1
+                continue
+            stats["failed"] += 1
+            if outcome == "retry":
+                failed.add(index)
+            elif outcome == "DeviceNotRegistered":
+                stats["invalid_tokens"].append(device_token)
+    return stats, failed
+
+
+def _unroutable(detail):
+    """Count and log a fence alert or digest that nobody can be told about."""
+    UNROUTABLE.inc()
+    logger.warning(
+        "Dropping alert for fences %s: no device tokens and SUBSCRIPTIONS_TABLE is unset",
+        detail.get("fence_ids") or detail.get("fence_id"),
+    )
+
+
+def _record_id(record):
+    return record.get("messageId") or (record.get("Sns") or {}).get("MessageId")
+
+
+def _redelivered(record):
+    """Whether ``record`` may have been attempted before (SNS retries carry no receive count)."""
+    if "Sns" in record:
+        return True
+    return int((record.get("attributes") or {}).get("ApproximateReceiveCount", "1")) > 1
+
+
+def settled_tokens(message_id):
+    """Device tokens an earlier attempt at ``message_id`` already settled."""
+    kwargs = {
+        "TableName": DELIVERIES_TABLE,
+        "KeyConditionExpression": "message_id = :message_id",
+        "ExpressionAttributeValues": {":message_id": {"S": message_id}},
+        "ProjectionExpression": "device_token",
+    }
+    tokens = set()
+    while True:
+        resp = dynamodb.query(**kwargs)
+        tokens.update(item["device_token"]["S"] for item in resp.get("Items", []))
+        if "LastEvaluatedKey" not in resp:
+            return tokens
+        kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
+
+
+def record_settled(tokens_by_message):
+    """Add ``{message_id: device_tokens}`` to the delivery ledger, expiring after ``DELIVERY_TTL_SECONDS``."""
+    expires_at = str(int(time.time()) + DELIVERY_TTL_SECONDS)
+    requests = [
+        {
+            "PutRequest": {
+                "Item": {
+                    "message_id": {"S": message_id},
+                    "device_token": {"S": device_token},
+                    "expires_at": {"N": expires_at},
+                }
+            }
+        }
+        for message_id, tokens in tokens_by_message.items()
+        for device_token in sorted(tokens)
+    ]
+    unwritten = batch_write.write_batch(dynamodb, DELIVERIES_TABLE, requests)
+    if unwritten:
+        LEDGER_UNWRITTEN.inc(len(unwritten))
+
+
+def deliver_once(details, message_ids, redelivered):
+    """``deliver`` through the ledger: return stats and the indexes to retry.
+
+    ``message_ids`` maps each index to the id its retries arrive under and
+    ``redelivered(index)`` says whether an earlier attempt may have settled
+    some of its pushes. With ``DELIVERIES_TABLE`` set, those pushes are
+    skipped, and the settled pushes of indexes about to be retried are
+    written to the ledger, so subscribers who already got the alert are not
+    sent it again.
+    """
+    skip, settled = {}, None
+    if DELIVERIES_TABLE:
+        # Only a retried message can have settled pushes; first attempts skip the read
+        for index, _ in details:
+            if message_ids.get(index) and redelivered(index):
+                skip[index] = settled_tokens(message_ids[index])
+        settled = {}
+    stats, failed = deliver(details, skip, settled)
+    if failed and settled:
+        record_settled({
+            message_ids[index]: settled[index]
+            for index in failed
+            if settled.get(index) and message_ids.get(index)
+        })
+    return stats, failed
+
+
+def handle_batch(records):
+    """Deliver every message in an SQS/SNS batch; records with undelivered messages are failures.
+
+    Re-driven records resend only what the ledger has not settled (see ``deliver_once``).
+    """
+    details = []
+    for index, record in enumerate(records):
+        try:
+            details.append((index, _record_detail(record)))
+        except (TypeError, ValueError, KeyError):
+            logger.warning("Skipping malformed record %s", record.get("messageId"))
+    message_ids = {index: _record_id(record) for index, record in enumerate(records)}
+    stats, failed = deliver_once(details, message_ids, lambda index: _redelivered(records[index]))
+    stats["batchItemFailures"] = [
+        {"itemIdentifier": records[index].get("messageId")} for index in sorted(failed)
+    ]
+    return stats
+
+
+def lambda_handler(event, context):
+    try:
+        return _handle(event)
+    finally:
+        metrics.flush()
+
+
+def _handle(event):
+    records = event.get("Records")
+    if records is not None:
+        stats = handle_batch(records)
+        if stats["batchItemFailures"] and any("Sns" in record for record in records):
+            # SNS invokes asynchronously; failing the invocation makes Lambda retry it
+            raise RuntimeError(f"{len(stats['batchItemFailures'])} records could not be delivered")
+        return stats
+    detail = event.get("detail", {})
+    if not _device_tokens(detail) and not SUBSCRIPTIONS_TABLE:
+        _unroutable(detail)
+        return {"status": "unroutable"}
+    # EventBridge retries a failed invocation under the same event id, with no attempt count
+    stats, failed = deliver_once([(0, detail)], {0: event.get("id")}, lambda index: True)
+    if failed:
+        raise RuntimeError("Expo push failed")
+    return stats
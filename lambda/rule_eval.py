@@ -1,27 +1,298 @@
+"""Turn fence ``intersects`` transitions from the table stream into EventBridge alerts.
+
+Only false-to-true transitions alert, and each fence then gets a
+``COALESCE_WINDOW_SECONDS`` suppression window claimed with a conditional
+PutItem, so a flapping fence does not re-alert. Fences of one region that
+start intersecting within a batch are folded into one
+``FenceIntersectionDigest``. Events go out in PutEvents requests of at most
+10 entries / 256 KB, several at a time; only entries with a retryable
+``ErrorCode`` are resent, and records that still fail are returned as
+``batchItemFailures`` so Lambda re-drives just those.
+"""
 import json
-import boto3
-from opentelemetry.instrumentation.aws_lambda import AwsLambdaInstrumentor
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-AwsLambdaInstrumentor().instrument()
+from botocore.exceptions import ClientError
 
-eventbridge = boto3.client('events')
+from common import metrics, runtime
 
-def lambda_handler(event, context):
-    entries = []
-    for record in event.get('Records', []):
+runtime.instrument()
+
+logger = logging.getLogger(__name__)
+
+eventbridge = runtime.lazy_client('events')
+# Only used when COALESCE_TABLE is set
+dynamodb = runtime.lazy_client('dynamodb')
+
+# PutEvents accepts at most 10 entries and 256 KB per request
+MAX_ENTRIES = 10
+MAX_REQUEST_BYTES = 256 * 1024
+# PutEvents calls in flight at once
+PUBLISH_CONCURRENCY = int(os.environ.get('PUBLISH_CONCURRENCY', '8'))
+# Attempts per chunk before its remaining entries are reported as failed
+PUBLISH_MAX_ATTEMPTS = int(os.environ.get('PUBLISH_MAX_ATTEMPTS', '5'))
+BASE_DELAY = 0.05
+MAX_DELAY = 1.0
+
+# A fence that starts intersecting alerts at most once per window (0 disables)
+COALESCE_WINDOW_SECONDS = int(os.environ.get('COALESCE_WINDOW_SECONDS', '3600'))
+# DynamoDB table (key window_key, TTL attribute expires_at) holding open windows;
+# unset keeps them in this container only
+COALESCE_TABLE = os.environ.get('COALESCE_TABLE')
+# Fence ids folded into one FenceIntersectionDigest event
+DIGEST_MAX_FENCES = int(os.environ.get('DIGEST_MAX_FENCES', '500'))
+
+_RETRYABLE_CODES = {'InternalFailure', 'InternalException', 'ThrottlingException', 'ServiceUnavailable'}
+
+PUBLISH_SECONDS = metrics.histogram('eventbridge_publish_seconds', 'PutEvents latency by outcome')
+EVENTS_PUBLISHED = metrics.counter('eventbridge_entries_total', 'PutEvents entries by final outcome')
+TRANSITIONS = metrics.counter('rule_eval_transitions_total', 'Fences that started intersecting, by whether they alerted')
+
+
+def _entry_size(entry):
+    """Size PutEvents counts towards the 256 KB limit."""
+    size = 14 if entry.get('Time') else 0
+    for field in ('Source', 'DetailType', 'Detail'):
+        size += len(entry.get(field, '').encode('utf-8'))
+    return size + sum(len(resource.encode('utf-8')) for resource in entry.get('Resources', []))
+
+
+def _chunks(entries):
+    """Split ``(key, entry)`` pairs into PutEvents requests of 10 entries / 256 KB."""
+    chunk, size = [], 0
+    for key, entry in entries:
+        entry_size = _entry_size(entry)
+        if entry_size > MAX_REQUEST_BYTES:
+            logger.warning('Dropping event for %s: %d bytes exceeds the PutEvents limit', key, entry_size)
+            EVENTS_PUBLISHED.inc(outcome='oversized')
+            continue
+        if chunk and (len(chunk) == MAX_ENTRIES or size + entry_size > MAX_REQUEST_BYTES):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append((key, entry))
+        size += entry_size
+    if chunk:
+        yield chunk
+
+
+def _backoff(attempt):
+    time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt)))
+
+
+def _publish_chunk(chunk):
+    """Publish one chunk, retrying only failed entries; return the keys that never made it."""
+    pending, failed = chunk, []
+    for attempt in range(PUBLISH_MAX_ATTEMPTS):
+        if attempt:
+            _backoff(attempt)
+        started = time.perf_counter()
+        try:
+            response = eventbridge.put_events(Entries=[entry for _, entry in pending])
+        except ClientError as exc:
+            PUBLISH_SECONDS.observe(time.perf_counter() - started, outcome='error')
+            if exc.response['Error']['Code'] not in _RETRYABLE_CODES:
+                return failed + [key for key, _ in pending]
+            continue
+        PUBLISH_SECONDS.observe(
+            time.perf_counter() - started, outcome='partial' if response.get('FailedEntryCount') else 'ok'
+        )
+        if not response.get('FailedEntryCount'):
+            return failed
+        results = response.get('Entries', [])
+        if len(results) != len(pending):
+            # Without per-entry results there is no way to tell which ones landed
+            continue
+        retry = []
+        for item, result in zip(pending, results):
+            code = result.get('ErrorCode')
+            if code in _RETRYABLE_CODES:
+                retry.append(item)
+            elif code:
+                failed.append(item[0])
+        if not retry:
+            return failed
+        pending = retry
+    return failed + [key for key, _ in pending]
+
+
+def publish(entries):
+    """Publish ``(key, entry)`` pairs concurrently; return the published count and failed keys."""
+    chunks = list(_chunks(entries))
+    if len(chunks) <= 1 or PUBLISH_CONCURRENCY <= 1:
+        failed = [key for chunk in chunks for key in _publish_chunk(chunk)]
+    else:
+        with ThreadPoolExecutor(max_workers=PUBLISH_CONCURRENCY) as pool:
+            failed = [key for keys in pool.map(_publish_chunk, chunks) for key in keys]
+    published = sum(len(chunk) for chunk in chunks) - len(failed)
+    EVENTS_PUBLISHED.inc(published, outcome='ok')
+    EVENTS_PUBLISHED.inc(len(failed), outcome='failed')
+    return published, failed
+
+
+class LocalWindows:
+    """In-container stand-in for the coalescing table: window key -> expiry time."""
+
+    def __init__(self):
+        self.expiry = {}
+
+    def claim(self, key, now, seconds):
+        if self.expiry.get(key, 0) > now:
+            return False
+        self.expiry[key] = now + seconds
+        return True
+
+    def release(self, key, now, seconds):
+        self.expiry.pop(key, None)
+
+    def clear(self):
+        self.expiry.clear()
+
+
+class TableWindows:
+    """Coalescing windows as DynamoDB items claimed with a conditional write.
+
+    Expired items may linger until TTL deletes them, so the condition also
+    accepts an ``expires_at`` in the past.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def claim(self, key, now, seconds):
+        try:
+            dynamodb.put_item(
+                TableName=self.table,
+                Item={'window_key': {'S': key}, 'expires_at': {'N': str(int(now + seconds))}},
+                ConditionExpression='attribute_not_exists(window_key) OR expires_at <= :now',
+                ExpressionAttributeValues={':now': {'N': str(int(now))}},
+            )
+        except ClientError as exc:
+            if exc.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def release(self, key, now, seconds):
+        # Only drop the window this invocation opened
+        try:
+            dynamodb.delete_item(
+                TableName=self.table,
+                Key={'window_key': {'S': key}},
+                ConditionExpression='expires_at = :expires',
+                ExpressionAttributeValues={':expires': {'N': str(int(now + seconds))}},
+            )
+        except ClientError as exc:
+            if exc.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+
+_local_windows = LocalWindows()
+
+
+def _windows():
+    return TableWindows(COALESCE_TABLE) if COALESCE_TABLE else _local_windows
+
+
+def _flag(image):
+    return image.get('intersects', {}).get('BOOL', False)
+
+
+def transitions(records):
+    """``(position, fence_id, region)`` for records where a fence starts intersecting.
+
+    Re-writes of a fence that was already intersecting (OldImage true)
+    are not transitions and never alert.
+    """
+    found = []
+    for position, record in enumerate(records):
         if record.get('eventName') not in ('INSERT', 'MODIFY'):
             continue
-        new_image = record['dynamodb'].get('NewImage', {})
-        intersects = new_image.get('intersects', {}).get('BOOL', False)
-        if not intersects:
+        images = record['dynamodb']
+        new_image = images.get('NewImage', {})
+        if not _flag(new_image) or _flag(images.get('OldImage', {})):
             continue
         region = new_image.get('region', {}).get('S', 'unknown')
         fence_id = new_image.get('fence_id', {}).get('S', '')
-        entries.append({
-            'Source': 'koalasafe.rule_eval',
-            'DetailType': 'FenceIntersection',
-            'Detail': json.dumps({'fence_id': fence_id, 'region': region}),
-        })
-    if entries:
-        eventbridge.put_events(Entries=entries)
-    return {'events_published': len(entries)}
+        found.append((position, fence_id, region))
+    return found
+
+
+def coalesce(found, windows, now):
+    """Drop transitions whose fence is inside its window; return the rest and the keys claimed."""
+    if COALESCE_WINDOW_SECONDS <= 0:
+        return found, {}
+    by_key = {}
+    for transition in found:
+        _, fence_id, region = transition
+        by_key.setdefault(f'fence#{region}#{fence_id}', []).append(transition)
+
+    def claim(key):
+        return windows.claim(key, now, COALESCE_WINDOW_SECONDS)
+
+    if len(by_key) > 1 and PUBLISH_CONCURRENCY > 1:
+        with ThreadPoolExecutor(max_workers=PUBLISH_CONCURRENCY) as pool:
+            granted = list(pool.map(claim, by_key))
+    else:
+        granted = [claim(key) for key in by_key]
+    claimed = {key: [position for position, _, _ in by_key[key]] for key, ok in zip(by_key, granted) if ok}
+    kept = [transition for key, ok in zip(by_key, granted) if ok for transition in by_key[key]]
+    return sorted(kept), claimed
+
+
+def build_entries(kept):
+    """One FenceIntersection per lone fence; several fences in a region fold into digests."""
+    by_region = {}
+    for position, fence_id, region in kept:
+        by_region.setdefault(region, {}).setdefault(fence_id, []).append(position)
+    entries = []
+    for region, fences in by_region.items():
+        if len(fences) == 1:
+            (fence_id, positions), = fences.items()
+            entries.append((tuple(positions), {
+                'Source': 'koalasafe.rule_eval',
+                'DetailType': 'FenceIntersection',
+                'Detail': json.dumps({'fence_id': fence_id, 'region': region}),
+            }))
+            continue
+        fence_ids = list(fences)
+        for start in range(0, len(fence_ids), DIGEST_MAX_FENCES):
+            chunk = fence_ids[start:start + DIGEST_MAX_FENCES]
+            entries.append((tuple(position for fence_id in chunk for position in fences[fence_id]), {
+                'Source': 'koalasafe.rule_eval',
+                'DetailType': 'FenceIntersectionDigest',
+                'Detail': json.dumps({'region': region, 'fence_ids': chunk, 'count': len(chunk)}),
+            }))
+    return entries
+
+
+def lambda_handler(event, context):
+    records = event.get('Records', [])
+    now = time.time()
+    windows = _windows()
+    found = transitions(records)
+    kept, claimed = coalesce(found, windows, now)
+    entries = build_entries(kept)
+    published, failed_keys = publish(entries) if entries else (0, [])
+    failed = sorted({position for key in failed_keys for position in key})
+    if failed:
+        # Reopen the windows of unpublished fences so the re-driven records can alert
+        retry = set(failed)
+        for key, positions in claimed.items():
+            if retry.intersection(positions):
+                windows.release(key, now, COALESCE_WINDOW_SECONDS)
+    TRANSITIONS.inc(len(kept), coalesced='false')
+    TRANSITIONS.inc(len(found) - len(kept), coalesced='true')
+    metrics.flush()
+    # Lambda re-drives the stream from the earliest reported sequence number
+    return {
+        'events_published': published,
+        'transitions': len(found),
+        'suppressed': len(found) - len(kept),
+        'batchItemFailures': [
+            {'itemIdentifier': records[position]['dynamodb'].get('SequenceNumber')} for position in failed
+        ],
+    }
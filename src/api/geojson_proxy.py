@@ -1,20 +1,179 @@
+"""``GET /geojson/latest``: the published perimeter, served from the warm container.
+
+Response bodies are cached per container keyed on the object's ETag, which
+is revalidated with a HEAD at most every ``REVALIDATE_SECONDS``, so most
+requests never touch S3. ``If-None-Match`` gets a 304, and ``br``/``gzip``
+bodies are built once per ETag when the client accepts them (brotli only if
+the package is bundled). ``ETag`` and ``Cache-Control`` let CloudFront cache
+the response. An object over the 6 MB Lambda response limit is answered
+with a 302 to a presigned S3 URL before its body is read.
+"""
+import base64
+import gzip
 import json
 import os
-import boto3
+import time
+
+from botocore.exceptions import ClientError
+
+from common import runtime
+
+try:
+    import brotli
+except ImportError:  # not in the Lambda runtime unless layered in
+    brotli = None
+
+runtime.instrument()
+
+s3 = runtime.lazy_client('s3')
+
+# A cached copy is served this long before its ETag is revalidated with a HEAD
+REVALIDATE_SECONDS = float(os.environ.get("REVALIDATE_SECONDS", "30"))
+# max-age sent to browsers and CloudFront
+CACHE_MAX_AGE = int(os.environ.get("CACHE_MAX_AGE", "60"))
+# Lambda proxy responses are capped at 6 MB; leave room for headers
+MAX_RESPONSE_BYTES = int(os.environ.get("MAX_RESPONSE_BYTES", str(6 * 1024 * 1024 - 16 * 1024)))
+PRESIGNED_URL_SECONDS = int(os.environ.get("PRESIGNED_URL_SECONDS", "300"))
+
+# Warm-container cache: (bucket, key) -> entry with the ETag, size and served body texts
+_cache = {}
+
+
+def _header(event, name):
+    headers = (event or {}).get("headers") or {}
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _accepted_encodings(accept_encoding):
+    """Codings the client accepts, ignoring any it refuses with q=0."""
+    accepted = set()
+    for item in (accept_encoding or "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding and weight > 0:
+            accepted.add(coding.lower())
+    return accepted
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match or not etag:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _head(bucket, key):
+    """Cache entry for the object's current version: ETag, size and stored encoding, no body yet."""
+    obj = s3.head_object(Bucket=bucket, Key=key)
+    return {
+        "etag": obj.get("ETag"),
+        "length": obj.get("ContentLength"),
+        "stored": obj.get("ContentEncoding") or "identity",
+        "texts": {},
+        "checked": time.monotonic(),
+    }
+
+
+def _load(bucket, key):
+    """Return the cached entry, revalidating its ETag with a HEAD once it is stale."""
+    entry = _cache.get((bucket, key))
+    if entry is None or time.monotonic() - entry["checked"] >= REVALIDATE_SECONDS:
+        current = _head(bucket, key)
+        if entry is not None and current["etag"] == entry["etag"]:
+            entry["checked"] = current["checked"]
+        else:
+            entry = current
+            _cache[(bucket, key)] = entry
+    return entry
+
+
+def _body(bucket, key, entry, encoding):
+    """Response body text for ``encoding``, read from S3 and encoded from the stored copy.
+
+    The read is conditional on the entry's ETag, so a body replaced since the
+    HEAD raises ``PreconditionFailed`` instead of being cached under it.
+    """
+    conditions = {"IfMatch": entry["etag"]} if entry["etag"] else {}
+    obj = s3.get_object(Bucket=bucket, Key=key, **conditions)
+    raw = obj["Body"].read()
+    stored = obj.get("ContentEncoding") or entry["stored"]
+    if stored == encoding:
+        data = raw
+    else:
+        if stored == "br" and brotli is None:
+            raise RuntimeError("Brotli-encoded GeoJSON requires the brotli package")
+        plain = raw
+        if stored != "identity":
+            # The processor may upload precompressed output
+            plain = brotli.decompress(raw) if stored == "br" else gzip.decompress(raw)
+        if encoding == "identity":
+            data = plain
+        else:
+            data = brotli.compress(plain, quality=5) if encoding == "br" else gzip.compress(plain, 6)
+    return data.decode("utf-8") if encoding == "identity" else base64.b64encode(data).decode("ascii")
+
+
+def _redirect(bucket, key):
+    url = s3.generate_presigned_url(
+        "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=PRESIGNED_URL_SECONDS
+    )
+    return {"statusCode": 302, "headers": {"Location": url, "Cache-Control": "no-store"}, "body": ""}
 
-s3 = boto3.client('s3')
 
 def geojsonProxyFn(event, context):
-    """Return latest GeoJSON object from S3."""
+    """Return latest GeoJSON object from S3, cached per container and compressed when accepted."""
     bucket = os.environ.get("GEOJSON_BUCKET")
     key = os.environ.get("GEOJSON_KEY", "latest.geojson")
     if not bucket:
         return {"statusCode": 500, "body": json.dumps({"error": "GEOJSON_BUCKET not set"})}
+    try:
+        return _respond(event, bucket, key)
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] not in ("PreconditionFailed", "412"):
+            raise
+        # Replaced between the HEAD and the GET: start again from the new version
+        _cache.pop((bucket, key), None)
+        return _respond(event, bucket, key)
 
-    obj = s3.get_object(Bucket=bucket, Key=key)
-    data = obj["Body"].read().decode("utf-8")
-    return {
-        "statusCode": 200,
-        "headers": {"Content-Type": "application/json"},
-        "body": data,
-    }
+
+def _respond(event, bucket, key):
+    entry = _load(bucket, key)
+    headers = {"Cache-Control": f"public, max-age={CACHE_MAX_AGE}", "Vary": "Accept-Encoding"}
+    if entry["etag"]:
+        headers["ETag"] = entry["etag"]
+    if _etag_matches(_header(event, "if-none-match"), entry["etag"]):
+        return {"statusCode": 304, "headers": headers, "body": ""}
+
+    # The stored object alone is over the cap: redirect without reading it
+    if (entry["length"] or 0) > MAX_RESPONSE_BYTES:
+        return _redirect(bucket, key)
+    accepted = _accepted_encodings(_header(event, "accept-encoding"))
+    encoding = "identity"
+    if "br" in accepted and (brotli is not None or entry["stored"] == "br"):
+        encoding = "br"
+    elif "gzip" in accepted:
+        encoding = "gzip"
+    body = entry["texts"].get(encoding)
+    if body is None:
+        body = _body(bucket, key, entry, encoding)
+        if len(body) > MAX_RESPONSE_BYTES:
+            return _redirect(bucket, key)
+        # Only bodies that are served are kept, once per ETag
+        entry["texts"][encoding] = body
+
+    headers["Content-Type"] = "application/json"
+    response = {"statusCode": 200, "headers": headers, "body": body}
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+        response["isBase64Encoded"] = True
+    return response
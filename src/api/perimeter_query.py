@@ -0,0 +1,248 @@
+"""``GET /geojson/query``: perimeter features by bbox, age and source.
+
+Answers from the processor's spatial index (``INDEX_KEY``), loaded once per
+container and revalidated by ETag like the proxy. Only the JSON header is
+parsed: the packed R-tree yields bounding-box candidates, ``last_seen`` and
+the source bitmask filter them, and the matching Feature lines are spliced
+into the response as they are. A candidate whose box sticks out of ``bbox``
+has its line parsed and is tested exactly in pure Python, since the Lambda
+bundles no geometry library.
+"""
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from common import runtime
+
+runtime.instrument()
+
+s3 = runtime.lazy_client('s3')
+
+# A loaded index is used this long before its ETag is revalidated with a HEAD
+REVALIDATE_SECONDS = float(os.environ.get("REVALIDATE_SECONDS", "30"))
+CACHE_MAX_AGE = int(os.environ.get("CACHE_MAX_AGE", "60"))
+DEFAULT_LIMIT = int(os.environ.get("DEFAULT_LIMIT", "500"))
+MAX_LIMIT = int(os.environ.get("MAX_LIMIT", "5000"))
+# Lambda proxy responses are capped at 6 MB; leave room for headers
+MAX_RESPONSE_BYTES = int(os.environ.get("MAX_RESPONSE_BYTES", str(6 * 1024 * 1024 - 16 * 1024)))
+
+# Warm-container cache: (bucket, key) -> parsed index header and raw feature lines
+_indexes = {}
+
+
+def parse_index(raw, etag=None):
+    """Split an index file into its parsed header and raw feature lines."""
+    split = raw.index(b"\n")
+    header = json.loads(raw[:split])
+    # Feature lines stay as bytes; responses splice them together unparsed
+    features = raw[split + 1:].split(b"\n")[: header["count"]]
+    return {"etag": etag, "header": header, "features": features, "checked": time.monotonic()}
+
+
+def _fetch(bucket, key):
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    return parse_index(obj["Body"].read(), obj.get("ETag"))
+
+
+def _load(bucket, key):
+    """Return the index, loading it once per container and revalidating its ETag when stale."""
+    entry = _indexes.get((bucket, key))
+    if entry is not None and time.monotonic() - entry["checked"] >= REVALIDATE_SECONDS:
+        if s3.head_object(Bucket=bucket, Key=key).get("ETag") == entry["etag"]:
+            entry["checked"] = time.monotonic()
+        else:
+            entry = None
+    if entry is None:
+        entry = _fetch(bucket, key)
+        _indexes[(bucket, key)] = entry
+    return entry
+
+
+def search(header, bbox):
+    """Candidate positions: features whose bounding boxes intersect ``bbox``, walking the packed R-tree.
+
+    ``query`` refines them with ``intersects``.
+    """
+    levels = header["levels"]
+    if not levels:
+        return []
+    size = header["node_size"]
+    minx, miny, maxx, maxy = bbox
+    candidates = range(len(levels[-1][0]))
+    for depth in range(len(levels) - 1, -1, -1):
+        x0, y0, x1, y1 = levels[depth]
+        hits = [i for i in candidates if x0[i] <= maxx and x1[i] >= minx and y0[i] <= maxy and y1[i] >= miny]
+        if depth == 0:
+            return hits
+        count = len(levels[depth - 1][0])
+        candidates = [child for i in hits for child in range(i * size, min(i * size + size, count))]
+    return []
+
+
+def _segment_hits_box(ax, ay, bx, by, bbox):
+    """Whether segment a-b touches the box (Liang-Barsky clipping)."""
+    minx, miny, maxx, maxy = bbox
+    t0, t1 = 0.0, 1.0
+    dx, dy = bx - ax, by - ay
+    for p, q in ((-dx, ax - minx), (dx, maxx - ax), (-dy, ay - miny), (dy, maxy - ay)):
+        if p == 0:
+            if q < 0:
+                return False
+            continue
+        t = q / p
+        if p < 0:
+            t0 = max(t0, t)
+        else:
+            t1 = min(t1, t)
+        if t0 > t1:
+            return False
+    return True
+
+
+def _contains(rings, x, y):
+    """Even-odd point-in-polygon test over a polygon's rings, holes included."""
+    inside = False
+    for ring in rings:
+        for (ax, ay), (bx, by) in zip(ring, ring[1:]):
+            if (ay > y) != (by > y) and x < ax + (y - ay) * (bx - ax) / (by - ay):
+                inside = not inside
+    return inside
+
+
+def _parts(geometry):
+    """``(rings, is_area)`` for each part of ``geometry``; lines and points come as one open "ring"."""
+    kind, coordinates = geometry.get("type"), geometry.get("coordinates")
+    if kind == "Polygon":
+        yield coordinates, True
+    elif kind == "MultiPolygon":
+        for polygon in coordinates:
+            yield polygon, True
+    elif kind in ("LineString", "MultiPoint"):
+        yield [coordinates], False
+    elif kind == "MultiLineString":
+        for line in coordinates:
+            yield [line], False
+    elif kind == "Point":
+        yield [[coordinates]], False
+    elif kind == "GeometryCollection":
+        for part in geometry.get("geometries", []):
+            yield from _parts(part)
+
+
+def intersects(geometry, bbox):
+    """Whether a GeoJSON ``geometry`` intersects ``bbox`` exactly, not just by bounding box."""
+    minx, miny, maxx, maxy = bbox
+    for rings, is_area in _parts(geometry):
+        for ring in rings:
+            if any(minx <= x <= maxx and miny <= y <= maxy for x, y, *_ in ring):
+                return True
+            if any(_segment_hits_box(*a[:2], *b[:2], bbox) for a, b in zip(ring, ring[1:])):
+                return True
+        # No vertex in the box and no edge across it: the box is wholly inside the area or outside it
+        if is_area and _contains(rings, minx, miny):
+            return True
+    return False
+
+
+def _within(leaves, i, bbox):
+    """Whether feature ``i``'s bounding box lies inside ``bbox``, so it matches without a closer look."""
+    x0, y0, x1, y1 = leaves
+    return bbox[0] <= x0[i] and bbox[1] <= y0[i] and x1[i] <= bbox[2] and y1[i] <= bbox[3]
+
+
+def _parse_bbox(value):
+    parts = [float(v) for v in value.split(",")]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError("bbox must be minLon,minLat,maxLon,maxLat")
+    return parts
+
+
+def _parse_since(value):
+    """Epoch seconds or an ISO 8601 timestamp (naive values are UTC)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def perimeterQueryFn(event, context):
+    """Return perimeter features matching bbox, since, source and limit query parameters."""
+    bucket = os.environ.get("GEOJSON_BUCKET")
+    key = os.environ.get("GEOJSON_INDEX_KEY", "fire_perimeters.index.ndjson")
+    if not bucket:
+        return runtime.error_response(500, "GEOJSON_BUCKET not set")
+
+    try:
+        index = _load(bucket, key)
+    except ClientError as exc:
+        # The processor has not written its first index yet
+        if exc.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return runtime.error_response(503, "index not ready")
+        raise
+    return query(index, (event or {}).get("queryStringParameters") or {})
+
+
+def query(index, params):
+    """Proxy response with the features of a parsed ``index`` matching the query ``params``.
+
+    Shared with the resident perimeter service, which serves the same
+    parameters from an index it keeps in memory.
+    """
+    try:
+        bbox = _parse_bbox(params["bbox"]) if params.get("bbox") else None
+        since = _parse_since(params["since"]) if params.get("since") else None
+        limit = int(params.get("limit") or DEFAULT_LIMIT)
+    except (TypeError, ValueError) as exc:
+        return runtime.error_response(400, str(exc))
+    if not 0 < limit <= MAX_LIMIT:
+        return runtime.error_response(400, f"limit must be between 1 and {MAX_LIMIT}")
+
+    header = index["header"]
+    hits = search(header, bbox) if bbox else range(header["count"])
+    if bbox:
+        # Box-overlap candidates only parse their feature line when it straddles the box edge
+        leaves, lines = header["levels"][0], index["features"]
+        hits = [i for i in hits if _within(leaves, i, bbox) or intersects(json.loads(lines[i])["geometry"], bbox)]
+    last_seen = header["last_seen"]
+    if since is not None:
+        hits = [i for i in hits if last_seen[i] >= since]
+    if params.get("source"):
+        names = header["source_names"]
+        wanted = 0
+        for name in params["source"].split(","):
+            if name.strip() in names:
+                wanted |= 1 << names.index(name.strip())
+        masks = header["sources"]
+        hits = [i for i in hits if masks[i] & wanted]
+    # Most recently active perimeters first
+    hits = sorted(hits, key=lambda i: last_seen[i], reverse=True)
+
+    features, size, truncated = [], 0, len(hits) > limit
+    for i in hits[:limit]:
+        line = index["features"][i]
+        if size + len(line) + 1 > MAX_RESPONSE_BYTES - 256:
+            truncated = True
+            break
+        features.append(line)
+        size += len(line) + 1
+    body = (
+        b'{"type":"FeatureCollection","features":['
+        + b",".join(features)
+        + b'],"matched":'
+        + str(len(hits)).encode("ascii")
+        + b',"truncated":'
+        + (b"true" if truncated else b"false")
+        + b"}"
+    )
+    return {
+        "statusCode": 200,
+        "headers": {"Content-Type": "application/geo+json", "Cache-Control": f"public, max-age={CACHE_MAX_AGE}"},
+        "body": body.decode("utf-8"),
+    }
@@ -1,23 +1,213 @@
 import json
 import os
-import boto3
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
 
-dynamodb = boto3.resource('dynamodb')
+from botocore.exceptions import ClientError
 
+from common import batch_write, runtime
 
-def subscribeFn(event, context):
-    """Store alert subscription for the authenticated user."""
-    table = dynamodb.Table(os.environ['ALERTS_TABLE'])
-    user_id = event['requestContext']['authorizer']['claims']['sub']
-    body = json.loads(event.get('body') or '{}')
-    fence_id = body['fence_id']
+runtime.instrument()
+
+dynamodb = runtime.lazy_resource('dynamodb')
+# Low-level client for the batch calls
+client = runtime.lazy_client('dynamodb')
+
+# Geohash length of the ``cell`` attribute keyed by the cell-index GSI (4 ~ 39 x 20 km)
+CELL_PRECISION = int(os.environ.get('GEOHASH_CELL_PRECISION', '4'))
+GEOHASH_PRECISION = 9
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_serializer = None
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point, ``precision`` characters long."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, coord = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (span[0] + span[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def _positions(coordinates):
+    if coordinates and isinstance(coordinates[0], (int, float, Decimal)):
+        yield float(coordinates[0]), float(coordinates[1])
+        return
+    for part in coordinates or ():
+        yield from _positions(part)
+
+
+def _location(params):
+    """``(latitude, longitude)`` a fence is indexed under: its centre point, or
+    the middle of its GeoJSON geometry's bounding box."""
+    if params.get('latitude') is not None and params.get('longitude') is not None:
+        return float(params['latitude']), float(params['longitude'])
+    geometry = params.get('geometry')
+    if not isinstance(geometry, dict):
+        return None
+    points = list(_positions(geometry.get('coordinates')))
+    if not points:
+        return None
+    lons, lats = zip(*points)
+    return (min(lats) + max(lats)) / 2, (min(lons) + max(lons)) / 2
+
+
+def _item(user_id, body):
     item = {
         'user_id': user_id,
-        'fence_id': fence_id,
+        'fence_id': body['fence_id'],
         'params': body
     }
-    table.put_item(Item=item)
+    location = _location(body)
+    if location is not None:
+        # Area lookups query the cell-index GSI on ``cell``, refined by ``geohash`` prefixes
+        item['geohash'] = geohash(*location)
+        item['cell'] = item['geohash'][:CELL_PRECISION]
+    return item
+
+
+def _body(event):
+    # DynamoDB rejects floats, so coordinates are kept as Decimal
+    return runtime.json_body(event, parse_float=Decimal)
+
+
+def _register_device(user_id, body):
+    devices_table = os.environ.get('DEVICES_TABLE')
+    if devices_table and body.get('device_token'):
+        # push_bridge reads these when fanning an alert out to a fence's subscribers
+        dynamodb.Table(devices_table).update_item(
+            Key={'user_id': user_id},
+            UpdateExpression='ADD device_tokens :token',
+            ExpressionAttributeValues={':token': {body['device_token']}},
+        )
+
+
+def _update(item):
+    """UpdateItem expression and values storing ``item``'s subscription attributes.
+
+    Only those attributes are set (or removed), so re-subscribing a fence
+    keeps the ``intersects`` flag the processor maintains on it.
+    """
+    sets, removes, values = ['params = :params'], [], {':params': item['params']}
+    for name in ('geohash', 'cell'):
+        if name in item:
+            sets.append(f'{name} = :{name}')
+            values[f':{name}'] = item[name]
+        else:
+            removes.append(name)
+    expression = 'SET ' + ', '.join(sets)
+    if removes:
+        expression += ' REMOVE ' + ', '.join(removes)
+    return expression, values
+
+
+def _has_fence_id(fence):
+    return isinstance(fence, dict) and isinstance(fence.get('fence_id'), str) and bool(fence['fence_id'])
+
+
+def subscribeFn(event, context):
+    """Store alert subscription for the authenticated user."""
+    table = dynamodb.Table(os.environ['ALERTS_TABLE'])
+    user_id = event['requestContext']['authorizer']['claims']['sub']
+    try:
+        body = _body(event)
+    except ValueError:
+        return runtime.error_response(400, 'body must be JSON')
+    if not _has_fence_id(body):
+        return runtime.error_response(400, 'fence_id must be a non-empty string')
+    item = _item(user_id, body)
+    expression, values = _update(item)
+    table.update_item(
+        Key={'user_id': user_id, 'fence_id': item['fence_id']},
+        UpdateExpression=expression,
+        ExpressionAttributeValues=values,
+    )
+    _register_device(user_id, body)
     return {
         'statusCode': 201,
-        'body': json.dumps({'fence_id': fence_id})
+        'body': json.dumps({'fence_id': item['fence_id']})
+    }
+
+
+def _serialize(item):
+    """``item`` in DynamoDB attribute-value form (boto3 is imported on first use)."""
+    global _serializer
+    if _serializer is None:
+        from boto3.dynamodb.types import TypeSerializer
+
+        _serializer = TypeSerializer()
+    return {name: _serializer.serialize(value) for name, value in item.items()}
+
+
+def _update_existing(table, items):
+    """Update already-subscribed fences in place; returns the ids that failed."""
+    def update(item):
+        expression, values = _update(item)
+        try:
+            client.update_item(
+                TableName=table,
+                Key=_serialize({'user_id': item['user_id'], 'fence_id': item['fence_id']}),
+                UpdateExpression=expression,
+                ExpressionAttributeValues=_serialize(values),
+            )
+        except ClientError:
+            return item['fence_id']
+        return None
+
+    if len(items) <= 1 or batch_write.BATCH_WRITE_CONCURRENCY <= 1:
+        results = [update(item) for item in items]
+    else:
+        with ThreadPoolExecutor(max_workers=batch_write.BATCH_WRITE_CONCURRENCY) as pool:
+            results = list(pool.map(update, items))
+    return [fence_id for fence_id in results if fence_id is not None]
+
+
+def batchSubscribeFn(event, context):
+    """Store many alert subscriptions (``{"fences": [...]}``) for the authenticated user."""
+    user_id = event['requestContext']['authorizer']['claims']['sub']
+    try:
+        body = _body(event)
+    except ValueError:
+        return runtime.error_response(400, 'body must be JSON')
+    fences = body.get('fences') if isinstance(body, dict) else None
+    if not isinstance(fences, list) or not fences:
+        return runtime.error_response(400, 'fences must be a non-empty list')
+    if len(fences) > batch_write.MAX_BATCH_FENCES:
+        return runtime.error_response(400, f'at most {batch_write.MAX_BATCH_FENCES} fences per request')
+    if not all(_has_fence_id(fence) for fence in fences):
+        return runtime.error_response(400, 'every fence needs a string fence_id')
+    table = os.environ['ALERTS_TABLE']
+    # One BatchWriteItem call may not touch the same key twice; the last fence wins
+    items = {fence['fence_id']: _item(user_id, fence) for fence in fences}
+    # BatchWriteItem can only replace whole items, which would drop a fence's
+    # ``intersects`` flag, so it is used for new fences only; fences that exist
+    # (or could not be checked) are updated in place
+    keys = [_serialize({'user_id': user_id, 'fence_id': fence_id}) for fence_id in items]
+    found, unread = batch_write.get_batch(client, table, keys, 'fence_id')
+    existing = {item['fence_id']['S'] for item in found} | {key['fence_id']['S'] for key in unread}
+    requests = [
+        {'PutRequest': {'Item': _serialize(item)}}
+        for fence_id, item in items.items() if fence_id not in existing
+    ]
+    unwritten = batch_write.write_batch(client, table, requests)
+    failed = [request['PutRequest']['Item']['fence_id']['S'] for request in unwritten]
+    failed += _update_existing(table, [item for fence_id, item in items.items() if fence_id in existing])
+    _register_device(user_id, body)
+    failed.sort()
+    return {
+        'statusCode': 207 if failed else 201,
+        'body': json.dumps({'written': len(items) - len(failed), 'failed': failed})
     }
@@ -1,10 +1,15 @@
 import json
 import os
-import boto3
+
 from botocore.exceptions import ClientError
 
+from common import batch_write, runtime
+
+runtime.instrument()
 
-dynamodb = boto3.resource('dynamodb')
+dynamodb = runtime.lazy_resource('dynamodb')
+# Low-level client for the batch calls
+client = runtime.lazy_client('dynamodb')
 
 
 def unsubscribeFn(event, context):
@@ -19,6 +24,35 @@ def unsubscribeFn(event, context):
         )
     except ClientError as exc:
         if exc.response['Error']['Code'] == 'ConditionalCheckFailedException':
-            return {'statusCode': 404, 'body': json.dumps({'error': 'alert not found'})}
+            return runtime.error_response(404, 'alert not found')
         raise
     return {'statusCode': 204, 'body': ''}
+
+
+def batchUnsubscribeFn(event, context):
+    """Remove many alert subscriptions (``{"fence_ids": [...]}``) of the authenticated user.
+
+    Deletes are idempotent: ids without a subscription count as removed.
+    """
+    user_id = event['requestContext']['authorizer']['claims']['sub']
+    try:
+        body = runtime.json_body(event)
+    except ValueError:
+        return runtime.error_response(400, 'body must be JSON')
+    fence_ids = body.get('fence_ids') if isinstance(body, dict) else None
+    if not isinstance(fence_ids, list) or not fence_ids or not all(isinstance(f, str) and f for f in fence_ids):
+        return runtime.error_response(400, 'fence_ids must be a non-empty list of ids')
+    if len(fence_ids) > batch_write.MAX_BATCH_FENCES:
+        return runtime.error_response(400, f'at most {batch_write.MAX_BATCH_FENCES} fence_ids per request')
+    # One BatchWriteItem call may not touch the same key twice
+    unique = list(dict.fromkeys(fence_ids))
+    requests = [
+        {'DeleteRequest': {'Key': {'user_id': {'S': user_id}, 'fence_id': {'S': fence_id}}}}
+        for fence_id in unique
+    ]
+    unwritten = batch_write.write_batch(client, os.environ['ALERTS_TABLE'], requests)
+    failed = sorted(request['DeleteRequest']['Key']['fence_id']['S'] for request in unwritten)
+    return {
+        'statusCode': 207 if failed else 200,
+        'body': json.dumps({'deleted': len(unique) - len(failed), 'failed': failed})
+    }
@@ -0,0 +1,75 @@
+"""DynamoDB batch reads and writes with jittered retries of unprocessed requests.
+
+Shared by the batch subscribe/unsubscribe handlers, which ship it alongside
+their handler as ``common/batch_write.py``, and by the processor's fence
+writer for its backoff. It imports nothing beyond the standard library.
+"""
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Fences (or fence ids) accepted by one batch request
+MAX_BATCH_FENCES = int(os.environ.get('MAX_BATCH_FENCES', '5000'))
+# BatchWriteItem accepts at most 25 requests per call
+MAX_BATCH_WRITE = 25
+# BatchGetItem accepts at most 100 keys per call
+MAX_BATCH_GET = 100
+BATCH_WRITE_CONCURRENCY = int(os.environ.get('BATCH_WRITE_CONCURRENCY', '4'))
+BATCH_WRITE_MAX_ATTEMPTS = int(os.environ.get('BATCH_WRITE_MAX_ATTEMPTS', '6'))
+BASE_DELAY = 0.05
+MAX_DELAY = 2.0
+
+
+def backoff_delay(attempt, base_delay, max_delay, rng=random):
+    """Seconds to wait before retry ``attempt`` ("full jitter" exponential backoff)."""
+    return rng.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def _drain(send, chunks):
+    """Call ``send(chunk)`` for every chunk, ``BATCH_WRITE_CONCURRENCY`` at a time,
+    resending what it hands back; returns whatever is left after the last attempt."""
+    def run(chunk):
+        pending = chunk
+        for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(backoff_delay(attempt, BASE_DELAY, MAX_DELAY))
+            pending = send(pending)
+            if not pending:
+                return []
+        return pending
+
+    if len(chunks) <= 1 or BATCH_WRITE_CONCURRENCY <= 1:
+        return [left for chunk in chunks for left in run(chunk)]
+    with ThreadPoolExecutor(max_workers=BATCH_WRITE_CONCURRENCY) as pool:
+        return [left for unsent in pool.map(run, chunks) for left in unsent]
+
+
+def write_batch(client, table, requests):
+    """Send BatchWriteItem requests 25 at a time, retrying unprocessed ones.
+
+    Returns the requests still unprocessed after ``BATCH_WRITE_MAX_ATTEMPTS``.
+    """
+    def send(chunk):
+        resp = client.batch_write_item(RequestItems={table: chunk})
+        return resp.get('UnprocessedItems', {}).get(table, [])
+
+    return _drain(send, [requests[i:i + MAX_BATCH_WRITE] for i in range(0, len(requests), MAX_BATCH_WRITE)])
+
+
+def get_batch(client, table, keys, projection):
+    """Read ``keys`` with BatchGetItem 100 at a time, retrying unprocessed keys.
+
+    Returns ``(items, unread)``: the items found, with only the ``projection``
+    attributes, and the keys still unprocessed after ``BATCH_WRITE_MAX_ATTEMPTS``.
+    """
+    items = []
+
+    def send(chunk):
+        resp = client.batch_get_item(RequestItems={table: {'Keys': chunk, 'ProjectionExpression': projection}})
+        # list.extend is atomic, so the worker threads can share ``items``
+        items.extend(resp.get('Responses', {}).get(table, []))
+        return resp.get('UnprocessedKeys', {}).get(table, {}).get('Keys', [])
+
+    unread = _drain(send, [keys[i:i + MAX_BATCH_GET] for i in range(0, len(keys), MAX_BATCH_GET)])
+    return items, unread
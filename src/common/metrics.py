@@ -0,0 +1,254 @@
+"""Counters and histograms for the pipeline's hot paths.
+
+Instruments record into an in-process registry. A call costs a lock, a
+dict lookup and a bisect, and the module imports only the standard library,
+so the single-file Lambdas ship it next to ``common/runtime.py``.
+
+* The ECS app serves the registry in Prometheus text format on ``/metrics``.
+* With ``METRICS_EXPORTER=otlp``, every recording is also mirrored to an
+  OpenTelemetry instrument. Those are exported over OTLP/HTTP to
+  ``OTEL_EXPORTER_OTLP_ENDPOINT``, e.g. the ADOT collector.
+* Lambdas call ``flush`` before returning, because a frozen sandbox never
+  reaches the next periodic export.
+
+Instruments are declared once at module level with ``counter`` and
+``histogram``. Labels are passed as keyword arguments and should come from
+small fixed sets such as feed names and outcomes.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+# "otlp" mirrors every recording to OpenTelemetry and exports it; "none" keeps them in-process
+METRICS_EXPORTER = os.environ.get("METRICS_EXPORTER", "none").lower()
+# Milliseconds between periodic OTLP exports (Lambdas also flush per invocation)
+METRICS_EXPORT_INTERVAL_MS = int(os.environ.get("METRICS_EXPORT_INTERVAL_MS", "60000"))
+# Value of the service.name resource attribute on exported metrics
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME") or os.environ.get("AWS_LAMBDA_FUNCTION_NAME", "koalasafe")
+
+# Bucket upper bounds for latencies, sizes and counts
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+COUNTS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000, 10000, 100000, 1000000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_registry: Dict[str, "_Instrument"] = {}
+_meter: Any = None
+_provider: Any = None
+
+
+def _key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _exporting() -> bool:
+    return METRICS_EXPORTER == "otlp"
+
+
+def _otel_meter():
+    """The OpenTelemetry meter, with its OTLP exporter built on first use."""
+    global _meter, _provider
+    if _meter is None:
+        with _lock:
+            if _meter is None:
+                from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter
+                from opentelemetry.sdk.metrics import MeterProvider
+                from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+                from opentelemetry.sdk.resources import Resource
+
+                reader = PeriodicExportingMetricReader(
+                    OTLPMetricExporter(), export_interval_millis=METRICS_EXPORT_INTERVAL_MS
+                )
+                _provider = MeterProvider(
+                    metric_readers=[reader], resource=Resource.create({"service.name": SERVICE_NAME})
+                )
+                _meter = _provider.get_meter("koalasafe")
+    return _meter
+
+
+class _Instrument:
+    kind = ""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self.lock = threading.Lock()
+        self._mirror: Any = None
+
+    def mirror(self) -> Any:
+        if self._mirror is None:
+            self._mirror = self._create(_otel_meter())
+        return self._mirror
+
+    def _create(self, meter) -> Any:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+def _labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter(_Instrument):
+    """Monotonic total per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self.values: Dict[LabelKey, float] = {}
+
+    def _create(self, meter) -> Any:
+        return meter.create_counter(self.name, description=self.description)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("counters only go up")
+        key = _key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        if _exporting():
+            self.mirror().add(amount, dict(key))
+
+    def value(self, **labels) -> float:
+        return self.values.get(_key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_labels(key)} {_number(value)}" for key, value in items]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.values.clear()
+
+
+class Histogram(_Instrument):
+    """Bucketed distribution per label set, with a running sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float] = SECONDS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (last is +Inf), sum, count]
+        self.series: Dict[LabelKey, list] = {}
+
+    def _create(self, meter) -> Any:
+        return meter.create_histogram(
+            self.name, description=self.description, explicit_bucket_boundaries_advisory=list(self.buckets)
+        )
+
+    def observe(self, value: float, **labels) -> None:
+        key = _key(labels)
+        slot = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][slot] += 1
+            series[1] += value
+            series[2] += 1
+        if _exporting():
+            self.mirror().record(value, dict(key))
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[Dict[str, Any]]:
+        """Observe the block's wall-clock seconds; labels may be added to the yielded dict."""
+        started = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        series = self.series.get(_key(labels))
+        return series[2] if series else 0
+
+    def sum(self, **labels) -> float:
+        series = self.series.get(_key(labels))
+        return series[1] if series else 0.0
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self.series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                lines.append(f"{self.name}_bucket{_labels(key, [('le', _number(bound))])} {running}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(key)} {count}")
+        return lines
+
+    def clear(self) -> None:
+        with self.lock:
+            self.series.clear()
+
+
+def _register(cls, name: str, *args) -> Any:
+    with _lock:
+        found = _registry.get(name)
+        if found is None:
+            found = _registry[name] = cls(name, *args)
+        elif not isinstance(found, cls):
+            raise ValueError(f"{name} is already registered as a {found.kind}")
+    return found
+
+
+def counter(name: str, description: str) -> Counter:
+    """The process-wide counter ``name`` (Prometheus convention: end it in ``_total``)."""
+    return _register(Counter, name, description)
+
+
+def histogram(name: str, description: str, buckets: Sequence[float] = SECONDS) -> Histogram:
+    """The process-wide histogram ``name``; ``buckets`` are inclusive upper bounds."""
+    return _register(Histogram, name, description, buckets)
+
+
+def render() -> str:
+    """Every registered instrument in the Prometheus text exposition format."""
+    with _lock:
+        instruments = sorted(_registry.values(), key=lambda instrument: instrument.name)
+    lines = []
+    for instrument in instruments:
+        lines.append(f"# HELP {instrument.name} {instrument.description}")
+        lines.append(f"# TYPE {instrument.name} {instrument.kind}")
+        lines.extend(instrument.render())
+    return "\n".join(lines) + "\n"
+
+
+def flush(timeout_ms: int = 5000) -> bool:
+    """Push pending OTLP data now (end of a Lambda invocation); no-op unless exporting."""
+    if _provider is None:
+        return False
+    return _provider.force_flush(timeout_ms)
+
+
+def reset() -> None:
+    """Zero every instrument (tests); registrations are kept."""
+    with _lock:
+        instruments = list(_registry.values())
+    for instrument in instruments:
+        instrument.clear()
@@ -0,0 +1,74 @@
+"""Wire formats for normalized ingest records.
+
+``jsonl`` is one JSON object per line, as Firehose has always received.
+``msgpack`` writes each record as a fixed-position MessagePack array
+``[version, source, id, latitude, longitude, timestamp, raw]``, dropping the
+repeated key names; ``raw`` is ``nil`` when excluded. Both formats can be
+concatenated freely, so Firehose aggregation and S3 delivery keep working.
+"""
+import json
+from typing import Any, Callable, Dict, Iterator
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+ENCODINGS = ("jsonl", "msgpack")
+FIELDS = ("source", "id", "latitude", "longitude", "timestamp", "raw")
+ROW_VERSION = 1
+
+_JSON_START = frozenset(b"{[ \t\r\n")
+
+
+def get_encoder(encoding: str = "jsonl", include_raw: bool = True) -> Callable[[Dict[str, Any]], bytes]:
+    """Return a function turning one record into its encoded bytes."""
+    if encoding == "jsonl":
+        if include_raw:
+            return lambda rec: (json.dumps(rec) + "\n").encode("utf-8")
+        return lambda rec: (json.dumps({k: v for k, v in rec.items() if k != "raw"}) + "\n").encode("utf-8")
+    if encoding == "msgpack":
+        if msgpack is None:
+            raise RuntimeError("RECORD_ENCODING=msgpack requires the msgpack package")
+
+        def encode(rec: Dict[str, Any]) -> bytes:
+            row = [
+                ROW_VERSION,
+                rec.get("source"),
+                rec.get("id"),
+                rec.get("latitude"),
+                rec.get("longitude"),
+                rec.get("timestamp"),
+                rec.get("raw") if include_raw else None,
+            ]
+            return msgpack.packb(row, use_bin_type=True, default=str)
+
+        return encode
+    raise ValueError(f"Unknown record encoding {encoding!r}; expected one of {ENCODINGS}")
+
+
+def detect_encoding(body: bytes) -> str:
+    """Guess the encoding of a delivered object from its first byte."""
+    if not body or body[0] in _JSON_START:
+        return "jsonl"
+    return "msgpack"
+
+
+def decode_records(body: bytes) -> Iterator[Dict[str, Any]]:
+    """Yield records from an object written in any supported encoding."""
+    if detect_encoding(body) == "jsonl":
+        for line in body.splitlines():
+            if line.strip():
+                yield json.loads(line)
+        return
+    if msgpack is None:
+        raise RuntimeError("Object is MessagePack encoded but msgpack is not installed")
+    unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+    unpacker.feed(body)
+    for row in unpacker:
+        if not isinstance(row, list) or not row or row[0] != ROW_VERSION:
+            raise ValueError(f"Unsupported record row {row!r:.80}")
+        rec = dict(zip(FIELDS, row[1:]))
+        if rec["raw"] is None:
+            del rec["raw"]
+        yield rec
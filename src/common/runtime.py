@@ -0,0 +1,152 @@
+"""Lightweight runtime helpers shared by the Lambda handlers.
+
+Cold starts used to pay for every boto3 client, an OpenTelemetry
+instrumentation pass and, in the ingest Lambda, a Secrets Manager call
+before the first event arrived. This module defers all of that: clients
+are built on first use and cached for the life of the process, secrets
+are read on demand and cached for a TTL, and instrumentation only runs
+when a function opts in with ``INSTRUMENTATION=true``.
+
+It imports nothing beyond the standard library at module load, so the
+single-file Lambdas ship it alongside their handler as ``common/runtime.py``.
+"""
+import base64
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Opt-in: only instrument handlers with OpenTelemetry when "true"
+INSTRUMENTATION = os.environ.get("INSTRUMENTATION", "false").lower() == "true"
+# Fraction of traces kept once instrumented (parent-based trace id ratio sampler)
+TRACE_SAMPLE_RATE = os.environ.get("TRACE_SAMPLE_RATE", "0.1")
+# Seconds a secret read from Secrets Manager is reused
+SECRET_TTL_SECONDS = float(os.environ.get("SECRET_TTL_SECONDS", "300"))
+
+_lock = threading.Lock()
+_clients: Dict[Tuple, Any] = {}
+_instrumented = False
+
+
+def _cached(kind: str, service: str, kwargs: Dict[str, Any]) -> Any:
+    key = (kind, service, tuple(sorted(kwargs.items())))
+    found = _clients.get(key)
+    if found is not None:
+        return found
+    with _lock:
+        found = _clients.get(key)
+        if found is None:
+            import boto3
+
+            found = _clients[key] = getattr(boto3, kind)(service, **kwargs)
+    return found
+
+
+def client(service: str, **kwargs) -> Any:
+    """The process-wide boto3 client for ``service`` and ``kwargs``, built on first call."""
+    return _cached("client", service, kwargs)
+
+
+def resource(service: str, **kwargs) -> Any:
+    """The process-wide boto3 resource for ``service`` and ``kwargs``, built on first call."""
+    return _cached("resource", service, kwargs)
+
+
+class Lazy:
+    """Module-level stand-in for a client that is only built when first used.
+
+    Attribute access is forwarded to ``factory()``; tests can still replace
+    the module attribute or patch attributes on the proxy itself.
+    """
+
+    def __init__(self, factory: Callable[[], Any]):
+        self._factory = factory
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self._factory(), name)
+
+
+def lazy_client(service: str, **kwargs) -> Lazy:
+    return Lazy(lambda: client(service, **kwargs))
+
+
+def lazy_resource(service: str, **kwargs) -> Lazy:
+    return Lazy(lambda: resource(service, **kwargs))
+
+
+class SecretCache:
+    """``SecretString`` values by secret id, each re-read once ``ttl`` seconds old."""
+
+    def __init__(self, ttl: float = SECRET_TTL_SECONDS):
+        self.ttl = ttl
+        self.entries: Dict[str, Tuple[Optional[str], float]] = {}
+        self.reads = 0
+
+    def get(self, secret_id: str, ttl: Optional[float] = None, **client_kwargs) -> Optional[str]:
+        now = time.monotonic()
+        entry = self.entries.get(secret_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        resp = client("secretsmanager", **client_kwargs).get_secret_value(SecretId=secret_id)
+        self.reads += 1
+        value = resp.get("SecretString")
+        self.entries[secret_id] = (value, now + (self.ttl if ttl is None else ttl))
+        return value
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+_secrets = SecretCache()
+
+
+def secret(secret_id: str, ttl: Optional[float] = None, **client_kwargs) -> Optional[str]:
+    """A secret's ``SecretString``, cached for ``ttl`` (default ``SECRET_TTL_SECONDS``)."""
+    return _secrets.get(secret_id, ttl, **client_kwargs)
+
+
+def json_body(event: Dict[str, Any], **loads_kwargs) -> Any:
+    """The parsed JSON body of an API Gateway proxy event; raises ``ValueError`` if it is not JSON.
+
+    The API treats every media type as binary so the GeoJSON proxy can
+    return gzip, so bodies may arrive base64-encoded. ``loads_kwargs`` are
+    passed to ``json.loads``.
+    """
+    raw = event.get("body") or "{}"
+    if event.get("isBase64Encoded"):
+        raw = base64.b64decode(raw)
+    return json.loads(raw, **loads_kwargs)
+
+
+def error_response(status: int, message: str) -> Dict[str, Any]:
+    """API Gateway proxy response with a ``{"error": message}`` JSON body."""
+    return {"statusCode": status, "body": json.dumps({"error": message})}
+
+
+def instrument() -> bool:
+    """Instrument the Lambda handler with OpenTelemetry if ``INSTRUMENTATION`` is on.
+
+    Call at module level; the instrumentor wraps the handler named by
+    ``_HANDLER``, which the runtime resolves before the first event. Traces
+    are sampled at ``TRACE_SAMPLE_RATE`` unless ``OTEL_TRACES_SAMPLER`` is set.
+    """
+    global _instrumented
+    if not INSTRUMENTATION or _instrumented:
+        return _instrumented
+    os.environ.setdefault("OTEL_TRACES_SAMPLER", "parentbased_traceidratio")
+    os.environ.setdefault("OTEL_TRACES_SAMPLER_ARG", TRACE_SAMPLE_RATE)
+    from opentelemetry.instrumentation.aws_lambda import AwsLambdaInstrumentor
+
+    AwsLambdaInstrumentor().instrument()
+    _instrumented = True
+    return True
+
+
+def reset() -> None:
+    """Forget cached clients and secrets (tests, or after credentials rotate)."""
+    with _lock:
+        _clients.clear()
+    _secrets.clear()
@@ -0,0 +1,487 @@
+"""Rolling hourly air-quality series and averages for NSW EPN monitoring sites.
+
+Readings are grouped by (site, pollutant) into NumPy ring buffers of
+``AIR_QUALITY_RETENTION_HOURS`` hourly values. A value's slot is its epoch
+hour modulo the capacity, and a parallel array records the hour each slot
+holds, so the previous lap's values are never read as current. An update
+scatters new hours into their slots and recomputes the 1 h and 24 h averages
+only for the series it touched; PM2.5 and PM10 are categorised on their 24 h
+averages, the gases on their 1 h averages.
+"""
+import io
+import json
+import math
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from common import metrics
+from common.record_codec import decode_records, detect_encoding
+from geojson_processor.geojson_output import upload_bytes
+from geojson_processor.incremental import S3StateStore
+from geojson_processor.reader import EPN_SOURCE, iter_object_bodies
+
+# Outputs are written under this prefix of the output bucket (empty disables the rollup)
+AIR_QUALITY_PREFIX = os.environ.get("AIR_QUALITY_PREFIX", "air_quality/")
+AIR_QUALITY_STATE_KEY = os.environ.get("AIR_QUALITY_STATE_KEY", "state/air_quality_state.npz")
+# Hours of history kept per series (2160 is 90 days)
+AIR_QUALITY_RETENTION_HOURS = int(os.environ.get("AIR_QUALITY_RETENTION_HOURS", "2160"))
+# Hours in each per-site series output, ending at the site's latest reading
+AIR_QUALITY_SERIES_HOURS = int(os.environ.get("AIR_QUALITY_SERIES_HOURS", "720"))
+# Share of the 24 hours that must have readings for a 24 h average (the NSW EPA uses 75 %)
+AIR_QUALITY_MIN_CAPTURE = float(os.environ.get("AIR_QUALITY_MIN_CAPTURE", "0.75"))
+# Offset of naive EPN timestamps from UTC; the EPA reports in AEST all year
+AIR_QUALITY_UTC_OFFSET_HOURS = float(os.environ.get("AIR_QUALITY_UTC_OFFSET_HOURS", "10"))
+
+SOURCE = EPN_SOURCE
+STATE_VERSION = 1
+CATEGORIES = ("GOOD", "FAIR", "POOR", "VERY POOR", "EXTREMELY POOR")
+
+# pollutant -> (unit, hours averaged for its category, upper bounds of GOOD..VERY POOR)
+POLLUTANTS: Dict[str, Tuple[str, int, Tuple[float, ...]]] = {
+    "PM2.5": ("µg/m³", 24, (25.0, 50.0, 100.0, 300.0)),
+    "PM10": ("µg/m³", 24, (50.0, 100.0, 200.0, 600.0)),
+    "O3": ("pphm", 1, (5.4, 8.0, 12.0, 16.0)),
+    "NO2": ("pphm", 1, (8.0, 12.0, 25.0, 50.0)),
+    "SO2": ("pphm", 1, (13.0, 20.0, 40.0, 80.0)),
+    "CO": ("ppm", 1, (6.0, 9.0, 13.5, 18.0)),
+}
+# Parameter codes as the feed spells them, upper-cased with punctuation removed
+_ALIASES = {re.sub(r"[^A-Z0-9]", "", code): code for code in POLLUTANTS}
+_ALIASES["OZONE"] = "O3"
+
+UPDATE_SECONDS = metrics.histogram("air_quality_update_seconds", "Air-quality rollup time per update (fold only)")
+READINGS = metrics.counter("air_quality_readings_total", "EPN readings folded into the rollup")
+
+# (site, pollutant, epoch hour, value)
+Reading = Tuple[str, str, int, float]
+
+
+def pollutant_code(name: Any) -> Optional[str]:
+    return _ALIASES.get(re.sub(r"[^A-Z0-9]", "", str(name).upper()))
+
+
+def epoch_hour(raw: Dict[str, Any], timestamp: Any) -> Optional[int]:
+    """Epoch hour a reading averages over.
+
+    The feed's ``Hour`` is the hour *ending* (1-24) on ``Date``. Naive
+    timestamps are shifted by ``AIR_QUALITY_UTC_OFFSET_HOURS``.
+    """
+    date = raw.get("Date") or timestamp
+    if not date:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(date).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    hour = raw.get("Hour")
+    if hour is not None and len(str(date)) <= 10:
+        try:
+            parsed += timedelta(hours=int(hour) - 1)
+        except (TypeError, ValueError):
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone(timedelta(hours=AIR_QUALITY_UTC_OFFSET_HOURS)))
+    return int(parsed.timestamp() // 3600)
+
+
+def _number(value: Any) -> Optional[float]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def iter_readings(rec: Dict[str, Any]) -> Iterator[Reading]:
+    """Readings in one normalized ``nsw_epn`` record.
+
+    Handles the EPA's long rows (a ``Parameter`` code or object plus a
+    ``Value``) and wide rows with one column per pollutant. Records sent
+    with ``RECORD_INCLUDE_RAW=false`` carry no readings.
+    """
+    raw = rec.get("raw") or {}
+    site = rec.get("id") or raw.get("Site_Id")
+    if site is None:
+        return
+    hour = epoch_hour(raw, rec.get("timestamp"))
+    if hour is None:
+        return
+    parameter = raw.get("Parameter")
+    if parameter is not None:
+        if isinstance(parameter, dict):
+            parameter = parameter.get("ParameterCode")
+        code, value = pollutant_code(parameter), _number(raw.get("Value"))
+        if code and value is not None:
+            yield str(site), code, hour, value
+        return
+    for name, value in raw.items():
+        code, value = pollutant_code(name), _number(value)
+        if code and value is not None:
+            yield str(site), code, hour, value
+
+
+def iter_epn_records(body: bytes) -> Iterator[Dict[str, Any]]:
+    """``nsw_epn`` records in one Firehose object; objects and lines without them are not decoded."""
+    marker = SOURCE.encode("ascii")
+    if marker not in body:
+        return
+    if detect_encoding(body) == "jsonl":
+        for line in body.splitlines():
+            if marker in line:
+                rec = json.loads(line)
+                if isinstance(rec, dict) and rec.get("source") == SOURCE:
+                    yield rec
+        return
+    for rec in decode_records(body):
+        if rec.get("source") == SOURCE:
+            yield rec
+
+
+def _iso(hour: int) -> str:
+    return datetime.fromtimestamp(int(hour) * 3600, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _rounded(value: float) -> Optional[float]:
+    return None if value != value else round(float(value), 2)
+
+
+class AirQualityRollup:
+    """Ring buffers, rolling averages and categories for every (site, pollutant) series.
+
+    ``objects`` is the manifest of folded objects (key -> ETag), as in
+    ``PerimeterState``, so restarts and relists only read new deliveries.
+    """
+
+    def __init__(self, capacity: int = AIR_QUALITY_RETENTION_HOURS, min_capture: float = AIR_QUALITY_MIN_CAPTURE):
+        self.capacity = capacity
+        self.min_count = max(1, math.ceil(24 * min_capture))
+        self.keys: List[Tuple[str, str]] = []
+        self.rows: Dict[Tuple[str, str], int] = {}
+        self.site_rows: Dict[str, List[int]] = {}
+        self.sites: Dict[str, Dict[str, Any]] = {}
+        self.objects: Dict[str, str] = {}
+        self.values = np.full((0, capacity), np.nan, dtype=np.float32)
+        self.hours = np.full((0, capacity), -1, dtype=np.int32)
+        self.latest = np.full(0, -1, dtype=np.int32)
+        self.avg_1h = np.full(0, np.nan, dtype=np.float32)
+        self.avg_24h = np.full(0, np.nan, dtype=np.float32)
+        # Sites changed since the last publish
+        self.touched: set = set()
+
+    def _row(self, site: str, pollutant: str) -> int:
+        key = (site, pollutant)
+        row = self.rows.get(key)
+        if row is None:
+            row = self.rows[key] = len(self.keys)
+            self.keys.append(key)
+            self.site_rows.setdefault(site, []).append(row)
+        return row
+
+    def _grow(self) -> None:
+        have, need = len(self.latest), len(self.keys)
+        if need <= have:
+            return
+        size = max(need, 2 * have, 16)
+
+        def grown(array, fill):
+            out = np.full((size,) + array.shape[1:], fill, dtype=array.dtype)
+            out[:have] = array
+            return out
+
+        self.values = grown(self.values, np.nan)
+        self.hours = grown(self.hours, -1)
+        self.latest = grown(self.latest, -1)
+        self.avg_1h = grown(self.avg_1h, np.nan)
+        self.avg_24h = grown(self.avg_24h, np.nan)
+
+    def site(self, site: str, name: Any = None, latitude: Any = None, longitude: Any = None) -> None:
+        """Record a site's name and location (the latest non-empty values win)."""
+        meta = self.sites.setdefault(site, {"name": site, "latitude": None, "longitude": None})
+        if name:
+            meta["name"] = str(name)
+        if _number(latitude) is not None and _number(longitude) is not None:
+            meta["latitude"], meta["longitude"] = float(latitude), float(longitude)
+
+    def add_records(self, records: Iterable[Dict[str, Any]]) -> int:
+        readings = []
+        for rec in records:
+            found = list(iter_readings(rec))
+            if found:
+                raw = rec.get("raw") or {}
+                self.site(found[0][0], raw.get("SiteName") or raw.get("Site"), rec.get("latitude"), rec.get("longitude"))
+                readings.extend(found)
+        return self.add(readings)
+
+    def add(self, readings: Iterable[Reading]) -> int:
+        """Fold ``(site, pollutant, epoch hour, value)`` readings in; returns how many were stored."""
+        rows, hours, values = [], [], []
+        for site, pollutant, hour, value in readings:
+            rows.append(self._row(site, pollutant))
+            hours.append(hour)
+            values.append(value)
+        if not rows:
+            return 0
+        self._grow()
+        return self.add_arrays(np.asarray(rows, np.int64), np.asarray(hours, np.int64), np.asarray(values, np.float32))
+
+    def add_arrays(self, rows: np.ndarray, hours: np.ndarray, values: np.ndarray) -> int:
+        """Vectorised core of ``add``: ``rows`` index ``keys``."""
+        # Ascending hours, so the newest reading for a slot is the last of its duplicates
+        order = np.argsort(hours, kind="stable")
+        rows, hours, values = rows[order], hours[order], values[order]
+        newest = self.latest.copy()
+        np.maximum.at(newest, rows, hours.astype(np.int32))
+        # Drop readings that fall out of their series' window, and ones older than what their slot holds
+        slots = hours % self.capacity
+        keep = (hours > newest[rows] - self.capacity) & (hours >= self.hours[rows, slots])
+        rows, hours, values, slots = rows[keep], hours[keep], values[keep], slots[keep]
+        flat = rows * self.capacity + slots
+        _, last = np.unique(flat[::-1], return_index=True)
+        last = len(flat) - 1 - last
+        rows, hours, values, slots = rows[last], hours[last], values[last], slots[last]
+        self.values[rows, slots] = values
+        self.hours[rows, slots] = hours
+        self.latest = newest
+        changed = np.unique(rows)
+        self._refresh(changed)
+        self.touched.update(self.keys[row][0] for row in changed.tolist())
+        return len(rows)
+
+    def _refresh(self, rows: np.ndarray) -> None:
+        """Recompute the 1 h and 24 h averages of ``rows`` from their last 24 slots."""
+        if not len(rows):
+            return
+        window = self.latest[rows, None].astype(np.int64) - np.arange(23, -1, -1)
+        slots = window % self.capacity
+        values = self.values[rows[:, None], slots]
+        valid = (self.hours[rows[:, None], slots] == window) & ~np.isnan(values)
+        count = valid.sum(axis=1)
+        total = np.where(valid, values, 0).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.avg_24h[rows] = np.where(count >= self.min_count, total / count, np.nan)
+        self.avg_1h[rows] = np.where(valid[:, -1], values[:, -1], np.nan)
+
+    def category(self, row: int) -> Optional[str]:
+        pollutant = self.keys[row][1]
+        _, hours, bounds = POLLUTANTS[pollutant]
+        value = self.avg_24h[row] if hours == 24 else self.avg_1h[row]
+        if value != value:
+            return None
+        return CATEGORIES[int(np.searchsorted(bounds, value, side="right"))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """FeatureCollection of every located site with its latest averages and worst category."""
+        features = []
+        for site, rows in sorted(self.site_rows.items()):
+            meta = self.sites.get(site, {})
+            if meta.get("latitude") is None:
+                continue
+            pollutants, worst = {}, None
+            for row in rows:
+                category = self.category(row)
+                if category is not None and (worst is None or CATEGORIES.index(category) > CATEGORIES.index(worst)):
+                    worst = category
+                pollutants[self.keys[row][1]] = {
+                    "unit": POLLUTANTS[self.keys[row][1]][0],
+                    "hour": _iso(self.latest[row]),
+                    "avg_1h": _rounded(self.avg_1h[row]),
+                    "avg_24h": _rounded(self.avg_24h[row]),
+                    "category": category,
+                }
+            features.append(
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [meta["longitude"], meta["latitude"]]},
+                    "properties": {
+                        "site": site,
+                        "name": meta.get("name", site),
+                        "updated": _iso(max(int(self.latest[row]) for row in rows)),
+                        "category": worst,
+                        "pollutants": pollutants,
+                    },
+                }
+            )
+        return {"type": "FeatureCollection", "features": features}
+
+    def series(self, site: str, hours: int = AIR_QUALITY_SERIES_HOURS) -> Optional[Dict[str, Any]]:
+        """Hourly values for each of ``site``'s pollutants over the ``hours`` ending at its latest reading."""
+        rows = self.site_rows.get(site)
+        if not rows:
+            return None
+        rows_array = np.asarray(rows)
+        hours = min(hours, self.capacity)
+        end = int(self.latest[rows_array].max())
+        window = end - np.arange(hours - 1, -1, -1)
+        slots = window % self.capacity
+        values = self.values[rows_array[:, None], slots]
+        values = np.where(self.hours[rows_array[:, None], slots] == window, values, np.nan)
+        present = np.flatnonzero(~np.isnan(values).all(axis=0))
+        start = int(present[0]) if len(present) else hours - 1
+        rounded = np.round(values[:, start:].astype(np.float64), 2)
+        meta = self.sites.get(site, {})
+        return {
+            "site": site,
+            "name": meta.get("name", site),
+            "latitude": meta.get("latitude"),
+            "longitude": meta.get("longitude"),
+            "start": _iso(window[start]),
+            "step_s": 3600,
+            "pollutants": {
+                self.keys[row][1]: {
+                    "unit": POLLUTANTS[self.keys[row][1]][0],
+                    "values": [None if value != value else value for value in rounded[n].tolist()],
+                    "avg_1h": _rounded(self.avg_1h[row]),
+                    "avg_24h": _rounded(self.avg_24h[row]),
+                    "category": self.category(row),
+                }
+                for n, row in enumerate(rows)
+            },
+        }
+
+    def to_bytes(self) -> bytes:
+        count = len(self.keys)
+        meta = {
+            "version": STATE_VERSION,
+            "capacity": self.capacity,
+            "keys": self.keys,
+            "sites": self.sites,
+            "objects": self.objects,
+        }
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            meta=np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8),
+            values=self.values[:count],
+            hours=self.hours[:count],
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(
+        cls,
+        data: Optional[bytes],
+        capacity: int = AIR_QUALITY_RETENTION_HOURS,
+        min_capture: float = AIR_QUALITY_MIN_CAPTURE,
+    ) -> "AirQualityRollup":
+        """Restore a checkpoint, refilling the buffers when ``capacity`` changed; an outdated one starts empty."""
+        rollup = cls(capacity, min_capture)
+        if not data:
+            return rollup
+        with np.load(io.BytesIO(data), allow_pickle=False) as saved:
+            meta = json.loads(saved["meta"].tobytes())
+            if meta.get("version") != STATE_VERSION:
+                return rollup
+            values, hours = saved["values"], saved["hours"]
+        rollup.sites = meta["sites"]
+        rollup.objects = meta["objects"]
+        for site, pollutant in meta["keys"]:
+            rollup._row(site, pollutant)
+        rollup._grow()
+        rows, slots = np.nonzero(hours >= 0)
+        if len(rows):
+            rollup.add_arrays(rows, hours[rows, slots].astype(np.int64), values[rows, slots])
+        rollup.touched.clear()
+        return rollup
+
+
+def site_key(site: str) -> str:
+    return re.sub(r"[^a-z0-9_-]+", "-", site.lower()).strip("-") or "site"
+
+
+class AirQualityStage:
+    """Folds new Firehose objects into an ``AirQualityRollup`` and publishes its outputs to S3.
+
+    ``update`` runs on the engine thread while request handlers read
+    ``snapshot`` (a body swapped whole) and ``series`` (under ``lock``).
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        output_bucket: str,
+        prefix: str = AIR_QUALITY_PREFIX,
+        store: Optional[S3StateStore] = None,
+        encoding: str = "identity",
+        download_workers: int = 16,
+    ):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.output_bucket = output_bucket
+        self.prefix = prefix
+        self.store = store
+        self.encoding = encoding
+        self.download_workers = download_workers
+        self.rollup = AirQualityRollup.from_bytes(store.load() if store else None)
+        self.lock = threading.Lock()
+        # stations.geojson body for the current rollup
+        self.snapshot = self._snapshot()
+
+    @property
+    def dirty(self) -> bool:
+        """True while some site changed since the last publish."""
+        return bool(self.rollup.touched)
+
+    def _snapshot(self) -> bytes:
+        return json.dumps(self.rollup.snapshot(), separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+    def update(self, objects: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """Fold objects not yet in the manifest; ``objects`` is the full listing, so gone keys are forgotten."""
+        objects = list(objects)
+        seen = self.rollup.objects
+        new = [obj for obj in objects if seen.get(obj["Key"]) != obj.get("ETag")]
+        records = []
+        for _, body in iter_object_bodies(self.s3, self.bucket, new, self.download_workers):
+            records.extend(iter_epn_records(body))
+        with UPDATE_SECONDS.time(), self.lock:
+            stored = self.rollup.add_records(records)
+            listed = {obj["Key"] for obj in objects}
+            self.rollup.objects = {key: etag for key, etag in seen.items() if key in listed}
+            self.rollup.objects.update((obj["Key"], obj.get("ETag")) for obj in new)
+            if stored:
+                self.snapshot = self._snapshot()
+        READINGS.inc(stored)
+        return {"objects": len(new), "records": len(records), "readings": stored, "sites": len(self.rollup.touched)}
+
+    def series(self, site: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            return self.rollup.series(site)
+
+    def publish(self) -> Dict[str, Any]:
+        """Rewrite the series of touched sites, then the station snapshot."""
+        started = time.perf_counter()
+        touched = sorted(self.rollup.touched)
+        written = 0
+        for site in touched:
+            series = self.series(site)
+            if series is None:
+                continue
+            key = f"{self.prefix}sites/{site_key(site)}.json"
+            body = json.dumps(series, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            written += upload_bytes(self.s3, self.output_bucket, key, body, "application/json", self.encoding)["bytes"]
+        key = f"{self.prefix}stations.geojson"
+        written += upload_bytes(self.s3, self.output_bucket, key, self.snapshot, encoding=self.encoding)["bytes"]
+        self.rollup.touched.clear()
+        return {"sites": len(touched), "bytes": written, "seconds": round(time.perf_counter() - started, 3)}
+
+    def checkpoint(self) -> None:
+        if self.store is not None:
+            with self.lock:
+                data = self.rollup.to_bytes()
+            self.store.save(data)
+
+
+def build_stage(s3_client, bucket: str, output_bucket: str, encoding: str = "identity", download_workers: int = 16):
+    """Stage configured from the environment, or None when ``AIR_QUALITY_PREFIX`` is empty."""
+    if not AIR_QUALITY_PREFIX:
+        return None
+    store = S3StateStore(s3_client, output_bucket, AIR_QUALITY_STATE_KEY, content_type="application/octet-stream")
+    return AirQualityStage(s3_client, bucket, output_bucket, AIR_QUALITY_PREFIX, store, encoding, download_workers)
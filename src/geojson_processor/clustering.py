@@ -0,0 +1,151 @@
+import math
+from typing import Any, Callable, List, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.ops import unary_union
+
+# Metres per degree of latitude, and of longitude at the equator
+M_PER_DEG_LAT = 110_540.0
+M_PER_DEG_LON = 111_320.0
+
+# VIIRS pixels are ~375 m across; MODIS pixels are ~1 km
+DEFAULT_FOOTPRINT_M = 375.0
+
+# Half of the 3x3 neighbourhood (plus the cell itself) so each cell pair is visited once
+_NEIGHBOUR_OFFSETS = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def _metres(dlon: np.ndarray, dlat: np.ndarray, mid_lat: np.ndarray) -> np.ndarray:
+    """Squared local equirectangular distance, accurate enough for kilometre-scale linking."""
+    return (dlon * M_PER_DEG_LON * np.cos(np.radians(mid_lat))) ** 2 + (dlat * M_PER_DEG_LAT) ** 2
+
+
+def _neighbour_pairs(lon: np.ndarray, lat: np.ndarray, eps: float) -> Tuple[np.ndarray, np.ndarray]:
+    """All index pairs closer than ``eps`` metres, found with a uniform grid hash.
+
+    Cells are ``eps`` tall and at least ``eps`` wide at the highest latitude
+    present, so every close pair lies in the same or an adjacent cell.
+    """
+    max_lat = min(float(np.abs(lat).max()), 85.0)
+    cell_lon = eps / (M_PER_DEG_LON * math.cos(math.radians(max_lat)))
+    cell_lat = eps / M_PER_DEG_LAT
+    cx = np.floor(lon / cell_lon).astype(np.int64)
+    cy = np.floor(lat / cell_lat).astype(np.int64)
+    # Pack cell coordinates into one sortable key
+    shift = np.int64(1 << 31)
+    keys = (cx + shift) * (shift * 2) + (cy + shift)
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    lefts, rights = [], []
+    for dx, dy in _NEIGHBOUR_OFFSETS:
+        target = (cx + dx + shift) * (shift * 2) + (cy + dy + shift)
+        start = np.searchsorted(sorted_keys, target, side="left")
+        stop = np.searchsorted(sorted_keys, target, side="right")
+        counts = stop - start
+        if not counts.any():
+            continue
+        left = np.repeat(np.arange(len(lon)), counts)
+        # Position of each candidate within its target cell's run
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        right = order[np.repeat(start, counts) + offsets]
+        if dx == 0 and dy == 0:
+            keep = left < right
+            left, right = left[keep], right[keep]
+        close = _metres(lon[left] - lon[right], lat[left] - lat[right], (lat[left] + lat[right]) / 2) <= eps * eps
+        lefts.append(left[close])
+        rights.append(right[close])
+    if not lefts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(lefts), np.concatenate(rights)
+
+
+def _components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Connected-component labels via vectorised min-label propagation with pointer jumping."""
+    labels = np.arange(n)
+    if not len(left):
+        return labels
+    while True:
+        low = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, low)
+        np.minimum.at(updated, right, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def cluster_hotspots(lon: np.ndarray, lat: np.ndarray, link_m: float) -> np.ndarray:
+    """Label hotspots so any two within ``link_m`` metres share a cluster.
+
+    This is DBSCAN with ``min_samples=1`` (single linkage): a neighbour grid
+    of ``link_m`` cells bounds the candidate pairs, so the cost is linear in
+    the number of hotspots for realistic densities.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    if not len(lon):
+        return np.empty(0, dtype=np.int64)
+    left, right = _neighbour_pairs(lon, lat, link_m)
+    return _components(len(lon), left, right)
+
+
+def hotspot_perimeters(
+    lon: np.ndarray,
+    lat: np.ndarray,
+    footprint_m: float = DEFAULT_FOOTPRINT_M,
+    link_m: float = 0.0,
+) -> List[Any]:
+    """Return one perimeter polygon per hotspot cluster.
+
+    Each hotspot becomes its square detection pixel (``footprint_m`` wide)
+    and the pixels of a cluster are unioned together. ``link_m`` is raised
+    to at least the pixel diagonal so pixels of different clusters can never
+    overlap, which lets the clusters be returned without a global union.
+    """
+    lon = np.asarray(lon, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    if not len(lon):
+        return []
+    link_m = max(link_m, footprint_m * math.sqrt(2) * 1.01)
+    labels = cluster_hotspots(lon, lat, link_m)
+
+    half_lat = footprint_m / 2 / M_PER_DEG_LAT
+    half_lon = footprint_m / 2 / (M_PER_DEG_LON * np.cos(np.radians(lat)))
+    pixels = shapely.box(lon - half_lon, lat - half_lat, lon + half_lon, lat + half_lat)
+
+    order = np.argsort(labels, kind="stable")
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    perimeters = []
+    for group in np.split(order, bounds):
+        if len(group) == 1:
+            perimeters.append(pixels[group[0]])
+        else:
+            perimeters.append(shapely.union_all(pixels[group]))
+    return perimeters
+
+
+def cluster_and_union(
+    geometries: Sequence[Any],
+    footprint_m: float = DEFAULT_FOOTPRINT_M,
+    link_m: float = 0.0,
+    union: Callable[[List[Any]], Any] = unary_union,
+):
+    """Turn point hotspots into cluster perimeters, then union them with other geometries."""
+    geoms = np.asarray(geometries, dtype=object)
+    if not len(geoms):
+        return shapely.GeometryCollection()
+    is_point = shapely.get_type_id(geoms) == shapely.GeometryType.POINT
+    points = geoms[is_point]
+    others = geoms[~is_point].tolist()
+    perimeters: List[Any] = []
+    if len(points):
+        perimeters = hotspot_perimeters(shapely.get_x(points), shapely.get_y(points), footprint_m, link_m)
+    if not others:
+        # Cluster perimeters are disjoint by construction, so no union is needed
+        parts = shapely.get_parts(np.asarray(perimeters, dtype=object))
+        return shapely.multipolygons(parts) if len(parts) > 1 else parts[0]
+    return union(perimeters + others)
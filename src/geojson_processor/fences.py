@@ -0,0 +1,265 @@
+"""Fence/perimeter intersection for the ``geo_fences`` table.
+
+Each run scans every fence, builds an STRtree over their geometries and
+tests the merged perimeter's parts against it in bulk: the tree yields
+bounding-box candidates and the exact test runs vectorised against the
+prepared fence geometries. Only fences whose ``intersects`` flag changed
+are written back, so the table stream (and ``rule_eval``) sees one
+MODIFY per transition rather than one per fence per run.
+"""
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import boto3
+import numpy as np
+import shapely
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+from common.batch_write import backoff_delay
+from geojson_processor.clustering import M_PER_DEG_LAT, M_PER_DEG_LON
+
+# Radius used for point fences that do not set radius_m
+DEFAULT_RADIUS_M = 5000.0
+CIRCLE_SEGMENTS = 32
+
+_RETRYABLE_CODES = {"ProvisionedThroughputExceededException", "ThrottlingException", "InternalServerError"}
+
+
+def make_dynamodb_client(max_workers: int = 8):
+    """DynamoDB client whose connection pool can serve ``max_workers`` concurrent calls."""
+    return boto3.client("dynamodb", config=Config(max_pool_connections=max(10, max_workers)))
+
+
+def _plain(value: Dict[str, Any]) -> Any:
+    """A DynamoDB attribute value as plain Python, with numbers as floats."""
+    kind, inner = next(iter(value.items()))
+    if kind == "M":
+        return {k: _plain(v) for k, v in inner.items()}
+    if kind == "L":
+        return [_plain(v) for v in inner]
+    if kind == "N":
+        return float(inner)
+    if kind == "NULL":
+        return None
+    return inner
+
+
+def _scan_segment(client, table: str, segment: int, total: int) -> List[Dict[str, Any]]:
+    items, kwargs = [], {"TableName": table, "Segment": segment, "TotalSegments": total}
+    while True:
+        page = client.scan(**kwargs)
+        items.extend(page.get("Items", []))
+        if "LastEvaluatedKey" not in page:
+            return items
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def scan_fences(client, table: str, segments: int = 4) -> List[Dict[str, Any]]:
+    """Every item in ``table`` in its raw attribute-value form, via a parallel scan."""
+    segments = max(1, segments)
+    if segments == 1:
+        return _scan_segment(client, table, 0, 1)
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        pages = pool.map(lambda segment: _scan_segment(client, table, segment, segments), range(segments))
+        return [item for page in pages for item in page]
+
+
+def _circles(lon: np.ndarray, lat: np.ndarray, radius_m: np.ndarray, segments: int = CIRCLE_SEGMENTS) -> np.ndarray:
+    """Polygons approximating ``radius_m`` circles, built for all centres at once."""
+    angles = np.linspace(0, 2 * np.pi, segments + 1)
+    angles[-1] = 0
+    r_lon = radius_m / (M_PER_DEG_LON * np.cos(np.radians(lat)))
+    r_lat = radius_m / M_PER_DEG_LAT
+    rings = np.stack(
+        [lon[:, None] + r_lon[:, None] * np.cos(angles), lat[:, None] + r_lat[:, None] * np.sin(angles)], axis=-1
+    )
+    return shapely.polygons(rings)
+
+
+def fence_geometries(items: List[Dict[str, Any]], default_radius_m: float = DEFAULT_RADIUS_M) -> np.ndarray:
+    """Geometry per fence item, or None for fences without one.
+
+    A fence is the GeoJSON ``params.geometry`` when present, otherwise a
+    circle of ``params.radius_m`` metres around ``params.latitude/longitude``.
+    """
+    geometries = np.full(len(items), None, dtype=object)
+    circle_idx, centres = [], []
+    for i, item in enumerate(items):
+        params = _plain(item["params"]) if "params" in item else {}
+        if not isinstance(params, dict):
+            continue
+        if params.get("geometry"):
+            try:
+                geometries[i] = shape(params["geometry"])
+            except (AttributeError, KeyError, TypeError, ValueError):
+                continue
+        elif params.get("latitude") is not None and params.get("longitude") is not None:
+            circle_idx.append(i)
+            centres.append((params["longitude"], params["latitude"], params.get("radius_m") or default_radius_m))
+    if centres:
+        lon, lat, radius = np.array(centres, dtype=np.float64).T
+        geometries[circle_idx] = _circles(lon, lat, radius)
+    return geometries
+
+
+class FenceIndex:
+    """STRtree over prepared fence geometries for bulk perimeter tests."""
+
+    def __init__(self, items: List[Dict[str, Any]], default_radius_m: float = DEFAULT_RADIUS_M):
+        self.items = items
+        geometries = fence_geometries(items, default_radius_m)
+        # Positions in ``items`` of the fences that have a geometry
+        self.positions = np.flatnonzero(~shapely.is_missing(geometries))
+        self.geometries = geometries[self.positions]
+        invalid = ~shapely.is_valid(self.geometries)
+        self.geometries[invalid] = shapely.make_valid(self.geometries[invalid])
+        shapely.prepare(self.geometries)
+        self.tree = STRtree(self.geometries)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def intersecting(self, perimeter) -> np.ndarray:
+        """Boolean per item: does its fence intersect ``perimeter``?"""
+        hits = np.zeros(len(self.items), dtype=bool)
+        if perimeter is None or shapely.is_empty(perimeter) or not len(self.geometries):
+            return hits
+        parts = shapely.get_parts(perimeter)
+        part_idx, fence_idx = self.tree.query(parts)
+        # Exact tests for every bounding-box candidate pair, against the prepared fences
+        exact = shapely.intersects(self.geometries[fence_idx], parts[part_idx])
+        hits[self.positions[np.unique(fence_idx[exact])]] = True
+        return hits
+
+    def changes(self, perimeter) -> List[Dict[str, Any]]:
+        """Items whose stored ``intersects`` (missing counts as false) differs from the new result.
+
+        Only each returned item's ``intersects`` attribute is rewritten in place;
+        the writer sends that flag alone, never the whole item.
+        """
+        changed = []
+        for item, flag in zip(self.items, self.intersecting(perimeter).tolist()):
+            if item.get("intersects", {}).get("BOOL", False) != flag:
+                item["intersects"] = {"BOOL": flag}
+                changed.append(item)
+        return changed
+
+
+class FenceWriter:
+    """Concurrent writer of ``intersects`` flags that retries throttled updates with jittered backoff.
+
+    Each flag is set with ``UpdateItem`` on its own attribute, so subscription
+    edits made since the scan survive, and conditioned on the fence still
+    existing, so a fence unsubscribed in the meantime is not recreated.
+    """
+
+    def __init__(
+        self,
+        client,
+        table: str,
+        workers: int = 8,
+        max_attempts: int = 8,
+        base_delay: float = 0.05,
+        max_delay: float = 2.0,
+        sleep: Callable[[float], None] = time.sleep,
+        key_attributes=("user_id", "fence_id"),
+    ):
+        self.client = client
+        self.table = table
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.key_attributes = tuple(key_attributes)
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.stats = {"written": 0, "missing": 0, "failed": 0, "calls": 0, "retried_items": 0}
+
+    def _backoff(self, attempt: int) -> None:
+        self.sleep(backoff_delay(attempt, self.base_delay, self.max_delay, self._random))
+
+    def _count(self, outcome: str) -> None:
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats[outcome] += 1
+
+    def _send(self, item: Dict[str, Any]) -> None:
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._backoff(attempt)
+            try:
+                self.client.update_item(
+                    TableName=self.table,
+                    Key={name: item[name] for name in self.key_attributes},
+                    UpdateExpression="SET intersects = :v",
+                    ConditionExpression="attribute_exists(fence_id)",
+                    ExpressionAttributeValues={":v": item["intersects"]},
+                )
+            except ClientError as exc:
+                code = exc.response["Error"]["Code"]
+                if code == "ConditionalCheckFailedException":
+                    # Unsubscribed since the scan; nothing to flag
+                    self._count("missing")
+                    return
+                if code not in _RETRYABLE_CODES:
+                    raise
+                self._count("retried_items")
+                continue
+            self._count("written")
+            return
+        with self._lock:
+            self.stats["failed"] += 1
+
+    def write(self, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        if self.workers == 1 or len(items) <= 1:
+            for item in items:
+                self._send(item)
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                list(pool.map(self._send, items))
+        return dict(self.stats)
+
+
+def update_fence_intersections(
+    client,
+    table: str,
+    perimeter,
+    scan_segments: int = 4,
+    write_workers: int = 8,
+    default_radius_m: float = DEFAULT_RADIUS_M,
+    writer: Optional[FenceWriter] = None,
+) -> Dict[str, Any]:
+    """Recompute every fence's ``intersects`` flag against ``perimeter`` and write back changes."""
+    timings = {}
+    started = time.perf_counter()
+    items = scan_fences(client, table, scan_segments)
+    timings["scan_s"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    index = FenceIndex(items, default_radius_m)
+    timings["index_s"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    changed = index.changes(perimeter)
+    timings["intersect_s"] = round(time.perf_counter() - started, 3)
+
+    started = time.perf_counter()
+    writer = writer or FenceWriter(client, table, write_workers)
+    written = writer.write(changed)
+    timings["write_s"] = round(time.perf_counter() - started, 3)
+    return {
+        "fences": len(items),
+        "with_geometry": len(index.geometries),
+        "intersecting": sum(1 for item in items if item.get("intersects", {}).get("BOOL")),
+        "changed": len(changed),
+        **written,
+        **timings,
+    }
+
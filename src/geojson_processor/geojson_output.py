@@ -0,0 +1,94 @@
+"""In-memory GeoJSON serialization and upload for processor outputs.
+
+Geometries are written by GEOS's GeoJSON writer after rounding coordinates
+to ``precision`` decimals, so no per-coordinate Python objects are built
+and no temporary file touches disk. Bodies can be precompressed with gzip
+or brotli and are uploaded from memory with ``upload_fileobj``, which
+switches to a concurrent multipart upload for large outputs.
+"""
+import gzip
+import io
+import json
+from typing import Any, Dict, Optional
+
+import numpy as np
+import shapely
+from boto3.s3.transfer import TransferConfig
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+CONTENT_ENCODINGS = ("identity", "gzip", "br")
+CONTENT_TYPE = "application/geo+json"
+
+# Multipart kicks in above 8 MiB, uploading 8 MiB parts four at a time
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, max_concurrency=4
+)
+
+
+def geometry_json(geometry, precision: Optional[int] = 6) -> bytes:
+    """GeoJSON geometry object with coordinates rounded to ``precision`` decimals (None keeps all)."""
+    if precision is not None:
+        geometry = shapely.transform(geometry, lambda coords: np.round(coords, precision))
+    return shapely.to_geojson(geometry).encode("utf-8")
+
+
+def feature_collection(geometry, precision: Optional[int] = 6, properties: Optional[Dict[str, Any]] = None) -> bytes:
+    """A single-feature FeatureCollection holding ``geometry``."""
+    return b"".join(
+        (
+            b'{"type":"FeatureCollection","features":[{"type":"Feature","geometry":',
+            geometry_json(geometry, precision),
+            b',"properties":',
+            json.dumps(properties or {}, separators=(",", ":")).encode("utf-8"),
+            b"}]}",
+        )
+    )
+
+
+def compress(body: bytes, encoding: str = "identity") -> bytes:
+    if encoding == "identity":
+        return body
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    if encoding == "br":
+        if brotli is None:
+            raise RuntimeError("OUTPUT_ENCODING=br requires the brotli package")
+        return brotli.compress(body, quality=5)
+    raise ValueError(f"Unknown content encoding {encoding!r}; expected one of {CONTENT_ENCODINGS}")
+
+
+def upload_bytes(
+    s3_client,
+    bucket: str,
+    key: str,
+    body: bytes,
+    content_type: str = CONTENT_TYPE,
+    encoding: str = "identity",
+    cache_control: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Compress ``body`` and upload it straight from memory, returning sizes for reporting."""
+    data = compress(body, encoding)
+    extra = {"ContentType": content_type}
+    if encoding != "identity":
+        extra["ContentEncoding"] = encoding
+    if cache_control:
+        extra["CacheControl"] = cache_control
+    s3_client.upload_fileobj(io.BytesIO(data), bucket, key, ExtraArgs=extra, Config=TRANSFER_CONFIG)
+    return {"key": key, "raw_bytes": len(body), "bytes": len(data), "encoding": encoding}
+
+
+def upload_geojson(
+    s3_client,
+    bucket: str,
+    key: str,
+    geometry,
+    precision: Optional[int] = 6,
+    encoding: str = "identity",
+    properties: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Serialize ``geometry`` as a FeatureCollection and upload it."""
+    return upload_bytes(s3_client, bucket, key, feature_collection(geometry, precision, properties), encoding=encoding)
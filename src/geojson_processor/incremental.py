@@ -0,0 +1,184 @@
+import base64
+import json
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+from shapely import wkb
+from shapely.geometry import GeometryCollection
+from shapely.ops import unary_union
+
+from geojson_processor.reader import UNKNOWN_SOURCE
+
+STATE_VERSION = 2
+
+# Turns a list of S3 objects into (object, geometries) pairs, e.g. reader.iter_firehose_objects;
+# geometries is a list or a {source: [geometry]} dict
+Loader = Callable[[List[Dict[str, Any]]], Iterable[Tuple[Dict[str, Any], Any]]]
+# A slice of the checkpoint: (slot start, source)
+SliceKey = Tuple[int, str]
+
+
+def _epoch(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class S3StateStore:
+    """Persist the perimeter checkpoint as a single S3 object."""
+
+    def __init__(self, s3_client, bucket: str, key: str, content_type: str = "application/json"):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+
+    def load(self) -> Optional[bytes]:
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=self.key)["Body"].read()
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def save(self, data: bytes) -> None:
+        self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=data, ContentType=self.content_type)
+
+
+class PerimeterState:
+    """Checkpoint of per-time-bucket unions plus the manifest of processed objects.
+
+    Objects are grouped into ``bucket_seconds`` slices by S3 ``LastModified``,
+    and each slice is split by record source. Each slice keeps the union of
+    its geometries, so a run only unions new objects into their slice,
+    expiring a slice simply drops it, and the merged perimeter is the union
+    of a few dozen slice geometries.
+    """
+
+    def __init__(self, bucket_seconds: int = 3600):
+        self.bucket_seconds = bucket_seconds
+        self.buckets: Dict[SliceKey, Any] = {}
+        self.manifest: Dict[str, Tuple[str, int]] = {}
+
+    def slot(self, obj: Dict[str, Any]) -> int:
+        ts = _epoch(obj["LastModified"])
+        return int(ts // self.bucket_seconds) * self.bucket_seconds
+
+    def to_bytes(self) -> bytes:
+        return json.dumps(
+            {
+                "version": STATE_VERSION,
+                "bucket_seconds": self.bucket_seconds,
+                "buckets": {
+                    f"{slot}/{source}": base64.b64encode(wkb.dumps(geom)).decode("ascii")
+                    for (slot, source), geom in self.buckets.items()
+                },
+                "manifest": {key: [etag, slot] for key, (etag, slot) in self.manifest.items()},
+            }
+        ).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], bucket_seconds: int = 3600) -> "PerimeterState":
+        """Restore a checkpoint; a missing, outdated or re-sliced one starts empty."""
+        state = cls(bucket_seconds)
+        if not data:
+            return state
+        doc = json.loads(data)
+        if doc.get("version") != STATE_VERSION or doc.get("bucket_seconds") != bucket_seconds:
+            return state
+        for name, blob in doc.get("buckets", {}).items():
+            slot, _, source = name.partition("/")
+            state.buckets[(int(slot), source)] = wkb.loads(base64.b64decode(blob))
+        state.manifest = {key: (etag, int(slot)) for key, (etag, slot) in doc.get("manifest", {}).items()}
+        return state
+
+    def merged(self, union: Callable[[List[Any]], Any] = unary_union):
+        if not self.buckets:
+            return GeometryCollection()
+        return union(list(self.buckets.values()))
+
+
+def _in_window(state: PerimeterState, objects: Iterable[Dict[str, Any]], cutoff: float) -> List[Dict[str, Any]]:
+    return [obj for obj in objects if cutoff <= 0 or state.slot(obj) + state.bucket_seconds > cutoff]
+
+
+def update_perimeter(
+    state: PerimeterState,
+    objects: Iterable[Dict[str, Any]],
+    load: Loader,
+    now: float,
+    window_seconds: float = 0,
+    union: Callable[[List[Any]], Any] = unary_union,
+) -> Tuple[Any, Dict[str, int]]:
+    """Fold newly delivered objects into ``state`` and return the merged perimeter.
+
+    ``objects`` is the current listing of the prefix. Slices entirely older
+    than ``window_seconds`` (0 keeps everything) are expired. A slice whose
+    objects were overwritten or deleted since the checkpoint is rebuilt
+    from its current objects, so the result always matches
+    ``full_recompute`` over the same listing. ``union`` replaces
+    ``unary_union`` for the per-slice merges, e.g. ``tiling.tiled_union``.
+    """
+    cutoff = now - window_seconds if window_seconds > 0 else 0
+    current = _in_window(state, objects, cutoff)
+
+    expired = [key for key in state.buckets if cutoff > 0 and key[0] + state.bucket_seconds <= cutoff]
+    for key in expired:
+        del state.buckets[key]
+
+    listed = {obj["Key"]: obj for obj in current}
+    dirty = set()
+    for key, (etag, slot) in list(state.manifest.items()):
+        obj = listed.get(key)
+        if cutoff > 0 and slot + state.bucket_seconds <= cutoff:
+            del state.manifest[key]
+        elif obj is None or obj.get("ETag") != etag or state.slot(obj) != slot:
+            dirty.add(slot)
+    for key in [key for key in state.buckets if key[0] in dirty]:
+        del state.buckets[key]
+    for key in [k for k, (_, s) in state.manifest.items() if s in dirty]:
+        del state.manifest[key]
+
+    todo = [obj for obj in current if obj["Key"] not in state.manifest]
+    additions: Dict[SliceKey, List[Any]] = defaultdict(list)
+    for obj, geometries in load(todo):
+        slot = state.slot(obj)
+        groups = geometries if isinstance(geometries, dict) else {UNKNOWN_SOURCE: geometries}
+        for source, members in groups.items():
+            additions[(slot, source)].extend(members)
+        state.manifest[obj["Key"]] = (obj.get("ETag"), slot)
+    for key, geometries in additions.items():
+        if key in state.buckets:
+            geometries = [state.buckets[key], *geometries]
+        if geometries:
+            state.buckets[key] = union(geometries)
+
+    stats = {
+        "objects_listed": len(current),
+        "objects_processed": len(todo),
+        "slices": len({slot for slot, _ in state.buckets}),
+        "slices_expired": len({slot for slot, _ in expired}),
+        "slices_rebuilt": len(dirty),
+    }
+    return state.merged(union), stats
+
+
+def full_recompute(
+    objects: Iterable[Dict[str, Any]],
+    load: Loader,
+    now: float,
+    window_seconds: float = 0,
+    bucket_seconds: int = 3600,
+):
+    """Union every in-window object from scratch (the reference for ``update_perimeter``)."""
+    cutoff = now - window_seconds if window_seconds > 0 else 0
+    current = _in_window(PerimeterState(bucket_seconds), objects, cutoff)
+    geometries = []
+    for _, loaded in load(current):
+        for geoms in loaded.values() if isinstance(loaded, dict) else [loaded]:
+            geometries.extend(geoms)
+    if not geometries:
+        return GeometryCollection()
+    return unary_union(geometries)
@@ -1,25 +1,199 @@
 import json
 import os
-import tempfile
+import time
+from typing import Callable, Optional
 
-import boto3
-import fiona
-from shapely.geometry import shape, mapping
+import shapely
+from shapely.geometry import mapping
 from shapely.ops import unary_union
 
+from common import metrics
+from geojson_processor import air_quality
+from geojson_processor.clustering import cluster_and_union
+from geojson_processor.fences import DEFAULT_RADIUS_M, make_dynamodb_client, update_fence_intersections
+from geojson_processor.geojson_output import upload_bytes, upload_geojson
+from geojson_processor.incremental import PerimeterState, S3StateStore, update_perimeter
+from geojson_processor.reader import iter_firehose_objects, iter_objects, make_s3_client
+from geojson_processor.simplified import parse_zoom_bands, upload_simplified_outputs
+from geojson_processor.spatial_index import annotate_parts, build_index, index_key
+from geojson_processor.tiling import assign_tiles, tiled_union
+from geojson_processor.vector_tiles import upload_tile_pyramid
 
-def collect_firehose_geometries(s3_client, bucket: str, prefix: str):
-    """Load GeoJSON features from Firehose-delivered objects."""
+# Concurrent S3 GETs and parser processes (0 parses in the main process)
+DOWNLOAD_WORKERS = int(os.environ.get("DOWNLOAD_WORKERS", "16"))
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", str(max(0, (os.cpu_count() or 1) - 1))))
+
+# Union only objects delivered since the checkpoint instead of the whole prefix
+INCREMENTAL_UNION = os.environ.get("INCREMENTAL_UNION", "true").lower() == "true"
+STATE_KEY = os.environ.get("STATE_KEY", "state/perimeter_state.json")
+# Hotspots delivered longer ago than this drop out of the perimeter (0 keeps everything)
+WINDOW_HOURS = float(os.environ.get("WINDOW_HOURS", "72"))
+SLICE_MINUTES = int(os.environ.get("SLICE_MINUTES", "60"))
+
+# Union geometries per grid tile on a process pool, then stitch tiles that touch
+TILED_UNION = os.environ.get("TILED_UNION", "true").lower() == "true"
+TILE_DEGREES = float(os.environ.get("TILE_DEGREES", "1.0"))
+TILE_WORKERS = int(os.environ.get("TILE_WORKERS", str(max(0, (os.cpu_count() or 1) - 1))))
+# When set, each tile's union is also written to <prefix><x>_<y>.geojson
+TILE_OUTPUT_PREFIX = os.environ.get("TILE_OUTPUT_PREFIX")
+
+# Replace point hotspots by per-cluster unions of their detection pixels before the union
+CLUSTER_HOTSPOTS = os.environ.get("CLUSTER_HOTSPOTS", "true").lower() == "true"
+HOTSPOT_FOOTPRINT_M = float(os.environ.get("HOTSPOT_FOOTPRINT_M", "375"))
+# Hotspots closer than this join one fire; never below the pixel diagonal
+HOTSPOT_LINK_M = float(os.environ.get("HOTSPOT_LINK_M", "0"))
+
+# Decimal places kept in the full output (6 is ~0.1 m; -1 keeps full double precision)
+OUTPUT_PRECISION = int(os.environ.get("OUTPUT_PRECISION", "6"))
+# Precompress outputs and set Content-Encoding: identity, gzip or br
+OUTPUT_ENCODING = os.environ.get("OUTPUT_ENCODING", "identity")
+
+# Simplified, precision-reduced copies of the output per zoom band (empty disables)
+OUTPUT_ZOOM_BANDS = parse_zoom_bands(os.environ.get("OUTPUT_ZOOM_BANDS", "0-5,6-9,10-12"))
+# Mapbox Vector Tile pyramid written under this prefix (empty disables)
+VECTOR_TILE_PREFIX = os.environ.get("VECTOR_TILE_PREFIX", "tiles/")
+VECTOR_TILE_MIN_ZOOM = int(os.environ.get("VECTOR_TILE_MIN_ZOOM", "0"))
+VECTOR_TILE_MAX_ZOOM = int(os.environ.get("VECTOR_TILE_MAX_ZOOM", "10"))
+# Prepended to the tile URL template in tiles.json, e.g. the CDN origin
+VECTOR_TILE_BASE_URL = os.environ.get("VECTOR_TILE_BASE_URL", "")
+# Packed R-tree + per-feature attributes served by the perimeter query API (empty disables)
+INDEX_KEY = os.environ.get("INDEX_KEY", index_key(os.environ.get("OUTPUT_KEY", "fire_perimeters.geojson")))
+
+# Recompute each fence's ``intersects`` flag in this table against the perimeter (empty disables)
+FENCES_TABLE = os.environ.get("FENCES_TABLE", "")
+FENCE_SCAN_SEGMENTS = int(os.environ.get("FENCE_SCAN_SEGMENTS", "4"))
+FENCE_WRITE_WORKERS = int(os.environ.get("FENCE_WRITE_WORKERS", "8"))
+# Radius of point fences that do not set radius_m
+FENCE_RADIUS_M = float(os.environ.get("FENCE_RADIUS_M", str(DEFAULT_RADIUS_M)))
+
+
+UNION_SECONDS = metrics.histogram("processor_union_seconds", "Perimeter union time per call (slice folds and the merge)")
+OUTPUT_SECONDS = metrics.histogram("processor_output_seconds", "Time to build and upload each output level")
+OUTPUT_BYTES = metrics.histogram("processor_output_bytes", "Uploaded bytes per output level", metrics.BYTES)
+GEOMETRY_VERTICES = metrics.histogram(
+    "processor_geometry_vertices", "Vertices in the published perimeter per output level", metrics.COUNTS
+)
+
+
+def union_geometries(geometries):
+    if TILED_UNION:
+        return tiled_union(geometries, TILE_DEGREES, TILE_WORKERS)
+    return unary_union(geometries)
+
+
+def perimeter_union(geometries):
+    with UNION_SECONDS.time():
+        if CLUSTER_HOTSPOTS:
+            return cluster_and_union(geometries, HOTSPOT_FOOTPRINT_M, HOTSPOT_LINK_M, union=union_geometries)
+        return union_geometries(geometries)
+
+
+def upload_tile_outputs(s3_client, bucket: str, prefix: str, geometry) -> int:
+    """Write the parts of ``geometry`` falling in each tile as their own GeoJSON object."""
+    parts = shapely.get_parts(geometry)
+    for (x, y), idx in assign_tiles(parts, TILE_DEGREES).items():
+        tile_geom = shapely.union_all(parts[idx])
+        body = json.dumps({"type": "Feature", "geometry": mapping(tile_geom), "properties": {"tile": [x, y]}})
+        s3_client.put_object(
+            Bucket=bucket, Key=f"{prefix}{x}_{y}.geojson", Body=body.encode("utf-8"), ContentType="application/geo+json"
+        )
+    return len(parts)
+
+
+def update_fences(perimeter) -> None:
+    if not FENCES_TABLE:
+        return
+    client = make_dynamodb_client(max(FENCE_SCAN_SEGMENTS, FENCE_WRITE_WORKERS))
+    stats = update_fence_intersections(
+        client, FENCES_TABLE, perimeter, FENCE_SCAN_SEGMENTS, FENCE_WRITE_WORKERS, FENCE_RADIUS_M
+    )
+    print(f"Fence intersections: {json.dumps(stats)}")
+
+
+def perimeter_index(state: PerimeterState, union_geom) -> bytes:
+    """The packed R-tree index file for ``union_geom``, attributed from ``state``'s slices."""
+    parts, attributes, sources = annotate_parts(state, union_geom)
+    return build_index(
+        parts, attributes, sources, OUTPUT_PRECISION if OUTPUT_PRECISION >= 0 else None, generated=time.time()
+    )
+
+
+def publish_outputs(s3, output_bucket: str, output_key: str, state: PerimeterState, union_geom, index=None):
+    """Write the merged perimeter and every derived output; returns the per-level log.
+
+    ``index`` is a prebuilt ``perimeter_index`` body, built here when omitted.
+    """
+    started = time.perf_counter()
+    full = upload_geojson(
+        s3, output_bucket, output_key, union_geom, OUTPUT_PRECISION if OUTPUT_PRECISION >= 0 else None, OUTPUT_ENCODING
+    )
+    print(f"Uploaded merged perimeters to s3://{output_bucket}/{output_key}")
+    levels = [{"level": "full", **full, "seconds": round(time.perf_counter() - started, 3)}]
+    if OUTPUT_ZOOM_BANDS:
+        levels += upload_simplified_outputs(
+            s3, output_bucket, output_key, union_geom, OUTPUT_ZOOM_BANDS, OUTPUT_ENCODING
+        )
+    if VECTOR_TILE_PREFIX:
+        levels += upload_tile_pyramid(
+            s3,
+            output_bucket,
+            VECTOR_TILE_PREFIX,
+            union_geom,
+            VECTOR_TILE_MIN_ZOOM,
+            VECTOR_TILE_MAX_ZOOM,
+            DOWNLOAD_WORKERS,
+            VECTOR_TILE_BASE_URL,
+        )
+    if INDEX_KEY:
+        started = time.perf_counter()
+        body = index if index is not None else perimeter_index(state, union_geom)
+        uploaded = upload_bytes(s3, output_bucket, INDEX_KEY, body, content_type="application/x-ndjson")
+        features = body.count(b"\n") - 1
+        levels.append(
+            {"level": "index", **uploaded, "features": features, "seconds": round(time.perf_counter() - started, 3)}
+        )
+    print(f"Output levels: {json.dumps(levels)}")
+    GEOMETRY_VERTICES.observe(int(shapely.get_num_coordinates(union_geom)), level="full")
+    for level in levels:
+        OUTPUT_SECONDS.observe(level["seconds"], level=level["level"])
+        OUTPUT_BYTES.observe(level["bytes"], level=level["level"])
+        if "coordinates" in level:
+            GEOMETRY_VERTICES.observe(level["coordinates"], level=level["level"])
+    if TILE_OUTPUT_PREFIX:
+        upload_tile_outputs(s3, output_bucket, TILE_OUTPUT_PREFIX, union_geom)
+    return levels
+
+
+def collect_firehose_geometries(
+    s3_client, bucket: str, prefix: str, download_workers: int = 16, parse_workers: int = 0
+):
+    """Load geometries from every Firehose-delivered object under ``prefix``."""
     geometries = []
-    resp = s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    for obj in resp.get("Contents", []):
-        body = s3_client.get_object(Bucket=bucket, Key=obj["Key"])['Body'].read()
-        data = json.loads(body)
-        for feature in data.get("features", []):
-            geometries.append(shape(feature["geometry"]))
+    for _, parsed in iter_firehose_objects(
+        s3_client, bucket, prefix, download_workers=download_workers, parse_workers=parse_workers
+    ):
+        geometries.extend(parsed)
     return geometries
 
 
+def output_keys(output_key: str) -> Callable[[str], bool]:
+    """Predicate matching every key the processor publishes, for when raw and output share a bucket.
+
+    Without it each publish would show up as a new raw object and feed the next fold.
+    """
+    prefixes = [os.path.splitext(output_key)[0], STATE_KEY, INDEX_KEY]
+    prefixes += [air_quality.AIR_QUALITY_PREFIX, air_quality.AIR_QUALITY_STATE_KEY]
+    prefixes += [prefix for prefix in (VECTOR_TILE_PREFIX, TILE_OUTPUT_PREFIX) if prefix]
+    prefixes = tuple(prefix for prefix in prefixes if prefix)
+    return lambda key: key.startswith(prefixes)
+
+
+def raw_key_filter(firehose_bucket: str, output_bucket: str, output_key: str) -> Optional[Callable[[str], bool]]:
+    """The ``ignore`` predicate for listing raw deliveries: this processor's outputs when
+    both share a bucket, else None. Both the scheduled run and the service list through it."""
+    return output_keys(output_key) if firehose_bucket == output_bucket else None
+
+
 def main():
     firehose_bucket = os.environ.get("FIREHOSE_BUCKET")
     firehose_prefix = os.environ.get("FIREHOSE_PREFIX", "")
@@ -29,22 +203,52 @@ def main():
     if not firehose_bucket or not output_bucket:
         raise RuntimeError("FIREHOSE_BUCKET and OUTPUT_BUCKET must be set")
 
-    s3 = boto3.client("s3")
+    s3 = make_s3_client(DOWNLOAD_WORKERS)
 
-    geometries = collect_firehose_geometries(s3, firehose_bucket, firehose_prefix)
-    if not geometries:
-        print("No fire perimeter features found")
-        return
+    # Without incremental union every run starts from an empty, unsaved checkpoint;
+    # its (slot, source) slices still attribute the index features
+    store = S3StateStore(s3, output_bucket, STATE_KEY) if INCREMENTAL_UNION else None
+    state = PerimeterState.from_bytes(store.load() if store else None, SLICE_MINUTES * 60)
 
-    union_geom = unary_union(geometries)
+    def load(objects):
+        return iter_firehose_objects(
+            s3, firehose_bucket, firehose_prefix, objects, DOWNLOAD_WORKERS, PARSE_WORKERS, by_source=True
+        )
 
-    schema = {"geometry": union_geom.geom_type, "properties": {}}
+    # The listing feeds two consumers split by source: nsw_epn readings go only to the
+    # air-quality rollup, and the reader drops them from the perimeter's geometries
+    ignore = raw_key_filter(firehose_bucket, output_bucket, output_key)
+    objects = list(iter_objects(s3, firehose_bucket, firehose_prefix, ignore=ignore))
+    rollup = air_quality.build_stage(s3, firehose_bucket, output_bucket, OUTPUT_ENCODING, DOWNLOAD_WORKERS)
+    if rollup is not None:
+        print(f"Air-quality rollup: {rollup.update(objects)}")
+        if rollup.dirty:
+            print(f"Air-quality outputs: {rollup.publish()}")
+        rollup.checkpoint()
+
+    union_geom, stats = update_perimeter(
+        state,
+        objects,
+        load,
+        now=time.time(),
+        window_seconds=WINDOW_HOURS * 3600 if INCREMENTAL_UNION else 0,
+        union=perimeter_union,
+    )
+    print(f"{'Incremental' if INCREMENTAL_UNION else 'Full'} union: {stats}")
+
+    if union_geom is None or union_geom.is_empty:
+        print("No fire perimeter features found")
+        update_fences(None)
+        if store is not None:
+            store.save(state.to_bytes())
+        return
 
-    with tempfile.NamedTemporaryFile(suffix=".geojson", delete=False) as tmp:
-        with fiona.open(tmp.name, "w", driver="GeoJSON", schema=schema) as dst:
-            dst.write({"geometry": mapping(union_geom), "properties": {}})
-        s3.upload_file(tmp.name, output_bucket, output_key)
-        print(f"Uploaded merged perimeters to s3://{output_bucket}/{output_key}")
+    publish_outputs(s3, output_bucket, output_key, state, union_geom)
+    # Flags flip only after the perimeter they refer to is published
+    update_fences(union_geom)
+    # Checkpoint only once the output it describes has been published
+    if store is not None:
+        store.save(state.to_bytes())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,171 @@
+import json
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from shapely.geometry import Point, shape
+
+from common import metrics
+from common.record_codec import decode_records, detect_encoding
+
+# Source recorded for geometries whose record or feature does not name one
+UNKNOWN_SOURCE = "unknown"
+# Source of the EPN air-quality readings, which share the raw objects with the fire records
+EPN_SOURCE = "nsw_epn"
+# Sources whose records are not fire observations and never become perimeter geometry
+NON_FIRE_SOURCES = frozenset({EPN_SOURCE})
+
+S3_OBJECTS_READ = metrics.counter("processor_s3_objects_read_total", "Raw Firehose objects downloaded")
+S3_BYTES_READ = metrics.counter("processor_s3_bytes_read_total", "Raw Firehose object bytes downloaded")
+S3_GET_SECONDS = metrics.histogram("processor_s3_get_seconds", "Raw object GET latency, body included")
+FIRES_PROCESSED = metrics.counter("fires_processed_total", "Hotspot and perimeter geometries parsed from raw objects")
+
+
+def make_s3_client(max_workers: int = 16):
+    """S3 client whose connection pool can serve ``max_workers`` concurrent GETs."""
+    return boto3.client("s3", config=Config(max_pool_connections=max(10, max_workers)))
+
+
+def iter_object_features(body: bytes) -> Iterator[Tuple[str, Any]]:
+    """Yield ``(source, geometry)`` from one Firehose object in any delivered format.
+
+    Objects may hold a GeoJSON FeatureCollection, JSON-lines records or
+    MessagePack rows (see ``common.record_codec``); records become points.
+    Records and features from ``NON_FIRE_SOURCES`` are skipped.
+    """
+    if detect_encoding(body) == "jsonl":
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError:
+            data = None
+        if isinstance(data, dict) and "features" in data:
+            for feature in data["features"]:
+                source = (feature.get("properties") or {}).get("source") or UNKNOWN_SOURCE
+                if source not in NON_FIRE_SOURCES:
+                    yield source, shape(feature["geometry"])
+            return
+    for rec in decode_records(body):
+        if rec.get("source") in NON_FIRE_SOURCES or rec.get("longitude") is None or rec.get("latitude") is None:
+            continue
+        yield rec.get("source") or UNKNOWN_SOURCE, Point(float(rec["longitude"]), float(rec["latitude"]))
+
+
+def iter_object_geometries(body: bytes):
+    """Yield geometries from one Firehose object in any delivered format."""
+    for _, geometry in iter_object_features(body):
+        yield geometry
+
+
+def parse_object(body: bytes) -> List[Any]:
+    """Parse one object into a list of geometries (process-pool entry point)."""
+    return list(iter_object_geometries(body))
+
+
+def parse_object_by_source(body: bytes) -> Dict[str, List[Any]]:
+    """Parse one object into geometries grouped by source (process-pool entry point)."""
+    groups: Dict[str, List[Any]] = {}
+    for source, geometry in iter_object_features(body):
+        groups.setdefault(source, []).append(geometry)
+    return groups
+
+
+def iter_objects(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    start_after: str = "",
+    ignore: Optional[Callable[[str], bool]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield every object under ``prefix``, following list continuation tokens.
+
+    Only keys after ``start_after`` are listed, and keys for which ``ignore``
+    returns True are skipped.
+    """
+    paginator = s3_client.get_paginator("list_objects_v2")
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        params["StartAfter"] = start_after
+    for page in paginator.paginate(**params):
+        for obj in page.get("Contents", []):
+            if ignore is None or not ignore(obj["Key"]):
+                yield obj
+
+
+def _bounded_map(
+    executor: Executor, fn, items: Iterable[Any], window: int, arg=lambda item: item
+) -> Iterator[Tuple[Any, Any]]:
+    """Like ``executor.map`` but only ``window`` items are outstanding at once.
+
+    ``fn`` is called with ``arg(item)`` and results are yielded in order.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            head, future = pending.popleft()
+            yield head, future.result()
+        pending.append((item, executor.submit(fn, arg(item))))
+    while pending:
+        head, future = pending.popleft()
+        yield head, future.result()
+
+
+def iter_object_bodies(
+    s3_client, bucket: str, objects: Iterable[Dict[str, Any]], max_workers: int = 16
+) -> Iterator[Tuple[Dict[str, Any], bytes]]:
+    """Download objects on a thread pool, yielding ``(object, body)`` in listing order."""
+
+    def fetch(obj: Dict[str, Any]) -> bytes:
+        with S3_GET_SECONDS.time():
+            body = s3_client.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+        S3_OBJECTS_READ.inc()
+        S3_BYTES_READ.inc(len(body))
+        return body
+
+    if max_workers <= 1:
+        for obj in objects:
+            yield obj, fetch(obj)
+        return
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        yield from _bounded_map(pool, fetch, objects, max_workers * 2)
+
+
+def iter_parsed_objects(
+    bodies: Iterable[Tuple[Dict[str, Any], bytes]],
+    parse_workers: int = 0,
+    parse: Callable[[bytes], Any] = parse_object,
+) -> Iterator[Tuple[Dict[str, Any], Any]]:
+    """Parse downloaded bodies with ``parse``, on a process pool when ``parse_workers`` > 0.
+
+    Bodies are handed to the pool as they arrive and at most a few per worker
+    are outstanding, so memory stays bounded however many objects are listed.
+    """
+    if parse_workers <= 0:
+        for obj, body in bodies:
+            yield obj, parse(body)
+        return
+    with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+        for (obj, _), geometries in _bounded_map(pool, parse, bodies, parse_workers * 4, arg=lambda pair: pair[1]):
+            yield obj, geometries
+
+
+def iter_firehose_objects(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    objects: Optional[Iterable[Dict[str, Any]]] = None,
+    download_workers: int = 16,
+    parse_workers: int = 0,
+    by_source: bool = False,
+) -> Iterator[Tuple[Dict[str, Any], Any]]:
+    """Yield ``(object, geometries)`` for each delivered object under ``prefix``.
+
+    With ``by_source`` the geometries come as a ``{source: [geometry]}`` dict.
+    """
+    if objects is None:
+        objects = iter_objects(s3_client, bucket, prefix)
+    bodies = iter_object_bodies(s3_client, bucket, objects, download_workers)
+    for obj, geometries in iter_parsed_objects(bodies, parse_workers, parse_object_by_source if by_source else parse_object):
+        FIRES_PROCESSED.inc(sum(map(len, geometries.values())) if by_source else len(geometries))
+        yield obj, geometries
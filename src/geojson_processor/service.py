@@ -0,0 +1,419 @@
+"""Resident perimeter engine behind the ECS service.
+
+The scheduled task restarted every five minutes, re-imported Shapely and
+re-listed the whole prefix before doing any work. The engine instead keeps
+the checkpoint slices, the prefix listing, the merged perimeter and its
+packed R-tree index in memory. Each step it picks up newly delivered
+objects from a source, folds them into their slices with
+``update_perimeter``, serves the new index at once and republishes the S3
+outputs at most every ``MIN_PUBLISH_SECONDS``.
+
+Sources either list after the newest key seen (``ListingSource``) or drain
+S3 event notifications from an SQS queue (``QueueSource``, when
+``QUEUE_URL`` is set). Both relist the prefix every ``RELIST_SECONDS`` to
+pick up out-of-order keys, overwrites and deletions.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import unquote_plus
+
+import boto3
+from shapely.geometry import GeometryCollection
+
+from common import metrics
+from geojson_processor import air_quality, main
+from geojson_processor.air_quality import AirQualityStage
+from geojson_processor.incremental import PerimeterState, S3StateStore, update_perimeter
+from geojson_processor.reader import iter_firehose_objects, iter_objects, make_s3_client
+
+# Seconds between listings when polling S3, and the SQS long-poll wait with a queue
+POLL_SECONDS = float(os.environ.get("POLL_SECONDS", "5"))
+# Seconds between full relists of the prefix (catches out-of-order keys and deletions)
+RELIST_SECONDS = float(os.environ.get("RELIST_SECONDS", "300"))
+# SQS queue receiving the raw bucket's S3 event notifications (empty polls the listing)
+QUEUE_URL = os.environ.get("QUEUE_URL", "")
+# Messages drained from the queue per step, in receives of 10
+QUEUE_MAX_MESSAGES = int(os.environ.get("QUEUE_MAX_MESSAGES", "100"))
+# Minimum seconds between S3 publishes; the in-memory index is refreshed every step
+MIN_PUBLISH_SECONDS = float(os.environ.get("MIN_PUBLISH_SECONDS", "10"))
+# Seconds after which fences are rescanned even if the perimeter is unchanged, so new or
+# edited fences get their intersects flag (the old scheduled task's cadence)
+FENCE_REFRESH_SECONDS = float(os.environ.get("FENCE_REFRESH_SECONDS", "300"))
+# Minimum seconds between checkpoint writes
+CHECKPOINT_SECONDS = float(os.environ.get("CHECKPOINT_SECONDS", "60"))
+# /health fails once the last successful poll is older than this
+STALE_SECONDS = float(os.environ.get("STALE_SECONDS", "120"))
+# Increments smaller than this are parsed in-process instead of on a process pool
+PARSE_POOL_MIN_OBJECTS = int(os.environ.get("PARSE_POOL_MIN_OBJECTS", "64"))
+
+STEP_SECONDS = metrics.histogram("processor_step_seconds", "Engine step duration, by outcome")
+PUBLISH_LAG_SECONDS = metrics.histogram(
+    "processor_publish_lag_seconds", "Seconds from the newest raw object landing to its S3 publish"
+)
+
+
+def timestamp(value: Any) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class ListingSource:
+    """Objects under a prefix, found by listing after the newest key seen.
+
+    Firehose keys start with the UTC delivery hour, so new deliveries sort
+    after everything already listed; a full relist every ``relist_seconds``
+    catches keys that do not, overwritten objects and deletions. Keys
+    for which ``ignore`` returns True are never listed.
+    """
+
+    # Seconds the engine sleeps between polls
+    interval = POLL_SECONDS
+
+    def __init__(
+        self,
+        s3_client,
+        bucket: str,
+        prefix: str = "",
+        relist_seconds: float = RELIST_SECONDS,
+        ignore: Optional[Callable[[str], bool]] = None,
+    ):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.relist_seconds = relist_seconds
+        self.ignore = ignore or (lambda key: False)
+        self.relisted: Optional[float] = None
+        self.last_key = ""
+
+    def poll(self, listing: Dict[str, Dict[str, Any]], now: float) -> bool:
+        """Bring ``listing`` (key -> listed object) up to date; True when it changed."""
+        if self.relisted is None or now - self.relisted >= self.relist_seconds:
+            changed = self.relist(listing)
+            self.relisted = now
+        else:
+            changed = self.changes(listing)
+        if listing:
+            self.last_key = max(self.last_key, max(listing))
+        return changed
+
+    def relist(self, listing: Dict[str, Dict[str, Any]]) -> bool:
+        fresh = {obj["Key"]: obj for obj in iter_objects(self.s3, self.bucket, self.prefix, ignore=self.ignore)}
+        changed = fresh.keys() != listing.keys() or any(
+            listing[key].get("ETag") != obj.get("ETag") for key, obj in fresh.items()
+        )
+        listing.clear()
+        listing.update(fresh)
+        return changed
+
+    def changes(self, listing: Dict[str, Dict[str, Any]]) -> bool:
+        changed = False
+        for obj in iter_objects(self.s3, self.bucket, self.prefix, self.last_key, self.ignore):
+            listing[obj["Key"]] = obj
+            changed = True
+        return changed
+
+    def ack(self) -> None:
+        """Called once the changes from the last poll are folded into the perimeter."""
+
+
+class QueueSource(ListingSource):
+    """Objects under a prefix, tracked from S3 event notifications delivered to SQS.
+
+    Messages are deleted only after their changes are folded in; the
+    periodic relist still reconciles anything a notification missed.
+    """
+
+    interval = 0
+
+    def __init__(
+        self,
+        s3_client,
+        sqs_client,
+        queue_url: str,
+        bucket: str,
+        prefix: str = "",
+        relist_seconds: float = RELIST_SECONDS,
+        wait_seconds: float = POLL_SECONDS,
+        ignore: Optional[Callable[[str], bool]] = None,
+    ):
+        super().__init__(s3_client, bucket, prefix, relist_seconds, ignore)
+        self.sqs = sqs_client
+        self.queue_url = queue_url
+        self.wait_seconds = wait_seconds
+        self.receipts: List[str] = []
+
+    def _apply(self, record: Dict[str, Any], listing: Dict[str, Dict[str, Any]]) -> bool:
+        s3 = record.get("s3") or {}
+        key = unquote_plus(s3.get("object", {}).get("key", ""))
+        if s3.get("bucket", {}).get("name") != self.bucket or not key.startswith(self.prefix) or self.ignore(key):
+            return False
+        if record.get("eventName", "").startswith("ObjectRemoved"):
+            return listing.pop(key, None) is not None
+        listing[key] = {
+            "Key": key,
+            "ETag": f'"{s3["object"].get("eTag", "")}"',
+            "Size": s3["object"].get("size", 0),
+            "LastModified": datetime.fromisoformat(record["eventTime"].replace("Z", "+00:00")),
+        }
+        return True
+
+    def changes(self, listing: Dict[str, Dict[str, Any]]) -> bool:
+        changed = False
+        wait = self.wait_seconds
+        while len(self.receipts) < QUEUE_MAX_MESSAGES:
+            resp = self.sqs.receive_message(
+                QueueUrl=self.queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=int(round(wait))
+            )
+            messages = resp.get("Messages", [])
+            if not messages:
+                break
+            for message in messages:
+                self.receipts.append(message["ReceiptHandle"])
+                body = json.loads(message["Body"])
+                # s3:TestEvent and other bodies without records are dropped
+                for record in body.get("Records", []):
+                    changed = self._apply(record, listing) or changed
+            # Only the first receive waits; later ones just drain the backlog
+            wait = 0
+        return changed
+
+    def ack(self) -> None:
+        for start in range(0, len(self.receipts), 10):
+            entries = [{"Id": str(n), "ReceiptHandle": r} for n, r in enumerate(self.receipts[start : start + 10])]
+            self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=entries)
+        self.receipts = []
+
+
+class PerimeterEngine:
+    """The merged perimeter and its index, kept current from a source of raw objects.
+
+    ``step`` is driven by the background thread ``start`` launches; request
+    handlers only read ``index`` and ``health``, which use values the thread
+    swaps whole and never iterate its live state.
+    """
+
+    def __init__(
+        self,
+        s3_client,
+        source: ListingSource,
+        output_bucket: str,
+        output_key: str = "fire_perimeters.geojson",
+        store: Optional[S3StateStore] = None,
+        window_seconds: float = main.WINDOW_HOURS * 3600,
+        publish_outputs: bool = True,
+        air_quality: Optional[AirQualityStage] = None,
+    ):
+        self.s3 = s3_client
+        self.source = source
+        self.output_bucket = output_bucket
+        self.output_key = output_key
+        self.store = store
+        self.window_seconds = window_seconds
+        self.publish_outputs = publish_outputs
+        # Rollup of the EPN readings in the same objects, folded and published every changed step
+        self.air_quality = air_quality
+        self.state = PerimeterState.from_bytes(store.load() if store else None, main.SLICE_MINUTES * 60)
+        # Counted on the engine thread; /health must not iterate state.buckets while a step rewrites it
+        self.slices = self._count_slices()
+        self.listing: Dict[str, Dict[str, Any]] = {}
+        self.perimeter = GeometryCollection()
+        # Index file body (see spatial_index.build_index) served by /perimeters; None until the first step
+        self.index: Optional[bytes] = None
+        self.pending = False
+        self.checkpoint_pending = False
+        self.started = time.time()
+        self.last_poll: Optional[float] = None
+        self.last_update: Optional[float] = None
+        self.last_publish: Optional[float] = None
+        self.last_checkpoint = self.started
+        # Perimeter the fence flags were last computed against, and when
+        self.fenced_perimeter = None
+        self.last_fence_update: Optional[float] = None
+        self.newest_object: Optional[float] = None
+        self.published_newest: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.stats: Dict[str, Any] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load(self, objects):
+        workers = main.PARSE_WORKERS if len(objects) >= PARSE_POOL_MIN_OBJECTS else 0
+        return iter_firehose_objects(
+            self.s3, self.source.bucket, self.source.prefix, objects, main.DOWNLOAD_WORKERS, workers, by_source=True
+        )
+
+    def _count_slices(self) -> int:
+        return len({slot for slot, _ in self.state.buckets})
+
+    def _expiring(self, now: float) -> bool:
+        cutoff = now - self.window_seconds
+        return self.window_seconds > 0 and any(
+            slot + self.state.bucket_seconds <= cutoff for slot, _ in self.state.buckets
+        )
+
+    def step(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Poll once, fold any new objects and publish when due; returns the fold stats."""
+        now = time.time() if now is None else now
+        changed = self.source.poll(self.listing, now)
+        stats: Dict[str, Any] = {}
+        if changed or self._expiring(now) or self.index is None:
+            self.perimeter, stats = update_perimeter(
+                self.state, list(self.listing.values()), self._load, now, self.window_seconds, main.perimeter_union
+            )
+            # Served by /perimeters straight away; the S3 copies follow when due
+            self.index = main.perimeter_index(self.state, self.perimeter)
+            self.slices = self._count_slices()
+            if self.listing:
+                self.newest_object = max(timestamp(obj["LastModified"]) for obj in self.listing.values())
+            self.last_update = now
+            self.pending = self.checkpoint_pending = True
+            self.stats = stats
+        if self.air_quality is not None and (changed or self.last_poll is None):
+            if self.air_quality.update(self.listing.values())["objects"]:
+                self.checkpoint_pending = True
+            if self.air_quality.dirty and self.publish_outputs:
+                self.air_quality.publish()
+        self.source.ack()
+        if self.pending and (self.last_publish is None or now - self.last_publish >= MIN_PUBLISH_SECONDS):
+            self.publish(now)
+        elif (
+            self.publish_outputs
+            and not self.pending
+            and self.last_fence_update is not None
+            and now - self.last_fence_update >= FENCE_REFRESH_SECONDS
+        ):
+            # No new perimeter to publish, but fences added since the last scan need their flags
+            self.update_fences(now)
+        if self.checkpoint_pending and now - self.last_checkpoint >= CHECKPOINT_SECONDS:
+            self.checkpoint(now)
+        # Only a step that got this far counts as a poll for /health
+        self.last_poll = now
+        return stats
+
+    def publish(self, now: float) -> None:
+        """Write the S3 outputs for the current perimeter, then the fence flags it implies."""
+        empty = self.perimeter is None or self.perimeter.is_empty
+        if self.publish_outputs:
+            if not empty:
+                main.publish_outputs(
+                    self.s3, self.output_bucket, self.output_key, self.state, self.perimeter, self.index
+                )
+            # Flags flip only after the perimeter they refer to is published
+            if self._fences_due(now):
+                self.update_fences(now)
+        self.pending = False
+        self.last_publish = now
+        self.published_newest = self.newest_object
+        if self.newest_object is not None:
+            PUBLISH_LAG_SECONDS.observe(max(0.0, now - self.newest_object))
+
+    def update_fences(self, now: float) -> None:
+        empty = self.perimeter is None or self.perimeter.is_empty
+        main.update_fences(None if empty else self.perimeter)
+        self.fenced_perimeter = self.perimeter
+        self.last_fence_update = now
+
+    def _fences_due(self, now: float) -> bool:
+        """Whether a publish should rescan the fence table.
+
+        Every scan reads the whole table, so publishes that leave the
+        geometry as it was skip it until ``FENCE_REFRESH_SECONDS`` have passed.
+        """
+        if self.last_fence_update is None or now - self.last_fence_update >= FENCE_REFRESH_SECONDS:
+            return True
+        before, after = self.fenced_perimeter, self.perimeter
+        if before is None or after is None:
+            return before is not after
+        if before.is_empty or after.is_empty:
+            return before.is_empty != after.is_empty
+        return not after.equals(before)
+
+    def checkpoint(self, now: float) -> None:
+        if self.store is not None:
+            self.store.save(self.state.to_bytes())
+        if self.air_quality is not None:
+            self.air_quality.checkpoint()
+        self.checkpoint_pending = False
+        self.last_checkpoint = now
+
+    def health(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Freshness report; ``ok`` is False until the first poll and once polling stalls."""
+        now = time.time() if now is None else now
+
+        def age(value: Optional[float]) -> Optional[float]:
+            return None if value is None else round(now - value, 3)
+
+        ok = self.last_poll is not None and now - self.last_poll <= STALE_SECONDS
+        return {
+            "status": "ok" if ok else ("starting" if self.last_poll is None else "stale"),
+            "ok": ok,
+            "uptime_s": age(self.started),
+            "last_poll_age_s": age(self.last_poll),
+            "last_update_age_s": age(self.last_update),
+            "last_publish_age_s": age(self.last_publish),
+            # Age of the newest raw object, and how long after it landed the outputs were published
+            "newest_object_age_s": age(self.newest_object),
+            "publish_lag_s": (
+                None
+                if self.last_publish is None or self.published_newest is None
+                else round(max(0.0, self.last_publish - self.published_newest), 3)
+            ),
+            "pending_publish": self.pending,
+            "objects": len(self.listing),
+            "slices": self.slices,
+            "air_quality_sites": None if self.air_quality is None else len(self.air_quality.rollup.sites),
+            "last_error": self.last_error,
+        }
+
+    def run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            with STEP_SECONDS.time(outcome="ok") as labels:
+                try:
+                    stats = self.step()
+                    if stats.get("objects_processed"):
+                        print(f"Perimeter update: {json.dumps(stats)}")
+                    self.last_error = None
+                except Exception as exc:  # keep serving the last good perimeter
+                    labels["outcome"] = "error"
+                    self.last_error = f"{type(exc).__name__}: {exc}"
+                    traceback.print_exc()
+            self._stop.wait(max(0.0, self.source.interval - (time.monotonic() - started)))
+
+    def start(self) -> "PerimeterEngine":
+        self._thread = threading.Thread(target=self.run, name="perimeter-engine", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self.checkpoint_pending:
+            self.checkpoint(time.time())
+
+
+def build_engine() -> PerimeterEngine:
+    """Engine configured from the same environment as the scheduled task."""
+    firehose_bucket = os.environ.get("FIREHOSE_BUCKET")
+    firehose_prefix = os.environ.get("FIREHOSE_PREFIX", "")
+    output_bucket = os.environ.get("OUTPUT_BUCKET")
+    output_key = os.environ.get("OUTPUT_KEY", "fire_perimeters.geojson")
+    if not firehose_bucket or not output_bucket:
+        raise RuntimeError("FIREHOSE_BUCKET and OUTPUT_BUCKET must be set")
+
+    ignore = main.raw_key_filter(firehose_bucket, output_bucket, output_key)
+    s3 = make_s3_client(main.DOWNLOAD_WORKERS)
+    if QUEUE_URL:
+        source = QueueSource(s3, boto3.client("sqs"), QUEUE_URL, firehose_bucket, firehose_prefix, ignore=ignore)
+    else:
+        source = ListingSource(s3, firehose_bucket, firehose_prefix, ignore=ignore)
+    store = S3StateStore(s3, output_bucket, main.STATE_KEY) if main.INCREMENTAL_UNION else None
+    rollup = air_quality.build_stage(s3, firehose_bucket, output_bucket, main.OUTPUT_ENCODING, main.DOWNLOAD_WORKERS)
+    return PerimeterEngine(s3, source, output_bucket, output_key, store, air_quality=rollup)
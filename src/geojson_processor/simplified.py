@@ -0,0 +1,87 @@
+import math
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import shapely
+
+from geojson_processor.geojson_output import feature_collection, upload_bytes
+from geojson_processor.tiling import merge_intersecting
+
+ZoomBand = Tuple[int, int]
+
+
+def parse_zoom_bands(spec: str) -> List[ZoomBand]:
+    """Parse ``"0-5,6-9,10-12"`` into ``[(0, 5), (6, 9), (10, 12)]``."""
+    bands = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        low, _, high = item.partition("-")
+        bands.append((int(low), int(high or low)))
+    return bands
+
+
+def band_tolerance(max_zoom: int) -> float:
+    """Half a 256 px screen pixel at ``max_zoom``, in degrees of longitude."""
+    return 360.0 / (256 * 2**max_zoom) / 2
+
+
+def band_precision(max_zoom: int) -> int:
+    """Decimal places that keep rounding error an order of magnitude under the tolerance."""
+    return math.ceil(-math.log10(band_tolerance(max_zoom))) + 1
+
+
+def simplify_for_zoom(geometry, max_zoom: int):
+    """Topology-preserving simplification plus coordinate rounding for one zoom band.
+
+    Parts are simplified and rounded one by one, which is far cheaper than
+    simplifying the whole multipolygon at once. A part that rounding made
+    invalid is snapped to the precision grid properly instead, and the few
+    parts that now touch a neighbour are merged, so the result stays valid.
+    """
+    decimals = band_precision(max_zoom)
+    grid = 10.0**-decimals
+
+    def round_coords(geoms):
+        return shapely.transform(geoms, lambda coords: np.round(coords, decimals))
+
+    parts = shapely.get_parts(geometry)
+    simplified = shapely.simplify(parts, band_tolerance(max_zoom), preserve_topology=True)
+    rounded = round_coords(simplified)
+    invalid = ~shapely.is_valid(rounded)
+    if invalid.any():
+        rounded[invalid] = round_coords(shapely.set_precision(simplified[invalid], grid))
+    rounded = rounded[~shapely.is_empty(rounded)]
+    return round_coords(merge_intersecting(shapely.get_parts(rounded).tolist(), grid_size=grid))
+
+
+def band_key(output_key: str, band: ZoomBand) -> str:
+    """``fire_perimeters.geojson`` -> ``fire_perimeters.z0-5.geojson``."""
+    root, ext = os.path.splitext(output_key)
+    return f"{root}.z{band[0]}-{band[1]}{ext or '.geojson'}"
+
+
+def upload_simplified_outputs(
+    s3_client, bucket: str, output_key: str, geometry, bands: List[ZoomBand], encoding: str = "identity"
+) -> List[Dict[str, Any]]:
+    """Write one simplified GeoJSON per zoom band and report size and time per level."""
+    report = []
+    for band in bands:
+        started = time.perf_counter()
+        simplified = simplify_for_zoom(geometry, band[1])
+        # Coordinates are already rounded to the band's precision
+        uploaded = upload_bytes(
+            s3_client, bucket, band_key(output_key, band), feature_collection(simplified, None), encoding=encoding
+        )
+        report.append(
+            {
+                "level": f"z{band[0]}-{band[1]}",
+                **uploaded,
+                "coordinates": int(shapely.get_num_coordinates(simplified)),
+                "seconds": round(time.perf_counter() - started, 3),
+            }
+        )
+    return report
@@ -0,0 +1,162 @@
+"""Packed R-tree over perimeter features, persisted next to the GeoJSON output.
+
+The index file is newline-delimited. Line one is a JSON header holding the
+per-level node boxes of an STR-packed R-tree, plus per-feature columns for
+first/last seen times and a source bitmask. Each following line is one
+GeoJSON Feature, in leaf order. The query Lambda parses only the header and
+splices the matching feature lines into its response, so it needs no
+geometry library.
+"""
+import json
+import math
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import shapely
+from shapely.strtree import STRtree
+
+from geojson_processor.incremental import PerimeterState
+
+INDEX_VERSION = 1
+NODE_SIZE = 16
+
+_COLLECTION_TYPES = [
+    shapely.GeometryType.MULTIPOINT,
+    shapely.GeometryType.MULTILINESTRING,
+    shapely.GeometryType.MULTIPOLYGON,
+    shapely.GeometryType.GEOMETRYCOLLECTION,
+]
+
+
+def annotate_parts(state: PerimeterState, merged) -> Tuple[np.ndarray, Dict[str, np.ndarray], List[str]]:
+    """Split the merged perimeter into parts and attribute each one from the checkpoint slices.
+
+    A part's sources are every source whose slice geometry intersects it;
+    first/last seen span the delivery windows of those slices. Polygons
+    nested in collections are kept; line and point parts the union left
+    behind have no area to query and are counted and skipped.
+    """
+    parts = shapely.get_parts(merged)
+    # get_parts flattens one level, so a collection holding multi-part members takes several passes
+    while np.isin(shapely.get_type_id(parts), _COLLECTION_TYPES).any():
+        parts = shapely.get_parts(parts)
+    polygonal = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+    if not polygonal.all():
+        print(f"Spatial index skipped {int((~polygonal).sum())} non-polygon parts")
+    parts = parts[polygonal]
+    sources = sorted({source for _, source in state.buckets})
+    first = np.full(len(parts), np.inf)
+    last = np.full(len(parts), -np.inf)
+    masks = np.zeros(len(parts), dtype=np.int64)
+    if len(parts) and state.buckets:
+        slice_parts, starts, bits = [], [], []
+        for (slot, source), geometry in state.buckets.items():
+            pieces = shapely.get_parts(geometry)
+            slice_parts.append(pieces)
+            starts.append(np.full(len(pieces), slot, dtype=np.float64))
+            bits.append(np.full(len(pieces), 1 << sources.index(source), dtype=np.int64))
+        slice_parts = np.concatenate(slice_parts)
+        starts = np.concatenate(starts)
+        bits = np.concatenate(bits)
+        piece, part = STRtree(parts).query(slice_parts, predicate="intersects")
+        np.minimum.at(first, part, starts[piece])
+        np.maximum.at(last, part, starts[piece] + state.bucket_seconds)
+        np.bitwise_or.at(masks, part, bits[piece])
+    first[np.isinf(first)] = 0
+    last[np.isinf(last)] = 0
+    return parts, {"first_seen": first.astype(np.int64), "last_seen": last.astype(np.int64), "sources": masks}, sources
+
+
+def _str_order(boxes: np.ndarray, node_size: int) -> np.ndarray:
+    """Sort-Tile-Recursive order: vertical slices by x centre, each sorted by y centre."""
+    n = len(boxes)
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2
+    slices = max(1, math.ceil(math.sqrt(math.ceil(n / node_size))))
+    per_slice = slices * node_size
+    by_x = np.argsort(cx, kind="stable")
+    order = [chunk[np.argsort(cy[chunk], kind="stable")] for chunk in np.split(by_x, range(per_slice, n, per_slice))]
+    return np.concatenate(order) if order else by_x
+
+
+def _level_columns(level: np.ndarray) -> List[List[float]]:
+    """[minx, miny, maxx, maxy] columns at 1e-7 degrees, rounded outwards so boxes never shrink."""
+    scale = 1e7
+    return [
+        (np.floor(level[:, 0] * scale) / scale).tolist(),
+        (np.floor(level[:, 1] * scale) / scale).tolist(),
+        (np.ceil(level[:, 2] * scale) / scale).tolist(),
+        (np.ceil(level[:, 3] * scale) / scale).tolist(),
+    ]
+
+
+def pack_levels(boxes: np.ndarray, node_size: int = NODE_SIZE) -> List[np.ndarray]:
+    """Node boxes per level, leaves first; node ``i`` of level ``k`` covers children ``i*size..``."""
+    levels = [boxes]
+    while len(levels[-1]) > 1:
+        child = levels[-1]
+        starts = np.arange(0, len(child), node_size)
+        levels.append(
+            np.column_stack(
+                [
+                    np.minimum.reduceat(child[:, 0], starts),
+                    np.minimum.reduceat(child[:, 1], starts),
+                    np.maximum.reduceat(child[:, 2], starts),
+                    np.maximum.reduceat(child[:, 3], starts),
+                ]
+            )
+        )
+    return levels
+
+
+def build_index(
+    parts: np.ndarray,
+    attributes: Dict[str, np.ndarray],
+    sources: List[str],
+    precision: Optional[int] = 6,
+    node_size: int = NODE_SIZE,
+    generated: Optional[float] = None,
+) -> bytes:
+    """Serialize perimeter parts and their attributes into the index file format."""
+    boxes = shapely.bounds(parts).reshape(-1, 4) if len(parts) else np.empty((0, 4))
+    order = _str_order(boxes, node_size) if len(parts) else np.empty(0, dtype=np.int64)
+    boxes = boxes[order]
+    # Missing attribute columns default to zeros
+    columns = {
+        name: np.asarray(attributes[name])[order] if name in attributes else np.zeros(len(parts), dtype=np.int64)
+        for name in ("first_seen", "last_seen", "sources")
+    }
+    levels = pack_levels(boxes, node_size) if len(parts) else []
+
+    header = {
+        "version": INDEX_VERSION,
+        "node_size": node_size,
+        "count": len(parts),
+        "generated": generated,
+        "source_names": sources,
+        # Each level as [minx, miny, maxx, maxy] columns, leaves first
+        "levels": [_level_columns(level) for level in levels],
+        "first_seen": columns["first_seen"].tolist(),
+        "last_seen": columns["last_seen"].tolist(),
+        "sources": columns["sources"].tolist(),
+    }
+    ordered = parts[order]
+    if precision is not None:
+        ordered = shapely.transform(ordered, lambda coords: np.round(coords, precision))
+    lines = [json.dumps(header, separators=(",", ":"))]
+    for rank, geometry in enumerate(shapely.to_geojson(ordered).tolist()):
+        properties = {
+            "sources": [name for bit, name in enumerate(sources) if header["sources"][rank] >> bit & 1],
+            "first_seen": header["first_seen"][rank],
+            "last_seen": header["last_seen"][rank],
+        }
+        lines.append(
+            f'{{"type":"Feature","geometry":{geometry},"properties":{json.dumps(properties, separators=(",", ":"))}}}'
+        )
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def index_key(output_key: str) -> str:
+    """``fire_perimeters.geojson`` -> ``fire_perimeters.index.ndjson``."""
+    return f"{os.path.splitext(output_key)[0]}.index.ndjson"
@@ -0,0 +1,123 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import GeometryCollection, MultiPoint, MultiPolygon
+from shapely.strtree import STRtree
+
+Tile = Tuple[int, int]
+
+
+def assign_tiles(geometries: Sequence[Any], tile_degrees: float) -> Dict[Tile, List[int]]:
+    """Bucket geometry indices by the grid cell holding their bounding-box centre."""
+    if not len(geometries):
+        return {}
+    bounds = shapely.bounds(np.asarray(geometries, dtype=object))
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+    ix = np.floor(cx / tile_degrees).astype(np.int64)
+    iy = np.floor(cy / tile_degrees).astype(np.int64)
+    tiles: Dict[Tile, List[int]] = defaultdict(list)
+    for i, key in enumerate(zip(ix.tolist(), iy.tolist())):
+        tiles[key].append(i)
+    return tiles
+
+
+def _union_wkb(blobs: List[bytes]) -> bytes:
+    """Process-pool entry point: union one tile's geometries passed as WKB."""
+    return shapely.to_wkb(shapely.union_all(shapely.from_wkb(np.asarray(blobs, dtype=object))))
+
+
+def union_tiles(
+    geometries: Sequence[Any], tile_degrees: float = 1.0, workers: int = 0
+) -> Dict[Tile, Any]:
+    """Union each tile's geometries, on a process pool when ``workers`` > 0."""
+    tiles = assign_tiles(geometries, tile_degrees)
+    geoms = np.asarray(geometries, dtype=object)
+    if workers <= 0 or len(tiles) < 2:
+        return {key: shapely.union_all(geoms[idx]) for key, idx in tiles.items()}
+    blobs = {key: shapely.to_wkb(geoms[idx]).tolist() for key, idx in tiles.items()}
+    # Largest tiles first so one dense fire does not become the straggler
+    order = sorted(blobs, key=lambda key: len(blobs[key]), reverse=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(_union_wkb, [blobs[key] for key in order])
+        return {key: shapely.from_wkb(blob) for key, blob in zip(order, results)}
+
+
+def _assemble(parts: List[Any]):
+    if not parts:
+        return GeometryCollection()
+    types = {part.geom_type for part in parts}
+    if types == {"Polygon"}:
+        return parts[0] if len(parts) == 1 else MultiPolygon(parts)
+    if types == {"Point"}:
+        return parts[0] if len(parts) == 1 else MultiPoint(parts)
+    return GeometryCollection(parts)
+
+
+def merge_intersecting(parts: List[Any], owner: Optional[Sequence[int]] = None, grid_size: Optional[float] = None):
+    """Union only the parts that intersect each other and pass the rest through.
+
+    Parts sharing an ``owner`` are known to be disjoint already, so only
+    pairs with different owners (every pair when ``owner`` is None) found by
+    an STRtree are grouped with union-find and re-unioned.
+    """
+    if not parts:
+        return GeometryCollection()
+    left, right = STRtree(parts).query(parts, predicate="intersects")
+    if owner is None:
+        cross = left < right
+    else:
+        owner_arr = np.asarray(owner)
+        cross = owner_arr[left] != owner_arr[right]
+    left, right = left[cross], right[cross]
+
+    parent = list(range(len(parts)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in zip(left.tolist(), right.tolist()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[ra] = rb
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for i in range(len(parts)):
+        groups[find(i)].append(i)
+
+    merged: List[Any] = []
+    for members in groups.values():
+        if len(members) == 1:
+            merged.append(parts[members[0]])
+        else:
+            union = shapely.union_all([parts[i] for i in members], grid_size=grid_size)
+            merged.extend(shapely.get_parts(union).tolist())
+    return _assemble(merged)
+
+
+def stitch_tiles(tile_unions: Dict[Tile, Any]):
+    """Merge per-tile unions into one geometry, re-unioning only touching parts.
+
+    Parts from one tile are already disjoint, so only parts from different
+    tiles that intersect are grouped and unioned again; everything else is
+    passed through untouched.
+    """
+    parts: List[Any] = []
+    owner: List[int] = []
+    for n, geom in enumerate(tile_unions.values()):
+        for part in shapely.get_parts(geom).tolist():
+            if not part.is_empty:
+                parts.append(part)
+                owner.append(n)
+    return merge_intersecting(parts, owner)
+
+
+def tiled_union(geometries: Sequence[Any], tile_degrees: float = 1.0, workers: int = 0):
+    """Drop-in replacement for ``unary_union`` that unions spatial tiles independently."""
+    return stitch_tiles(union_tiles(geometries, tile_degrees, workers))
@@ -0,0 +1,282 @@
+import gzip
+import json
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+import shapely
+
+from geojson_processor.reader import iter_objects
+
+# Mapbox Vector Tile spec 2.1 defaults
+EXTENT = 4096
+BUFFER = 64
+LAYER_NAME = "fire_perimeters"
+MAX_LATITUDE = 85.0511287798
+
+TileKey = Tuple[int, int, int]
+
+_MOVE_TO, _LINE_TO, _CLOSE_PATH = 1, 2, 7
+_POLYGON = 3
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _uint_field(field: int, value: int) -> bytes:
+    return _varint(field << 3) + _varint(value)
+
+
+def _bytes_field(field: int, payload: bytes) -> bytes:
+    return _varint(field << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _varints(values: np.ndarray) -> bytes:
+    """Protobuf varint encoding of a whole array of unsigned integers at once."""
+    values = values.astype(np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    offsets = np.cumsum(sizes) - sizes
+    for k in range(int(sizes.max(initial=0))):
+        has = sizes > k
+        byte = (values[has] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (sizes[has] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[has] + k] = byte | more
+    return out.tobytes()
+
+
+def _packed_field(field: int, values: np.ndarray) -> bytes:
+    return _bytes_field(field, _varints(values))
+
+
+def to_unit_mercator(geometry):
+    """Project lon/lat to Web Mercator scaled to the unit square, y pointing down."""
+
+    def project(coords: np.ndarray) -> np.ndarray:
+        lat = np.radians(np.clip(coords[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+        u = (coords[:, 0] + 180.0) / 360.0
+        v = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+        return np.column_stack([u, v])
+
+    return shapely.transform(geometry, project)
+
+
+def polygon_commands(polygons: List[Any], origin: np.ndarray, scale: float) -> np.ndarray:
+    """Encode polygons as an MVT command stream, vectorised over all their rings.
+
+    Coordinates are snapped to integer tile units and repeated points are
+    dropped. Exterior rings get a positive surveyor's-formula area in tile
+    coordinates (clockwise on screen) and holes a negative one, as the spec
+    requires. Rings that collapse at this zoom are dropped, and so are the
+    holes of a collapsed exterior.
+    """
+    empty = np.empty(0, dtype=np.uint64)
+    if not len(polygons):
+        return empty
+    rings, ring_polygon = shapely.get_rings(np.asarray(polygons, dtype=object), return_index=True)
+    coords, ring_of = shapely.get_coordinates(rings, return_index=True)
+    points = np.round((coords - origin) * scale).astype(np.int64)
+
+    # Drop each ring's closing point and consecutive repeats
+    last = np.append(ring_of[1:] != ring_of[:-1], True)
+    repeat = np.zeros(len(points), dtype=bool)
+    repeat[1:] = (points[1:] == points[:-1]).all(axis=1) & (ring_of[1:] == ring_of[:-1])
+    keep = ~last & ~repeat
+    points, ring_of = points[keep], ring_of[keep]
+    if not len(points):
+        return empty
+    # ...and a last point that rounded onto the first
+    starts = np.flatnonzero(np.append(True, ring_of[1:] != ring_of[:-1]))
+    ends = np.append(starts[1:], len(points)) - 1
+    wraps = (ends > starts) & (points[starts] == points[ends]).all(axis=1)
+    keep = np.ones(len(points), dtype=bool)
+    keep[ends[wraps]] = False
+    points, ring_of = points[keep], ring_of[keep]
+
+    counts = np.bincount(ring_of, minlength=len(rings))
+    starts = np.cumsum(counts) - counts
+    nxt = np.arange(1, len(points) + 1)
+    nxt[starts[counts > 0] + counts[counts > 0] - 1] = starts[counts > 0]
+    x, y = points[:, 0], points[:, 1]
+    area = np.bincount(ring_of, weights=x * y[nxt] - x[nxt] * y, minlength=len(rings))
+
+    exterior = np.append(True, ring_polygon[1:] != ring_polygon[:-1])
+    usable = (counts >= 3) & (area != 0)
+    exterior_ok = np.zeros(len(polygons), dtype=bool)
+    exterior_ok[ring_polygon[exterior]] = usable[exterior]
+    usable &= exterior_ok[ring_polygon]
+    if not usable.any():
+        return empty
+    reverse = np.where(exterior, area < 0, area > 0)
+
+    # Reorder points so kept rings come out in order, reversed where needed
+    count = counts[usable]
+    first = starts[usable]
+    ring_rank = np.repeat(np.arange(len(count)), count)
+    pos = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    flip = np.repeat(reverse[usable], count)
+    src = np.repeat(first, count) + np.where(flip, np.repeat(count, count) - 1 - pos, pos)
+    ordered = points[src]
+    deltas = np.diff(ordered, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+    # Per ring: MoveTo(1), x, y, LineTo(count - 1), deltas..., ClosePath
+    width = 2 * count + 3
+    offset = np.cumsum(width) - width
+    out = np.empty(int(width.sum()), dtype=np.uint64)
+    out[offset] = 1 << 3 | _MOVE_TO
+    out[offset + 3] = ((count - 1) << 3 | _LINE_TO).astype(np.uint64)
+    out[offset + width - 1] = 1 << 3 | _CLOSE_PATH
+    slot = offset[ring_rank] + 2 * pos + 2 - (pos == 0)
+    out[slot] = zigzag[:, 0]
+    out[slot + 1] = zigzag[:, 1]
+    return out
+
+
+def encode_tile(polygons: List[Any], tile: TileKey) -> bytes:
+    """Encode unit-Mercator polygons as one single-feature MVT layer for ``tile``."""
+    z, x, y = tile
+    n = 1 << z
+    geometry = polygon_commands(polygons, np.array([x / n, y / n]), n * EXTENT)
+    if not len(geometry):
+        return b""
+    feature = _uint_field(1, 1) + _uint_field(3, _POLYGON) + _packed_field(4, geometry)
+    layer = (
+        _uint_field(15, 2)
+        + _bytes_field(1, LAYER_NAME.encode("utf-8"))
+        + _bytes_field(2, feature)
+        + _uint_field(5, EXTENT)
+    )
+    return _bytes_field(3, layer)
+
+
+def _tile_members(parts: np.ndarray, zoom: int) -> Dict[Tuple[int, int], np.ndarray]:
+    """Map each tile (including its buffer) to the indices of the parts touching it."""
+    n = 1 << zoom
+    pad = BUFFER / EXTENT
+    bounds = shapely.bounds(parts) * n
+    x0 = np.clip(np.floor(bounds[:, 0] - pad), 0, n - 1).astype(np.int64)
+    y0 = np.clip(np.floor(bounds[:, 1] - pad), 0, n - 1).astype(np.int64)
+    x1 = np.clip(np.floor(bounds[:, 2] + pad), 0, n - 1).astype(np.int64)
+    y1 = np.clip(np.floor(bounds[:, 3] + pad), 0, n - 1).astype(np.int64)
+
+    members: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+    # Most fires fit in one tile; group those without a Python-level loop
+    single = (x0 == x1) & (y0 == y1)
+    keys = x0[single] * n + y0[single]
+    idx = np.flatnonzero(single)
+    order = np.argsort(keys, kind="stable")
+    for group in np.split(idx[order], np.flatnonzero(np.diff(keys[order])) + 1):
+        if len(group):
+            members[(int(x0[group[0]]), int(y0[group[0]]))].extend(group.tolist())
+    for i in np.flatnonzero(~single).tolist():
+        for tx in range(x0[i], x1[i] + 1):
+            for ty in range(y0[i], y1[i] + 1):
+                members[(tx, ty)].append(i)
+    return {key: np.asarray(value) for key, value in members.items()}
+
+
+def iter_zoom_tiles(mercator_parts: np.ndarray, zoom: int) -> Iterator[Tuple[TileKey, bytes]]:
+    """Yield ``(tile, mvt_bytes)`` for every non-empty tile at ``zoom``.
+
+    Each part is simplified to one tile unit at this zoom on its own, then
+    clipped to the buffered bounds of the tiles it touches.
+    """
+    n = 1 << zoom
+    parts = shapely.simplify(mercator_parts, 1.0 / (n * EXTENT), preserve_topology=True)
+    parts = parts[~shapely.is_empty(parts)]
+    if not len(parts):
+        return
+    pad = BUFFER / EXTENT / n
+    for (x, y), idx in _tile_members(parts, zoom).items():
+        clipped = shapely.clip_by_rect(parts[idx], x / n - pad, y / n - pad, (x + 1) / n + pad, (y + 1) / n + pad)
+        polygons = shapely.get_parts(clipped)
+        polygons = polygons[shapely.get_type_id(polygons) == shapely.GeometryType.POLYGON].tolist()
+        data = encode_tile(polygons, (zoom, x, y))
+        if data:
+            yield (zoom, x, y), data
+
+
+def tilejson(prefix: str, min_zoom: int, max_zoom: int, bounds, base_url: str = "") -> Dict[str, Any]:
+    return {
+        "tilejson": "3.0.0",
+        "tiles": [f"{base_url}{prefix}{{z}}/{{x}}/{{y}}.pbf"],
+        "minzoom": min_zoom,
+        "maxzoom": max_zoom,
+        "bounds": [round(value, 6) for value in bounds],
+        "vector_layers": [{"id": LAYER_NAME, "fields": {}, "minzoom": min_zoom, "maxzoom": max_zoom}],
+    }
+
+
+def upload_tile_pyramid(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    geometry,
+    min_zoom: int = 0,
+    max_zoom: int = 10,
+    workers: int = 16,
+    base_url: str = "",
+) -> List[Dict[str, Any]]:
+    """Write gzipped MVT tiles to ``<prefix><z>/<x>/<y>.pbf`` plus ``<prefix>tiles.json``.
+
+    Tiles left over from earlier runs that no longer hold any fire are
+    deleted. Returns per-zoom tile counts, compressed bytes and seconds.
+    """
+    mercator = shapely.get_parts(to_unit_mercator(geometry))
+    written = set()
+    report = []
+
+    def put(item: Tuple[TileKey, bytes]) -> int:
+        (z, x, y), data = item
+        body = gzip.compress(data, compresslevel=6)
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=f"{prefix}{z}/{x}/{y}.pbf",
+            Body=body,
+            ContentType="application/vnd.mapbox-vector-tile",
+            ContentEncoding="gzip",
+        )
+        return len(body)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for zoom in range(min_zoom, max_zoom + 1):
+            started = time.perf_counter()
+            tiles = list(iter_zoom_tiles(mercator, zoom))
+            sizes = list(pool.map(put, tiles))
+            written.update(f"{prefix}{z}/{x}/{y}.pbf" for (z, x, y), _ in tiles)
+            report.append(
+                {
+                    "level": f"mvt z{zoom}",
+                    "tiles": len(tiles),
+                    "bytes": sum(sizes),
+                    "seconds": round(time.perf_counter() - started, 3),
+                }
+            )
+
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=f"{prefix}tiles.json",
+        Body=json.dumps(tilejson(prefix, min_zoom, max_zoom, geometry.bounds, base_url)).encode("utf-8"),
+        ContentType="application/json",
+    )
+    stale = [
+        {"Key": obj["Key"]}
+        for obj in iter_objects(s3_client, bucket, prefix)
+        if obj["Key"].endswith(".pbf") and obj["Key"] not in written
+    ]
+    for start in range(0, len(stale), 1000):
+        s3_client.delete_objects(Bucket=bucket, Delete={"Objects": stale[start : start + 1000], "Quiet": True})
+    return report
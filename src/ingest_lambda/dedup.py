@@ -0,0 +1,160 @@
+import hashlib
+import json
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+# key fingerprint, content fingerprint, expiry (epoch seconds)
+_ENTRY = struct.Struct("<QQd")
+
+
+def _fingerprint(*parts: Any) -> int:
+    digest = hashlib.blake2b("\x1f".join(str(p) for p in parts).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def record_fingerprints(rec: Dict[str, Any]) -> Tuple[int, int]:
+    """Return ``(key, content)`` fingerprints for a normalized record."""
+    # Coordinates keep id-less records from collapsing onto one key
+    key = _fingerprint(
+        rec.get("source"),
+        rec.get("id"),
+        rec.get("timestamp"),
+        rec.get("latitude"),
+        rec.get("longitude"),
+    )
+    content = _fingerprint(json.dumps(rec, sort_keys=True, default=str))
+    return key, content
+
+
+class S3FingerprintStore:
+    """Persist a deduper snapshot as a single binary S3 object."""
+
+    def __init__(self, s3_client, bucket: str, key: str = "dedup/fingerprints.bin"):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.key = key
+
+    def load(self) -> Optional[bytes]:
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=self.key)["Body"].read()
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def save(self, data: bytes) -> None:
+        self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=data)
+
+
+class RecordDeduper:
+    """Remember recently emitted records so only new or changed ones are re-sent.
+
+    Each record is reduced to two 64-bit fingerprints: one over
+    ``(source, id, timestamp)`` plus coordinates and one over its full
+    content, so a record whose properties change under the same key is
+    emitted again. Entries expire ``ttl`` seconds after the record was
+    emitted, not last seen, so a record still listed unchanged is re-sent
+    once per ``ttl`` and stays inside the processor's ``WINDOW_HOURS``. Like
+    ``FeedCache``, newly emitted fingerprints are staged and only remembered
+    on ``commit``.
+    """
+
+    def __init__(self, ttl: float = 90000, store=None, clock=time.time):
+        self.ttl = ttl
+        self.store = store
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._seen: Dict[int, Tuple[int, float]] = {}
+        self._pending: Dict[int, int] = {}
+        self._loaded = store is None
+        self._dirty = False
+        self.records_in = 0
+        self.records_out = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        data = self.store.load()
+        if data:
+            self.loads(data)
+        self._loaded = True
+
+    def evict(self) -> int:
+        now = self.clock()
+        expired = [k for k, (_, expiry) in self._seen.items() if expiry <= now]
+        for k in expired:
+            del self._seen[k]
+        return len(expired)
+
+    def _prepare(self) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            if self.evict():
+                self._dirty = True
+
+    def _admit(self, rec: Dict[str, Any]) -> bool:
+        key, content = record_fingerprints(rec)
+        with self._lock:
+            self.records_in += 1
+            known = self._seen.get(key)
+            if known is not None and known[0] == content:
+                return False
+            if self._pending.get(key) == content:
+                return False
+            self._pending[key] = content
+            self.records_out += 1
+            return True
+
+    def filter(self, records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return the records not emitted within the TTL window."""
+        return list(self.iter_new(records))
+
+    def iter_new(self, records: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Lazily yield the records not emitted within the TTL window."""
+        self._prepare()
+        for rec in records:
+            if self._admit(rec):
+                yield rec
+
+    def commit(self) -> None:
+        with self._lock:
+            expiry = self.clock() + self.ttl
+            for key, content in self._pending.items():
+                self._seen[key] = (content, expiry)
+            dirty = self._dirty or bool(self._pending)
+            self._pending = {}
+            if self.store is not None and dirty:
+                self.store.save(self.dumps())
+                self._dirty = False
+
+    def discard(self) -> None:
+        with self._lock:
+            self._pending = {}
+
+    def dumps(self) -> bytes:
+        return b"".join(_ENTRY.pack(k, c, e) for k, (c, e) in self._seen.items())
+
+    def loads(self, data: bytes) -> None:
+        now = self.clock()
+        for k, c, e in _ENTRY.iter_unpack(data):
+            if e > now:
+                self._seen[k] = (c, e)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            suppressed = self.records_in - self.records_out
+            ratio = suppressed / self.records_in if self.records_in else 0.0
+            return {
+                "records_in": self.records_in,
+                "records_out": self.records_out,
+                "suppressed": suppressed,
+                "dedup_ratio": round(ratio, 4),
+                "fingerprints": len(self._seen),
+            }
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from botocore.exceptions import ClientError
+
+# Returned by ``fetch_json`` when a cached feed has not changed since the last run
+NOT_MODIFIED = object()
+
+
+class InMemoryFeedStateStore:
+    """Feed state kept for the life of a warm Lambda container."""
+
+    def __init__(self):
+        self._states: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        return self._states.get(url)
+
+    def put(self, url: str, state: Dict[str, Any]) -> None:
+        self._states[url] = state
+
+
+class S3FeedStateStore:
+    """Feed state persisted as one small JSON object per URL."""
+
+    def __init__(self, s3_client, bucket: str, prefix: str = "feed-state/"):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, url: str) -> str:
+        return f"{self.prefix}{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        try:
+            obj = self.s3.get_object(Bucket=self.bucket, Key=self._key(url))
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(obj["Body"].read())
+
+    def put(self, url: str, state: Dict[str, Any]) -> None:
+        self.s3.put_object(
+            Bucket=self.bucket,
+            Key=self._key(url),
+            Body=json.dumps(state).encode("utf-8"),
+            ContentType="application/json",
+        )
+
+
+class FeedCache:
+    """Conditional-request validators and body digests for each feed URL.
+
+    New states are staged by ``check`` and only written to the store by
+    ``commit`` once the records have been delivered, so a failed Firehose
+    send is retried on the next run instead of being mistaken for a
+    duplicate.
+
+    A feed last ingested more than ``max_age`` seconds ago (0 never) is
+    fetched and ingested in full even when unchanged, so the deduper can
+    re-send records that are still listed before the processor's window
+    drops them.
+    """
+
+    def __init__(self, store, max_age: float = 0, clock=time.time):
+        self.store = store
+        self.max_age = max_age
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _stale(self, state: Dict[str, Any]) -> bool:
+        return self.max_age > 0 and self.clock() - state.get("ingested", 0) >= self.max_age
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        state = self.store.get(url) or {}
+        headers = {}
+        if self._stale(state):
+            return headers
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+        return headers
+
+    def check(
+        self,
+        url: str,
+        status_code: int,
+        headers,
+        body: Optional[bytes],
+        digest: Optional[str] = None,
+    ) -> bool:
+        """Return True when the response carries a feed we have already ingested.
+
+        Pass ``digest`` instead of ``body`` when the body was hashed while streaming.
+        """
+        if status_code == 304:
+            with self._lock:
+                self.hits += 1
+                self.not_modified += 1
+            return True
+        if digest is None:
+            digest = hashlib.sha256(body or b"").hexdigest()
+        previous = self.store.get(url) or {}
+        unchanged = previous.get("digest") == digest and not self._stale(previous)
+        state = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "digest": digest,
+            "ingested": previous.get("ingested", 0) if unchanged else self.clock(),
+        }
+        with self._lock:
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._pending[url] = state
+        return unchanged
+
+    def commit(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for url, state in pending.items():
+            self.store.put(url, state)
+
+    def discard(self, url: Optional[str] = None) -> None:
+        """Drop the staged state of ``url``, or of every feed when omitted."""
+        with self._lock:
+            if url is None:
+                self._pending = {}
+            else:
+                self._pending.pop(url, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "not_modified": self.not_modified}
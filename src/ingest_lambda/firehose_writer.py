@@ -0,0 +1,178 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from common import metrics
+from common.record_codec import get_encoder
+
+logger = logging.getLogger(__name__)
+
+# PutRecordBatch service limits
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAX_RECORD_BYTES = 1000 * 1024
+
+_RETRYABLE_CODES = {"ServiceUnavailableException", "ThrottlingException", "InternalFailure"}
+
+BATCH_ENTRIES = metrics.histogram("firehose_batch_entries", "Firehose records per PutRecordBatch call", metrics.COUNTS)
+BATCH_BYTES = metrics.histogram("firehose_batch_bytes", "Payload bytes per PutRecordBatch call", metrics.BYTES)
+PUT_SECONDS = metrics.histogram("firehose_put_seconds", "PutRecordBatch latency by outcome")
+FAILED_ENTRIES = metrics.counter(
+    "firehose_failed_entries_total", "Firehose records rejected per attempt (final=true once retries are exhausted)"
+)
+
+
+class FirehoseWriter:
+    """Byte-aware, concurrent PutRecordBatch writer that retries only failed entries.
+
+    Batches are cut at 500 entries or 4 MiB. With ``aggregate`` enabled,
+    consecutive encoded records (self-delimiting JSON lines or MessagePack
+    rows) are packed into a single Firehose record of up to 1000 KiB, which
+    S3 delivery writes out unchanged. Up to ``max_in_flight`` batches are sent at once; the input
+    iterable is only read ahead by that many batches, so memory stays
+    bounded. Entries that come back with an ``ErrorCode``, and whole calls
+    that are throttled, are retried with full-jitter exponential backoff.
+    """
+
+    def __init__(
+        self,
+        client,
+        stream_name: str,
+        max_in_flight: int = 4,
+        aggregate: bool = False,
+        max_attempts: int = 6,
+        base_delay: float = 0.05,
+        max_delay: float = 2.0,
+        encoder: Optional[Callable[[Dict[str, Any]], bytes]] = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.client = client
+        self.stream_name = stream_name
+        self.max_in_flight = max(1, max_in_flight)
+        self.aggregate = aggregate
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.encoder = encoder or get_encoder("jsonl")
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.stats = self._empty_stats()
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, int]:
+        return {"sent": 0, "failed": 0, "oversized": 0, "batches": 0, "calls": 0, "retried_entries": 0}
+
+    def _entries(self, records: Iterable[Dict[str, Any]]) -> Iterator[Tuple[bytes, int]]:
+        """Yield ``(data, source_record_count)`` Firehose entries."""
+        packed: List[bytes] = []
+        packed_size = 0
+        for rec in records:
+            data = self.encoder(rec)
+            if len(data) > MAX_RECORD_BYTES:
+                logger.warning("Dropping record %s: %d bytes exceeds Firehose limit", rec.get("id"), len(data))
+                with self._lock:
+                    self.stats["oversized"] += 1
+                continue
+            if not self.aggregate:
+                yield data, 1
+                continue
+            if packed and packed_size + len(data) > MAX_RECORD_BYTES:
+                yield b"".join(packed), len(packed)
+                packed, packed_size = [], 0
+            packed.append(data)
+            packed_size += len(data)
+        if packed:
+            yield b"".join(packed), len(packed)
+
+    def _batches(self, records: Iterable[Dict[str, Any]]) -> Iterator[List[Tuple[bytes, int]]]:
+        batch: List[Tuple[bytes, int]] = []
+        size = 0
+        for entry in self._entries(records):
+            if batch and (len(batch) == MAX_BATCH_RECORDS or size + len(entry[0]) > MAX_BATCH_BYTES):
+                yield batch
+                batch, size = [], 0
+            batch.append(entry)
+            size += len(entry[0])
+        if batch:
+            yield batch
+
+    def _backoff(self, attempt: int) -> None:
+        self.sleep(self._random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt))))
+
+    def _send_batch(self, batch: List[Tuple[bytes, int]]) -> None:
+        pending = batch
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self._backoff(attempt)
+            BATCH_ENTRIES.observe(len(pending))
+            BATCH_BYTES.observe(sum(len(data) for data, _ in pending))
+            started = time.perf_counter()
+            try:
+                response = self.client.put_record_batch(
+                    DeliveryStreamName=self.stream_name,
+                    Records=[{"Data": data} for data, _ in pending],
+                )
+            except ClientError as exc:
+                PUT_SECONDS.observe(time.perf_counter() - started, outcome="error")
+                FAILED_ENTRIES.inc(len(pending), final="false")
+                if exc.response["Error"]["Code"] not in _RETRYABLE_CODES:
+                    raise
+                with self._lock:
+                    self.stats["calls"] += 1
+                    self.stats["retried_entries"] += len(pending)
+                continue
+            PUT_SECONDS.observe(
+                time.perf_counter() - started, outcome="partial" if response.get("FailedPutCount") else "ok"
+            )
+            with self._lock:
+                self.stats["calls"] += 1
+            if not response.get("FailedPutCount"):
+                delivered = sum(count for _, count in pending)
+                with self._lock:
+                    self.stats["sent"] += delivered
+                return
+            results = response.get("RequestResponses", [])
+            retry = [entry for entry, result in zip(pending, results) if result.get("ErrorCode")]
+            if len(results) != len(pending):
+                # Without per-entry results there is no way to tell which ones landed
+                retry = pending
+            delivered = sum(count for _, count in pending) - sum(count for _, count in retry)
+            with self._lock:
+                self.stats["sent"] += delivered
+                self.stats["retried_entries"] += len(retry)
+            FAILED_ENTRIES.inc(len(retry), final="false")
+            pending = retry
+        lost = sum(count for _, count in pending)
+        logger.warning("Giving up on %d records after %d attempts", lost, self.max_attempts)
+        with self._lock:
+            self.stats["failed"] += lost
+        FAILED_ENTRIES.inc(len(pending), final="true")
+
+    def put_records(self, records: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """Deliver ``records`` and return counts for this call, in source records."""
+        with self._lock:
+            self.stats = self._empty_stats()
+        if self.max_in_flight == 1:
+            for batch in self._batches(records):
+                self.stats["batches"] += 1
+                self._send_batch(batch)
+            return dict(self.stats)
+
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            for batch in self._batches(records):
+                if len(in_flight) >= self.max_in_flight:
+                    in_flight.popleft().result()
+                with self._lock:
+                    self.stats["batches"] += 1
+                in_flight.append(pool.submit(self._send_batch, batch))
+            while in_flight:
+                in_flight.popleft().result()
+        return dict(self.stats)
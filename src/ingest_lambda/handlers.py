@@ -1,60 +1,185 @@
 import os
-import json
-from typing import List, Dict, Any
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from itertools import chain
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
 import requests
-import boto3
-from opentelemetry.instrumentation.aws_lambda import AwsLambdaInstrumentor
 
-AwsLambdaInstrumentor().instrument()
+from common import metrics, runtime
+from common.record_codec import get_encoder
+from ingest_lambda.dedup import RecordDeduper, S3FingerprintStore
+from ingest_lambda.feed_cache import (
+    NOT_MODIFIED,
+    FeedCache,
+    InMemoryFeedStateStore,
+    S3FeedStateStore,
+)
+from ingest_lambda.firehose_writer import FirehoseWriter
+from ingest_lambda.streaming import StreamedDocument
+
+runtime.instrument()
+
+logger = logging.getLogger(__name__)
 
 FIREHOSE_STREAM_NAME = os.environ.get("FIREHOSE_STREAM_NAME", "bushfire_raw")
+# Concurrent PutRecordBatch calls per invocation
+FIREHOSE_MAX_IN_FLIGHT = int(os.environ.get("FIREHOSE_MAX_IN_FLIGHT", "4"))
+# Wire format of each record: "jsonl" or "msgpack" (see common.record_codec)
+RECORD_ENCODING = os.environ.get("RECORD_ENCODING", "jsonl")
+# Drop the verbose upstream property dict from delivered records when "false"
+RECORD_INCLUDE_RAW = os.environ.get("RECORD_INCLUDE_RAW", "true").lower() == "true"
+# Pack several newline-delimited records into each Firehose record (billed per 5 KB)
+FIREHOSE_AGGREGATE = os.environ.get("FIREHOSE_AGGREGATE", "false").lower() == "true"
+
+AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
 
-firehose = boto3.client("firehose", region_name=os.environ.get("AWS_REGION", "us-east-1"))
+firehose = runtime.lazy_client("firehose", region_name=AWS_REGION)
 
 NSW_RFS_URL = "https://www.rfs.nsw.gov.au/feeds/majorIncidents.json"
-NASA_API_KEY = os.environ.get("NASA_API_KEY")
-NASA_API_KEY_SECRET_ARN = os.environ.get("NASA_API_KEY_SECRET_ARN")
-if NASA_API_KEY_SECRET_ARN and not NASA_API_KEY:
-    sm = boto3.client("secretsmanager", region_name=os.environ.get("AWS_REGION", "us-east-1"))
-    resp = sm.get_secret_value(SecretId=NASA_API_KEY_SECRET_ARN)
-    NASA_API_KEY = resp.get("SecretString")
+# The public 24h GeoJSON file needs no MAP_KEY (only the FIRMS area API does)
 NASA_FIRMS_URL = (
     "https://firms.modaps.eosdis.nasa.gov/active_fire/c6/geojson/MODIS_C6_Australia_NewZealand_24h.geojson"
 )
 NSW_EPN_URL = "https://data.airquality.nsw.gov.au/api/Data/Hourly/Average"
 
-def fetch_json(url: str) -> Dict[str, Any]:
-    """Fetch JSON data from a URL."""
-    resp = requests.get(url, timeout=10)
+FETCH_SECONDS = metrics.histogram("ingest_fetch_seconds", "Feed fetch latency by source and outcome")
+FETCH_BYTES = metrics.counter("ingest_fetch_bytes_total", "Feed body bytes downloaded by source")
+RECORDS_NORMALIZED = metrics.counter("ingest_records_normalized_total", "Records normalized by source")
+RECORDS_SENT = metrics.counter("ingest_records_sent_total", "Records handed to Firehose after dedup")
+
+# "concurrent" fetches every feed at once, "sequential" keeps the old one-by-one order
+FETCH_MODE = os.environ.get("FETCH_MODE", "concurrent")
+# Seconds a single feed may take (for a streamed body, spent reading it) before its records are skipped this run
+FETCH_SOURCE_TIMEOUT = float(os.environ.get("FETCH_SOURCE_TIMEOUT", "10"))
+# Seconds of the invocation kept back for normalising and sending to Firehose
+FETCH_RESERVE_SECONDS = float(os.environ.get("FETCH_RESERVE_SECONDS", "5"))
+
+# Parse feed bodies incrementally instead of loading the whole response
+STREAMING_INGEST = os.environ.get("STREAMING_INGEST", "false").lower() == "true"
+STREAM_CHUNK_BYTES = 64 * 1024
+
+# Bucket for persisting feed validators across cold starts; warm containers alone when unset
+FEED_STATE_BUCKET = os.environ.get("FEED_STATE_BUCKET")
+# Re-ingest unchanged feeds this often so the deduper re-sends still-listed records
+FEED_REFRESH_SECONDS = float(os.environ.get("FEED_REFRESH_SECONDS", os.environ.get("DEDUP_TTL_SECONDS", "90000")))
+
+if FEED_STATE_BUCKET:
+    feed_cache = FeedCache(
+        S3FeedStateStore(
+            runtime.lazy_client("s3", region_name=AWS_REGION),
+            FEED_STATE_BUCKET,
+            os.environ.get("FEED_STATE_PREFIX", "feed-state/"),
+        ),
+        max_age=FEED_REFRESH_SECONDS,
+    )
+else:
+    feed_cache = FeedCache(InMemoryFeedStateStore(), max_age=FEED_REFRESH_SECONDS)
+
+# Only forward records not already emitted within DEDUP_TTL_SECONDS
+INCREMENTAL_INGEST = os.environ.get("INCREMENTAL_INGEST", "true").lower() == "true"
+# Outlives the 24h FIRMS product; must stay below the processor's WINDOW_HOURS, since
+# unchanged records are re-sent only once per TTL
+DEDUP_TTL_SECONDS = float(os.environ.get("DEDUP_TTL_SECONDS", "90000"))
+DEDUP_STATE_BUCKET = os.environ.get("DEDUP_STATE_BUCKET")
+
+deduper = RecordDeduper(
+    ttl=DEDUP_TTL_SECONDS,
+    store=S3FingerprintStore(
+        runtime.lazy_client("s3", region_name=AWS_REGION),
+        DEDUP_STATE_BUCKET,
+        os.environ.get("DEDUP_STATE_KEY", "dedup/fingerprints.bin"),
+    )
+    if DEDUP_STATE_BUCKET
+    else None,
+)
+
+def fetch_json(url: str, timeout: float = 10, cache: Optional[FeedCache] = None) -> Any:
+    """Fetch JSON data from a URL.
+
+    With a ``cache`` the request is conditional, and ``NOT_MODIFIED`` is
+    returned when the server answers 304 or the body hashes the same as the
+    last ingested copy.
+    """
+    headers = cache.request_headers(url) if cache else {}
+    resp = requests.get(url, headers=headers, timeout=timeout)
+    if cache and resp.status_code == 304:
+        cache.check(url, 304, resp.headers, None)
+        return NOT_MODIFIED
     resp.raise_for_status()
+    FETCH_BYTES.inc(len(resp.content), source=_feed_name(url))
+    if cache and cache.check(url, resp.status_code, resp.headers, resp.content):
+        return NOT_MODIFIED
     return resp.json()
 
-def normalize_nsw_rfs(data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """Normalize NSW RFS major incident feed."""
-    features = data.get("features", [])
-    normalized = []
-    for feat in features:
+def open_json_stream(
+    url: str, timeout: float = 10, cache: Optional[FeedCache] = None, deadline: Optional[float] = None
+) -> Any:
+    """Start a conditional GET and return a ``StreamedDocument`` over its body.
+
+    Only the status line and headers have been read when this returns. The
+    body is read later by whoever consumes the document, interleaved with
+    sending its records, so ``timeout`` bounds the time spent waiting for the
+    body itself (see ``_chunks_within``) and ``deadline`` (monotonic) ends the
+    read outright, keeping it inside the invocation. The body digest is
+    recorded in ``cache`` by ``_stream_records`` once the document has been
+    consumed, so an unchanged body is still parsed and left to the record
+    deduper.
+    """
+    headers = cache.request_headers(url) if cache else {}
+    resp = requests.get(url, headers=headers, timeout=timeout, stream=True)
+    if cache and resp.status_code == 304:
+        resp.close()
+        cache.check(url, 304, resp.headers, None)
+        return NOT_MODIFIED
+    resp.raise_for_status()
+    return StreamedDocument(_chunks_within(resp, timeout, deadline), url=url, headers=resp.headers)
+
+def _chunks_within(resp, timeout: float, deadline: Optional[float] = None) -> Iterator[bytes]:
+    """Body chunks of ``resp``, raising ``TimeoutError`` once reading them has taken ``timeout`` seconds.
+
+    Only the time spent waiting for chunks counts, not the time the consumer
+    holds each one, so a slow Firehose or an earlier feed's body does not use
+    up this feed's allowance. Past ``deadline`` (monotonic) reading stops
+    regardless.
+    """
+    chunks = resp.iter_content(chunk_size=STREAM_CHUNK_BYTES)
+    reading = 0.0
+    try:
+        while True:
+            started = time.monotonic()
+            chunk = next(chunks, None)
+            now = time.monotonic()
+            reading += now - started
+            if chunk is None:
+                return
+            if reading > timeout:
+                raise TimeoutError(f"Feed body took over {timeout:.1f}s to read")
+            if deadline is not None and now > deadline:
+                raise TimeoutError("Feed body still arriving at the end of the invocation budget")
+            yield chunk
+    finally:
+        resp.close()
+
+def iter_nsw_rfs(data) -> Iterator[Dict[str, Any]]:
+    """Yield normalized NSW RFS major incidents."""
+    for feat in data.get("features", []):
         prop = feat.get("properties", {})
         geom = feat.get("geometry", {})
         coords = geom.get("coordinates", [None, None])
-        normalized.append(
-            {
-                "source": "nsw_rfs",
-                "id": prop.get("id") or prop.get("objectid"),
-                "latitude": coords[1],
-                "longitude": coords[0],
-                "timestamp": prop.get("updated") or prop.get("pubdate"),
-                "raw": prop,
-            }
-        )
-    return normalized
+        yield {
+            "source": "nsw_rfs",
+            "id": prop.get("id") or prop.get("objectid"),
+            "latitude": coords[1],
+            "longitude": coords[0],
+            "timestamp": prop.get("updated") or prop.get("pubdate"),
+            "raw": prop,
+        }
 
-def normalize_nasa_firms(data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """Normalize NASA FIRMS feed."""
-    features = data.get("features", [])
-    normalized = []
-    for feat in features:
+def iter_nasa_firms(data) -> Iterator[Dict[str, Any]]:
+    """Yield normalized NASA FIRMS hotspots."""
+    for feat in data.get("features", []):
         prop = feat.get("properties", {})
         geom = feat.get("geometry", {})
         coords = geom.get("coordinates", [None, None])
@@ -63,64 +188,226 @@ def normalize_nasa_firms(data: Dict[str, Any]) -> List[Dict[str, Any]]:
         ts = None
         if acq_date and acq_time:
             ts = f"{acq_date}T{acq_time}Z"
-        normalized.append(
-            {
-                "source": "nasa_firms",
-                "id": prop.get("id") or prop.get("fid"),
-                "latitude": coords[1],
-                "longitude": coords[0],
-                "timestamp": ts,
-                "raw": prop,
-            }
-        )
-    return normalized
+        yield {
+            "source": "nasa_firms",
+            "id": prop.get("id") or prop.get("fid"),
+            "latitude": coords[1],
+            "longitude": coords[0],
+            "timestamp": ts,
+            "raw": prop,
+        }
+
+def iter_nsw_epn(data) -> Iterator[Dict[str, Any]]:
+    """Yield normalized NSW Environmental Protection readings."""
+    # A streamed body can only be read forward, so take whichever key it holds in one pass
+    if isinstance(data, StreamedDocument):
+        rows = data.first(("records", "data"), [])
+    else:
+        rows = data.get("records") or data.get("data") or []
+    for rec in rows:
+        yield {
+            "source": "nsw_epn",
+            "id": rec.get("Site") or rec.get("station"),
+            "latitude": rec.get("Latitude") or rec.get("lat"),
+            "longitude": rec.get("Longitude") or rec.get("lon"),
+            "timestamp": rec.get("Date") or rec.get("timestamp"),
+            "raw": rec,
+        }
+
+def normalize_nsw_rfs(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Normalize NSW RFS major incident feed."""
+    return list(iter_nsw_rfs(data))
+
+def normalize_nasa_firms(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Normalize NASA FIRMS feed."""
+    return list(iter_nasa_firms(data))
 
 def normalize_nsw_epn(data: Dict[str, Any]) -> List[Dict[str, Any]]:
     """Normalize NSW Environmental Protection data feed."""
-    records = data.get("records", []) or data.get("data", [])
-    normalized = []
-    for rec in records:
-        normalized.append(
-            {
-                "source": "nsw_epn",
-                "id": rec.get("Site") or rec.get("station"),
-                "latitude": rec.get("Latitude") or rec.get("lat"),
-                "longitude": rec.get("Longitude") or rec.get("lon"),
-                "timestamp": rec.get("Date") or rec.get("timestamp"),
-                "raw": rec,
-            }
-        )
-    return normalized
-
-def send_to_firehose(records: List[Dict[str, Any]]) -> int:
-    """Send records to Kinesis Firehose."""
-    if not records:
-        return 0
-
-    def chunk(lst: List[Dict[str, Any]], size: int):
-        for i in range(0, len(lst), size):
-            yield lst[i : i + size]
-
-    sent = 0
-    for batch in chunk(records, 500):
-        response = firehose.put_record_batch(
-            DeliveryStreamName=FIREHOSE_STREAM_NAME,
-            Records=[{"Data": json.dumps(rec) + "\n"} for rec in batch],
-        )
-        failures = response.get("FailedPutCount", 0)
-        sent += len(batch) - failures
-    return sent
+    return list(iter_nsw_epn(data))
 
-def handler(event, context):
-    nsw_rfs_data = fetch_json(NSW_RFS_URL)
-    nasa_firms_data = fetch_json(NASA_FIRMS_URL)
-    nsw_epn_data = fetch_json(NSW_EPN_URL)
-
-    records = (
-        normalize_nsw_rfs(nsw_rfs_data)
-        + normalize_nasa_firms(nasa_firms_data)
-        + normalize_nsw_epn(nsw_epn_data)
+def send_to_firehose(records: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Send records to Kinesis Firehose.
+
+    ``records`` may be any iterable; it is consumed one PutRecordBatch call
+    at a time so a generator pipeline never materialises the whole feed.
+    Returns the writer's counts: ``sent`` records Firehose accepted,
+    ``oversized`` ones dropped for exceeding its record limit, and so on.
+    """
+    writer = FirehoseWriter(
+        firehose,
+        FIREHOSE_STREAM_NAME,
+        max_in_flight=FIREHOSE_MAX_IN_FLIGHT,
+        aggregate=FIREHOSE_AGGREGATE,
+        encoder=get_encoder(RECORD_ENCODING, include_raw=RECORD_INCLUDE_RAW),
     )
+    stats = writer.put_records(records)
+    if stats["failed"] or stats["oversized"]:
+        logger.warning("Firehose delivery incomplete: %s", stats)
+    return stats
+
+Feed = Tuple[str, str, Callable[[Any], Iterable[Dict[str, Any]]]]
+
+FEEDS: Sequence[Feed] = (
+    ("nsw_rfs", NSW_RFS_URL, iter_nsw_rfs),
+    ("nasa_firms", NASA_FIRMS_URL, iter_nasa_firms),
+    ("nsw_epn", NSW_EPN_URL, iter_nsw_epn),
+)
+
+def fetch_budget(context) -> float:
+    """Seconds available for fetching, derived from the Lambda deadline."""
+    if context is None or not hasattr(context, "get_remaining_time_in_millis"):
+        return FETCH_SOURCE_TIMEOUT
+    remaining = context.get_remaining_time_in_millis() / 1000.0 - FETCH_RESERVE_SECONDS
+    return max(0.0, remaining)
+
+def _feed_name(url: Optional[str]) -> str:
+    for name, feed_url, _ in FEEDS:
+        if feed_url == url:
+            return name
+    return "other"
+
+def _fetch_source(name: str, url: str, timeout: float, deadline: Optional[float] = None) -> Any:
+    # A streamed body is still being read after this returns; only the response start is
+    # timed here, and open_json_stream bounds the rest of the body by ``timeout`` and ``deadline``
+    with FETCH_SECONDS.time(source=name) as labels:
+        try:
+            if STREAMING_INGEST:
+                data = open_json_stream(url, timeout=timeout, cache=feed_cache, deadline=deadline)
+            else:
+                data = fetch_json(url, timeout=timeout, cache=feed_cache)
+        except Exception as exc:
+            labels["outcome"] = "error"
+            logger.warning("Fetching %s failed: %s", name, exc)
+            return None
+        labels["outcome"] = "not_modified" if data is NOT_MODIFIED else "ok"
+        return data
+
+def fetch_feeds(
+    feeds: Sequence[Feed],
+    budget: float,
+    mode: str = "concurrent",
+) -> Dict[str, Any]:
+    """Fetch every feed, returning ``None`` for sources that failed or ran out of time.
+
+    Sources whose content has not changed since the last delivery map to
+    ``NOT_MODIFIED``.
+
+    Each source gets ``FETCH_SOURCE_TIMEOUT`` seconds, capped by the overall
+    ``budget``. In concurrent mode all feeds share the same start time, so the
+    run takes as long as the slowest healthy feed rather than the sum of all.
+    Streamed bodies are read after this returns, each within its own
+    ``FETCH_SOURCE_TIMEOUT`` of reading time and all by the end of ``budget``.
+    """
+    results: Dict[str, Any] = {name: None for name, _, _ in feeds}
+    started = time.monotonic()
+    run_deadline = started + budget
+
+    if mode == "sequential":
+        for name, url, _ in feeds:
+            remaining = budget - (time.monotonic() - started)
+            if remaining <= 0:
+                logger.warning("Fetch budget exhausted before %s", name)
+                continue
+            results[name] = _fetch_source(name, url, min(FETCH_SOURCE_TIMEOUT, remaining), run_deadline)
+        return results
+
+    deadline = min(FETCH_SOURCE_TIMEOUT, budget)
+    if deadline <= 0 or not feeds:
+        return results
+    pool = ThreadPoolExecutor(max_workers=len(feeds))
+    try:
+        futures = {
+            pool.submit(_fetch_source, name, url, deadline, run_deadline): name for name, url, _ in feeds
+        }
+        done, not_done = wait(futures, timeout=deadline)
+        for future in done:
+            results[futures[future]] = future.result()
+        for future in not_done:
+            future.cancel()
+            logger.warning("Fetching %s exceeded %.1fs deadline", futures[future], deadline)
+    finally:
+        # Never block the invocation on a straggler; its socket timeout ends it.
+        pool.shutdown(wait=False)
+    return results
+
+def _stream_records(name: str, url: str, data: Any, normalize, failed: List[str]) -> Iterator[Dict[str, Any]]:
+    """Normalized records of one feed; a body that fails to parse part-way ends only this feed.
+
+    Records yielded before the error are still delivered. The feed is added
+    to ``failed`` and its cache state is dropped so the next run reads it again.
+    """
+    count = 0
+    try:
+        for record in normalize(data):
+            count += 1
+            yield record
+    except Exception as exc:
+        logger.warning("Parsing %s failed after %d records: %s", name, count, exc)
+        RECORDS_NORMALIZED.inc(count, source=name)
+        failed.append(name)
+        feed_cache.discard(url)
+        return
+    RECORDS_NORMALIZED.inc(count, source=name)
+    if isinstance(data, StreamedDocument):
+        digest = data.finish()
+        FETCH_BYTES.inc(data.bytes_read, source=name)
+        feed_cache.check(data.url, 200, data.headers, None, digest=digest)
+
+def _counted(items: Iterable[Dict[str, Any]], tally: Dict[str, int], key: str) -> Iterator[Dict[str, Any]]:
+    for item in items:
+        tally[key] += 1
+        yield item
+
+def handler(event, context):
+    feeds = FEEDS
+    fetched = fetch_feeds(feeds, fetch_budget(context), mode=FETCH_MODE)
+
+    failed = []
+    unchanged = []
+    streams = []
+    for name, url, normalize in feeds:
+        data = fetched.get(name)
+        if data is None:
+            failed.append(name)
+        elif data is NOT_MODIFIED:
+            unchanged.append(name)
+        else:
+            streams.append(_stream_records(name, url, data, normalize, failed))
+
+    tally = {"normalized": 0, "records": 0}
+    records: Iterable[Dict[str, Any]] = _counted(chain.from_iterable(streams), tally, "normalized")
+    if INCREMENTAL_INGEST:
+        records = deduper.iter_new(records)
+    records = _counted(records, tally, "records")
 
-    send_to_firehose(records)
-    return {"records": len(records)}
+    try:
+        delivery = send_to_firehose(records)
+    except Exception:
+        feed_cache.discard()
+        deduper.discard()
+        metrics.flush()
+        raise
+    RECORDS_SENT.inc(delivery["sent"])
+    # Only remember a feed version once every record from it reached Firehose.
+    # Oversized records can never be delivered, so reading the feed again would
+    # not help; they are dropped (and logged) rather than holding the commit back
+    if delivery["sent"] + delivery["oversized"] == tally["records"]:
+        feed_cache.commit()
+        if INCREMENTAL_INGEST:
+            deduper.commit()
+    else:
+        feed_cache.discard()
+        deduper.discard()
+    result = {
+        "records": tally["records"],
+        "normalized": tally["normalized"],
+        "oversized": delivery["oversized"],
+        "failed_sources": failed,
+        "unchanged_sources": unchanged,
+        "feed_cache": feed_cache.stats(),
+    }
+    if INCREMENTAL_INGEST:
+        result["dedup"] = deduper.stats()
+    metrics.flush()
+    return result
@@ -0,0 +1,232 @@
+import codecs
+import hashlib
+import json
+from typing import Any, Iterable, Iterator, Optional
+
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+# Consumed text is dropped from the buffer once this many characters have been parsed
+_COMPACT_AT = 1 << 16
+
+
+class StreamedDocument:
+    """Forward-only view of a JSON object read incrementally from byte chunks.
+
+    ``get(key)`` scans ahead to ``key`` and, when its value is an array,
+    returns a lazy iterator that decodes one element at a time, so a
+    FeatureCollection can be normalised without holding the whole body or
+    the parsed document in memory. Keys that were skipped over cannot be
+    revisited. A running SHA-256 of the raw bytes is kept for ``FeedCache``.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], url: Optional[str] = None, headers=None):
+        self.url = url
+        self.headers = headers or {}
+        self.bytes_read = 0
+        self._chunks = iter(chunks)
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._hash = hashlib.sha256()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+        self._state = "start"
+        self._active: Optional["_ArrayItems"] = None
+
+    # -- buffer management -------------------------------------------------
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            self.bytes_read += len(chunk)
+            self._hash.update(chunk)
+            if self._pos > _COMPACT_AT:
+                self._buf = self._buf[self._pos :]
+                self._pos = 0
+            self._buf += self._text.decode(chunk)
+            return True
+        self._eof = True
+        self._buf += self._text.decode(b"", final=True)
+        return False
+
+    def _peek(self) -> Optional[str]:
+        while True:
+            buf = self._buf
+            pos = self._pos
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            self._pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if not self._fill():
+                return None
+
+    def _expect(self, char: str) -> None:
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self._pos}, found {found!r}")
+        self._pos += 1
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                obj, end = self._json.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # A number at the end of the buffer may continue in the next chunk, and
+            # one cut after its "." or "e" decodes short, ending before the cut
+            rest = end
+            if isinstance(obj, (int, float)) and not isinstance(obj, bool):
+                while rest < len(self._buf) and self._buf[rest] in _NUMBER_CHARS:
+                    rest += 1
+            while rest < len(self._buf) and self._buf[rest] in _WHITESPACE:
+                rest += 1
+            if rest == len(self._buf) and self._fill():
+                continue
+            self._pos = end
+            return obj
+
+    # -- object traversal --------------------------------------------------
+
+    def _next_key(self) -> Optional[str]:
+        if self._state == "start":
+            if self._peek() != "{":
+                self._state = "done"
+                return None
+            self._pos += 1
+            self._state = "first"
+        if self._state == "done":
+            return None
+        if self._peek() == "}":
+            self._pos += 1
+            self._state = "done"
+            return None
+        if self._state == "next":
+            self._expect(",")
+        key = self._value()
+        self._expect(":")
+        self._state = "next"
+        return key
+
+    def _items(self) -> Iterator[Any]:
+        first = True
+        while True:
+            char = self._peek()
+            if char == "]":
+                self._pos += 1
+                return
+            if char is None:
+                raise ValueError("Unterminated JSON array")
+            if not first:
+                self._expect(",")
+            first = False
+            yield self._value()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return ``key``'s value, as a lazy iterator when it is an array."""
+        if self._active is not None:
+            self._active.drain()
+            self._active = None
+        while True:
+            name = self._next_key()
+            if name is None:
+                return default
+            is_array = self._peek() == "["
+            if name == key:
+                if not is_array:
+                    return self._value()
+                self._pos += 1
+                self._active = _ArrayItems(self._items())
+                return self._active
+            self._skip()
+
+    def _skip(self) -> None:
+        if self._peek() == "[":
+            # Skip element by element so an unwanted array is never held whole
+            self._pos += 1
+            for _ in self._items():
+                pass
+        else:
+            self._value()
+
+    def first(self, keys: Iterable[str], default: Any = None) -> Any:
+        """Value of whichever of ``keys`` comes first with a non-empty value, in one forward pass.
+
+        ``get`` cannot fall back from one key to another, because looking for
+        the first key consumes the rest of the object when it is absent.
+        """
+        keys = set(keys)
+        if self._active is not None:
+            self._active.drain()
+            self._active = None
+        while True:
+            name = self._next_key()
+            if name is None:
+                return default
+            if name not in keys:
+                self._skip()
+                continue
+            if self._peek() != "[":
+                value = self._value()
+                if value:
+                    return value
+                continue
+            self._pos += 1
+            items = _ArrayItems(self._items())
+            # Peeking at the first element consumes an empty array whole
+            if items:
+                self._active = items
+                return items
+
+    def finish(self) -> str:
+        """Read the rest of the body and return its SHA-256 hex digest."""
+        if self._active is not None:
+            self._active.drain()
+            self._active = None
+        while self._fill():
+            self._buf = ""
+            self._pos = 0
+        return self._hash.hexdigest()
+
+
+class _ArrayItems:
+    """Iterator over a streamed array whose truthiness peeks at the first element."""
+
+    _EMPTY = object()
+
+    def __init__(self, items: Iterator[Any]):
+        self._items = items
+        self._head: Any = None
+        self._has_head = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        if self._has_head:
+            self._has_head = False
+            head, self._head = self._head, None
+            return head
+        return next(self._items)
+
+    def __bool__(self) -> bool:
+        if self._has_head:
+            return True
+        head = next(self._items, self._EMPTY)
+        if head is self._EMPTY:
+            return False
+        self._head = head
+        self._has_head = True
+        return True
+
+    def drain(self) -> None:
+        self._has_head = False
+        self._head = None
+        for _ in self._items:
+            pass
@@ -4,20 +4,78 @@ provider "aws" {
 
 data "archive_file" "geojson_proxy" {
   type        = "zip"
-  source_file = "${path.module}/../../src/api/geojson_proxy.py"
   output_path = "${path.module}/dist/geojson_proxy.zip"
+
+  source {
+    content  = file("${path.module}/../../src/api/geojson_proxy.py")
+    filename = "geojson_proxy.py"
+  }
+
+  # Shared lazy-client / secret-cache / instrumentation helpers (common is a namespace package here)
+  source {
+    content  = file("${path.module}/../../src/common/runtime.py")
+    filename = "common/runtime.py"
+  }
+}
+
+data "archive_file" "perimeter_query" {
+  type        = "zip"
+  output_path = "${path.module}/dist/perimeter_query.zip"
+
+  source {
+    content  = file("${path.module}/../../src/api/perimeter_query.py")
+    filename = "perimeter_query.py"
+  }
+
+  # Shared lazy-client / secret-cache / instrumentation helpers (common is a namespace package here)
+  source {
+    content  = file("${path.module}/../../src/common/runtime.py")
+    filename = "common/runtime.py"
+  }
 }
 
 data "archive_file" "subscribe" {
   type        = "zip"
-  source_file = "${path.module}/../../src/api/subscribe.py"
   output_path = "${path.module}/dist/subscribe.zip"
+
+  source {
+    content  = file("${path.module}/../../src/api/subscribe.py")
+    filename = "subscribe.py"
+  }
+
+  # Shared lazy-client / secret-cache / instrumentation helpers (common is a namespace package here)
+  source {
+    content  = file("${path.module}/../../src/common/runtime.py")
+    filename = "common/runtime.py"
+  }
+
+  # Batched reads/writes with retries of unprocessed requests, shared by both subscription archives
+  source {
+    content  = file("${path.module}/../../src/common/batch_write.py")
+    filename = "common/batch_write.py"
+  }
 }
 
 data "archive_file" "unsubscribe" {
   type        = "zip"
-  source_file = "${path.module}/../../src/api/unsubscribe.py"
   output_path = "${path.module}/dist/unsubscribe.zip"
+
+  source {
+    content  = file("${path.module}/../../src/api/unsubscribe.py")
+    filename = "unsubscribe.py"
+  }
+
+  # Shared lazy-client / secret-cache / instrumentation helpers (common is a namespace package here)
+  source {
+    content  = file("${path.module}/../../src/common/runtime.py")
+    filename = "common/runtime.py"
+  }
+
+  # Batched reads/writes with retries of unprocessed requests, shared by both subscription archives
+  source {
+    content  = file("${path.module}/../../src/common/batch_write.py")
+    filename = "common/batch_write.py"
+  }
 }
 
 resource "aws_iam_role" "lambda" {
@@ -45,12 +103,20 @@ resource "aws_iam_role_policy" "lambda_extra" {
       {
         Effect   = "Allow"
         Action   = ["s3:GetObject"],
-        Resource = "arn:aws:s3:::${var.geojson_bucket}/${var.geojson_key}"
+        Resource = [
+          "arn:aws:s3:::${var.geojson_bucket}/${var.geojson_key}",
+          "arn:aws:s3:::${var.geojson_bucket}/${var.geojson_index_key}"
+        ]
       },
       {
         Effect   = "Allow"
-        Action   = ["dynamodb:PutItem", "dynamodb:DeleteItem"],
+        Action   = ["dynamodb:PutItem", "dynamodb:UpdateItem", "dynamodb:DeleteItem", "dynamodb:BatchGetItem", "dynamodb:BatchWriteItem"],
         Resource = "arn:aws:dynamodb:*:*:table/${var.geo_fences_table_name}"
+      },
+      {
+        Effect   = "Allow"
+        Action   = ["dynamodb:UpdateItem"],
+        Resource = "arn:aws:dynamodb:*:*:table/${var.devices_table_name}"
       }
     ]
   })
@@ -65,8 +131,29 @@ resource "aws_lambda_function" "geojson_proxy" {
   source_code_hash = data.archive_file.geojson_proxy.output_base64sha256
   environment {
     variables = {
-      GEOJSON_BUCKET = var.geojson_bucket
-      GEOJSON_KEY    = var.geojson_key
+      GEOJSON_BUCKET     = var.geojson_bucket
+      GEOJSON_KEY        = var.geojson_key
+      REVALIDATE_SECONDS = "30"
+      CACHE_MAX_AGE      = "60"
+    }
+  }
+}
+
+resource "aws_lambda_function" "perimeter_query" {
+  function_name    = "perimeterQueryFn"
+  handler          = "perimeter_query.perimeterQueryFn"
+  runtime          = "python3.12"
+  role             = aws_iam_role.lambda.arn
+  filename         = data.archive_file.perimeter_query.output_path
+  source_code_hash = data.archive_file.perimeter_query.output_base64sha256
+  # The parsed index stays resident in warm containers
+  memory_size = 512
+  environment {
+    variables = {
+      GEOJSON_BUCKET     = var.geojson_bucket
+      GEOJSON_INDEX_KEY  = var.geojson_index_key
+      REVALIDATE_SECONDS = "30"
+      CACHE_MAX_AGE      = "60"
     }
   }
 }
@@ -80,7 +167,8 @@ resource "aws_lambda_function" "subscribe" {
   source_code_hash = data.archive_file.subscribe.output_base64sha256
   environment {
     variables = {
-      ALERTS_TABLE = var.geo_fences_table_name
+      ALERTS_TABLE  = var.geo_fences_table_name
+      DEVICES_TABLE = var.devices_table_name
     }
   }
 }
@@ -99,9 +187,45 @@ resource "aws_lambda_function" "unsubscribe" {
   }
 }
 
+# Bulk onboarding: the batch handlers live in the same archives as their single-item counterparts
+resource "aws_lambda_function" "batch_subscribe" {
+  function_name    = "batchSubscribeFn"
+  handler          = "subscribe.batchSubscribeFn"
+  runtime          = "python3.12"
+  role             = aws_iam_role.lambda.arn
+  filename         = data.archive_file.subscribe.output_path
+  source_code_hash = data.archive_file.subscribe.output_base64sha256
+  timeout          = 29
+  environment {
+    variables = {
+      ALERTS_TABLE     = var.geo_fences_table_name
+      DEVICES_TABLE    = var.devices_table_name
+      MAX_BATCH_FENCES = "5000"
+    }
+  }
+}
+
+resource "aws_lambda_function" "batch_unsubscribe" {
+  function_name    = "batchUnsubscribeFn"
+  handler          = "unsubscribe.batchUnsubscribeFn"
+  runtime          = "python3.12"
+  role             = aws_iam_role.lambda.arn
+  filename         = data.archive_file.unsubscribe.output_path
+  source_code_hash = data.archive_file.unsubscribe.output_base64sha256
+  timeout          = 29
+  environment {
+    variables = {
+      ALERTS_TABLE     = var.geo_fences_table_name
+      MAX_BATCH_FENCES = "5000"
+    }
+  }
+}
+
 resource "aws_api_gateway_rest_api" "api" {
   name        = "koalasafe-api"
   description = "KoalaSafe API"
+  # Lets geojsonProxyFn return gzip/br bodies as isBase64Encoded responses
+  binary_media_types = ["*/*"]
 }
 
 resource "aws_api_gateway_resource" "geojson" {
@@ -116,6 +240,12 @@ resource "aws_api_gateway_resource" "latest" {
   path_part   = "latest"
 }
 
+resource "aws_api_gateway_resource" "query" {
+  rest_api_id = aws_api_gateway_rest_api.api.id
+  parent_id   = aws_api_gateway_resource.geojson.id
+  path_part   = "query"
+}
+
 resource "aws_api_gateway_resource" "alerts" {
   rest_api_id = aws_api_gateway_rest_api.api.id
   parent_id   = aws_api_gateway_rest_api.api.root_resource_id
@@ -128,6 +258,12 @@ resource "aws_api_gateway_resource" "subscribe" {
   path_part   = "subscribe"
 }
 
+resource "aws_api_gateway_resource" "alerts_batch" {
+  rest_api_id = aws_api_gateway_rest_api.api.id
+  parent_id   = aws_api_gateway_resource.alerts.id
+  path_part   = "batch"
+}
+
 resource "aws_api_gateway_resource" "alert" {
   rest_api_id = aws_api_gateway_rest_api.api.id
   parent_id   = aws_api_gateway_resource.alerts.id
@@ -149,6 +285,20 @@ resource "aws_api_gateway_method" "get_latest" {
   api_key_required = true
 }
 
+resource "aws_api_gateway_method" "get_query" {
+  rest_api_id      = aws_api_gateway_rest_api.api.id
+  resource_id      = aws_api_gateway_resource.query.id
+  http_method      = "GET"
+  authorization    = "NONE"
+  api_key_required = true
+  request_parameters = {
+    "method.request.querystring.bbox"   = false
+    "method.request.querystring.since"  = false
+    "method.request.querystring.source" = false
+    "method.request.querystring.limit"  = false
+  }
+}
+
 resource "aws_api_gateway_method" "post_subscribe" {
   rest_api_id   = aws_api_gateway_rest_api.api.id
   resource_id   = aws_api_gateway_resource.subscribe.id
@@ -165,6 +315,22 @@ resource "aws_api_gateway_method" "delete_alert" {
   authorizer_id = aws_api_gateway_authorizer.cognito.id
 }
 
+resource "aws_api_gateway_method" "post_alerts_batch" {
+  rest_api_id   = aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.alerts_batch.id
+  http_method   = "POST"
+  authorization = "COGNITO_USER_POOLS"
+  authorizer_id = aws_api_gateway_authorizer.cognito.id
+}
+
+resource "aws_api_gateway_method" "delete_alerts_batch" {
+  rest_api_id   = aws_api_gateway_rest_api.api.id
+  resource_id   = aws_api_gateway_resource.alerts_batch.id
+  http_method   = "DELETE"
+  authorization = "COGNITO_USER_POOLS"
+  authorizer_id = aws_api_gateway_authorizer.cognito.id
+}
+
 resource "aws_api_gateway_integration" "get_latest" {
   rest_api_id             = aws_api_gateway_rest_api.api.id
   resource_id             = aws_api_gateway_resource.latest.id
@@ -174,6 +340,15 @@ resource "aws_api_gateway_integration" "get_latest" {
   uri                     = aws_lambda_function.geojson_proxy.invoke_arn
 }
 
+resource "aws_api_gateway_integration" "get_query" {
+  rest_api_id             = aws_api_gateway_rest_api.api.id
+  resource_id             = aws_api_gateway_resource.query.id
+  http_method             = aws_api_gateway_method.get_query.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.perimeter_query.invoke_arn
+}
+
 resource "aws_api_gateway_integration" "post_subscribe" {
   rest_api_id             = aws_api_gateway_rest_api.api.id
   resource_id             = aws_api_gateway_resource.subscribe.id
@@ -192,6 +367,24 @@ resource "aws_api_gateway_integration" "delete_alert" {
   uri                     = aws_lambda_function.unsubscribe.invoke_arn
 }
 
+resource "aws_api_gateway_integration" "post_alerts_batch" {
+  rest_api_id             = aws_api_gateway_rest_api.api.id
+  resource_id             = aws_api_gateway_resource.alerts_batch.id
+  http_method             = aws_api_gateway_method.post_alerts_batch.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.batch_subscribe.invoke_arn
+}
+
+resource "aws_api_gateway_integration" "delete_alerts_batch" {
+  rest_api_id             = aws_api_gateway_rest_api.api.id
+  resource_id             = aws_api_gateway_resource.alerts_batch.id
+  http_method             = aws_api_gateway_method.delete_alerts_batch.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.batch_unsubscribe.invoke_arn
+}
+
 resource "aws_lambda_permission" "apigw_geojson" {
   statement_id  = "AllowAPIGatewayInvokeGeo"
   action        = "lambda:InvokeFunction"
@@ -200,6 +393,14 @@ resource "aws_lambda_permission" "apigw_geojson" {
   source_arn    = "${aws_api_gateway_rest_api.api.execution_arn}/*/GET/geojson/latest"
 }
 
+resource "aws_lambda_permission" "apigw_query" {
+  statement_id  = "AllowAPIGatewayInvokeQuery"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.perimeter_query.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.api.execution_arn}/*/GET/geojson/query"
+}
+
 resource "aws_lambda_permission" "apigw_subscribe" {
   statement_id  = "AllowAPIGatewayInvokeSub"
   action        = "lambda:InvokeFunction"
@@ -216,11 +417,30 @@ resource "aws_lambda_permission" "apigw_unsubscribe" {
   source_arn    = "${aws_api_gateway_rest_api.api.execution_arn}/*/DELETE/alerts/*"
 }
 
+resource "aws_lambda_permission" "apigw_batch_subscribe" {
+  statement_id  = "AllowAPIGatewayInvokeBatchSub"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.batch_subscribe.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.api.execution_arn}/*/POST/alerts/batch"
+}
+
+resource "aws_lambda_permission" "apigw_batch_unsubscribe" {
+  statement_id  = "AllowAPIGatewayInvokeBatchUnsub"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.batch_unsubscribe.function_name
+  principal     = "apigateway.amazonaws.com"
+  source_arn    = "${aws_api_gateway_rest_api.api.execution_arn}/*/DELETE/alerts/batch"
+}
+
 resource "aws_api_gateway_deployment" "api" {
   depends_on = [
     aws_api_gateway_integration.get_latest,
+    aws_api_gateway_integration.get_query,
     aws_api_gateway_integration.post_subscribe,
-    aws_api_gateway_integration.delete_alert
+    aws_api_gateway_integration.delete_alert,
+    aws_api_gateway_integration.post_alerts_batch,
+    aws_api_gateway_integration.delete_alerts_batch
   ]
   rest_api_id = aws_api_gateway_rest_api.api.id
 }
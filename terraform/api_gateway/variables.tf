@@ -14,6 +14,11 @@ variable "geo_fences_table_name" {
   type        = string
 }
 
+variable "devices_table_name" {
+  description = "DynamoDB table of device tokens per user"
+  type        = string
+}
+
 variable "geojson_bucket" {
   description = "S3 bucket containing latest GeoJSON"
   type        = string
@@ -24,3 +29,9 @@ variable "geojson_key" {
   type        = string
   default     = "latest.geojson"
 }
+
+variable "geojson_index_key" {
+  description = "Key of the perimeter spatial index written by the processor"
+  type        = string
+  default     = "fire_perimeters.index.ndjson"
+}
@@ -24,6 +24,15 @@ resource "aws_lb_target_group" "geojson" {
   protocol    = "HTTP"
   target_type = "ip"
   vpc_id      = data.aws_subnet.selected.vpc_id
+
+  # /health returns 503 until the first poll completes and once polling stalls
+  health_check {
+    path                = "/health"
+    matcher             = "200"
+    interval            = 15
+    healthy_threshold   = 2
+    unhealthy_threshold = 4
+  }
 }
 
 resource "aws_lb_listener" "http" {
@@ -79,6 +88,23 @@ resource "aws_iam_role_policy_attachment" "geojson_s3_attach" {
   policy_arn = aws_iam_policy.geojson_s3.arn
 }
 
+resource "aws_iam_policy" "geo_fences" {
+  name = "${var.name}-geo-fences"
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Action   = ["dynamodb:Scan", "dynamodb:UpdateItem"],
+      Effect   = "Allow",
+      Resource = "arn:aws:dynamodb:*:*:table/${var.geo_fences_table_name}"
+    }]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "geo_fences_attach" {
+  role       = aws_iam_role.geojson_task.name
+  policy_arn = aws_iam_policy.geo_fences.arn
+}
+
 resource "aws_iam_policy" "mapbox_secret" {
   name = "${var.name}-mapbox-secret"
   policy = jsonencode({
@@ -91,6 +117,25 @@ resource "aws_iam_policy" "mapbox_secret" {
   })
 }
 
+resource "aws_iam_policy" "raw_object_queue" {
+  count = var.raw_object_queue_arn == "" ? 0 : 1
+  name  = "${var.name}-raw-object-queue"
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"],
+      Effect   = "Allow",
+      Resource = var.raw_object_queue_arn
+    }]
+  })
+}
+
+resource "aws_iam_role_policy_attachment" "raw_object_queue_attach" {
+  count      = var.raw_object_queue_arn == "" ? 0 : 1
+  role       = aws_iam_role.geojson_task.name
+  policy_arn = aws_iam_policy.raw_object_queue[0].arn
+}
+
 resource "aws_iam_role_policy_attachment" "mapbox_secret_attach" {
   role       = aws_iam_role.geojson_task.name
   policy_arn = aws_iam_policy.mapbox_secret.arn
@@ -100,8 +145,9 @@ resource "aws_ecs_task_definition" "geojson" {
   family                   = "${var.name}-geojson"
   network_mode             = "awsvpc"
   requires_compatibilities = ["FARGATE"]
-  cpu                      = "512"
-  memory                   = "1024"
+  # The perimeter engine keeps the checkpoint slices and index resident
+  cpu                      = "1024"
+  memory                   = "2048"
   execution_role_arn       = aws_iam_role.geojson_task.arn
   task_role_arn            = aws_iam_role.geojson_task.arn
 
@@ -112,7 +158,15 @@ resource "aws_ecs_task_definition" "geojson" {
       essential = true
       environment = [
         { name = "FIREHOSE_BUCKET", value = var.firehose_bucket },
-        { name = "OUTPUT_BUCKET", value = var.output_bucket }
+        { name = "OUTPUT_BUCKET", value = var.output_bucket },
+        { name = "FENCES_TABLE", value = var.geo_fences_table_name },
+        { name = "POLL_SECONDS", value = tostring(var.poll_seconds) },
+        { name = "MIN_PUBLISH_SECONDS", value = tostring(var.min_publish_seconds) },
+        { name = "QUEUE_URL", value = var.raw_object_queue_url },
+        # The shared security group only admits port 80
+        { name = "PORT", value = "80" },
+        # Pipeline metrics are scraped from /metrics by the collector sidecar below
+        { name = "OTEL_SERVICE_NAME", value = "${var.name}-processor" }
       ]
       secrets = [
         { name = "MAPBOX_TOKEN", valueFrom = var.mapbox_token_secret_arn }
@@ -143,6 +197,13 @@ resource "aws_ecs_task_definition" "geojson" {
           value = <<EOT
 receivers:
   awsecscontainermetrics:
+  prometheus:
+    config:
+      scrape_configs:
+        - job_name: processor
+          scrape_interval: 30s
+          static_configs:
+            - targets: ["localhost:80"]
   otlp:
     protocols:
       grpc:
@@ -153,7 +214,7 @@ exporters:
 service:
   pipelines:
     metrics:
-      receivers: [awsecscontainermetrics]
+      receivers: [awsecscontainermetrics, prometheus, otlp]
       exporters: [awsprometheusremotewrite]
     traces:
       receivers: [otlp]
@@ -177,8 +238,13 @@ resource "aws_ecs_service" "geojson" {
   name            = "${var.name}-service"
   cluster         = aws_ecs_cluster.this.id
   task_definition = aws_ecs_task_definition.geojson.arn
-  desired_count   = 1
-  launch_type     = "FARGATE"
+  # One resident engine owns the outputs and the checkpoint; never run two side by side
+  desired_count                      = 1
+  deployment_minimum_healthy_percent = 0
+  deployment_maximum_percent         = 100
+  launch_type                        = "FARGATE"
+  # First start folds the whole window before /health turns green
+  health_check_grace_period_seconds = 300
 
   network_configuration {
     subnets          = var.subnet_ids
@@ -192,52 +258,3 @@ resource "aws_ecs_service" "geojson" {
     container_port   = 80
   }
 }
-
-resource "aws_cloudwatch_event_rule" "geojson_schedule" {
-  name                = "${var.name}-schedule"
-  schedule_expression = "cron(0/5 * * * ? *)"
-}
-
-data "aws_iam_policy_document" "events_assume" {
-  statement {
-    actions = ["sts:AssumeRole"]
-    principals {
-      type        = "Service"
-      identifiers = ["events.amazonaws.com"]
-    }
-  }
-}
-
-resource "aws_iam_role" "events" {
-  name               = "${var.name}-events-role"
-  assume_role_policy = data.aws_iam_policy_document.events_assume.json
-}
-
-data "aws_iam_policy_document" "events_run_task" {
-  statement {
-    actions   = ["ecs:RunTask", "iam:PassRole"]
-    resources = [aws_ecs_task_definition.geojson.arn, aws_iam_role.geojson_task.arn]
-  }
-}
-
-resource "aws_iam_role_policy" "events_run_task" {
-  name   = "${var.name}-events-policy"
-  role   = aws_iam_role.events.id
-  policy = data.aws_iam_policy_document.events_run_task.json
-}
-
-resource "aws_cloudwatch_event_target" "geojson_target" {
-  rule     = aws_cloudwatch_event_rule.geojson_schedule.name
-  arn      = aws_ecs_cluster.this.arn
-  role_arn = aws_iam_role.events.arn
-
-  ecs_target {
-    launch_type         = "FARGATE"
-    task_definition_arn = aws_ecs_task_definition.geojson.arn
-    network_configuration {
-      subnets          = var.subnet_ids
-      security_groups  = var.security_group_ids
-      assign_public_ip = false
-    }
-  }
-}
@@ -44,3 +44,32 @@ variable "mapbox_token_secret_arn" {
   description = "ARN of the Mapbox token secret"
 
 }
+
+variable "geo_fences_table_name" {
+  type        = string
+  description = "DynamoDB table whose fences get their intersects flag recomputed each run"
+}
+
+variable "poll_seconds" {
+  type        = number
+  description = "Seconds between raw-object polls (the SQS long-poll wait when a queue is set)"
+  default     = 5
+}
+
+variable "min_publish_seconds" {
+  type        = number
+  description = "Minimum seconds between S3 publishes of the perimeter outputs"
+  default     = 10
+}
+
+variable "raw_object_queue_url" {
+  type        = string
+  description = "SQS queue receiving the raw bucket's S3 event notifications (empty polls the listing)"
+  default     = ""
+}
+
+variable "raw_object_queue_arn" {
+  type        = string
+  description = "ARN of raw_object_queue_url, granting the task receive/delete"
+  default     = ""
+}
@@ -185,6 +185,31 @@ resource "aws_dynamodb_table" "geo_fences" {
     type = "S"
   }
 
+  attribute {
+    name = "cell"
+    type = "S"
+  }
+
+  attribute {
+    name = "geohash"
+    type = "S"
+  }
+
+  # Area lookups: fences in a geohash cell, narrowed with begins_with on geohash
+  global_secondary_index {
+    name            = "cell-index"
+    hash_key        = "cell"
+    range_key       = "geohash"
+    projection_type = "KEYS_ONLY"
+  }
+
+  # push_bridge resolves every subscriber of an intersecting fence through this index
+  global_secondary_index {
+    name            = "fence_id-index"
+    hash_key        = "fence_id"
+    projection_type = "KEYS_ONLY"
+  }
+
   stream_enabled   = true
   stream_view_type = "NEW_AND_OLD_IMAGES"
 
@@ -193,11 +218,83 @@ resource "aws_dynamodb_table" "geo_fences" {
   }
 }
 
+# Expo device tokens per user (string set device_tokens), registered by subscribeFn
+resource "aws_dynamodb_table" "devices" {
+  name         = "devices"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "user_id"
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  replica {
+    region_name = var.secondary_region
+  }
+}
+
+# Open alert-coalescing windows claimed by rule_eval; TTL removes expired ones
+resource "aws_dynamodb_table" "alert_windows" {
+  name         = "alert_windows"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "window_key"
+
+  attribute {
+    name = "window_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Pushes push_bridge already settled for records or events it is about to retry; TTL removes them
+resource "aws_dynamodb_table" "push_deliveries" {
+  name         = "push_deliveries"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "message_id"
+  range_key    = "device_token"
+
+  attribute {
+    name = "message_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "device_token"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
 # Package and deploy rule evaluation Lambda triggered by the table stream
 data "archive_file" "rule_eval" {
   type        = "zip"
-  source_file = "${path.module}/../../lambda/rule_eval.py"
   output_path = "${path.module}/dist/rule_eval.zip"
+
+  source {
+    content  = file("${path.module}/../../lambda/rule_eval.py")
+    filename = "rule_eval.py"
+  }
+
+  # Shared lazy-client / secret-cache / instrumentation helpers (common is a namespace package here)
+  source {
+    content  = file("${path.module}/../../src/common/runtime.py")
+    filename = "common/runtime.py"
+  }
+
+  # Stdlib-only counters/histograms; exported over OTLP when metrics_otlp_endpoint is set
+  source {
+    content  = file("${path.module}/../../src/common/metrics.py")
+    filename = "common/metrics.py"
+  }
 }
 
 resource "aws_iam_role" "rule_eval" {
@@ -222,11 +319,18 @@ resource "aws_iam_role_policy" "rule_eval" {
   role = aws_iam_role.rule_eval.id
   policy = jsonencode({
     Version = "2012-10-17",
-    Statement = [{
-      Effect   = "Allow",
-      Action   = ["events:PutEvents"],
-      Resource = "*"
-    }]
+    Statement = [
+      {
+        Effect   = "Allow",
+        Action   = ["events:PutEvents"],
+        Resource = "*"
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["dynamodb:PutItem", "dynamodb:DeleteItem"],
+        Resource = aws_dynamodb_table.alert_windows.arn
+      }
+    ]
   })
 }
 
@@ -237,12 +341,27 @@ resource "aws_lambda_function" "rule_eval" {
   handler          = "rule_eval.lambda_handler"
   runtime          = "python3.12"
   role             = aws_iam_role.rule_eval.arn
+  timeout          = 60
+  environment {
+    variables = {
+      PUBLISH_CONCURRENCY         = "8"
+      COALESCE_TABLE              = aws_dynamodb_table.alert_windows.name
+      COALESCE_WINDOW_SECONDS     = "3600"
+      METRICS_EXPORTER            = var.metrics_otlp_endpoint == "" ? "none" : "otlp"
+      OTEL_EXPORTER_OTLP_ENDPOINT = var.metrics_otlp_endpoint
+    }
+  }
 }
 
 resource "aws_lambda_event_source_mapping" "geo_fences_stream" {
   event_source_arn  = aws_dynamodb_table.geo_fences.stream_arn
   function_name     = aws_lambda_function.rule_eval.arn
   starting_position = "LATEST"
+  batch_size        = 500
+  # rule_eval returns batchItemFailures so only unpublished records are re-driven
+  function_response_types        = ["ReportBatchItemFailures"]
+  maximum_retry_attempts         = 5
+  bisect_batch_on_function_error = true
 }
 
 # SNS topic and push bridge Lambda for dispatching alerts
@@ -257,8 +376,30 @@ resource "aws_sns_topic" "fire_alert" {
 
 data "archive_file" "push_bridge" {
   type        = "zip"
-  source_file = "${path.module}/../../lambda/push_bridge.py"
   output_path = "${path.module}/dist/push_bridge.zip"
+
+  source {
+    content  = file("${path.module}/../../lambda/push_bridge.py")
+    filename = "push_bridge.py"
+  }
+
+  # Batched writes with retries of unprocessed requests, for the delivery ledger
+  source {
+    content  = file("${path.module}/../../src/common/batch_write.py")
+    filename = "common/batch_write.py"
+  }
+
+  # Shared lazy-client / secret-cache / instrumentation helpers (common is a namespace package here)
+  source {
+    content  = file("${path.module}/../../src/common/runtime.py")
+    filename = "common/runtime.py"
+  }
+
+  # Stdlib-only counters/histograms; exported over OTLP when metrics_otlp_endpoint is set
+  source {
+    content  = file("${path.module}/../../src/common/metrics.py")
+    filename = "common/metrics.py"
+  }
 }
 
 resource "aws_iam_role" "push_bridge" {
@@ -285,9 +426,18 @@ resource "aws_lambda_function" "push_bridge" {
   handler          = "push_bridge.lambda_handler"
   runtime          = "python3.12"
   role             = aws_iam_role.push_bridge.arn
+  timeout          = 60
   environment {
     variables = {
-      EXPO_TOKEN_SECRET_ARN = var.expo_token_secret_arn
+      EXPO_TOKEN_SECRET_ARN       = var.expo_token_secret_arn
+      PUSH_CONCURRENCY            = "4"
+      TOKEN_TTL_SECONDS           = "300"
+      SUBSCRIPTIONS_TABLE         = aws_dynamodb_table.geo_fences.name
+      SUBSCRIPTIONS_INDEX         = "fence_id-index"
+      DEVICES_TABLE               = aws_dynamodb_table.devices.name
+      DELIVERIES_TABLE            = aws_dynamodb_table.push_deliveries.name
+      METRICS_EXPORTER            = var.metrics_otlp_endpoint == "" ? "none" : "otlp"
+      OTEL_EXPORTER_OTLP_ENDPOINT = var.metrics_otlp_endpoint
     }
   }
 }
@@ -309,18 +459,79 @@ resource "aws_iam_role_policy_attachment" "push_bridge_secret_attach" {
   policy_arn = aws_iam_policy.push_bridge_secret.arn
 }
 
+# Alerts are buffered in SQS so push_bridge receives them in batches
+resource "aws_sqs_queue" "push_bridge_dlq" {
+  name                    = "${var.name}-push-bridge-dlq-${terraform.workspace}"
+  sqs_managed_sse_enabled = true
+}
+
+resource "aws_sqs_queue" "push_bridge" {
+  name                       = "${var.name}-push-bridge-${terraform.workspace}"
+  sqs_managed_sse_enabled    = true
+  visibility_timeout_seconds = 360
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.push_bridge_dlq.arn
+    maxReceiveCount     = 5
+  })
+}
+
+resource "aws_sqs_queue_policy" "push_bridge" {
+  queue_url = aws_sqs_queue.push_bridge.id
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [{
+      Effect    = "Allow",
+      Principal = { Service = "sns.amazonaws.com" },
+      Action    = "sqs:SendMessage",
+      Resource  = aws_sqs_queue.push_bridge.arn,
+      Condition = { ArnEquals = { "aws:SourceArn" = aws_sns_topic.fire_alert.arn } }
+    }]
+  })
+}
+
 resource "aws_sns_topic_subscription" "push_bridge" {
   topic_arn = aws_sns_topic.fire_alert.arn
-  protocol  = "lambda"
-  endpoint  = aws_lambda_function.push_bridge.arn
+  protocol  = "sqs"
+  endpoint  = aws_sqs_queue.push_bridge.arn
 }
 
-resource "aws_lambda_permission" "allow_sns_push_bridge" {
-  statement_id  = "AllowExecutionFromSNS"
-  action        = "lambda:InvokeFunction"
-  function_name = aws_lambda_function.push_bridge.function_name
-  principal     = "sns.amazonaws.com"
-  source_arn    = aws_sns_topic.fire_alert.arn
+resource "aws_iam_role_policy" "push_bridge_queue" {
+  name = "${var.name}-push-bridge-queue-${terraform.workspace}"
+  role = aws_iam_role.push_bridge.id
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect   = "Allow",
+        Action   = ["sqs:ReceiveMessage", "sqs:DeleteMessage", "sqs:GetQueueAttributes"],
+        Resource = aws_sqs_queue.push_bridge.arn
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["dynamodb:Query"],
+        Resource = "${aws_dynamodb_table.geo_fences.arn}/index/fence_id-index"
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["dynamodb:BatchGetItem"],
+        Resource = aws_dynamodb_table.devices.arn
+      },
+      {
+        Effect   = "Allow",
+        Action   = ["dynamodb:Query", "dynamodb:BatchWriteItem"],
+        Resource = aws_dynamodb_table.push_deliveries.arn
+      }
+    ]
+  })
+}
+
+resource "aws_lambda_event_source_mapping" "push_bridge_queue" {
+  event_source_arn                   = aws_sqs_queue.push_bridge.arn
+  function_name                      = aws_lambda_function.push_bridge.arn
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 2
+  # push_bridge returns batchItemFailures so only undelivered records are re-driven
+  function_response_types = ["ReportBatchItemFailures"]
 }
 
 # Route events from rule evaluation to SNS
@@ -328,7 +539,7 @@ resource "aws_cloudwatch_event_rule" "fire_dispatch" {
   name = "${var.name}-fire-dispatch-${terraform.workspace}"
   event_pattern = jsonencode({
     source        = ["koalasafe.rule_eval"],
-    "detail-type" = ["FenceIntersection"]
+    "detail-type" = ["FenceIntersection", "FenceIntersectionDigest"]
   })
 }
 
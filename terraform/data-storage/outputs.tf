@@ -10,6 +10,10 @@ output "geo_fences_table_name" {
   value = aws_dynamodb_table.geo_fences.name
 }
 
+output "devices_table_name" {
+  value = aws_dynamodb_table.devices.name
+}
+
 output "bucket_arn" {
   value = aws_s3_bucket.data.arn
 }
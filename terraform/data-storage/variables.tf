@@ -17,3 +17,9 @@ variable "expo_token_secret_arn" {
   type        = string
   description = "ARN of the Expo push token secret"
 }
+
+variable "metrics_otlp_endpoint" {
+  type        = string
+  description = "OTLP/HTTP endpoint the rule_eval and push_bridge Lambdas export metrics to; needs the ADOT Python layer (empty disables export)"
+  default     = ""
+}
@@ -34,12 +34,11 @@ module "data_storage" {
 module "ingest_firehose" {
   source = "./ingest-firehose"
 
-  name                    = var.name
-  region                  = var.region
-  lambda_s3_bucket        = var.lambda_s3_bucket
-  lambda_s3_key           = var.lambda_s3_key
-  delivery_bucket_arn     = module.data_storage.bucket_arn
-  nasa_api_key_secret_arn = aws_secretsmanager_secret.nasa_api_key.arn
+  name                = var.name
+  region              = var.region
+  lambda_s3_bucket    = var.lambda_s3_bucket
+  lambda_s3_key       = var.lambda_s3_key
+  delivery_bucket_arn = module.data_storage.bucket_arn
 }
 
 module "compute_fargate" {
@@ -54,7 +53,7 @@ module "compute_fargate" {
   firehose_bucket         = module.data_storage.bucket_name
   output_bucket           = module.data_storage.bucket_name
   mapbox_token_secret_arn = aws_secretsmanager_secret.mapbox_token.arn
-
+  geo_fences_table_name   = module.data_storage.geo_fences_table_name
 }
 module "edge_frontend" {
   source = "./edge-frontend"
@@ -72,5 +71,6 @@ module "api_gateway" {
   region                = var.region
   cognito_user_pool_arn = var.cognito_user_pool_arn
   geo_fences_table_name = module.data_storage.geo_fences_table_name
+  devices_table_name    = module.data_storage.devices_table_name
   geojson_bucket        = module.data_storage.bucket_name
 }
@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import importlib
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from common.record_codec import get_encoder  # noqa: E402
+from geojson_processor import air_quality, main, service  # noqa: E402
+from geojson_processor.air_quality import AirQualityRollup, AirQualityStage, iter_readings  # noqa: E402
+from geojson_processor.incremental import S3StateStore  # noqa: E402
+from stubs import StubS3  # noqa: E402
+
+# 2026-10-18T00:00Z in epoch hours
+H0 = 497856
+
+
+def _epn(site, pollutant, hour, value, lat=-33.9, lon=151.0):
+    """A normalized EPN record in the EPA's long-row shape, for the UTC epoch ``hour``."""
+    return {
+        "source": "nsw_epn",
+        "id": site,
+        "latitude": lat,
+        "longitude": lon,
+        "timestamp": None,
+        "raw": {
+            "Site_Id": site,
+            "Parameter": {"ParameterCode": pollutant},
+            "Value": value,
+            "Date": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(hour * 3600)),
+        },
+    }
+
+
+def test_readings_from_long_and_wide_rows():
+    long_row = {
+        "source": "nsw_epn",
+        "id": None,
+        "raw": {"Site_Id": 39, "Parameter": {"ParameterCode": "PM2.5"}, "Value": 7.3, "Date": "2026-10-18", "Hour": 1},
+    }
+    # Hour 1 is the hour ending 01:00 AEST, i.e. 14:00 UTC the day before
+    assert list(iter_readings(long_row)) == [("39", "PM2.5", H0 - 10, 7.3)]
+    wide_row = {"id": "Sydney", "timestamp": "2026-10-18T05:00:00Z", "raw": {"pm10": "21", "Ozone": 3.1, "NO2": None, "Latitude": -33.8}}
+    assert sorted(iter_readings(wide_row)) == [("Sydney", "O3", H0 + 5, 3.1), ("Sydney", "PM10", H0 + 5, 21.0)]
+    # RECORD_INCLUDE_RAW=false leaves nothing to roll up
+    assert list(iter_readings({"id": "Sydney", "timestamp": "2026-10-18T05:00:00Z"})) == []
+
+
+def test_ring_buffer_wraps_without_stale_slots():
+    rollup = AirQualityRollup(capacity=48)
+    rollup.add(("a", "O3", H0 + h, 1.0) for h in range(48))
+    # One lap later only the newest hour is known; the slot's old value must not count
+    rollup.add([("a", "O3", H0 + 48 + 47, 2.0)])
+    series = rollup.series("a", hours=48)
+    assert series["pollutants"]["O3"]["values"] == [2.0]
+    assert series["start"] == air_quality._iso(H0 + 95)
+    # Older than the window, or older than what the slot holds: dropped
+    assert rollup.add([("a", "O3", H0 + 10, 9.0), ("a", "O3", H0 + 47, 9.0)]) == 0
+    # Duplicates keep the last reading for the hour
+    rollup.add([("a", "O3", H0 + 94, 3.0), ("a", "O3", H0 + 94, 4.0)])
+    assert rollup.series("a", hours=2)["pollutants"]["O3"]["values"] == [4.0, 2.0]
+
+
+def test_rolling_averages_capture_and_categories():
+    rollup = AirQualityRollup(capacity=72)
+    rollup.add(("a", "PM2.5", H0 + h, 40.0) for h in range(17))
+    row = rollup.rows[("a", "PM2.5")]
+    # 17 of 24 hours is below the 75 % capture needed for a 24 h average
+    assert np.isnan(rollup.avg_24h[row]) and rollup.category(row) is None
+    rollup.add([("a", "PM2.5", H0 + 17, 100.0), ("a", "O3", H0 + 17, 9.0)])
+    assert rollup.avg_1h[row] == pytest.approx(100.0)
+    assert rollup.avg_24h[row] == pytest.approx((17 * 40 + 100) / 18)
+    assert rollup.category(row) == "FAIR"
+    # Ozone is categorised on its 1 h average
+    assert rollup.category(rollup.rows[("a", "O3")]) == "POOR"
+    # A late reading inside the window updates the averages
+    rollup.add([("a", "PM2.5", H0 - 6, 400.0)])
+    assert rollup.avg_24h[row] == pytest.approx((17 * 40 + 100 + 400) / 19)
+
+
+def test_snapshot_reports_worst_category_per_site():
+    rollup = AirQualityRollup(capacity=48)
+    rollup.add_records(_epn("a", "O3", H0 + h, 2.0) for h in range(24))
+    rollup.add_records([_epn("a", "NO2", H0 + 23, 30.0), _epn("b", "PM10", H0 + 23, 10.0, lat=-34.0, lon=150.5)])
+    features = {f["properties"]["site"]: f for f in rollup.snapshot()["features"]}
+    assert features["a"]["properties"]["category"] == "VERY POOR"
+    assert features["a"]["properties"]["pollutants"]["O3"] == {
+        "unit": "pphm", "hour": air_quality._iso(H0 + 23), "avg_1h": 2.0, "avg_24h": 2.0, "category": "GOOD",
+    }
+    assert features["b"]["geometry"]["coordinates"] == [150.5, -34.0]
+    # One PM10 hour is too little for its 24 h category
+    assert features["b"]["properties"]["category"] is None
+
+
+def test_state_round_trips_and_resizes():
+    rollup = AirQualityRollup(capacity=48)
+    rollup.add(("a", "O3", H0 + h, float(h)) for h in range(48))
+    rollup.objects = {"k": '"e"'}
+    restored = AirQualityRollup.from_bytes(rollup.to_bytes(), capacity=48)
+    assert restored.objects == {"k": '"e"'} and not restored.touched
+    assert restored.series("a", 48) == rollup.series("a", 48)
+    smaller = AirQualityRollup.from_bytes(rollup.to_bytes(), capacity=24)
+    assert smaller.series("a", 24)["pollutants"]["O3"]["values"] == [float(h) for h in range(24, 48)]
+    assert AirQualityRollup.from_bytes(None).keys == []
+
+
+def _deliver(s3, key, records, encoding="jsonl"):
+    encode = get_encoder(encoding)
+    s3.put_object(Bucket="raw", Key=key, Body=b"".join(encode(rec) for rec in records))
+
+
+def test_stage_reads_only_new_objects_and_publishes_touched_sites():
+    s3 = StubS3()
+    hotspot = {"source": "nasa_firms", "id": "x", "latitude": -33.0, "longitude": 150.0, "timestamp": "t", "raw": {}}
+    _deliver(s3, "2026/10/18/00/a", [hotspot] + [_epn("a", "PM2.5", H0 + h, 10.0) for h in range(24)])
+    _deliver(s3, "2026/10/18/00/b", [_epn("b", "O3", H0, 3.0), hotspot], encoding="msgpack")
+    _deliver(s3, "2026/10/18/00/c", [hotspot])
+    store = S3StateStore(s3, "out", "aq.npz")
+    stage = AirQualityStage(s3, "raw", "out", "aq/", store)
+    listing = [obj for page in s3.get_paginator("list_objects_v2").paginate(Bucket="raw") for obj in page["Contents"]]
+    assert stage.update(listing) == {"objects": 3, "records": 25, "readings": 25, "sites": 2}
+    stats = stage.publish()
+    assert stats["sites"] == 2 and not stage.dirty
+    series = json.loads(s3.objects["out/aq/sites/a.json"]["Body"])
+    assert series["pollutants"]["PM2.5"]["avg_24h"] == 10.0 and len(series["pollutants"]["PM2.5"]["values"]) == 24
+    stations = json.loads(s3.objects["out/aq/stations.geojson"]["Body"])
+    assert sorted(f["properties"]["site"] for f in stations["features"]) == ["a", "b"]
+
+    stage.checkpoint()
+    gets = s3.requests["GetObject"]
+    restarted = AirQualityStage(s3, "raw", "out", "aq/", store)
+    # Only the checkpoint is read back; listed objects are already in the manifest
+    assert restarted.update(listing)["objects"] == 0 and s3.requests["GetObject"] == gets + 1
+    # Deleted keys drop out of the manifest
+    assert restarted.update(listing[:1])["objects"] == 0 and list(restarted.rollup.objects) == [listing[0]["Key"]]
+
+
+def test_main_sends_epn_readings_only_to_the_rollup(monkeypatch):
+    monkeypatch.setattr(main, "TILE_WORKERS", 0)
+    monkeypatch.setattr(main, "PARSE_WORKERS", 0)
+    monkeypatch.setattr(main, "make_s3_client", lambda workers: s3)
+    monkeypatch.setenv("FIREHOSE_BUCKET", "raw")
+    monkeypatch.setenv("OUTPUT_BUCKET", "out")
+    s3 = StubS3()
+    hotspot = {"source": "nasa_firms", "id": "x", "latitude": -35.0, "longitude": 149.0, "timestamp": "t", "raw": {}}
+    _deliver(s3, "2026/10/18/00/a", [hotspot, _epn("a", "NO2", H0, 4.0, lat=-33.9, lon=151.0)])
+    main.main()
+    assert json.loads(s3.objects["out/air_quality/sites/a.json"]["Body"])["pollutants"]["NO2"]["values"] == [4.0]
+    # Only the hotspot's footprint is a perimeter; the station is not
+    (feature,) = json.loads(s3.objects["out/fire_perimeters.geojson"]["Body"])["features"]
+    assert all(abs(lon - 149.0) < 0.01 for lon, _ in feature["geometry"]["coordinates"][0])
+
+
+def test_one_hour_update_over_months_of_history_is_fast():
+    sites, pollutants, hours = 120, list(air_quality.POLLUTANTS), 2160
+    rollup = AirQualityRollup(capacity=hours)
+    rows = [rollup._row(f"s{n}", p) for n in range(sites) for p in pollutants]
+    for n in range(sites):
+        rollup.site(f"s{n}", latitude=-33.0 - n * 0.01, longitude=151.0)
+    rollup._grow()
+    rollup.add_arrays(
+        np.repeat(np.asarray(rows), hours),
+        np.tile(np.arange(H0, H0 + hours), len(rows)),
+        np.random.default_rng(0).random(len(rows) * hours, dtype=np.float32) * 50,
+    )
+    started = time.perf_counter()
+    assert rollup.add((f"s{n}", p, H0 + hours, 5.0) for n in range(sites) for p in pollutants) == len(rows)
+    snapshot = rollup.snapshot()
+    elapsed = time.perf_counter() - started
+    # Months of hourly data for every station; one new hour plus the snapshot stays well under a second
+    assert len(snapshot["features"]) == sites and elapsed < 0.25
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    pytest.importorskip("opentelemetry.instrumentation.flask")
+    module = importlib.import_module("ecs.app")
+    monkeypatch.setattr(module, "engine", None)
+    return module
+
+
+def test_engine_folds_epn_readings_and_serves_them(app_module, monkeypatch):
+    monkeypatch.setattr(main, "TILE_WORKERS", 0)
+    monkeypatch.setattr(main, "PARSE_WORKERS", 0)
+    s3 = StubS3()
+    _deliver(s3, "2026/10/18/00/a", [_epn("a", "NO2", H0 + h, 4.0) for h in range(3)])
+    stage = AirQualityStage(s3, "raw", "out", "aq/", S3StateStore(s3, "out", "aq.npz"))
+    source = service.ListingSource(s3, "raw", "2026/")
+    engine = service.PerimeterEngine(s3, source, "out", "fire.geojson", window_seconds=0, publish_outputs=False, air_quality=stage)
+    engine.step(now=1000.0)
+    assert engine.health(1000.0)["air_quality_sites"] == 1 and engine.checkpoint_pending
+    app_module.engine = engine
+    client = app_module.app.test_client()
+    stations = client.get("/air-quality").get_json()
+    assert stations["features"][0]["properties"]["pollutants"]["NO2"]["category"] == "GOOD"
+    assert client.get("/air-quality/a").get_json()["pollutants"]["NO2"]["values"] == [4.0, 4.0, 4.0]
+    assert client.get("/air-quality/nope").status_code == 404
+    engine.checkpoint(1000.0)
+    assert "out/aq.npz" in s3.objects
@@ -0,0 +1,80 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import numpy as np
+from shapely.geometry import Point, box
+from shapely.ops import unary_union
+
+from geojson_processor.clustering import (
+    M_PER_DEG_LAT,
+    cluster_and_union,
+    cluster_hotspots,
+    hotspot_perimeters,
+)
+
+
+def _brute_force_labels(lon, lat, link_m):
+    n = len(lon)
+    parent = list(range(n))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            dx = (lon[i] - lon[j]) * 111_320.0 * np.cos(np.radians((lat[i] + lat[j]) / 2))
+            dy = (lat[i] - lat[j]) * M_PER_DEG_LAT
+            if dx**2 + dy**2 <= link_m**2:
+                parent[find(i)] = find(j)
+    return [find(i) for i in range(n)]
+
+
+def _partition(labels):
+    groups = {}
+    for i, label in enumerate(labels):
+        groups.setdefault(label, set()).add(i)
+    return sorted(map(sorted, groups.values()))
+
+
+def test_cluster_hotspots_matches_brute_force():
+    rng = np.random.default_rng(3)
+    lon = 150 + rng.uniform(0, 0.05, 300)
+    lat = -33 + rng.uniform(0, 0.05, 300)
+    labels = cluster_hotspots(lon, lat, 600.0)
+    assert _partition(labels) == _partition(_brute_force_labels(lon, lat, 600.0))
+
+
+def test_clusters_from_dense_hotspots_form_a_valid_multipolygon():
+    # Far from the meridian, where a per-point projection would misplace neighbours
+    rng = np.random.default_rng(7)
+    lon = 152 + rng.normal(0, 0.02, 3000)
+    lat = -38 + rng.normal(0, 0.02, 3000)
+    result = cluster_and_union([Point(x, y) for x, y in zip(lon, lat)])
+    assert result.is_valid
+
+
+def test_hotspot_perimeters_are_disjoint_polygons():
+    lon = np.array([150.0, 150.003, 150.006, 151.0])
+    lat = np.array([-33.0, -33.0, -33.0, -33.0])
+    perimeters = hotspot_perimeters(lon, lat, footprint_m=375)
+    assert len(perimeters) == 2
+    assert perimeters[0].geom_type == "Polygon"
+    assert not perimeters[0].intersects(perimeters[1])
+    # Three ~375 m pixels spaced ~280 m apart form one ~935 m long strip
+    minx, _, maxx, _ = perimeters[0].bounds
+    assert 0.0095 < maxx - minx < 0.0105
+
+
+def test_cluster_and_union_merges_points_with_polygons():
+    incident = box(150.0, -33.01, 150.01, -33.0)
+    points = [Point(150.02, -33.005), Point(150.0205, -33.005), Point(152.0, -30.0)]
+    result = cluster_and_union([incident, *points])
+    assert result.geom_type == "MultiPolygon"
+    assert len(result.geoms) == 3
+    assert result.contains(incident)
+    only_points = cluster_and_union(points)
+    assert only_points.equals(unary_union(hotspot_perimeters([p.x for p in points], [p.y for p in points])))
@@ -0,0 +1,72 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ingest_lambda.dedup import RecordDeduper
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class _MemoryStore:
+    def __init__(self):
+        self.data = None
+        self.saves = 0
+
+    def load(self):
+        return self.data
+
+    def save(self, data):
+        self.data = data
+        self.saves += 1
+
+
+def _rec(rid, ts="2024-12-01T0100Z", **raw):
+    return {"source": "nasa_firms", "id": rid, "latitude": -33.0, "longitude": 150.0, "timestamp": ts, "raw": raw}
+
+
+def test_deduper_emits_only_new_or_changed_records():
+    deduper = RecordDeduper(ttl=60, clock=_Clock())
+    first = [_rec("a"), _rec("b")]
+    assert deduper.filter(first) == first
+    deduper.commit()
+
+    changed = _rec("b", confidence=90)
+    assert deduper.filter([_rec("a"), changed, _rec("c")]) == [changed, _rec("c")]
+    deduper.commit()
+    stats = deduper.stats()
+    assert stats["records_in"] == 5
+    assert stats["records_out"] == 4
+    assert stats["dedup_ratio"] == 0.2
+
+
+def test_deduper_uncommitted_records_are_resent():
+    deduper = RecordDeduper(ttl=60, clock=_Clock())
+    assert deduper.filter([_rec("a")]) == [_rec("a")]
+    deduper.discard()
+    assert deduper.filter([_rec("a")]) == [_rec("a")]
+
+
+def test_deduper_ttl_eviction_and_persistence():
+    clock = _Clock()
+    store = _MemoryStore()
+    deduper = RecordDeduper(ttl=60, store=store, clock=clock)
+    deduper.filter([_rec("a")])
+    deduper.commit()
+    assert store.saves == 1
+
+    restored = RecordDeduper(ttl=60, store=store, clock=clock)
+    assert restored.filter([_rec("a")]) == []
+    restored.commit()
+    # Seeing the record again does not extend its expiry, so nothing is rewritten
+    assert store.saves == 1
+
+    clock.now += 61
+    assert restored.filter([_rec("a")]) == [_rec("a")]
+    assert len(restored) == 0
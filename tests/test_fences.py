@@ -0,0 +1,134 @@
+import os
+import sys
+
+import numpy as np
+import shapely
+from shapely.geometry import Point, box
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from geojson_processor.fences import FenceIndex, FenceWriter, fence_geometries, scan_fences, update_fence_intersections
+from stubs import StubDynamoDB
+
+
+def _circle_item(i, lon, lat, radius_m=None, **extra):
+    params = {"latitude": {"N": str(lat)}, "longitude": {"N": str(lon)}}
+    if radius_m is not None:
+        params["radius_m"] = {"N": str(radius_m)}
+    return {"user_id": {"S": f"u{i % 7}"}, "fence_id": {"S": f"f{i}"}, "params": {"M": params}, **extra}
+
+
+def _polygon_item(i, geometry):
+    def typed(value):
+        if isinstance(value, (list, tuple)):
+            return {"L": [typed(v) for v in value]}
+        return {"N": str(value)}
+
+    mapping = shapely.geometry.mapping(geometry)
+    params = {"geometry": {"M": {"type": {"S": mapping["type"]}, "coordinates": typed(mapping["coordinates"])}}}
+    return {"user_id": {"S": f"u{i % 7}"}, "fence_id": {"S": f"f{i}"}, "params": {"M": params}}
+
+
+def test_fence_geometries():
+    items = [
+        _circle_item(0, 151.0, -33.0, 1000),
+        _circle_item(1, 151.0, -33.0),
+        _polygon_item(2, box(150, -34, 150.1, -33.9)),
+        {"user_id": {"S": "u"}, "fence_id": {"S": "f3"}, "params": {"M": {"type": {"S": "fire"}}}},
+        {"user_id": {"S": "u"}, "fence_id": {"S": "f4"}},
+    ]
+    geometries = fence_geometries(items, default_radius_m=2000)
+    small, default, polygon = geometries[:3]
+    # 1 km north-south is 1000 / 110540 degrees of latitude
+    assert abs((small.bounds[3] - small.bounds[1]) / 2 - 1000 / 110_540) < 1e-9
+    assert abs(default.area / small.area - 4) < 1e-6
+    assert polygon.equals(box(150, -34, 150.1, -33.9))
+    assert geometries[3] is None and geometries[4] is None
+
+
+def test_intersecting_matches_brute_force():
+    rng = np.random.default_rng(5)
+    items = [_circle_item(i, rng.uniform(140, 150), rng.uniform(-38, -30), rng.uniform(500, 30000)) for i in range(3000)]
+    items.append({"user_id": {"S": "u"}, "fence_id": {"S": "no-geometry"}})
+    fires = shapely.union_all(
+        [box(x, y, x + rng.uniform(0.01, 0.3), y + rng.uniform(0.01, 0.3)) for x, y in rng.uniform((140, -38), (150, -30), (200, 2))]
+    )
+    index = FenceIndex(items)
+    hits = index.intersecting(fires)
+    expected = [geometry is not None and geometry.intersects(fires) for geometry in fence_geometries(items)]
+    assert hits.tolist() == expected
+    assert 0 < hits.sum() < len(items)
+    assert not index.intersecting(None).any()
+    assert not index.intersecting(shapely.GeometryCollection()).any()
+
+
+def test_changes_only_flags_that_flip():
+    items = [
+        _circle_item(0, 151.0, -33.0, 1000),
+        _circle_item(1, 140.0, -30.0, 1000, intersects={"BOOL": True}),
+        _circle_item(2, 151.5, -33.5, 1000, intersects={"BOOL": True}),
+        _circle_item(3, 140.0, -25.0, 1000),
+    ]
+    fires = shapely.union_all([Point(151.0, -33.0).buffer(0.01), Point(151.5, -33.5).buffer(0.01)])
+    changed = FenceIndex(items).changes(fires)
+    assert [item["fence_id"]["S"] for item in changed] == ["f0", "f1"]
+    assert [item["intersects"]["BOOL"] for item in changed] == [True, False]
+
+
+def test_writer_retries_throttled_updates():
+    client = StubDynamoDB(throttle_rate=0.5)
+    items = [_circle_item(i, 150, -30, 100, intersects={"BOOL": True}) for i in range(200)]
+    for item in items:
+        client.put_item(TableName="fences", Item={k: v for k, v in item.items() if k != "intersects"})
+    delays = []
+    stats = FenceWriter(client, "fences", workers=4, max_attempts=20, sleep=delays.append).write(items)
+    assert stats["written"] == 200 and stats["failed"] == 0
+    assert stats["retried_items"] > 0 and delays
+    assert all(item["intersects"] == {"BOOL": True} for item in client.tables["fences"].values())
+
+
+def test_writer_reports_items_it_gives_up_on():
+    client = StubDynamoDB(throttle_rate=1.0)
+    items = [_circle_item(i, 150, -30, 100, intersects={"BOOL": True}) for i in range(30)]
+    stats = FenceWriter(client, "fences", max_attempts=3, sleep=lambda _: None).write(items)
+    assert stats == {"written": 0, "missing": 0, "failed": 30, "calls": 90, "retried_items": 90}
+
+
+def test_writer_keeps_concurrent_subscription_edits():
+    client = StubDynamoDB()
+    for i in range(3):
+        client.put_item(TableName="fences", Item=_circle_item(i, 150, -30, 100))
+    scanned = scan_fences(client, "fences", segments=1)
+    for item in scanned:
+        item["intersects"] = {"BOOL": True}
+    # Between the scan and the write one fence is edited and one is unsubscribed
+    edited = _circle_item(0, 150, -30, 100, label={"S": "home"})
+    client.put_item(TableName="fences", Item=edited)
+    client.delete_item(TableName="fences", Key={"user_id": {"S": "u1"}, "fence_id": {"S": "f1"}})
+    stats = FenceWriter(client, "fences", workers=1).write(scanned)
+    assert stats["written"] == 2 and stats["missing"] == 1
+    stored = {item["fence_id"]["S"]: item for item in client.tables["fences"].values()}
+    assert sorted(stored) == ["f0", "f2"]
+    assert stored["f0"]["label"] == {"S": "home"} and stored["f0"]["intersects"] == {"BOOL": True}
+
+
+def test_update_fence_intersections_round_trip():
+    client = StubDynamoDB()
+    rng = np.random.default_rng(9)
+    for i in range(2500):
+        client.put_item(TableName="geo_fences", Item=_circle_item(i, rng.uniform(150, 152), rng.uniform(-34, -32), 2000))
+    # Two segments of ~1250 items each take two 1000-item pages apiece
+    assert len(scan_fences(client, "geo_fences", segments=2)) == 2500
+    assert client.requests["Scan"] == 4
+
+    fires = box(150.5, -33.5, 151.0, -33.0)
+    stats = update_fence_intersections(client, "geo_fences", fires, scan_segments=3, write_workers=4)
+    stored = {item["fence_id"]["S"]: item for item in client.tables["geo_fences"].values()}
+    flagged = {key for key, item in stored.items() if item.get("intersects", {}).get("BOOL")}
+    assert stats["changed"] == stats["written"] == stats["intersecting"] == len(flagged) > 0
+    assert all(stored[key]["params"] for key in flagged)
+
+    assert update_fence_intersections(client, "geo_fences", fires)["changed"] == 0
+    cleared = update_fence_intersections(client, "geo_fences", None)
+    assert cleared["changed"] == len(flagged) and cleared["intersecting"] == 0
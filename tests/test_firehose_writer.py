@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import random
+import threading
+
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from ingest_lambda.firehose_writer import MAX_BATCH_BYTES, MAX_BATCH_RECORDS, FirehoseWriter
+
+
+class ThrottlingFirehose:
+    """Stub client that throttles whole calls and fails individual entries."""
+
+    def __init__(self, seed=7, call_throttle=0.2, entry_failure=0.3):
+        self.random = random.Random(seed)
+        self.call_throttle = call_throttle
+        self.entry_failure = entry_failure
+        self.lock = threading.Lock()
+        self.delivered = []
+        self.batch_sizes = []
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        with self.lock:
+            assert len(Records) <= MAX_BATCH_RECORDS
+            assert sum(len(r["Data"]) for r in Records) <= MAX_BATCH_BYTES
+            self.batch_sizes.append(len(Records))
+            if self.random.random() < self.call_throttle:
+                raise ClientError({"Error": {"Code": "ThrottlingException"}}, "PutRecordBatch")
+            responses = []
+            for rec in Records:
+                if self.random.random() < self.entry_failure:
+                    responses.append({"ErrorCode": "ServiceUnavailableException", "ErrorMessage": "slow down"})
+                else:
+                    self.delivered.append(rec["Data"])
+                    responses.append({"RecordId": "x"})
+            failed = sum(1 for r in responses if "ErrorCode" in r)
+            return {"FailedPutCount": failed, "RequestResponses": responses}
+
+
+def _records(n, pad=0):
+    return ({"source": "nasa_firms", "id": str(i), "raw": {"pad": "x" * pad}} for i in range(n))
+
+
+def test_writer_retries_only_failed_entries_under_throttling():
+    client = ThrottlingFirehose()
+    writer = FirehoseWriter(client, "stream", max_in_flight=4, max_attempts=20, sleep=lambda s: None)
+    stats = writer.put_records(_records(2000))
+    assert stats["sent"] == 2000
+    assert stats["failed"] == 0
+    assert stats["retried_entries"] > 0
+    ids = sorted(int(json.loads(d)["id"]) for d in client.delivered)
+    assert ids == list(range(2000))
+
+
+def test_writer_reports_records_that_exhaust_retries():
+    client = ThrottlingFirehose(call_throttle=0.0, entry_failure=1.0)
+    writer = FirehoseWriter(client, "stream", max_attempts=3, sleep=lambda s: None)
+    stats = writer.put_records(_records(10))
+    assert stats == {"sent": 0, "failed": 10, "oversized": 0, "batches": 1, "calls": 3, "retried_entries": 30}
+
+
+def test_writer_packs_by_bytes_and_drops_oversized_records():
+    client = ThrottlingFirehose(call_throttle=0.0, entry_failure=0.0)
+    writer = FirehoseWriter(client, "stream", sleep=lambda s: None)
+    records = list(_records(30, pad=200_000)) + [{"id": "huge", "raw": {"pad": "x" * 1_100_000}}]
+    stats = writer.put_records(records)
+    assert stats["sent"] == 30
+    assert stats["oversized"] == 1
+    assert max(client.batch_sizes) < 30
+
+
+def test_writer_aggregates_newline_delimited_records():
+    client = ThrottlingFirehose(call_throttle=0.0, entry_failure=0.0)
+    writer = FirehoseWriter(client, "stream", aggregate=True, sleep=lambda s: None)
+    stats = writer.put_records(_records(5000))
+    assert stats["sent"] == 5000
+    assert len(client.delivered) < 20
+    lines = b"".join(client.delivered).splitlines()
+    assert [json.loads(line)["id"] for line in lines] == [str(i) for i in range(5000)]
@@ -0,0 +1,59 @@
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import pytest
+import shapely
+from shapely.geometry import MultiPolygon, Point, box, shape
+
+from geojson_processor.geojson_output import compress, feature_collection, upload_geojson
+from stubs import StubS3
+
+try:
+    import brotli
+except ImportError:  # optional, as in geojson_output
+    brotli = None
+needs_brotli = pytest.mark.skipif(brotli is None, reason="brotli is not installed")
+
+FIRES = MultiPolygon([box(150.123456789, -33.2, 150.3, -33.0), box(145.0, -37.1, 145.05, -37.0)])
+
+
+def test_feature_collection_matches_geometry_within_precision():
+    doc = json.loads(feature_collection(FIRES, precision=4, properties={"run": 1}))
+    assert doc["type"] == "FeatureCollection"
+    feature = doc["features"][0]
+    assert feature["properties"] == {"run": 1}
+    assert [150.1235, -33.2] in feature["geometry"]["coordinates"][0][0]
+    assert shapely.hausdorff_distance(shape(feature["geometry"]), FIRES) <= 5e-5
+
+
+def test_full_precision_round_trips_exactly():
+    doc = json.loads(feature_collection(Point(150.123456789012, -33.1), precision=None))
+    assert shape(doc["features"][0]["geometry"]).equals(Point(150.123456789012, -33.1))
+
+
+@pytest.mark.parametrize(
+    "encoding, decode",
+    [
+        ("gzip", gzip.decompress),
+        pytest.param("br", lambda body: brotli.decompress(body), marks=needs_brotli),
+    ],
+)
+def test_upload_sets_content_encoding(encoding, decode):
+    s3 = StubS3()
+    report = upload_geojson(s3, "out", "fire_perimeters.geojson", FIRES, encoding=encoding)
+    obj = s3.get_object(Bucket="out", Key="fire_perimeters.geojson")
+    assert obj["ContentEncoding"] == encoding
+    assert obj["ContentType"] == "application/geo+json"
+    body = decode(obj["Body"].read())
+    assert len(body) == report["raw_bytes"] and report["bytes"] < report["raw_bytes"]
+    assert json.loads(body)["features"][0]["geometry"]["type"] == "MultiPolygon"
+
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(ValueError):
+        compress(b"{}", "zstd")
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from common.record_codec import get_encoder
+from geojson_processor import main, reader
+from stubs import StubDynamoDB, StubS3
+
+RECORDS = [
+    {"source": "nasa_firms", "id": "a", "latitude": -32.0, "longitude": 151.0, "timestamp": "t", "raw": {}},
+    {"source": "nsw_epn", "id": "b", "latitude": None, "longitude": None, "timestamp": "t", "raw": {}},
+]
+
+
+def test_object_geometries_autodetects_format():
+    collection = json.dumps(
+        {"type": "FeatureCollection", "features": [{"type": "Feature", "geometry": {"type": "Point", "coordinates": [150.0, -33.0]}, "properties": {}}]},
+        indent=2,
+    ).encode("utf-8")
+    assert [g.coords[0] for g in reader.iter_object_geometries(collection)] == [(150.0, -33.0)]
+    for encoding in ("jsonl", "msgpack"):
+        body = b"".join(map(get_encoder(encoding), RECORDS))
+        assert [g.coords[0] for g in reader.iter_object_geometries(body)] == [(151.0, -32.0)]
+
+
+def test_parse_object_by_source():
+    body = b"".join(map(get_encoder("jsonl"), RECORDS + [{**RECORDS[0], "source": None}]))
+    groups = reader.parse_object_by_source(body)
+    assert sorted(groups) == ["nasa_firms", reader.UNKNOWN_SOURCE]
+    assert [g.coords[0] for g in groups["nasa_firms"]] == [(151.0, -32.0)]
+
+
+def test_air_quality_records_never_become_perimeters(monkeypatch):
+    station = {"source": "nsw_epn", "id": "Sydney", "latitude": -33.9, "longitude": 151.0, "timestamp": "t", "raw": {}}
+    assert list(reader.iter_object_features(get_encoder("jsonl")(station))) == []
+    collection = {"features": [{"geometry": {"type": "Point", "coordinates": [151.0, -33.9]}, "properties": {"source": "nsw_epn"}}]}
+    assert list(reader.iter_object_features(json.dumps(collection).encode())) == []
+
+    s3, fences = StubS3(), StubDynamoDB()
+    s3.put_object(Bucket="raw", Key="2026/10/18/00/epn", Body=get_encoder("jsonl")(station))
+    fence = {"user_id": {"S": "u"}, "fence_id": {"S": "f"}, "params": {"M": {"latitude": {"N": "-33.9"}, "longitude": {"N": "151.0"}}}}
+    fences.put_item(TableName="geo_fences", Item=fence)
+    for name, value in (("make_s3_client", lambda workers: s3), ("make_dynamodb_client", lambda workers: fences),
+                        ("FENCES_TABLE", "geo_fences"), ("PARSE_WORKERS", 0), ("TILE_WORKERS", 0)):
+        monkeypatch.setattr(main, name, value)
+    monkeypatch.setenv("FIREHOSE_BUCKET", "raw")
+    monkeypatch.setenv("OUTPUT_BUCKET", "out")
+    main.main()
+    # A monitoring station is not a fire: no perimeter is published and no fence flips
+    assert "out/fire_perimeters.geojson" not in s3.objects
+    assert "intersects" not in next(iter(fences.tables["geo_fences"].values()))
+
+
+def test_main_twice_on_a_shared_bucket_ignores_its_own_outputs(monkeypatch):
+    s3 = StubS3()
+    fire = {"source": "nasa_firms", "id": "h", "latitude": -33.0, "longitude": 150.0, "timestamp": "t", "raw": {}}
+    station = {"source": "nsw_epn", "id": "Sydney", "latitude": -33.9, "longitude": 151.0,
+               "timestamp": "2026-10-18T00:00:00", "raw": {"value": 10.0, "parameter": "PM2.5"}}
+    s3.put_object(Bucket="shared", Key="2026/10/18/00/a", Body=b"".join(map(get_encoder("jsonl"), (fire, station))))
+    for name, value in (("make_s3_client", lambda workers: s3), ("FENCES_TABLE", ""), ("PARSE_WORKERS", 0),
+                        ("TILE_WORKERS", 0), ("VECTOR_TILE_MAX_ZOOM", 2), ("TILE_OUTPUT_PREFIX", "tile_")):
+        monkeypatch.setattr(main, name, value)
+    monkeypatch.setenv("FIREHOSE_BUCKET", "shared")
+    monkeypatch.setenv("OUTPUT_BUCKET", "shared")
+    main.main()
+    first = s3.objects["shared/fire_perimeters.geojson"]["Body"]
+    outputs = {key for key in s3.objects if not key.startswith("shared/2026/")}
+    assert any("/tiles/" in key for key in outputs) and any("/state/" in key for key in outputs)
+    # The second run lists the tiles, checkpoint and rollup outputs next to the raw object
+    main.main()
+    assert s3.objects["shared/fire_perimeters.geojson"]["Body"] == first
+    ignore = main.output_keys("fire_perimeters.geojson")
+    assert all(ignore(key.split("/", 1)[1]) for key in outputs)
+
+
+class _PagedS3:
+    """In-memory S3 client that pages listings 1000 keys at a time like the real API."""
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000):
+        keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        start = int(ContinuationToken or 0)
+        page = keys[start : start + MaxKeys]
+        resp = {"Contents": [{"Key": k, "ETag": f'"{k}"'} for k in page]}
+        if start + MaxKeys < len(keys):
+            resp["IsTruncated"] = True
+            resp["NextContinuationToken"] = str(start + MaxKeys)
+        return resp
+
+    def get_paginator(self, name):
+        client = self
+
+        class _Paginator:
+            def paginate(self, **kwargs):
+                token = None
+                while True:
+                    resp = client.list_objects_v2(ContinuationToken=token, **kwargs)
+                    yield resp
+                    token = resp.get("NextContinuationToken")
+                    if not token:
+                        return
+
+        return _Paginator()
+
+    def get_object(self, Bucket, Key):
+        import io
+
+        return {"Body": io.BytesIO(self.objects[Key])}
+
+
+def test_collect_reads_past_first_listing_page():
+    encode = get_encoder("jsonl")
+    objects = {
+        f"raw/{i:05d}": encode({"source": "nasa_firms", "id": str(i), "latitude": -30.0, "longitude": 140.0 + i / 1000})
+        for i in range(2500)
+    }
+    s3 = _PagedS3(objects)
+    for parse_workers in (0, 2):
+        geometries = main.collect_firehose_geometries(s3, "bucket", "raw/", download_workers=8, parse_workers=parse_workers)
+        assert len(geometries) == 2500
+        assert geometries[1234].x == 140.0 + 1234 / 1000
@@ -2,11 +2,42 @@ import os
 import sys
 import json
 import io
+import base64
+import gzip
 from unittest.mock import patch
 
+import pytest
+
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
 
 from api import geojson_proxy
+from stubs import StubS3
+
+try:
+    import brotli
+except ImportError:  # optional, as in geojson_proxy
+    brotli = None
+needs_brotli = pytest.mark.skipif(brotli is None, reason="brotli is not installed")
+
+SAMPLE = {"type": "FeatureCollection", "features": [{"type": "Feature", "geometry": None, "properties": {}}] * 50}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    geojson_proxy._cache.clear()
+    yield
+    geojson_proxy._cache.clear()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    stub = StubS3()
+    stub.put_object(Bucket="my-bucket", Key="data.geojson", Body=json.dumps(SAMPLE).encode("utf-8"))
+    monkeypatch.setenv("GEOJSON_BUCKET", "my-bucket")
+    monkeypatch.setenv("GEOJSON_KEY", "data.geojson")
+    monkeypatch.setattr(geojson_proxy, "s3", stub)
+    return stub
 
 
 def test_geojson_proxy_no_bucket(monkeypatch=None):
@@ -21,9 +52,99 @@ def test_geojson_proxy_success(monkeypatch=None):
     os.environ["GEOJSON_BUCKET"] = "my-bucket"
     os.environ["GEOJSON_KEY"] = "data.geojson"
     sample = {"type": "FeatureCollection"}
-    mock_body = io.BytesIO(json.dumps(sample).encode("utf-8"))
-    with patch.object(geojson_proxy.s3, "get_object", return_value={"Body": mock_body}) as mock_get:
+    raw = json.dumps(sample).encode("utf-8")
+    mock_body = io.BytesIO(raw)
+    with patch.object(geojson_proxy.s3, "head_object", return_value={"ContentLength": len(raw)}), \
+            patch.object(geojson_proxy.s3, "get_object", return_value={"Body": mock_body}) as mock_get:
         response = geojson_proxy.geojsonProxyFn({}, None)
     mock_get.assert_called_once_with(Bucket="my-bucket", Key="data.geojson")
     assert response["statusCode"] == 200
     assert json.loads(response["body"]) == sample
+
+
+def test_warm_container_serves_from_cache_until_revalidation(s3, monkeypatch):
+    first = geojson_proxy.geojsonProxyFn({}, None)
+    second = geojson_proxy.geojsonProxyFn({}, None)
+    assert first["body"] == second["body"]
+    assert s3.requests == {"PutObject": 1, "HeadObject": 1, "GetObject": 1}
+    assert first["headers"]["ETag"] == s3.objects["my-bucket/data.geojson"]["ETag"]
+    assert first["headers"]["Cache-Control"] == "public, max-age=60"
+
+    monkeypatch.setattr(geojson_proxy, "REVALIDATE_SECONDS", 0)
+    geojson_proxy.geojsonProxyFn({}, None)
+    assert s3.requests == {"PutObject": 1, "HeadObject": 2, "GetObject": 1}
+
+    s3.put_object(Bucket="my-bucket", Key="data.geojson", Body=b'{"type":"FeatureCollection","features":[]}')
+    response = geojson_proxy.geojsonProxyFn({}, None)
+    assert json.loads(response["body"])["features"] == []
+    assert s3.requests["GetObject"] == 2
+
+
+def test_if_none_match_returns_304(s3):
+    etag = geojson_proxy.geojsonProxyFn({}, None)["headers"]["ETag"]
+    response = geojson_proxy.geojsonProxyFn({"headers": {"If-None-Match": f"W/{etag}"}}, None)
+    assert response["statusCode"] == 304
+    assert response["body"] == "" and response["headers"]["ETag"] == etag
+
+
+@pytest.mark.parametrize(
+    "accept, encoding, decode",
+    [
+        pytest.param("gzip, deflate, br", "br", lambda body: brotli.decompress(body), marks=needs_brotli),
+        ("gzip, br;q=0", "gzip", gzip.decompress),
+    ],
+)
+def test_compressed_bodies_when_accepted(s3, accept, encoding, decode):
+    response = geojson_proxy.geojsonProxyFn({"headers": {"accept-encoding": accept}}, None)
+    assert response["statusCode"] == 200
+    assert response["isBase64Encoded"] is True
+    assert response["headers"]["Content-Encoding"] == encoding
+    assert json.loads(decode(base64.b64decode(response["body"]))) == SAMPLE
+
+
+def test_precompressed_object_is_served_plain_to_clients_without_gzip(monkeypatch):
+    stub = StubS3()
+    stub.put_object(Bucket="b", Key="k", Body=gzip.compress(json.dumps(SAMPLE).encode()), ContentEncoding="gzip")
+    monkeypatch.setenv("GEOJSON_BUCKET", "b")
+    monkeypatch.setenv("GEOJSON_KEY", "k")
+    monkeypatch.setattr(geojson_proxy, "s3", stub)
+    assert json.loads(geojson_proxy.geojsonProxyFn({}, None)["body"]) == SAMPLE
+
+
+def test_oversized_payload_redirects_to_presigned_url(s3, monkeypatch):
+    monkeypatch.setattr(geojson_proxy, "MAX_RESPONSE_BYTES", 100)
+    response = geojson_proxy.geojsonProxyFn({"headers": {"Accept-Encoding": "gzip"}}, None)
+    assert response["statusCode"] == 302
+    assert response["headers"]["Location"].startswith("https://stub-s3.local/my-bucket/data.geojson")
+    # The object's size alone decides it; the body is never downloaded or cached
+    assert "GetObject" not in s3.requests
+    assert geojson_proxy._cache[("my-bucket", "data.geojson")]["texts"] == {}
+
+
+def test_only_served_bodies_are_cached(monkeypatch):
+    stub = StubS3()
+    plain = json.dumps(SAMPLE).encode()
+    stub.put_object(Bucket="b", Key="k", Body=gzip.compress(plain), ContentEncoding="gzip")
+    monkeypatch.setenv("GEOJSON_BUCKET", "b")
+    monkeypatch.setenv("GEOJSON_KEY", "k")
+    monkeypatch.setattr(geojson_proxy, "s3", stub)
+    # The gzip object fits as base64, its decompressed body does not
+    monkeypatch.setattr(geojson_proxy, "MAX_RESPONSE_BYTES", len(plain) - 1)
+    assert geojson_proxy.geojsonProxyFn({"headers": {"Accept-Encoding": "gzip"}}, None)["statusCode"] == 200
+    assert geojson_proxy.geojsonProxyFn({}, None)["statusCode"] == 302
+    assert set(geojson_proxy._cache[("b", "k")]["texts"]) == {"gzip"}
+
+
+def test_object_replaced_after_head_is_served_under_its_own_etag(s3, monkeypatch):
+    head = s3.head_object
+
+    def head_then_replace(**kwargs):
+        found = head(**kwargs)
+        if s3.requests["HeadObject"] == 1:
+            s3.put_object(Bucket="my-bucket", Key="data.geojson", Body=b'{"type":"FeatureCollection","features":[]}')
+        return found
+
+    monkeypatch.setattr(s3, "head_object", head_then_replace)
+    response = geojson_proxy.geojsonProxyFn({}, None)
+    assert json.loads(response["body"])["features"] == []
+    assert response["headers"]["ETag"] == s3.objects["my-bucket/data.geojson"]["ETag"]
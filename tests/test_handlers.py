@@ -1,10 +1,29 @@
 import os, sys
+import hashlib
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from ingest_lambda import handlers
+from ingest_lambda.dedup import RecordDeduper
+from ingest_lambda.feed_cache import NOT_MODIFIED, FeedCache, InMemoryFeedStateStore
 from ingest_lambda.handlers import (
     normalize_nsw_rfs,
     normalize_nasa_firms,
     normalize_nsw_epn,
 )
+from ingest_lambda.streaming import StreamedDocument
+
+
+@pytest.fixture(autouse=True)
+def fresh_ingest_state(monkeypatch):
+    """The module-level feed cache and deduper outlive a test; give each test its own."""
+    monkeypatch.setattr(handlers, "feed_cache", FeedCache(InMemoryFeedStateStore()))
+    monkeypatch.setattr(handlers, "deduper", RecordDeduper())
 
 
 def test_normalize_nsw_rfs():
@@ -78,3 +97,259 @@ def test_normalize_nsw_epn():
             },
         }
     ]
+
+
+def test_fetch_feeds_isolates_slow_and_failing_sources():
+    def fake_fetch(url, timeout=10, cache=None):
+        if url == "slow":
+            time.sleep(1.0)
+            return {"features": []}
+        if url == "broken":
+            raise RuntimeError("upstream 503")
+        return {"features": [{"properties": {"id": "ok"}}]}
+
+    feeds = [("a", "ok", None), ("b", "slow", None), ("c", "broken", None)]
+    with patch.object(handlers, "fetch_json", side_effect=fake_fetch):
+        started = time.monotonic()
+        result = handlers.fetch_feeds(feeds, budget=0.2)
+        elapsed = time.monotonic() - started
+    assert elapsed < 0.8
+    assert result == {"a": {"features": [{"properties": {"id": "ok"}}]}, "b": None, "c": None}
+
+
+def test_handler_keeps_healthy_sources():
+    fetched = {
+        "nsw_rfs": {"features": [{"properties": {"id": "1"}, "geometry": {"coordinates": [150.0, -33.0]}}]},
+        "nasa_firms": None,
+        "nsw_epn": {"records": []},
+    }
+    context = SimpleNamespace(get_remaining_time_in_millis=lambda: 30000)
+    sent = []
+
+    def fake_send(records):
+        sent.extend(records)
+        return {"sent": len(sent), "oversized": 0}
+
+    with patch.object(handlers, "fetch_feeds", return_value=fetched) as mock_fetch, patch.object(
+        handlers, "send_to_firehose", side_effect=fake_send
+    ):
+        result = handlers.handler({}, context)
+    assert mock_fetch.call_args[0][1] == 30 - handlers.FETCH_RESERVE_SECONDS
+    assert [rec["id"] for rec in sent] == ["1"]
+    assert result["records"] == 1
+    assert result["failed_sources"] == ["nasa_firms"]
+
+
+class _FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def test_fetch_json_conditional_and_digest_hits():
+    cache = FeedCache(InMemoryFeedStateStore())
+    body = b'{"features": []}'
+    first = _FakeResponse(200, body, {"ETag": '"v1"', "Last-Modified": "Mon, 02 Dec 2024 00:00:00 GMT"})
+    with patch.object(handlers.requests, "get", return_value=first) as mock_get:
+        assert handlers.fetch_json("http://feed", cache=cache) == {"features": []}
+    assert mock_get.call_args[1]["headers"] == {}
+    cache.commit()
+
+    with patch.object(handlers.requests, "get", return_value=_FakeResponse(304)) as mock_get:
+        assert handlers.fetch_json("http://feed", cache=cache) is NOT_MODIFIED
+    assert mock_get.call_args[1]["headers"] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 02 Dec 2024 00:00:00 GMT",
+    }
+
+    # Server ignores validators but the body is byte-identical
+    with patch.object(handlers.requests, "get", return_value=_FakeResponse(200, body)):
+        assert handlers.fetch_json("http://feed", cache=cache) is NOT_MODIFIED
+    assert cache.stats() == {"hits": 2, "misses": 1, "not_modified": 1}
+
+
+def test_feed_cache_not_committed_when_delivery_fails():
+    cache = FeedCache(InMemoryFeedStateStore())
+    assert cache.check("http://feed", 200, {}, b"v1") is False
+    cache.discard()
+    assert cache.check("http://feed", 200, {}, b"v1") is False
+    cache.commit()
+    assert cache.check("http://feed", 200, {}, b"v1") is True
+
+
+def test_streamed_document_matches_json_loads():
+    doc = {
+        "type": "FeatureCollection",
+        "metadata": {"note": "brackets ] and { inside strings", "list": [1, [2, 3]]},
+        "features": [
+            {"properties": {"fid": str(i), "acq_date": "2024-04-22", "acq_time": "0830", "frp": 12.5 + i}, "geometry": {"coordinates": [151.0 + i, -32.0]}}
+            for i in range(50)
+        ],
+    }
+    body = json.dumps(doc).encode("utf-8")
+    # Tiny chunks split tokens, numbers and strings across reads
+    chunks = (body[i : i + 7] for i in range(0, len(body), 7))
+    streamed = list(handlers.iter_nasa_firms(StreamedDocument(chunks)))
+    assert streamed == handlers.normalize_nasa_firms(doc)
+
+
+def test_streamed_numbers_split_at_every_point():
+    body = b'{"n": -1.5e10, "bbox": [1.25, 2.5], "features": [{"x": 3.0E-2}, {"x": 7}]}'
+    for cut in range(1, len(body)):
+        doc = StreamedDocument([body[:cut], body[cut:]])
+        assert doc.get("n") == -1.5e10, cut
+        assert list(doc.get("bbox")) == [1.25, 2.5], cut
+        assert list(doc.get("features")) == json.loads(body)["features"], cut
+
+
+def test_streamed_document_epn_fallback_key_and_digest():
+    body = json.dumps({"records": [], "data": [{"Site": "Sydney", "Date": "2024-04-22T00:00:00Z"}]}).encode("utf-8")
+    doc = StreamedDocument([body[:10], body[10:]])
+    assert [rec["id"] for rec in handlers.iter_nsw_epn(doc)] == ["Sydney"]
+    assert doc.finish() == hashlib.sha256(body).hexdigest()
+
+
+def test_streamed_epn_data_key_alone():
+    doc = {"meta": {"rows": 1}, "data": [{"Site": "Sydney", "Date": "2024-04-22T00:00:00Z"}]}
+    body = json.dumps(doc).encode("utf-8")
+    streamed = list(handlers.iter_nsw_epn(StreamedDocument(body[i : i + 5] for i in range(0, len(body), 5))))
+    assert streamed == handlers.normalize_nsw_epn(doc) and len(streamed) == 1
+
+
+def test_parse_error_mid_stream_fails_only_that_feed():
+    cache = FeedCache(InMemoryFeedStateStore())
+    truncated = b'{"features": [{"properties": {"fid": "1"}, "geometry": {"coordinates": [150.0, -33.0]}}, {"prop'
+    rfs = {"features": [{"properties": {"id": "r"}, "geometry": {"coordinates": [151.0, -33.0]}}]}
+    cache.check("rfs-url", 200, {}, b"rfs-v1")
+    cache.check("firms-url", 200, {}, b"firms-v1")
+    feeds = (
+        ("nasa_firms", "firms-url", handlers.iter_nasa_firms),
+        ("nsw_rfs", "rfs-url", handlers.iter_nsw_rfs),
+    )
+    fetched = {"nasa_firms": StreamedDocument([truncated], url="firms-url"), "nsw_rfs": rfs}
+    sent = []
+
+    def fake_send(records):
+        sent.extend(records)
+        return {"sent": len(sent), "oversized": 0}
+
+    with patch.object(handlers, "FEEDS", feeds), patch.object(handlers, "fetch_feeds", return_value=fetched), patch.object(
+        handlers, "send_to_firehose", side_effect=fake_send
+    ), patch.object(handlers, "feed_cache", cache):
+        result = handlers.handler({}, SimpleNamespace(get_remaining_time_in_millis=lambda: 30000))
+    # The hotspot parsed before the error and the healthy feed are both delivered
+    assert [rec["id"] for rec in sent] == ["1", "r"]
+    assert result["failed_sources"] == ["nasa_firms"]
+    # Only the healthy feed's version is remembered; the broken one is read again next run
+    assert cache.store.get("rfs-url") and cache.store.get("firms-url") is None
+
+
+def test_streamed_body_is_held_to_the_fetch_deadline():
+    hotspot = b'{"properties": {"fid": "%d"}, "geometry": {"coordinates": [150.0, -33.0]}}'
+
+    class _TricklingResponse(_FakeResponse):
+        closed = False
+
+        def iter_content(self, chunk_size):
+            yield b'{"features": [' + hotspot % 0
+            for i in range(1, 50):
+                time.sleep(0.05)
+                yield b", " + hotspot % i
+            yield b"]}"
+
+        def close(self):
+            self.closed = True
+
+    resp = _TricklingResponse(200)
+    sent = []
+
+    def fake_send(records):
+        sent.extend(records)
+        return {"sent": len(sent), "oversized": 0}
+
+    feeds = (("nasa_firms", "firms-url", handlers.iter_nasa_firms),)
+    with patch.object(handlers, "FEEDS", feeds), patch.object(handlers, "STREAMING_INGEST", True), patch.object(
+        handlers, "FETCH_SOURCE_TIMEOUT", 0.3
+    ), patch.object(handlers.requests, "get", return_value=resp), patch.object(
+        handlers, "send_to_firehose", side_effect=fake_send
+    ):
+        started = time.monotonic()
+        result = handlers.handler({}, SimpleNamespace(get_remaining_time_in_millis=lambda: 30000))
+        elapsed = time.monotonic() - started
+    # Reading stops at the deadline instead of waiting out the whole body
+    assert elapsed < 1.0 and resp.closed
+    assert result["failed_sources"] == ["nasa_firms"]
+    assert 0 < len(sent) < 50
+
+
+def test_slow_sending_does_not_use_up_later_feeds_read_time():
+    class _ChunkedResponse(_FakeResponse):
+        def iter_content(self, chunk_size):
+            for i in range(0, len(self.content), 64):
+                yield self.content[i : i + 64]
+
+        def close(self):
+            pass
+
+    firms = {"features": [{"properties": {"fid": str(i)}, "geometry": {"coordinates": [150.0, -33.0]}} for i in range(20)]}
+    epn = {"records": [{"Site": f"s{i}", "Date": "2024-04-22T00:00:00Z"} for i in range(20)]}
+    bodies = {"firms-url": json.dumps(firms).encode(), "epn-url": json.dumps(epn).encode()}
+    sent = []
+
+    def slow_send(records):
+        for record in records:
+            # Firehose takes 0.6s in all, twice the per-source timeout
+            time.sleep(0.015)
+            sent.append(record)
+        return {"sent": len(sent), "oversized": 0}
+
+    feeds = (("nasa_firms", "firms-url", handlers.iter_nasa_firms), ("nsw_epn", "epn-url", handlers.iter_nsw_epn))
+    with patch.object(handlers, "FEEDS", feeds), patch.object(handlers, "STREAMING_INGEST", True), patch.object(
+        handlers, "FETCH_SOURCE_TIMEOUT", 0.3
+    ), patch.object(
+        handlers.requests, "get", side_effect=lambda url, **kwargs: _ChunkedResponse(200, bodies[url])
+    ), patch.object(handlers, "send_to_firehose", side_effect=slow_send):
+        result = handlers.handler({}, SimpleNamespace(get_remaining_time_in_millis=lambda: 30000))
+    assert result["failed_sources"] == [] and len(sent) == 40
+
+
+def test_oversized_records_do_not_block_the_cache_commit():
+    cache = FeedCache(InMemoryFeedStateStore())
+    cache.check("rfs-url", 200, {}, b"rfs-v1")
+    huge = {"properties": {"id": "big", "pad": "x" * (1100 * 1024)}, "geometry": {"coordinates": [150.0, -33.0]}}
+    small = {"properties": {"id": "ok"}, "geometry": {"coordinates": [151.0, -33.0]}}
+    client = MagicMock()
+    client.put_record_batch.return_value = {"FailedPutCount": 0}
+    deduper = RecordDeduper()
+    with patch.object(handlers, "FEEDS", (("nsw_rfs", "rfs-url", handlers.iter_nsw_rfs),)), patch.object(
+        handlers, "fetch_feeds", return_value={"nsw_rfs": {"features": [huge, small]}}
+    ), patch.object(handlers, "firehose", client), patch.object(handlers, "deduper", deduper), patch.object(
+        handlers, "feed_cache", cache
+    ):
+        result = handlers.handler({}, SimpleNamespace(get_remaining_time_in_millis=lambda: 30000))
+    assert result["records"] == 2 and result["oversized"] == 1
+    assert client.put_record_batch.call_count == 1
+    # The record that can never fit is not retried: the feed version and both fingerprints are kept
+    assert cache.store.get("rfs-url")
+    assert deduper.stats()["fingerprints"] == 2
+
+
+def test_send_to_firehose_batches_by_count_and_bytes():
+    client = MagicMock()
+    client.put_record_batch.return_value = {"FailedPutCount": 0}
+    records = ({"id": i, "raw": {"pad": "x" * 20000}} for i in range(600))
+    with patch.object(handlers, "firehose", client):
+        assert handlers.send_to_firehose(records)["sent"] == 600
+    sizes = [len(call[1]["Records"]) for call in client.put_record_batch.call_args_list]
+    assert sum(sizes) == 600
+    for call in client.put_record_batch.call_args_list:
+        batch = call[1]["Records"]
+        assert len(batch) <= 500
+        assert sum(len(r["Data"]) for r in batch) <= 4 * 1024 * 1024
@@ -0,0 +1,132 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from shapely.geometry import Point, box
+
+from geojson_processor.incremental import PerimeterState, full_recompute, update_perimeter
+from ingest_lambda.dedup import RecordDeduper
+from ingest_lambda.feed_cache import FeedCache, InMemoryFeedStateStore
+
+
+def _same(a, b):
+    if a.is_empty or b.is_empty:
+        return a.is_empty and b.is_empty
+    return a.hausdorff_distance(b) < 1e-7 and abs(a.area - b.area) < 1e-7
+
+
+def _random_geometries(rng):
+    geoms = []
+    for _ in range(rng.randint(0, 4)):
+        x, y = rng.uniform(140, 150), rng.uniform(-38, -28)
+        if rng.random() < 0.3:
+            geoms.append(Point(x, y))
+        else:
+            size = rng.uniform(0.05, 1.5)
+            geoms.append(box(x, y, x + size, y + size))
+    return geoms
+
+
+def test_incremental_matches_full_recompute_property():
+    """Random add/overwrite/delete/advance sequences always agree with a full recompute."""
+    for seed in range(30):
+        rng = random.Random(seed)
+        window = rng.choice([0, 3 * 3600, 10 * 3600])
+        bucket = {}
+        now = 1_700_000_000.0
+        state = PerimeterState(3600)
+        serial = 0
+
+        def listing():
+            return [{"Key": k, "ETag": v["etag"], "LastModified": v["ts"]} for k, v in sorted(bucket.items())]
+
+        def load(objects):
+            return [(obj, bucket[obj["Key"]]["geoms"]) for obj in objects]
+
+        for _ in range(25):
+            op = rng.random()
+            if op < 0.5 or not bucket:
+                for _ in range(rng.randint(1, 3)):
+                    serial += 1
+                    bucket[f"raw/{serial:05d}"] = {"etag": f"e{serial}", "ts": now, "geoms": _random_geometries(rng)}
+            elif op < 0.6:
+                key = rng.choice(sorted(bucket))
+                serial += 1
+                bucket[key] = {"etag": f"e{serial}", "ts": bucket[key]["ts"], "geoms": _random_geometries(rng)}
+            elif op < 0.7:
+                del bucket[rng.choice(sorted(bucket))]
+            now += rng.choice([60, 300, 1800, 3600, 7200])
+            if rng.random() < 0.3:
+                state = PerimeterState.from_bytes(state.to_bytes(), 3600)
+
+            merged, _ = update_perimeter(state, listing(), load, now, window)
+            expected = full_recompute(listing(), load, now, window, 3600)
+            assert _same(merged, expected), f"seed {seed} diverged"
+
+
+def test_incremental_only_loads_new_objects():
+    state = PerimeterState(3600)
+    objects = [{"Key": "a", "ETag": "1", "LastModified": 0.0}]
+    loaded = []
+
+    def load(objs):
+        loaded.extend(o["Key"] for o in objs)
+        return [(o, [box(0, 0, 1, 1)]) for o in objs]
+
+    update_perimeter(state, objects, load, now=10)
+    objects.append({"Key": "b", "ETag": "1", "LastModified": 20.0})
+    merged, stats = update_perimeter(state, objects, load, now=30)
+    assert loaded == ["a", "b"]
+    assert stats["objects_processed"] == 1
+    assert merged.area == 1.0
+
+
+def test_slices_split_by_source_and_round_trip():
+    state = PerimeterState(3600)
+    objects = [{"Key": "a", "ETag": "1", "LastModified": 100.0}, {"Key": "b", "ETag": "1", "LastModified": 200.0}]
+    groups = {"a": {"MODIS": [box(0, 0, 1, 1)]}, "b": {"VIIRS": [box(2, 2, 3, 3)], "MODIS": [box(0, 0, 2, 1)]}}
+
+    merged, stats = update_perimeter(state, objects, lambda objs: [(o, groups[o["Key"]]) for o in objs], now=300)
+    assert set(state.buckets) == {(0, "MODIS"), (0, "VIIRS")}
+    assert state.buckets[(0, "MODIS")].area == 2.0
+    assert stats["slices"] == 1
+    assert merged.area == 3.0
+
+    restored = PerimeterState.from_bytes(state.to_bytes(), 3600)
+    assert set(restored.buckets) == set(state.buckets)
+    assert restored.merged().area == 3.0
+
+
+def test_unchanged_incident_outlives_the_window():
+    """An incident listed unchanged for 100 h stays in a 72 h perimeter.
+
+    For 50 h another record in the feed changes every hour, so only the
+    deduper can hold the incident back; then the whole feed stops changing.
+    """
+    now = [1_700_000_000.0]
+    ttl, window = 25 * 3600, 72 * 3600
+    cache = FeedCache(InMemoryFeedStateStore(), max_age=ttl, clock=lambda: now[0])
+    deduper = RecordDeduper(ttl=ttl, clock=lambda: now[0])
+    incident = {"source": "rfs", "id": "fire-1", "latitude": -33.0, "longitude": 150.0, "timestamp": "t", "raw": {}}
+    state, bucket, sent = PerimeterState(3600), {}, []
+
+    def load(objects):
+        return [(obj, bucket[obj["Key"]]) for obj in objects]
+
+    for hour in range(100):
+        updates = hour < 50
+        feed = [incident, {**incident, "id": "burn-off", "raw": {"hour": hour}}] if updates else [incident]
+        body = f"{hour}".encode() if updates else b"quiet"
+        if not cache.check("http://feed", 200, {}, body):
+            records = deduper.filter(feed)
+            bucket[f"raw/{hour:03d}"] = [Point(150.0, -33.0).buffer(0.01) for rec in records if rec is incident]
+            sent += [hour for rec in records if rec is incident]
+        cache.commit()
+        deduper.commit()
+        listing = [{"Key": key, "ETag": "e", "LastModified": 1_700_000_000.0 + int(key[4:]) * 3600} for key in bucket]
+        merged, _ = update_perimeter(state, listing, load, now[0], window)
+        assert not merged.is_empty, f"incident dropped after {hour} h"
+        now[0] += 3600
+    assert sent == [0, 25, 50, 75]
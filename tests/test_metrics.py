@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import importlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+from common import metrics  # noqa: E402
+from ingest_lambda.firehose_writer import FirehoseWriter  # noqa: E402
+from geojson_processor.reader import iter_firehose_objects  # noqa: E402
+from stubs import StubEventBridge, StubExpoServer, StubFirehose, StubS3  # noqa: E402
+
+rule_eval = importlib.import_module("lambda.rule_eval")
+push_bridge = importlib.import_module("lambda.push_bridge")
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_render_counters_and_cumulative_buckets():
+    hits = metrics.counter("test_hits_total", "Hits")
+    sizes = metrics.histogram("test_sizes", "Sizes", (1, 10))
+    hits.inc(source="a")
+    hits.inc(2, source='quo"te')
+    for value in (0.5, 1, 5, 50):
+        sizes.observe(value)
+    text = metrics.render()
+    assert "# TYPE test_hits_total counter" in text
+    assert 'test_hits_total{source="a"} 1' in text
+    assert 'test_hits_total{source="quo\\"te"} 2' in text
+    # Buckets are inclusive upper bounds and cumulative
+    assert 'test_sizes_bucket{le="1"} 2' in text
+    assert 'test_sizes_bucket{le="10"} 3' in text
+    assert 'test_sizes_bucket{le="+Inf"} 4' in text
+    assert "test_sizes_sum 56.5" in text and "test_sizes_count 4" in text
+    assert metrics.counter("test_hits_total", "Hits") is hits
+    with pytest.raises(ValueError):
+        metrics.histogram("test_hits_total", "Hits")
+    with pytest.raises(ValueError):
+        hits.inc(-1)
+
+
+def test_timer_labels_can_be_set_inside_the_block():
+    timer = metrics.histogram("test_block_seconds", "Block")
+    with timer.time(outcome="ok") as labels:
+        labels["outcome"] = "error"
+    assert timer.count(outcome="error") == 1 and timer.count(outcome="ok") == 0
+
+
+def test_otlp_mirror_records_the_same_values(monkeypatch):
+    sdk = pytest.importorskip("opentelemetry.sdk.metrics")
+    from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+    reader = InMemoryMetricReader()
+    provider = sdk.MeterProvider(metric_readers=[reader])
+    monkeypatch.setattr(metrics, "METRICS_EXPORTER", "otlp")
+    monkeypatch.setattr(metrics, "_provider", provider)
+    monkeypatch.setattr(metrics, "_meter", provider.get_meter("test"))
+    sent = metrics.counter("test_mirrored_total", "Mirrored")
+    monkeypatch.setattr(sent, "_mirror", None)
+    sent.inc(3, source="rfs")
+    assert metrics.flush()
+    exported = {
+        metric.name: [(dict(point.attributes), point.value) for point in metric.data.data_points]
+        for resource in reader.get_metrics_data().resource_metrics
+        for scope in resource.scope_metrics
+        for metric in scope.metrics
+    }
+    assert exported["test_mirrored_total"] == [({"source": "rfs"}, 3)]
+
+
+def test_firehose_writer_counts_batches_and_final_failures():
+    writer = FirehoseWriter(StubFirehose(), "stream")
+    writer.put_records({"id": str(i)} for i in range(1200))
+    batches = metrics.histogram("firehose_batch_entries", "")
+    assert batches.count() == 3 and batches.sum() == 1200
+
+    class Failing:
+        def put_record_batch(self, DeliveryStreamName, Records):
+            return {"FailedPutCount": len(Records), "RequestResponses": [{"ErrorCode": "ServiceUnavailableException"}] * len(Records)}
+
+    FirehoseWriter(Failing(), "stream", max_attempts=2, sleep=lambda s: None).put_records([{"id": "x"}])
+    failed = metrics.counter("firehose_failed_entries_total", "")
+    assert failed.value(final="false") == 2 and failed.value(final="true") == 1
+
+
+def test_processor_counts_objects_and_fires():
+    s3 = StubS3()
+    for n in range(3):
+        body = "".join(json.dumps({"latitude": -33.0, "longitude": 150.0 + n, "source": "nasa_firms"}) + "\n" for _ in range(4))
+        s3.put_object(Bucket="raw", Key=f"2026/obj-{n}", Body=body.encode())
+    list(iter_firehose_objects(s3, "raw", "2026/", download_workers=1))
+    text = metrics.render()
+    assert "processor_s3_objects_read_total 3" in text
+    assert "fires_processed_total 12" in text
+    assert metrics.histogram("processor_s3_get_seconds", "").count() == 3
+
+
+def test_rule_eval_times_publishes_and_counts_transitions(monkeypatch):
+    monkeypatch.setattr(rule_eval, "eventbridge", StubEventBridge())
+    monkeypatch.setattr(rule_eval, "_backoff", lambda attempt: None)
+    rule_eval._local_windows.clear()
+    images = {"NewImage": {"intersects": {"BOOL": True}, "region": {"S": "r"}, "fence_id": {"S": "f1"}}}
+    event = {"Records": [{"eventName": "INSERT", "dynamodb": dict(images, SequenceNumber="1")}]}
+    rule_eval.lambda_handler(event, None)
+    # The same fence again inside its window is coalesced
+    rule_eval.lambda_handler(event, None)
+    rule_eval._local_windows.clear()
+    assert rule_eval.PUBLISH_SECONDS.count(outcome="ok") == 1
+    assert rule_eval.EVENTS_PUBLISHED.value(outcome="ok") == 1
+    assert rule_eval.TRANSITIONS.value(coalesced="false") == 1
+    assert rule_eval.TRANSITIONS.value(coalesced="true") == 1
+
+
+def test_push_bridge_counts_outcomes(monkeypatch):
+    monkeypatch.delenv("EXPO_TOKEN", raising=False)
+    monkeypatch.delenv("EXPO_TOKEN_SECRET_ARN", raising=False)
+    with StubExpoServer(invalid_tokens={"bad"}) as expo:
+        monkeypatch.setattr(push_bridge, "EXPO_URL", expo.url)
+        monkeypatch.setattr(push_bridge, "_client", None)
+        body = json.dumps({"detail": {"device_tokens": ["a", "b", "bad"]}})
+        push_bridge.lambda_handler({"Records": [{"messageId": "m0", "body": body}]}, None)
+    monkeypatch.setattr(push_bridge, "_client", None)
+    assert push_bridge.SEND_SECONDS.count(status=200) == 1
+    assert push_bridge.MESSAGES.value(outcome="ok") == 2
+    assert push_bridge.MESSAGES.value(outcome="DeviceNotRegistered") == 1
+
+
+def test_ecs_app_serves_prometheus_text():
+    pytest.importorskip("opentelemetry.instrumentation.flask")
+    app = importlib.import_module("ecs.app").app
+    metrics.counter("fires_processed_total", "").inc(5)
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200 and response.mimetype == "text/plain"
+    assert "fires_processed_total 5" in response.get_data(as_text=True)
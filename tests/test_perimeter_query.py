@@ -0,0 +1,155 @@
+import os
+import sys
+import json
+
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import LineString, MultiPolygon, Point, Polygon, box
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from api import perimeter_query
+from geojson_processor.spatial_index import build_index
+from stubs import StubS3
+
+SOURCES = ["MODIS", "VIIRS"]
+
+
+def _index(count=40):
+    """Boxes along a diagonal; even ones seen by MODIS, odd by VIIRS, later ones more recently."""
+    parts = np.array([box(140 + i, -40 + i * 0.5, 140.5 + i, -39.5 + i * 0.5) for i in range(count)], dtype=object)
+    attributes = {
+        "first_seen": np.arange(count) * 3600,
+        "last_seen": np.arange(count) * 3600 + 3600,
+        "sources": np.where(np.arange(count) % 2 == 0, 1, 2),
+    }
+    return build_index(parts, attributes, SOURCES, node_size=4)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    perimeter_query._indexes.clear()
+    yield
+    perimeter_query._indexes.clear()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    stub = StubS3()
+    stub.put_object(Bucket="my-bucket", Key="fire.index.ndjson", Body=_index())
+    monkeypatch.setenv("GEOJSON_BUCKET", "my-bucket")
+    monkeypatch.setenv("GEOJSON_INDEX_KEY", "fire.index.ndjson")
+    monkeypatch.setattr(perimeter_query, "s3", stub)
+    return stub
+
+
+def _query(**params):
+    response = perimeter_query.perimeterQueryFn({"queryStringParameters": params or None}, None)
+    assert response["statusCode"] == 200, response
+    return json.loads(response["body"])
+
+
+def test_no_bucket(monkeypatch):
+    monkeypatch.delenv("GEOJSON_BUCKET", raising=False)
+    assert perimeter_query.perimeterQueryFn({}, None)["statusCode"] == 500
+
+
+def test_index_not_written_yet(s3):
+    s3.delete_object(Bucket="my-bucket", Key="fire.index.ndjson")
+    response = perimeter_query.perimeterQueryFn({}, None)
+    assert response["statusCode"] == 503
+    assert json.loads(response["body"]) == {"error": "index not ready"}
+
+
+def test_all_features_newest_first(s3):
+    body = _query()
+    assert body["type"] == "FeatureCollection"
+    assert body["matched"] == 40 and not body["truncated"]
+    seen = [f["properties"]["last_seen"] for f in body["features"]]
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_bbox_since_source_and_limit(s3):
+    body = _query(bbox="144,-40,150,-30")
+    assert sorted(f["properties"]["first_seen"] // 3600 for f in body["features"]) == list(range(4, 11))
+
+    body = _query(bbox="144,-40,150,-30", since="1970-01-01T06:00:00Z")
+    assert sorted(f["properties"]["first_seen"] // 3600 for f in body["features"]) == list(range(5, 11))
+
+    body = _query(bbox="144,-40,150,-30", source="VIIRS")
+    assert all(f["properties"]["sources"] == ["VIIRS"] for f in body["features"])
+    assert body["matched"] == 3
+
+    body = _query(source="MODIS,unknown", limit="5")
+    assert body["matched"] == 20 and len(body["features"]) == 5 and body["truncated"]
+    assert body["features"][0]["properties"]["first_seen"] == 38 * 3600
+
+    assert _query(source="GOES")["features"] == []
+    assert _query(since="1e9")["features"] == []
+
+
+def test_bbox_matches_geometry_not_just_its_bounding_box():
+    # An L-shaped perimeter and a ring with a hole; both bounding boxes cover the query box
+    ell = Polygon([(150, -34), (152, -34), (152, -33.8), (150.2, -33.8), (150.2, -32), (150, -32), (150, -34)])
+    ring = box(140, -40, 144, -36).difference(box(141, -39, 143, -37))
+    parts = np.array([ell, ring], dtype=object)
+    index = perimeter_query.parse_index(build_index(parts, {}, SOURCES))
+    for bbox, matched in [
+        ("151,-33.5,151.5,-33", 0),
+        ("151,-33.9,151.5,-33", 1),
+        ("141.5,-38.5,142.5,-37.5", 0),
+        ("141.5,-38.5,142.5,-36.5", 1),
+        ("139,-41,145,-35", 1),
+    ]:
+        body = json.loads(perimeter_query.query(index, {"bbox": bbox})["body"])
+        assert body["matched"] == matched, bbox
+
+
+def test_intersects_agrees_with_shapely():
+    rng = np.random.default_rng(3)
+    shapes = [
+        Polygon([(0, 0), (4, 0), (4, 1), (1, 1), (1, 4), (0, 4)]),
+        box(0, 0, 4, 4).difference(box(1, 1, 3, 3)),
+        MultiPolygon([box(0, 0, 1, 1), box(3, 3, 4, 4)]),
+        LineString([(0, 0), (4, 4), (4, 0)]),
+        Point(2, 2),
+    ]
+    for shape in shapes:
+        for _ in range(200):
+            x, y = rng.uniform(-1, 5, 2)
+            w, h = rng.uniform(0.05, 2, 2)
+            query = (x, y, x + w, y + h)
+            geometry = json.loads(shapely.to_geojson(shape))
+            assert perimeter_query.intersects(geometry, query) == shape.intersects(box(*query)), (shape.wkt, query)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [{"bbox": "1,2,3"}, {"bbox": "5,0,1,1"}, {"bbox": "a,b,c,d"}, {"since": "yesterday"}, {"limit": "0"}, {"limit": "x"}],
+)
+def test_bad_parameters(s3, params):
+    response = perimeter_query.perimeterQueryFn({"queryStringParameters": params}, None)
+    assert response["statusCode"] == 400
+    assert "error" in json.loads(response["body"])
+
+
+def test_index_loaded_once_and_revalidated(s3, monkeypatch):
+    _query()
+    _query(bbox="140,-40,141,-39")
+    assert s3.requests["GetObject"] == 1
+
+    monkeypatch.setattr(perimeter_query, "REVALIDATE_SECONDS", 0)
+    _query()
+    assert s3.requests["GetObject"] == 1 and s3.requests["HeadObject"] == 1
+
+    s3.put_object(Bucket="my-bucket", Key="fire.index.ndjson", Body=_index(count=3))
+    assert _query()["matched"] == 3
+    assert s3.requests["GetObject"] == 2
+
+
+def test_response_size_cap(s3, monkeypatch):
+    monkeypatch.setattr(perimeter_query, "MAX_RESPONSE_BYTES", 2000)
+    body = _query()
+    assert body["truncated"] and 0 < len(body["features"]) < 40
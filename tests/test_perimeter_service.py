@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import importlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from geojson_processor import main, service  # noqa: E402
+from geojson_processor.incremental import S3StateStore  # noqa: E402
+from stubs import StubS3, StubSQS  # noqa: E402
+
+RAW, OUT = "raw", "out"
+
+
+def _fire(s3, key, x, source="VIIRS"):
+    """A 0.1 degree square fire at longitude ``x`` reported by ``source``."""
+    body = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Polygon", "coordinates": [[[x, -33], [x + 0.1, -33], [x + 0.1, -32.9], [x, -32.9], [x, -33]]]},
+                "properties": {"source": source},
+            }
+        ],
+    }
+    s3.put_object(Bucket=RAW, Key=key, Body=json.dumps(body))
+
+
+@pytest.fixture(autouse=True)
+def quick_outputs(monkeypatch):
+    monkeypatch.setattr(main, "TILE_WORKERS", 0)
+    monkeypatch.setattr(main, "PARSE_WORKERS", 0)
+    monkeypatch.setattr(main, "OUTPUT_ZOOM_BANDS", [])
+    monkeypatch.setattr(main, "VECTOR_TILE_PREFIX", "")
+    monkeypatch.setattr(main, "FENCES_TABLE", "")
+    monkeypatch.setattr(service, "MIN_PUBLISH_SECONDS", 10)
+    monkeypatch.setattr(service, "CHECKPOINT_SECONDS", 60)
+
+
+@pytest.fixture
+def app_module(monkeypatch):
+    pytest.importorskip("opentelemetry.instrumentation.flask")
+    module = importlib.import_module("ecs.app")
+    monkeypatch.setattr(module, "engine", None)
+    return module
+
+
+@pytest.fixture
+def s3():
+    stub = StubS3()
+    _fire(stub, "2026/10/18/01/a", 150.0)
+    _fire(stub, "2026/10/18/01/b", 151.0, "MODIS")
+    return stub
+
+
+def _engine(s3, source=None, **kwargs):
+    source = source or service.ListingSource(s3, RAW, "2026/")
+    return service.PerimeterEngine(s3, source, OUT, "fire.geojson", window_seconds=0, **kwargs)
+
+
+def _served(app_module, engine):
+    app_module.engine = engine
+    return app_module.app.test_client()
+
+
+def test_listing_engine_folds_only_new_keys_and_debounces_publish(s3, monkeypatch):
+    monkeypatch.setattr(main, "INDEX_KEY", "fire.index.ndjson")
+    engine = _engine(s3)
+    stats = engine.step(now=1000.0)
+    assert stats["objects_processed"] == 2
+    assert f"{OUT}/fire.geojson" in s3.objects and f"{OUT}/fire.index.ndjson" in s3.objects
+    published = s3.objects[f"{OUT}/fire.geojson"]["ETag"]
+
+    # Nothing new: no fold, and the listing starts after the newest key
+    assert engine.step(now=1001.0) == {}
+    _fire(s3, "2026/10/18/02/c", 152.0)
+    stats = engine.step(now=1002.0)
+    assert stats["objects_processed"] == 1
+    # The served index already has the new fire; S3 waits for MIN_PUBLISH_SECONDS
+    assert engine.index.count(b"\n") - 1 == 3
+    assert engine.pending and s3.objects[f"{OUT}/fire.geojson"]["ETag"] == published
+    engine.step(now=1010.0)
+    assert not engine.pending and s3.objects[f"{OUT}/fire.geojson"]["ETag"] != published
+
+
+def test_fences_rescanned_only_when_the_perimeter_changes(s3, monkeypatch):
+    scans = []
+    monkeypatch.setattr(main, "update_fences", lambda perimeter: scans.append(perimeter))
+    monkeypatch.setattr(service, "FENCE_REFRESH_SECONDS", 300)
+    engine = _engine(s3)
+    engine.step(now=1000.0)
+    assert len(scans) == 1
+    # A repeat of a known fire republishes but leaves the geometry, and the flags, as they were
+    _fire(s3, "2026/10/18/02/c", 150.0)
+    engine.step(now=1020.0)
+    assert not engine.pending and len(scans) == 1
+    _fire(s3, "2026/10/18/02/d", 152.0)
+    engine.step(now=1040.0)
+    assert len(scans) == 2
+    # With nothing new, fences added since the last scan are still picked up on the refresh
+    engine.step(now=1200.0)
+    assert len(scans) == 2
+    engine.step(now=1340.0)
+    assert len(scans) == 3
+
+
+def test_listing_relist_picks_up_out_of_order_keys_and_deletions(s3, monkeypatch):
+    engine = _engine(s3, service.ListingSource(s3, RAW, "2026/", relist_seconds=100), publish_outputs=False)
+    engine.step(now=1000.0)
+    _fire(s3, "2026/10/18/00/late", 153.0)
+    s3.delete_object(Bucket=RAW, Key="2026/10/18/01/a")
+    # Sorts before the newest key seen, and the delete leaves no trace in a StartAfter listing
+    assert engine.step(now=1010.0) == {}
+    stats = engine.step(now=1100.0)
+    assert stats["objects_listed"] == 2 and stats["slices_rebuilt"] == 1
+    assert sorted(engine.listing) == ["2026/10/18/00/late", "2026/10/18/01/b"]
+
+
+def test_queue_engine_consumes_notifications_and_deletes_them(s3):
+    queue = StubSQS()
+    s3.notify(queue)
+    source = service.QueueSource(s3, queue, queue.url, RAW, "2026/", wait_seconds=0)
+    engine = _engine(s3, source, publish_outputs=False)
+    engine.step(now=1000.0)
+    assert len(engine.listing) == 2
+
+    _fire(s3, "2026/10/18/02/c", 152.0)
+    s3.put_object(Bucket=RAW, Key="other/ignored", Body=b"{}")
+    s3.delete_object(Bucket=RAW, Key="2026/10/18/01/a")
+    lists = s3.requests["ListObjectsV2"]
+    stats = engine.step(now=1001.0)
+    # The delete rebuilds the slice: the new object plus the surviving one are read
+    assert stats["objects_processed"] == 2 and stats["slices_rebuilt"] == 1
+    assert sorted(engine.listing) == ["2026/10/18/01/b", "2026/10/18/02/c"]
+    # Notifications replace listing calls, and are deleted once folded in
+    assert s3.requests["ListObjectsV2"] == lists
+    assert len(queue) == 0
+
+
+def test_shared_bucket_outputs_are_not_reingested(s3, monkeypatch):
+    monkeypatch.setattr(main, "INDEX_KEY", "fire.index.ndjson")
+    monkeypatch.setattr(main, "VECTOR_TILE_PREFIX", "tiles/")
+    monkeypatch.setattr(main, "VECTOR_TILE_MAX_ZOOM", 2)
+    assert main.raw_key_filter(RAW, OUT, "fire.geojson") is None
+    source = service.ListingSource(s3, RAW, "", ignore=main.raw_key_filter(RAW, RAW, "fire.geojson"))
+    engine = service.PerimeterEngine(s3, source, RAW, "fire.geojson", S3StateStore(s3, RAW, main.STATE_KEY), 0)
+    engine.step(now=1000.0)
+    engine.checkpoint(1000.0)
+    assert any(key.startswith(f"{RAW}/tiles/") for key in s3.objects)
+    assert engine.step(now=1100.0) == {}
+    assert sorted(engine.listing) == ["2026/10/18/01/a", "2026/10/18/01/b"]
+
+
+def test_restart_resumes_from_checkpoint(s3):
+    store = S3StateStore(s3, OUT, "state.json")
+    engine = _engine(s3, store=store, publish_outputs=False)
+    engine.step(now=1000.0)
+    engine.stop()
+    restarted = _engine(s3, store=store, publish_outputs=False)
+    assert restarted.step(now=2000.0)["objects_processed"] == 0
+    assert restarted.index.count(b"\n") - 1 == 2
+
+
+def test_health_reports_freshness(s3, app_module, monkeypatch):
+    monkeypatch.setattr(service, "STALE_SECONDS", 60)
+    engine = _engine(s3, publish_outputs=False)
+    client = _served(app_module, engine)
+    response = client.get("/health")
+    assert response.status_code == 503 and response.get_json()["status"] == "starting"
+
+    engine.step()
+    body = client.get("/health").get_json()
+    assert body["status"] == "ok" and body["objects"] == 2 and body["publish_lag_s"] is not None
+    assert body["last_poll_age_s"] < 5 and body["pending_publish"] is False
+
+    engine.last_poll -= 120
+    response = client.get("/health")
+    assert response.status_code == 503 and response.get_json()["status"] == "stale"
+
+
+def test_perimeters_served_from_memory(s3, app_module):
+    client = _served(app_module, _engine(s3, publish_outputs=False))
+    assert client.get("/perimeters").status_code == 503
+    app_module.engine.step()
+    requests = dict(s3.requests)
+
+    body = client.get("/perimeters").get_json()
+    assert len(body["features"]) == 2 and body["matched"] == 2
+    body = client.get("/perimeters?bbox=150.9,-33.5,151.5,-32&source=MODIS").get_json()
+    assert [f["properties"]["sources"] for f in body["features"]] == [["MODIS"]]
+    assert client.get("/perimeters?limit=0").status_code == 400
+    # Queries never touch S3
+    assert s3.requests == requests
@@ -0,0 +1,71 @@
+import os
+import sys
+import argparse
+import importlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import bench_pipeline  # noqa: E402
+from stubs import StubDynamoDB, StubFirehoseDelivery, StubS3  # noqa: E402
+
+rule_eval = importlib.import_module("lambda.rule_eval")
+push_bridge = importlib.import_module("lambda.push_bridge")
+
+
+def test_dynamodb_stand_in_streams_old_and_new_images():
+    client = StubDynamoDB(stream_tables=("fences",))
+    item = {"user_id": {"S": "u"}, "fence_id": {"S": "f"}}
+    client.put_item(TableName="fences", Item=item)
+    scanned = client.scan(TableName="fences")["Items"][0]
+    # Updating a scanned item in place must not rewrite the stored image
+    scanned["intersects"] = {"BOOL": True}
+    client.batch_write_item(RequestItems={"fences": [{"PutRequest": {"Item": scanned}}]})
+    client.delete_item(TableName="fences", Key=item)
+    client.put_item(TableName="other", Item=item)
+    insert, modify, remove = client.streams["fences"]
+    assert (insert["eventName"], modify["eventName"], remove["eventName"]) == ("INSERT", "MODIFY", "REMOVE")
+    assert "intersects" not in modify["dynamodb"]["OldImage"]
+    assert modify["dynamodb"]["NewImage"]["intersects"] == {"BOOL": True}
+    assert insert["dynamodb"]["SequenceNumber"] < modify["dynamodb"]["SequenceNumber"]
+    assert remove["dynamodb"]["Keys"] == item and "other" not in client.streams
+
+
+def test_firehose_stand_in_buffers_into_objects():
+    s3 = StubS3()
+    firehose = StubFirehoseDelivery(s3, "raw", prefix="p/", buffer_bytes=10)
+    firehose.put_record_batch("stream", [{"Data": b"abcd\n"}])
+    assert not s3.objects
+    firehose.put_record_batch("stream", [{"Data": b"efgh\n"}, {"Data": b"ij\n"}])
+    firehose.put_record_batch("stream", [{"Data": b"kl\n"}])
+    assert firehose.flush() == 2 and firehose.flush() == 2
+    keys = sorted(s3.objects)
+    assert keys[0].startswith("raw/p/") and "/stream-1-" in keys[0]
+    assert [s3.objects[key]["Body"] for key in keys] == [b"abcd\nefgh\nij\n", b"kl\n"]
+
+
+def test_pipeline_runs_end_to_end_at_small_scale():
+    args = argparse.Namespace(
+        hotspots=600, fences=300, subscribers=50, fences_per_subscriber=3, devices=2, incidents=5, sites=2,
+        cycles=2, latency_ms=0, feed_latency_ms=0, buffer_mib=0.01, stream_batch=50, queue_batch=10, workers=0, seed=0,
+    )
+    try:
+        stages, totals = bench_pipeline.run(args)
+    finally:
+        rule_eval._local_windows.clear()
+        push_bridge._device_cache.clear()
+    assert list(stages) == list(bench_pipeline.STAGES)
+    readings = 2 * 2 * len(bench_pipeline.POLLUTANTS)
+    assert stages["ingest"]["records"] == 2 * 600 + 5 + readings
+    # EPN readings go to the air-quality rollup, not the perimeter
+    assert stages["processor"]["records"] == stages["ingest"]["records"] - readings
+    assert totals["firehose_objects"] > 2
+    # Every flag flip reached rule_eval and every alert reached a device
+    assert stages["rule_eval"]["stream_records"] == totals["transitions"] > 0
+    assert totals["events"] > 0 and stages["push_bridge"]["messages"] == totals["messages_delivered"] > 0
+    for stage in stages.values():
+        assert stage["invocations"] >= 2 and stage["peak_rss_mib"] > 0
+        assert stage["latency_ms"]["p50"] <= stage["latency_ms"]["p99"] <= stage["latency_ms"]["max"]
+    report = {"stages": stages}
+    assert bench_pipeline.compare(report, report)["ingest"]["records_per_s"] == 1.0
@@ -1,57 +1,314 @@
 import os
 import sys
+import json
+import time
 import importlib
 from unittest.mock import patch, MagicMock
 
+import pytest
+
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
 
 push_bridge = importlib.import_module("lambda.push_bridge")
+from common import runtime  # noqa: E402
+from stubs import StubDynamoDB, StubExpoServer  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.delenv("EXPO_TOKEN", raising=False)
+    monkeypatch.delenv("EXPO_TOKEN_SECRET_ARN", raising=False)
+    runtime.reset()
+    push_bridge._client = None
+    push_bridge._device_cache.clear()
+    yield
+    push_bridge._client = None
+    runtime.reset()
+
+
+@pytest.fixture
+def expo(monkeypatch):
+    with StubExpoServer() as server:
+        monkeypatch.setattr(push_bridge, "EXPO_URL", server.url)
+        yield server
+
+
+def _sqs(details):
+    return {
+        "Records": [
+            {
+                "messageId": f"m{i}",
+                "eventSource": "aws:sqs",
+                # SNS-to-SQS envelope around the EventBridge event
+                "body": json.dumps({"Type": "Notification", "Message": json.dumps({"detail": detail})}),
+            }
+            for i, detail in enumerate(details)
+        ]
+    }
 
 
-def _mock_urlopen():
-    mock = MagicMock()
-    mock.__enter__.return_value.read.return_value = b""
-    mock.__exit__.return_value = False
-    return mock
-
-
-def test_push_bridge_with_token():
-    os.environ["EXPO_TOKEN"] = "token123"
-    try:
-        with patch("urllib.request.urlopen", return_value=_mock_urlopen()) as mock_open:
-            event = {"detail": {"device_token": "d1", "fence_id": "f1"}}
-            result = push_bridge.lambda_handler(event, None)
-        request = mock_open.call_args[0][0]
-        assert request.headers["Authorization"] == "Bearer token123"
-        assert result == {"status": "sent"}
-    finally:
-        del os.environ["EXPO_TOKEN"]
-
-
-def test_push_bridge_without_token():
-    if "EXPO_TOKEN" in os.environ:
-        del os.environ["EXPO_TOKEN"]
-    if "EXPO_TOKEN_SECRET_ARN" in os.environ:
-        del os.environ["EXPO_TOKEN_SECRET_ARN"]
-    with patch("urllib.request.urlopen", return_value=_mock_urlopen()) as mock_open:
+def test_push_bridge_with_token(expo, monkeypatch):
+    monkeypatch.setenv("EXPO_TOKEN", "token123")
+    event = {"detail": {"device_token": "d1", "fence_id": "f1"}}
+    result = push_bridge.lambda_handler(event, None)
+    assert expo.authorization == ["Bearer token123"]
+    assert expo.delivered[0]["to"] == "d1"
+    assert result == {"sent": 1, "failed": 0, "invalid_tokens": []}
+
+
+def test_push_bridge_without_token(expo):
+    event = {"detail": {"device_token": "d1", "fence_id": "f1"}}
+    result = push_bridge.lambda_handler(event, None)
+    assert expo.authorization == [None]
+    assert result == {"sent": 1, "failed": 0, "invalid_tokens": []}
+
+
+def test_push_bridge_with_secret(expo, monkeypatch):
+    monkeypatch.setenv("EXPO_TOKEN_SECRET_ARN", "arn:expo")
+    mock_client = MagicMock()
+    mock_client.get_secret_value.return_value = {"SecretString": "secretXYZ"}
+    with patch("boto3.client", return_value=mock_client):
         event = {"detail": {"device_token": "d1", "fence_id": "f1"}}
         result = push_bridge.lambda_handler(event, None)
-    request = mock_open.call_args[0][0]
-    assert "Authorization" not in request.headers
-    assert result == {"status": "sent"}
+        push_bridge.lambda_handler(event, None)
+    assert expo.authorization == ["Bearer secretXYZ"] * 2
+    assert result == {"sent": 1, "failed": 0, "invalid_tokens": []}
+    # The secret is read once per TTL, not once per event
+    mock_client.get_secret_value.assert_called_once_with(SecretId="arn:expo")
 
 
-def test_push_bridge_with_secret():
-    os.environ["EXPO_TOKEN_SECRET_ARN"] = "arn:expo"
+def test_push_bridge_token_cache_expires(expo, monkeypatch):
+    monkeypatch.setenv("EXPO_TOKEN_SECRET_ARN", "arn:expo")
+    monkeypatch.setattr(push_bridge, "TOKEN_TTL_SECONDS", 0)
     mock_client = MagicMock()
-    mock_client.get_secret_value.return_value = {"SecretString": "secretXYZ"}
-    try:
-        with patch("boto3.client", return_value=mock_client):
-            with patch("urllib.request.urlopen", return_value=_mock_urlopen()) as mock_open:
-                event = {"detail": {"device_token": "d1", "fence_id": "f1"}}
-                result = push_bridge.lambda_handler(event, None)
-        request = mock_open.call_args[0][0]
-        assert request.headers["Authorization"] == "Bearer secretXYZ"
-        assert result == {"status": "sent"}
-    finally:
-        del os.environ["EXPO_TOKEN_SECRET_ARN"]
+    mock_client.get_secret_value.side_effect = [{"SecretString": "old"}, {"SecretString": "new"}]
+    with patch("boto3.client", return_value=mock_client):
+        push_bridge.lambda_handler({"detail": {"device_token": "d1"}}, None)
+        push_bridge.lambda_handler({"detail": {"device_token": "d1"}}, None)
+    assert expo.authorization == ["Bearer old", "Bearer new"]
+
+
+def test_push_bridge_sends_to_every_listed_token(expo):
+    event = {"detail": {"device_tokens": ["d1", "d2"], "fence_id": "f1"}}
+    result = push_bridge.lambda_handler(event, None)
+    assert result == {"sent": 2, "failed": 0, "invalid_tokens": []}
+    assert sorted(m["to"] for m in expo.delivered) == ["d1", "d2"]
+    push_bridge.lambda_handler({"detail": {"device_token": "d0", "device_tokens": ["d1"]}}, None)
+    assert sorted(m["to"] for m in expo.delivered[2:]) == ["d0", "d1"]
+
+
+def test_push_bridge_digest_with_device_token_names_its_fences(expo):
+    digest = {"region": "nsw", "fence_ids": ["f1", "f2", "f3"], "count": 3, "device_token": "d1"}
+    push_bridge.lambda_handler({"detail": digest}, None)
+    push_bridge.lambda_handler({"detail": {"fence_ids": ["f9"], "count": 1, "device_token": "d1"}}, None)
+    assert [m["body"] for m in expo.delivered] == ["Fire intersected 3 of your fences", "Fire intersected fence f9"]
+
+
+def test_push_bridge_batches_sqs_records_over_one_connection(expo):
+    details = [{"fence_id": f"f{i}", "device_tokens": [f"t{i}-{j}" for j in range(5)]} for i in range(50)]
+    result = push_bridge.lambda_handler(_sqs(details), None)
+    assert result == {"sent": 250, "failed": 0, "invalid_tokens": [], "batchItemFailures": []}
+    assert expo.requests == 3
+    assert len(expo.delivered) == 250
+    assert expo.connections <= push_bridge.PUSH_CONCURRENCY
+    push_bridge.lambda_handler(_sqs(details[:1]), None)
+    assert push_bridge._expo().connections_opened == expo.connections
+
+
+def test_push_bridge_sns_records(expo):
+    event = {"Records": [{"EventSource": "aws:sns", "Sns": {"Message": json.dumps({"detail": {"device_token": "d9"}})}}]}
+    result = push_bridge.lambda_handler(event, None)
+    assert result["sent"] == 1 and expo.delivered[0]["to"] == "d9"
+
+
+def test_push_bridge_ticket_errors_and_429(monkeypatch):
+    with StubExpoServer(invalid_tokens={"t3-0", "t7-1"}, ticket_error_rate=0.2, throttle_every=2) as expo:
+        monkeypatch.setattr(push_bridge, "EXPO_URL", expo.url)
+        monkeypatch.setattr(push_bridge, "PUSH_MAX_ATTEMPTS", 20)
+        monkeypatch.setattr(push_bridge, "BASE_DELAY", 0)
+        details = [{"fence_id": f"f{i}", "device_tokens": [f"t{i}-{j}" for j in range(30)]} for i in range(10)]
+        result = push_bridge.lambda_handler(_sqs(details), None)
+    assert expo.throttled > 0
+    assert sorted(result["invalid_tokens"]) == ["t3-0", "t7-1"]
+    assert result["sent"] == 298 and result["failed"] == 2
+    assert result["batchItemFailures"] == []
+    assert len({m["to"] for m in expo.delivered}) == 298
+
+
+@pytest.mark.parametrize("payload", [b'{"data": [{"status": "ok"', b"<html>Bad Gateway</html>", b"[]"])
+def test_send_chunk_retries_unreadable_200_bodies(monkeypatch, payload):
+    expo = MagicMock()
+    expo.post.return_value = (200, {}, payload)
+    monkeypatch.setattr(push_bridge, "_expo", lambda: expo)
+    chunk = [(0, {"to": "a"}), (1, {"to": "b"})]
+    assert push_bridge.send_chunk(chunk, None) == {0: "retry", 1: "retry"}
+
+
+def test_push_bridge_reports_undeliverable_records(monkeypatch):
+    with StubExpoServer(ticket_error_rate=1.0) as expo:
+        monkeypatch.setattr(push_bridge, "EXPO_URL", expo.url)
+        monkeypatch.setattr(push_bridge, "PUSH_MAX_ATTEMPTS", 2)
+        monkeypatch.setattr(push_bridge, "BASE_DELAY", 0)
+        result = push_bridge.lambda_handler(_sqs([{"device_token": "a"}, {"device_tokens": []}]), None)
+    assert result["batchItemFailures"] == [{"itemIdentifier": "m0"}]
+
+
+def test_push_bridge_chunks_are_sent_concurrently(monkeypatch):
+    with StubExpoServer(latency=0.05) as expo:
+        monkeypatch.setattr(push_bridge, "EXPO_URL", expo.url)
+        monkeypatch.setattr(push_bridge, "PUSH_CONCURRENCY", 4)
+        details = [{"device_tokens": [f"t{i}-{j}" for j in range(100)]} for i in range(8)]
+        started = time.perf_counter()
+        result = push_bridge.lambda_handler(_sqs(details), None)
+        elapsed = time.perf_counter() - started
+    assert result["sent"] == 800 and expo.requests == 8
+    # Eight 50 ms requests take 0.4 s one after another
+    assert elapsed < 0.3
+
+
+@pytest.fixture
+def subscribers(monkeypatch):
+    """Alerts table with fences f1 (250 users) and f2 (users 200-299), two devices per user.
+
+    The same client also keys a delivery ledger by (message_id, device_token).
+    """
+    client = StubDynamoDB(key_attributes=("user_id", "fence_id", "message_id", "device_token"))
+    for i in range(300):
+        fences = (["f1"] if i < 250 else []) + (["f2"] if i >= 200 else [])
+        for fence_id in fences:
+            client.put_item(TableName="alerts", Item={"user_id": {"S": f"u{i}"}, "fence_id": {"S": fence_id}})
+        client.put_item(TableName="devices", Item={"user_id": {"S": f"u{i}"}, "device_tokens": {"SS": [f"u{i}-a", f"u{i}-b"]}})
+    monkeypatch.setattr(push_bridge, "dynamodb", client)
+    monkeypatch.setattr(push_bridge, "SUBSCRIPTIONS_TABLE", "alerts")
+    monkeypatch.setattr(push_bridge, "DEVICES_TABLE", "devices")
+    monkeypatch.setattr(push_bridge, "FANOUT_CHUNK", 64)
+    return client
+
+
+def test_push_bridge_fans_out_to_fence_subscribers(expo, subscribers):
+    result = push_bridge.lambda_handler({"detail": {"fence_id": "f1", "region": "nsw"}}, None)
+    assert result["sent"] == 500
+    assert {m["to"] for m in expo.delivered} == {f"u{i}-{d}" for i in range(250) for d in "ab"}
+    assert expo.delivered[0]["data"] == {"fence_id": "f1", "region": "nsw"}
+    # 250 users in chunks of 64 -> 4 BatchGetItem calls
+    assert subscribers.requests["BatchGetItem"] == 4
+
+
+def test_push_bridge_digest_alerts_each_user_once(expo, subscribers):
+    result = push_bridge.lambda_handler(_sqs([{"fence_ids": ["f1", "f2"], "region": "nsw", "count": 2}]), None)
+    assert result["sent"] == 600 and result["batchItemFailures"] == []
+    tokens = [m["to"] for m in expo.delivered]
+    assert len(tokens) == len(set(tokens)) == 600
+    assert {m["data"]["fence_id"] for m in expo.delivered if m["to"].startswith("u299-")} == {"f2"}
+
+
+def test_push_bridge_device_cache_skips_reads_when_warm(expo, subscribers):
+    push_bridge.lambda_handler({"detail": {"fence_id": "f2"}}, None)
+    reads = subscribers.requests["BatchGetItem"]
+    push_bridge.lambda_handler({"detail": {"fence_id": "f1"}}, None)
+    # Users 200-249 were cached by the f2 alert
+    assert subscribers.requests["BatchGetItem"] - reads == 4
+    push_bridge.lambda_handler({"detail": {"fence_id": "f1"}}, None)
+    assert subscribers.requests["BatchGetItem"] - reads == 4
+    assert len(expo.delivered) == 200 + 500 + 500
+
+
+def test_push_bridge_unresolved_devices_fail_the_record(expo, subscribers, monkeypatch):
+    monkeypatch.setattr(push_bridge, "PUSH_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(push_bridge, "BASE_DELAY", 0)
+    subscribers.unprocessed_rate = 0.3
+    result = push_bridge.lambda_handler(_sqs([{"fence_id": "f2"}, {"fence_id": "none"}]), None)
+    assert result["batchItemFailures"] == [{"itemIdentifier": "m0"}]
+    assert 0 < result["sent"] < 200
+
+
+def test_push_bridge_fanout_streams_with_bounded_lookahead(expo, subscribers, monkeypatch):
+    monkeypatch.setattr(push_bridge, "PUSH_CONCURRENCY", 1)
+    resolved = []
+    real = push_bridge.device_tokens
+
+    def tracking(user_ids, now=None):
+        resolved.append(len(user_ids))
+        return real(user_ids, now)
+
+    monkeypatch.setattr(push_bridge, "device_tokens", tracking)
+    sent_before = []
+    original = push_bridge.send_chunk
+    monkeypatch.setattr(push_bridge, "send_chunk", lambda chunk, token: sent_before.append(sum(resolved)) or original(chunk, token))
+    push_bridge.lambda_handler({"detail": {"fence_id": "f1"}}, None)
+    # The first request goes out after one chunk of subscribers, not all 250
+    assert sent_before[0] == 64
+    assert resolved == [64, 64, 64, 58]
+
+
+def test_push_bridge_eventbridge_retry_resends_only_undelivered_tokens(subscribers, monkeypatch):
+    monkeypatch.setattr(push_bridge, "DELIVERIES_TABLE", "deliveries")
+    monkeypatch.setattr(push_bridge, "PUSH_MAX_ATTEMPTS", 1)
+    event = {"id": "evt-1", "detail-type": "FenceIntersection", "detail": {"fence_id": "f2"}}
+    with StubExpoServer(ticket_error_rate=0.3) as expo:
+        monkeypatch.setattr(push_bridge, "EXPO_URL", expo.url)
+        with pytest.raises(RuntimeError):
+            push_bridge.lambda_handler(event, None)
+        delivered_first = len(expo.delivered)
+        expo.ticket_error_rate = 0.0
+        # EventBridge retries the invocation with the same event
+        result = push_bridge.lambda_handler(event, None)
+    assert result["sent"] == 200 - delivered_first
+    tokens = [m["to"] for m in expo.delivered]
+    assert sorted(tokens) == sorted(f"u{i}-{d}" for i in range(200, 300) for d in "ab")
+    assert {item["message_id"]["S"] for item in subscribers.tables["deliveries"].values()} == {"evt-1"}
+
+
+def test_push_bridge_counts_alerts_it_cannot_route(expo, caplog):
+    dropped = push_bridge.UNROUTABLE.value()
+    digest = {"fence_ids": ["f1", "f2"], "region": "nsw", "count": 2}
+    assert push_bridge.lambda_handler({"detail": digest}, None) == {"status": "unroutable"}
+    result = push_bridge.lambda_handler(_sqs([digest, {"device_token": "d1"}]), None)
+    assert result["sent"] == 1 and result["batchItemFailures"] == []
+    assert [m["to"] for m in expo.delivered] == ["d1"]
+    assert push_bridge.UNROUTABLE.value() - dropped == 2
+    assert "SUBSCRIPTIONS_TABLE is unset" in caplog.text
+
+
+def _redriven(records, receive_count):
+    for record in records["Records"]:
+        record["attributes"] = {"ApproximateReceiveCount": str(receive_count)}
+    return records
+
+
+def test_push_bridge_redrive_resends_only_undelivered_tokens(monkeypatch):
+    ledger = StubDynamoDB(key_attributes=("message_id", "device_token"))
+    monkeypatch.setattr(push_bridge, "dynamodb", ledger)
+    monkeypatch.setattr(push_bridge, "DELIVERIES_TABLE", "deliveries")
+    monkeypatch.setattr(push_bridge, "PUSH_MAX_ATTEMPTS", 1)
+    details = [{"fence_id": "f1", "device_tokens": [f"t{j}" for j in range(150)]}, {"device_token": "solo"}]
+    with StubExpoServer(ticket_error_rate=0.3) as expo:
+        monkeypatch.setattr(push_bridge, "EXPO_URL", expo.url)
+        first = push_bridge.lambda_handler(_redriven(_sqs(details), 1), None)
+        assert {"itemIdentifier": "m0"} in first["batchItemFailures"]
+        delivered_first = [m["to"] for m in expo.delivered]
+        # A first receive never reads the ledger
+        assert "Query" not in ledger.requests
+        expo.ticket_error_rate = 0.0
+        second = push_bridge.lambda_handler(_redriven(_sqs(details[:1]), 2), None)
+    assert second["batchItemFailures"] == []
+    assert second["sent"] == 150 - len([t for t in delivered_first if t != "solo"])
+    tokens = [m["to"] for m in expo.delivered if m["to"] != "solo"]
+    assert sorted(tokens) == sorted(f"t{j}" for j in range(150))
+    assert ledger.requests["Query"] == 1
+    stored = ledger.tables["deliveries"].values()
+    assert {item["message_id"]["S"] for item in stored} == {"m0"}
+    assert all(int(item["expires_at"]["N"]) > time.time() for item in stored)
+
+
+def test_push_bridge_without_ledger_redrives_whole_records(monkeypatch):
+    with StubExpoServer(ticket_error_rate=0.5) as expo:
+        monkeypatch.setattr(push_bridge, "EXPO_URL", expo.url)
+        monkeypatch.setattr(push_bridge, "PUSH_MAX_ATTEMPTS", 1)
+        details = [{"device_tokens": [f"t{j}" for j in range(20)]}]
+        push_bridge.lambda_handler(_sqs(details), None)
+        expo.ticket_error_rate = 0.0
+        result = push_bridge.lambda_handler(_redriven(_sqs(details), 2), None)
+    assert result["sent"] == 20
@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from common.record_codec import decode_records, detect_encoding, get_encoder
+
+RECORDS = [
+    {"source": "nasa_firms", "id": "abc", "latitude": -32.0, "longitude": 151.0, "timestamp": "2024-04-22T0830Z", "raw": {"fid": "abc", "confidence": 80}},
+    {"source": "nsw_rfs", "id": None, "latitude": -33.0, "longitude": 150.0, "timestamp": None, "raw": {}},
+]
+
+
+def _roundtrip(encoding, include_raw=True):
+    encode = get_encoder(encoding, include_raw=include_raw)
+    body = b"".join(encode(rec) for rec in RECORDS)
+    return detect_encoding(body), list(decode_records(body))
+
+
+def test_jsonl_roundtrip():
+    assert _roundtrip("jsonl") == ("jsonl", RECORDS)
+
+
+def test_msgpack_roundtrip_and_smaller():
+    assert _roundtrip("msgpack") == ("msgpack", RECORDS)
+    jsonl = b"".join(map(get_encoder("jsonl"), RECORDS))
+    packed = b"".join(map(get_encoder("msgpack"), RECORDS))
+    assert len(packed) < len(jsonl)
+
+
+def test_raw_column_can_be_dropped():
+    expected = [{k: v for k, v in rec.items() if k != "raw"} for rec in RECORDS]
+    assert _roundtrip("msgpack", include_raw=False)[1] == expected
+    assert _roundtrip("jsonl", include_raw=False)[1] == expected
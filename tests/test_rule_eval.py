@@ -1,18 +1,49 @@
 import os
 import sys
 import json
+import time
 import importlib
 from unittest.mock import MagicMock
 
+import pytest
+
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
 
 os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
 
 rule_eval = importlib.import_module("lambda.rule_eval")
+from stubs import StubDynamoDB, StubEventBridge  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(rule_eval, "_backoff", lambda attempt: None)
+    rule_eval._local_windows.clear()
+    yield
+    rule_eval._local_windows.clear()
+
+
+def _record(i, fence_id, region, new=True, old=None, event_name="MODIFY"):
+    images = {"SequenceNumber": f"{i:06d}", "NewImage": {"intersects": {"BOOL": new}, "region": {"S": region}, "fence_id": {"S": fence_id}}}
+    if old is not None:
+        images["OldImage"] = {"intersects": {"BOOL": old}, "region": {"S": region}, "fence_id": {"S": fence_id}}
+    return {"eventName": event_name, "dynamodb": images}
+
+
+def _stream(count, detail_bytes=0):
+    """Fences starting to intersect, each in its own region so none are folded into digests."""
+    return {"Records": [_record(i, f"f{i}", f"{i}" + "r" * detail_bytes, old=False) for i in range(count)]}
+
+
+def _details(stub):
+    return [(entry["DetailType"], json.loads(entry["Detail"])) for entry in stub.published]
 
 
 def test_rule_eval_publishes_events():
     mock_eventbridge = MagicMock()
+    mock_eventbridge.put_events.return_value = {"FailedEntryCount": 0, "Entries": [{"EventId": "1"}]}
     rule_eval.eventbridge = mock_eventbridge
     event = {
         "Records": [
@@ -50,7 +81,7 @@ def test_rule_eval_publishes_events():
             "Detail": json.dumps({"fence_id": "f1", "region": "r1"}),
         }
     ]
-    assert result == {"events_published": 1}
+    assert result == {"events_published": 1, "transitions": 1, "suppressed": 0, "batchItemFailures": []}
 
 
 def test_rule_eval_no_events():
@@ -58,4 +89,137 @@ def test_rule_eval_no_events():
     rule_eval.eventbridge = mock_eventbridge
     result = rule_eval.lambda_handler({"Records": []}, None)
     mock_eventbridge.put_events.assert_not_called()
-    assert result == {"events_published": 0}
+    assert result == {"events_published": 0, "transitions": 0, "suppressed": 0, "batchItemFailures": []}
+
+
+def test_rule_eval_chunks_by_count_and_size():
+    stub = StubEventBridge()
+    rule_eval.eventbridge = stub
+    result = rule_eval.lambda_handler(_stream(95), None)
+    assert result["events_published"] == 95 and result["batchItemFailures"] == []
+    assert stub.calls == 10
+    assert sorted(json.loads(e["Detail"])["fence_id"] for e in stub.published) == sorted(f"f{i}" for i in range(95))
+
+    stub = StubEventBridge()
+    rule_eval.eventbridge = stub
+    # ~100 KB details: only two fit in a 256 KB request
+    result = rule_eval.lambda_handler(_stream(5, detail_bytes=100_000), None)
+    assert result["events_published"] == 5 and stub.calls == 3
+
+
+def test_rule_eval_retries_only_failed_entries():
+    stub = StubEventBridge(failure_rate=0.3)
+    rule_eval.eventbridge = stub
+    result = rule_eval.lambda_handler(_stream(200), None)
+    assert result["events_published"] == 200 and result["batchItemFailures"] == []
+    assert len(stub.published) == 200
+    assert stub.calls > 20
+
+
+def test_rule_eval_reports_batch_item_failures():
+    stub = StubEventBridge(reject=lambda entry: json.loads(entry["Detail"])["fence_id"] in ("f3", "f17"))
+    rule_eval.eventbridge = stub
+    result = rule_eval.lambda_handler(_stream(30), None)
+    assert result["events_published"] == 28
+    assert result["batchItemFailures"] == [{"itemIdentifier": "000003"}, {"itemIdentifier": "000017"}]
+
+    rule_eval._local_windows.clear()
+    stub = StubEventBridge(failure_rate=1.0)
+    rule_eval.eventbridge = stub
+    result = rule_eval.lambda_handler(_stream(12), None)
+    assert result["events_published"] == 0 and len(result["batchItemFailures"]) == 12
+    assert stub.calls == 2 * rule_eval.PUBLISH_MAX_ATTEMPTS
+
+
+def test_rule_eval_drops_oversized_entries(caplog):
+    stub = StubEventBridge()
+    rule_eval.eventbridge = stub
+    event = _stream(3)
+    event["Records"][1]["dynamodb"]["NewImage"]["region"] = {"S": "r" * 300_000}
+    dropped = rule_eval.EVENTS_PUBLISHED.value(outcome="oversized")
+    with caplog.at_level("WARNING", logger=rule_eval.logger.name):
+        result = rule_eval.lambda_handler(event, None)
+    assert result["events_published"] == 2 and result["batchItemFailures"] == []
+    assert rule_eval.EVENTS_PUBLISHED.value(outcome="oversized") == dropped + 1
+    assert "exceeds the PutEvents limit" in caplog.text
+
+
+def test_rule_eval_publishes_chunks_concurrently(monkeypatch):
+    monkeypatch.setattr(rule_eval, "PUBLISH_CONCURRENCY", 8)
+    stub = StubEventBridge(latency=0.02)
+    rule_eval.eventbridge = stub
+    started = time.perf_counter()
+    result = rule_eval.lambda_handler(_stream(400), None)
+    elapsed = time.perf_counter() - started
+    assert result["events_published"] == 400
+    # 40 calls at 20 ms each would take 0.8 s one after another
+    assert stub.max_in_flight > 1 and elapsed < 0.5
+
+
+def test_rule_eval_alerts_only_on_transitions():
+    stub = StubEventBridge()
+    rule_eval.eventbridge = stub
+    event = {
+        "Records": [
+            _record(0, "already", "nsw", new=True, old=True),
+            _record(1, "cleared", "nsw", new=False, old=True),
+            _record(2, "started", "vic", new=True, old=False),
+            _record(3, "inserted", "qld", new=True, event_name="INSERT"),
+            _record(4, "removed", "sa", new=True, old=False, event_name="REMOVE"),
+        ]
+    }
+    result = rule_eval.lambda_handler(event, None)
+    assert result["transitions"] == result["events_published"] == 2
+    assert sorted(detail["fence_id"] for _, detail in _details(stub)) == ["inserted", "started"]
+
+
+def test_rule_eval_suppresses_repeats_within_window(monkeypatch):
+    stub = StubEventBridge()
+    rule_eval.eventbridge = stub
+    clock = [1_700_000_000.0]
+    monkeypatch.setattr(rule_eval.time, "time", lambda: clock[0])
+    flap = {"Records": [_record(0, "f1", "nsw", old=False)]}
+
+    assert rule_eval.lambda_handler(flap, None)["events_published"] == 1
+    clock[0] += rule_eval.COALESCE_WINDOW_SECONDS - 1
+    result = rule_eval.lambda_handler(flap, None)
+    assert result["events_published"] == 0 and result["suppressed"] == 1
+    clock[0] += 2
+    assert rule_eval.lambda_handler(flap, None)["events_published"] == 1
+    assert len(stub.published) == 2
+
+
+def test_rule_eval_folds_bursts_into_digests(monkeypatch):
+    monkeypatch.setattr(rule_eval, "DIGEST_MAX_FENCES", 4)
+    stub = StubEventBridge()
+    rule_eval.eventbridge = stub
+    records = [_record(i, f"f{i}", "nsw", old=False) for i in range(10)] + [_record(10, "lone", "vic", old=False)]
+    # The same fence twice in one batch still counts once
+    records.append(_record(11, "f0", "nsw", old=False))
+    result = rule_eval.lambda_handler({"Records": records}, None)
+    assert result["events_published"] == 4
+    details = _details(stub)
+    digests = [detail for kind, detail in details if kind == "FenceIntersectionDigest"]
+    assert sorted(fence for digest in digests for fence in digest["fence_ids"]) == sorted(f"f{i}" for i in range(10))
+    assert all(digest["region"] == "nsw" and digest["count"] <= 4 for digest in digests)
+    assert ("FenceIntersection", {"fence_id": "lone", "region": "vic"}) in details
+
+
+def test_rule_eval_table_windows_and_release_on_failure(monkeypatch):
+    client = StubDynamoDB(key_attributes=("window_key",))
+    monkeypatch.setattr(rule_eval, "dynamodb", client)
+    monkeypatch.setattr(rule_eval, "COALESCE_TABLE", "alert_windows")
+    event = {"Records": [_record(0, "f1", "nsw", old=False), _record(1, "f2", "vic", old=False)]}
+
+    rule_eval.eventbridge = StubEventBridge(reject=lambda entry: json.loads(entry["Detail"])["fence_id"] == "f2")
+    result = rule_eval.lambda_handler(event, None)
+    assert result["batchItemFailures"] == [{"itemIdentifier": "000001"}]
+    # f1's window stays open; f2's was released so the re-driven record can alert
+    assert [key[0] for key in client.tables["alert_windows"]] == ['{"S": "fence#nsw#f1"}']
+
+    stub = StubEventBridge()
+    rule_eval.eventbridge = stub
+    result = rule_eval.lambda_handler(event, None)
+    assert result["suppressed"] == 1 and result["batchItemFailures"] == []
+    assert [detail["fence_id"] for _, detail in _details(stub)] == ["f2"]
+    assert len(client.tables["alert_windows"]) == 2
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from common import runtime
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+@pytest.fixture(autouse=True)
+def fresh_runtime():
+    runtime.reset()
+    yield
+    runtime.reset()
+
+
+def test_clients_are_built_once_per_service_and_arguments():
+    with patch("boto3.client", side_effect=lambda service, **kwargs: MagicMock(name=service)) as factory:
+        s3 = runtime.client("s3")
+        assert runtime.client("s3") is s3
+        assert runtime.client("s3", region_name="us-west-2") is not s3
+    assert factory.call_count == 2
+
+
+def test_lazy_client_waits_for_first_use():
+    with patch("boto3.client", return_value=MagicMock()) as factory:
+        lazy = runtime.lazy_client("events")
+        assert factory.call_count == 0
+        lazy.put_events(Entries=[])
+        lazy.put_events(Entries=[])
+    factory.assert_called_once_with("events")
+    assert factory.return_value.put_events.call_count == 2
+
+
+def test_secret_cache_rereads_after_ttl(monkeypatch):
+    sm = MagicMock()
+    sm.get_secret_value.side_effect = [{"SecretString": "a"}, {"SecretString": "b"}]
+    clock = [100.0]
+    monkeypatch.setattr(runtime.time, "monotonic", lambda: clock[0])
+    with patch("boto3.client", return_value=sm):
+        assert runtime.secret("arn:s", ttl=60) == "a"
+        clock[0] += 59
+        assert runtime.secret("arn:s", ttl=60) == "a"
+        clock[0] += 2
+        assert runtime.secret("arn:s", ttl=60) == "b"
+    assert sm.get_secret_value.call_count == 2
+
+
+def test_instrumentation_is_opt_in(monkeypatch):
+    monkeypatch.setattr(runtime, "INSTRUMENTATION", False)
+    assert runtime.instrument() is False
+
+
+@pytest.mark.parametrize(
+    "module", ["ingest_lambda.handlers", "api.subscribe", "api.unsubscribe", "api.geojson_proxy", "api.perimeter_query", "rule_eval", "push_bridge"]
+)
+def test_handlers_import_without_boto3_or_opentelemetry(module):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([os.path.join(ROOT, "src"), os.path.join(ROOT, "lambda")]))
+    env.pop("INSTRUMENTATION", None)
+    code = (
+        f"import sys, {module}; "
+        "print(sorted({m.split('.')[0] for m in sys.modules} & {'boto3', 'opentelemetry'}))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import numpy as np
+import shapely
+from shapely.geometry import Point, shape
+
+from geojson_processor.simplified import (
+    band_key,
+    band_tolerance,
+    parse_zoom_bands,
+    simplify_for_zoom,
+    upload_simplified_outputs,
+)
+from stubs import StubS3
+
+
+def _ragged_fire():
+    angles = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+    radius = 0.2 + 0.01 * np.sin(angles * 40)
+    ring = np.column_stack([150 + radius * np.cos(angles), -33 + radius * np.sin(angles)])
+    return shapely.Polygon(ring).union(Point(150.5, -33).buffer(0.05))
+
+
+def test_parse_zoom_bands_and_keys():
+    assert parse_zoom_bands("0-5, 6-9,12") == [(0, 5), (6, 9), (12, 12)]
+    assert parse_zoom_bands("") == []
+    assert band_key("fire_perimeters.geojson", (0, 5)) == "fire_perimeters.z0-5.geojson"
+
+
+def test_simplified_levels_stay_valid_and_close():
+    fire = _ragged_fire()
+    coords = []
+    for zoom in (5, 9, 12):
+        simplified = simplify_for_zoom(fire, zoom)
+        assert simplified.is_valid
+        assert len(shapely.get_parts(simplified)) == 2
+        assert shapely.hausdorff_distance(fire, simplified) <= band_tolerance(zoom) * 1.5
+        coords.append(shapely.get_num_coordinates(simplified))
+    assert coords[0] < coords[1] <= coords[2] <= shapely.get_num_coordinates(fire)
+
+
+def test_upload_simplified_outputs_reports_each_level():
+    s3 = StubS3()
+    report = upload_simplified_outputs(s3, "out", "fire_perimeters.geojson", _ragged_fire(), [(0, 5), (6, 9)])
+    assert [level["level"] for level in report] == ["z0-5", "z6-9"]
+    assert report[0]["bytes"] < report[1]["bytes"]
+    doc = json.loads(s3.get_object(Bucket="out", Key="fire_perimeters.z0-5.geojson")["Body"].read())
+    geom = shape(doc["features"][0]["geometry"])
+    assert geom.is_valid and geom.geom_type == "MultiPolygon"
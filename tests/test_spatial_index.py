@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import random
+
+import numpy as np
+import shapely
+from shapely.geometry import box
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from api import perimeter_query
+from geojson_processor.incremental import PerimeterState, update_perimeter
+from geojson_processor.spatial_index import annotate_parts, build_index, index_key, pack_levels
+
+
+def _parse(body):
+    lines = body.decode("utf-8").splitlines()
+    return json.loads(lines[0]), [json.loads(line) for line in lines[1:]]
+
+
+def _random_boxes(rng, count):
+    boxes = []
+    for _ in range(count):
+        x, y = rng.uniform(110, 155), rng.uniform(-44, -10)
+        boxes.append(box(x, y, x + rng.uniform(0.001, 0.5), y + rng.uniform(0.001, 0.5)))
+    return np.array(boxes, dtype=object)
+
+
+def test_index_key():
+    assert index_key("fire_perimeters.geojson") == "fire_perimeters.index.ndjson"
+    assert index_key("out/latest.json") == "out/latest.index.ndjson"
+
+
+def test_pack_levels_parents_cover_children():
+    boxes = shapely.bounds(_random_boxes(random.Random(1), 300))
+    levels = pack_levels(boxes, 16)
+    assert [len(level) for level in levels] == [300, 19, 2, 1]
+    for child, parent in zip(levels, levels[1:]):
+        for i, node in enumerate(parent):
+            members = child[i * 16 : (i + 1) * 16]
+            assert node[0] == members[:, 0].min() and node[1] == members[:, 1].min()
+            assert node[2] == members[:, 2].max() and node[3] == members[:, 3].max()
+
+
+def test_search_matches_brute_force():
+    rng = random.Random(7)
+    parts = _random_boxes(rng, 2000)
+    body = build_index(parts, {}, [], precision=None, node_size=8)
+    header, features = _parse(body)
+    assert header["count"] == len(features) == 2000
+    bounds = np.array([shapely.bounds(shapely.geometry.shape(f["geometry"])) for f in features])
+    for _ in range(50):
+        x, y = rng.uniform(105, 155), rng.uniform(-45, -10)
+        query = [x, y, x + rng.uniform(0, 6), y + rng.uniform(0, 6)]
+        expected = np.flatnonzero(
+            (bounds[:, 0] <= query[2]) & (bounds[:, 2] >= query[0]) & (bounds[:, 1] <= query[3]) & (bounds[:, 3] >= query[1])
+        )
+        assert sorted(perimeter_query.search(header, query)) == expected.tolist()
+
+
+def test_empty_index():
+    header, features = _parse(build_index(np.empty(0, dtype=object), {}, []))
+    assert header["count"] == 0 and header["levels"] == [] and features == []
+    assert perimeter_query.search(header, [0, 0, 1, 1]) == []
+
+
+def test_annotate_parts_keeps_polygons_inside_collections(capsys):
+    state = PerimeterState(3600)
+    merged = shapely.GeometryCollection(
+        [
+            shapely.MultiPolygon([box(0, 0, 1, 1), box(2, 0, 3, 1)]),
+            box(4, 0, 5, 1),
+            shapely.LineString([(6, 0), (7, 1)]),
+            shapely.Point(8, 0),
+        ]
+    )
+    parts, attributes, _ = annotate_parts(state, merged)
+    assert sorted(int(part.bounds[0]) for part in parts) == [0, 2, 4]
+    assert len(attributes["sources"]) == 3
+    assert "skipped 2 non-polygon parts" in capsys.readouterr().out
+
+
+def test_annotate_parts_from_slices():
+    state = PerimeterState(3600)
+    listing = [
+        {"Key": "a", "ETag": "1", "LastModified": 7200},
+        {"Key": "b", "ETag": "2", "LastModified": 10800},
+        {"Key": "c", "ETag": "3", "LastModified": 10800},
+    ]
+    loaded = {
+        "a": {"MODIS": [box(0, 0, 1, 1)]},
+        "b": {"VIIRS": [box(0.5, 0.5, 2, 2)], "MODIS": [box(10, 10, 11, 11)]},
+        "c": {"VIIRS": [box(20, 20, 21, 21)]},
+    }
+    merged, _ = update_perimeter(state, listing, lambda objs: [(o, loaded[o["Key"]]) for o in objs], now=11000)
+    parts, attributes, sources = annotate_parts(state, merged)
+    assert sources == ["MODIS", "VIIRS"]
+    by_x = {int(part.bounds[0]): i for i, part in enumerate(parts)}
+    joined, lone_modis, lone_viirs = by_x[0], by_x[10], by_x[20]
+    assert attributes["sources"][joined] == 0b11
+    assert attributes["first_seen"][joined] == 7200 and attributes["last_seen"][joined] == 14400
+    assert attributes["sources"][lone_modis] == 0b01 and attributes["first_seen"][lone_modis] == 10800
+    assert attributes["sources"][lone_viirs] == 0b10
+
+    header, features = _parse(build_index(parts, attributes, sources, generated=42))
+    assert header["generated"] == 42
+    by_first = {f["properties"]["first_seen"]: f["properties"] for f in features}
+    assert by_first[7200] == {"sources": ["MODIS", "VIIRS"], "first_seen": 7200, "last_seen": 14400}
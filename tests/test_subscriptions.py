@@ -1,14 +1,20 @@
 import os
 import sys
 import json
+from decimal import Decimal
 from unittest.mock import MagicMock, patch
+
+import pytest
 from botocore.exceptions import ClientError
 
 os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
 
 from api import subscribe, unsubscribe
+from common import batch_write
+from stubs import StubDynamoDB
 
 
 def test_subscribe_stores_alert(monkeypatch=None):
@@ -20,17 +26,34 @@ def test_subscribe_stores_alert(monkeypatch=None):
     mock_table = MagicMock()
     with patch.object(subscribe.dynamodb, "Table", return_value=mock_table):
         response = subscribe.subscribeFn(event, None)
-    mock_table.put_item.assert_called_once_with(
-        Item={
-            "user_id": "user1",
-            "fence_id": "f1",
-            "params": {"type": "fire", "fence_id": "f1"},
-        }
+    mock_table.update_item.assert_called_once_with(
+        Key={"user_id": "user1", "fence_id": "f1"},
+        UpdateExpression="SET params = :params REMOVE geohash, cell",
+        ExpressionAttributeValues={":params": {"type": "fire", "fence_id": "f1"}},
     )
     assert response["statusCode"] == 201
     assert json.loads(response["body"]) == {"fence_id": "f1"}
 
 
+def test_subscribe_registers_device_token(monkeypatch):
+    monkeypatch.setenv("ALERTS_TABLE", "alerts")
+    monkeypatch.setenv("DEVICES_TABLE", "devices")
+    event = {
+        "requestContext": {"authorizer": {"claims": {"sub": "user1"}}},
+        "body": json.dumps({"fence_id": "f1", "device_token": "ExponentPushToken[a]"}),
+    }
+    tables = {"alerts": MagicMock(), "devices": MagicMock()}
+    with patch.object(subscribe.dynamodb, "Table", side_effect=tables.get):
+        response = subscribe.subscribeFn(event, None)
+    assert response["statusCode"] == 201
+    tables["alerts"].update_item.assert_called_once()
+    tables["devices"].update_item.assert_called_once_with(
+        Key={"user_id": "user1"},
+        UpdateExpression="ADD device_tokens :token",
+        ExpressionAttributeValues={":token": {"ExponentPushToken[a]"}},
+    )
+
+
 def test_unsubscribe_deletes_alert(monkeypatch=None):
     os.environ["ALERTS_TABLE"] = "alerts"
     event = {
@@ -61,3 +84,141 @@ def test_unsubscribe_not_found(monkeypatch=None):
     assert response["statusCode"] == 404
     body = json.loads(response["body"])
     assert body["error"] == "alert not found"
+
+
+def _event(body, user="user1"):
+    return {"requestContext": {"authorizer": {"claims": {"sub": user}}}, "body": json.dumps(body)}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    monkeypatch.setenv("ALERTS_TABLE", "alerts")
+    client = StubDynamoDB()
+    for module in (subscribe, unsubscribe):
+        monkeypatch.setattr(module, "client", client)
+    monkeypatch.setattr(batch_write, "BASE_DELAY", 0)
+    return client
+
+
+def test_geohash_matches_reference():
+    assert subscribe.geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert subscribe.geohash(-33.8688, 151.2093, 5) == "r3gx2"
+
+
+def test_subscribe_indexes_fence_location(monkeypatch):
+    monkeypatch.setenv("ALERTS_TABLE", "alerts")
+    mock_table = MagicMock()
+    polygon = {"type": "Polygon", "coordinates": [[[151.0, -34.0], [151.4, -34.0], [151.4, -33.7], [151.0, -34.0]]]}
+    with patch.object(subscribe.dynamodb, "Table", return_value=mock_table):
+        subscribe.subscribeFn(_event({"fence_id": "f1", "latitude": -33.8688, "longitude": 151.2093}), None)
+        subscribe.subscribeFn(_event({"fence_id": "f2", "geometry": polygon}), None)
+    point, area = (call.kwargs["ExpressionAttributeValues"] for call in mock_table.update_item.call_args_list)
+    assert point[":params"]["latitude"] == Decimal("-33.8688")
+    assert point[":geohash"].startswith("r3gx2") and point[":cell"] == "r3gx"
+    assert area[":geohash"] == subscribe.geohash(-33.85, 151.2) and area[":cell"] == area[":geohash"][:4]
+
+
+@pytest.mark.parametrize("body", [{"type": "fire"}, {"fence_id": 7}, {"fence_id": ""}])
+def test_subscribe_rejects_fence_ids_that_are_not_strings(monkeypatch, body):
+    monkeypatch.setenv("ALERTS_TABLE", "alerts")
+    mock_table = MagicMock()
+    with patch.object(subscribe.dynamodb, "Table", return_value=mock_table):
+        response = subscribe.subscribeFn(_event(body), None)
+    assert response["statusCode"] == 400
+    mock_table.update_item.assert_not_called()
+
+
+def test_batch_subscribe_retries_unprocessed_and_indexes_cells(table):
+    table.unprocessed_rate = 0.3
+    fences = [{"fence_id": f"f{i}", "latitude": -33.8688 + i * 1e-4, "longitude": 151.2093} for i in range(120)]
+    fences.append({"fence_id": "f0", "latitude": -35.3, "longitude": 149.1})
+    response = subscribe.batchSubscribeFn(_event({"fences": fences}), None)
+    assert response["statusCode"] == 201
+    assert json.loads(response["body"]) == {"written": 120, "failed": []}
+    assert len(table.tables["alerts"]) == 120
+    assert table.requests["BatchWriteItem"] > 5
+    # The duplicate f0 kept its last definition, in another cell
+    in_cell = table.query(
+        TableName="alerts",
+        IndexName="cell-index",
+        KeyConditionExpression="cell = :cell",
+        ExpressionAttributeValues={":cell": {"S": "r3gx"}},
+    )
+    assert in_cell["Count"] == 119
+    item = next(iter(table.tables["alerts"].values()))
+    assert item["params"]["M"]["latitude"]["N"]
+
+
+def test_batch_subscribe_reports_unwritten_fences(table, monkeypatch):
+    monkeypatch.setattr(batch_write, "BATCH_WRITE_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(table, "batch_write_item", lambda RequestItems: {"UnprocessedItems": RequestItems})
+    response = subscribe.batchSubscribeFn(_event({"fences": [{"fence_id": "a"}, {"fence_id": "b"}]}), None)
+    assert response["statusCode"] == 207
+    assert json.loads(response["body"]) == {"written": 0, "failed": ["a", "b"]}
+
+
+def test_batch_subscribe_updates_fences_it_cannot_read_and_reports_failures(table, monkeypatch):
+    monkeypatch.setattr(batch_write, "BATCH_WRITE_MAX_ATTEMPTS", 2)
+    table.unprocessed_rate = 1.0
+    table.throttle_rate = 1.0
+    response = subscribe.batchSubscribeFn(_event({"fences": [{"fence_id": "a"}, {"fence_id": "b"}]}), None)
+    assert response["statusCode"] == 207
+    assert json.loads(response["body"]) == {"written": 0, "failed": ["a", "b"]}
+    assert table.requests["BatchGetItem"] == 2
+    assert table.requests["UpdateItem"] == 2
+    assert "BatchWriteItem" not in table.requests
+
+
+def test_batch_unsubscribe_reports_undeleted_fences(table, monkeypatch):
+    monkeypatch.setattr(batch_write, "BATCH_WRITE_MAX_ATTEMPTS", 2)
+    table.unprocessed_rate = 1.0
+    response = unsubscribe.batchUnsubscribeFn(_event({"fence_ids": ["b", "a"]}), None)
+    assert response["statusCode"] == 207
+    assert json.loads(response["body"]) == {"deleted": 0, "failed": ["a", "b"]}
+    assert table.requests["BatchWriteItem"] == 2
+
+
+def test_batch_subscribe_keeps_the_intersects_flag_of_existing_fences(table):
+    subscribe.batchSubscribeFn(_event({"fences": [{"fence_id": "f1", "latitude": -33.87, "longitude": 151.21}]}), None)
+    table.update_item(
+        TableName="alerts",
+        Key={"user_id": {"S": "user1"}, "fence_id": {"S": "f1"}},
+        UpdateExpression="SET intersects = :v",
+        ExpressionAttributeValues={":v": {"BOOL": True}},
+    )
+    fences = [{"fence_id": "f1", "radius_m": 800}, {"fence_id": "f2", "latitude": -35.3, "longitude": 149.1}]
+    response = subscribe.batchSubscribeFn(_event({"fences": fences}), None)
+    assert json.loads(response["body"]) == {"written": 2, "failed": []}
+    rows = {json.loads(key[1])["S"]: item for key, item in table.tables["alerts"].items()}
+    assert rows["f1"]["intersects"] == {"BOOL": True}
+    assert rows["f1"]["params"]["M"]["radius_m"] == {"N": "800"}
+    # The new definition has no location, so the old cell no longer lists it
+    assert "cell" not in rows["f1"] and "geohash" not in rows["f1"]
+    assert rows["f2"]["cell"]["S"] == subscribe.geohash(-35.3, 149.1)[:4]
+    assert table.requests["UpdateItem"] == 2
+
+
+@pytest.mark.parametrize(
+    "body", [{}, {"fences": []}, {"fences": [{"name": "x"}]}, {"fences": [{"fence_id": 7}]}, {"fences": "f1"}]
+)
+def test_batch_subscribe_rejects_bad_bodies(table, body):
+    assert subscribe.batchSubscribeFn(_event(body), None)["statusCode"] == 400
+    assert "BatchWriteItem" not in table.requests
+
+
+def test_batch_subscribe_limits_request_size(table, monkeypatch):
+    monkeypatch.setattr(batch_write, "MAX_BATCH_FENCES", 3)
+    fences = [{"fence_id": f"f{i}"} for i in range(4)]
+    assert subscribe.batchSubscribeFn(_event({"fences": fences}), None)["statusCode"] == 400
+
+
+def test_batch_unsubscribe_deletes_only_the_callers_fences(table):
+    subscribe.batchSubscribeFn(_event({"fences": [{"fence_id": f"f{i}"} for i in range(40)]}), None)
+    subscribe.batchSubscribeFn(_event({"fences": [{"fence_id": "f1"}]}, user="user2"), None)
+    table.unprocessed_rate = 0.3
+    response = unsubscribe.batchUnsubscribeFn(_event({"fence_ids": [f"f{i}" for i in range(30)] + ["f1", "gone"]}), None)
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"]) == {"deleted": 31, "failed": []}
+    remaining = sorted(json.loads(key[0])["S"] + "/" + json.loads(key[1])["S"] for key in table.tables["alerts"])
+    assert remaining == sorted([f"user1/f{i}" for i in range(30, 40)] + ["user2/f1"])
+    assert unsubscribe.batchUnsubscribeFn(_event({"fence_ids": [1]}), None)["statusCode"] == 400
@@ -0,0 +1,44 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from shapely.geometry import Point, box
+from shapely.ops import unary_union
+
+from geojson_processor.tiling import assign_tiles, tiled_union
+
+
+def _hotspots(seed, count=400):
+    rng = random.Random(seed)
+    geoms = []
+    for _ in range(count):
+        # Cluster near tile corners so plenty of geometries straddle boundaries
+        x = rng.choice([145.0, 146.0, 147.5]) + rng.gauss(0, 0.3)
+        y = rng.choice([-35.0, -34.0]) + rng.gauss(0, 0.3)
+        geoms.append(Point(x, y).buffer(rng.uniform(0.01, 0.2), 8) if rng.random() < 0.9 else Point(x, y))
+    geoms.append(box(144.5, -35.5, 146.5, -34.5))
+    return geoms
+
+
+def test_assign_tiles_by_bbox_centre():
+    tiles = assign_tiles([box(0.2, 0.2, 0.4, 0.4), box(0.9, 0.9, 1.3, 1.3), Point(-0.5, 2.5)], 1.0)
+    assert tiles == {(0, 0): [0], (1, 1): [1], (-1, 2): [2]}
+
+
+def test_tiled_union_matches_unary_union():
+    for seed in range(5):
+        geoms = _hotspots(seed)
+        expected = unary_union(geoms)
+        for tile_degrees in (0.25, 1.0):
+            result = tiled_union(geoms, tile_degrees)
+            assert abs(result.area - expected.area) < 1e-9
+            assert result.symmetric_difference(expected).area < 1e-9
+            assert len(result.geoms) == len(expected.geoms)
+
+
+def test_tiled_union_process_pool():
+    geoms = _hotspots(42)
+    result = tiled_union(geoms, 0.5, workers=2)
+    assert result.symmetric_difference(unary_union(geoms)).area < 1e-9
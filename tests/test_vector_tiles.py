@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from shapely.geometry import MultiPolygon, Polygon, box
+
+from geojson_processor.vector_tiles import EXTENT, LAYER_NAME, encode_tile, upload_tile_pyramid
+from stubs import StubS3
+
+
+def _read_varint(buf, pos):
+    value = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return value, pos
+
+
+def _fields(buf):
+    pos, out = 0, []
+    while pos < len(buf):
+        key, pos = _read_varint(buf, pos)
+        if key & 7 == 2:
+            size, pos = _read_varint(buf, pos)
+            out.append((key >> 3, buf[pos : pos + size]))
+            pos += size
+        else:
+            value, pos = _read_varint(buf, pos)
+            out.append((key >> 3, value))
+    return out
+
+
+def _decode_rings(buf):
+    """Decode an MVT polygon geometry into rings of absolute tile coordinates."""
+    values, pos = [], 0
+    while pos < len(buf):
+        value, pos = _read_varint(buf, pos)
+        values.append(value)
+    rings, x, y, i = [], 0, 0, 0
+    while i < len(values):
+        cmd, count = values[i] & 7, values[i] >> 3
+        i += 1
+        if cmd == 7:
+            continue
+        for _ in range(count):
+            dx, dy = values[i], values[i + 1]
+            i += 2
+            x += (dx >> 1) ^ -(dx & 1)
+            y += (dy >> 1) ^ -(dy & 1)
+            if cmd == 1:
+                rings.append([])
+            rings[-1].append((x, y))
+    return rings
+
+
+def _signed_area(ring):
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1]))
+
+
+def test_encode_tile_winding_and_layer_metadata():
+    # A square with a hole covering the top-left quarter of tile 1/0/0 in unit Mercator
+    shell = box(0.0, 0.0, 0.25, 0.25)
+    hole = box(0.1, 0.1, 0.15, 0.15)
+    polygon = Polygon(shell.exterior.coords, [hole.exterior.coords])
+    tile = encode_tile([polygon], (1, 0, 0))
+
+    (field, layer), = _fields(tile)
+    assert field == 3
+    layer_fields = dict((f, v) for f, v in _fields(layer) if f != 2)
+    assert layer_fields[1] == LAYER_NAME.encode()
+    assert layer_fields[5] == EXTENT and layer_fields[15] == 2
+    feature = dict(_fields([v for f, v in _fields(layer) if f == 2][0]))
+    assert feature[3] == 3
+    exterior, interior = _decode_rings(feature[4])
+    assert _signed_area(exterior) > 0 > _signed_area(interior)
+    assert sorted(exterior) == [(0, 0), (0, 2048), (2048, 0), (2048, 2048)]
+
+
+def test_sub_unit_polygons_are_dropped():
+    assert encode_tile([box(0.0, 0.0, 1e-9, 1e-9)], (0, 0, 0)) == b""
+
+
+def test_upload_tile_pyramid_writes_tiles_and_prunes_stale_ones():
+    s3 = StubS3()
+    s3.put_object(Bucket="out", Key="tiles/9/0/0.pbf", Body=b"old")
+    fires = MultiPolygon([box(150.0, -33.2, 150.3, -33.0), box(145.0, -37.1, 145.05, -37.0)])
+    report = upload_tile_pyramid(s3, "out", "tiles/", fires, 0, 6, workers=4)
+
+    assert [level["level"] for level in report] == [f"mvt z{z}" for z in range(7)]
+    assert report[0]["tiles"] == 1 and all(level["bytes"] > 0 for level in report)
+    assert "out/tiles/9/0/0.pbf" not in s3.objects
+    obj = s3.get_object(Bucket="out", Key="tiles/0/0/0.pbf")
+    assert obj["ContentEncoding"] == "gzip"
+    (_, layer), = _fields(gzip.decompress(obj["Body"].read()))
+    assert any(field == 2 for field, _ in _fields(layer))
+    meta = json.loads(s3.get_object(Bucket="out", Key="tiles/tiles.json")["Body"].read())
+    assert meta["tiles"] == ["tiles/{z}/{x}/{y}.pbf"] and meta["maxzoom"] == 6
+
+
+def test_encoded_polygons_round_trip_through_the_decoder():
+    # Several fires in tile 4/14/9 (unit Mercator), one with a hole, plus a collapsed sliver
+    n = 16
+    shell = box(14.5 / n, 9.5 / n, 14.9 / n, 9.9 / n)
+    hole = box(14.6 / n, 9.6 / n, 14.7 / n, 9.7 / n)
+    fires = [
+        box(14.1 / n, 9.1 / n, 14.3 / n, 9.2 / n),
+        Polygon(shell.exterior.coords, [hole.exterior.coords]),
+        box(14.4 / n, 9.4 / n, 14.4 / n + 1e-9, 9.4 / n + 1e-9),
+    ]
+    (_, layer), = _fields(encode_tile(fires, (4, 14, 9)))
+    feature = dict(_fields([v for f, v in _fields(layer) if f == 2][0]))
+    rings = _decode_rings(feature[4])
+    assert [_signed_area(ring) > 0 for ring in rings] == [True, True, False]
+    expected = [0.2 * 0.1, 0.4 * 0.4, -0.1 * 0.1]
+    for ring, area in zip(rings, expected):
+        assert abs(_signed_area(ring) / 2 / EXTENT**2 - area) < 1e-3